@@ -2,15 +2,20 @@
 import re
 import sys
 import os
+import numpy as np
 import pandas as pd
 import json
-import copy
-import csv
 import pytz
 from datetime import datetime
 
 import cgm.cgm_qc as QC
 
+# Format of the timestamps in the Dexcom export and in the JSON output
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# Records formatted and written to the JSON file at a time
+WRITE_BLOCK_ROWS = 10000
+
 
 def convert_to_utc(df, column_name, timezone):
     # Map common timezone abbreviations to pytz timezone
@@ -45,7 +50,19 @@ def convert_to_utc(df, column_name, timezone):
         local_dt = local_tz.localize(dt, is_dst=True)
         return local_dt.astimezone(pytz.utc)
 
-    df[column_name] = df[column_name].apply(localize_and_convert)
+    # Parse and localize the whole column at once. Times that are ambiguous or do not
+    # exist around a DST change come back as NaT and go through pytz one by one, so
+    # they resolve exactly as localize(is_dst=True) does.
+    column = df[column_name]
+    parsed = pd.to_datetime(column, format=TIMESTAMP_FORMAT, errors="coerce")
+    converted = parsed.dt.tz_localize(
+        timezone, ambiguous="NaT", nonexistent="NaT"
+    ).dt.tz_convert("UTC")
+
+    for index in converted.index[converted.isna() & column.notna()]:
+        converted[index] = localize_and_convert(column[index])
+
+    df[column_name] = converted
 
 
 def convert(
@@ -60,7 +77,18 @@ def convert(
     uuid,
     timezone,
     optional=None,
+    debug_csv=False,
+    qc=True,
+    qc_plots=False,
 ):
+    """
+    Convert a Dexcom Clarity export to an Open mHealth blood glucose JSON file.
+
+    The columns are converted as a whole (timezone and unit normalization) and the
+    records are streamed to the JSON file in blocks. QC_results.txt is written when qc
+    is set, with histograms of the values when qc_plots is set as well. debug_csv adds
+    the dataframe and the flattened JSON records as CSV files next to the output.
+    """
     # ADD PARSER ARGUMENTS#
     # parser = argparse.ArgumentParser()
     # parser.add_argument(
@@ -176,8 +204,6 @@ def convert(
         df = pd.read_excel(input_path, engine="openpyxl")
     elif re.match("[\w\s\(\)_\-,\.\*\/]*\.csv", input_path):
         df = pd.read_csv(input_path)
-        with open(input_path, encoding="utf-8") as csv_file_handler:
-            csv_reader = csv.DictReader(csv_file_handler)
     else:
         sys.exit()
 
@@ -235,177 +261,289 @@ def convert(
     # Assign the formatted datetime string to the variable
     datetime_str = formatted_datetime
 
-    # JSON STRING CREATED FROM DATAFRAME VALUES#
-    df_data = (
-        '{"header":{"uuid":'
-        + f'"{props_dict["uuid"]}"'
-        + f',"creation_date_time":"{datetime_str}",'
-        + f'"patient_id":"{patient}"'
-        + ',"schema_id":{"namespace":"omh","name":"blood-glucose","version":3.0},"modality":"sensed","acquistion_rate":{"number_of_times":1, "time_window":{"value":5, "unit":"min"}},"external_datasheets":{"datasheet_type":"source_device","datasheet_reference":"iri-of-cgm-device"}'
-        + f',"timezone": "{props_dict["timezone"]}"'
-        + '}, "body": {"cgm":'
-        + df.to_json(orient="records", date_format="iso", date_unit="s")
-        + "}}"
-    )
+    header = {
+        "uuid": props_dict["uuid"],
+        "creation_date_time": datetime_str,
+        "patient_id": f"{patient}",
+        "schema_id": {"namespace": "omh", "name": "blood-glucose", "version": 3.0},
+        "modality": "sensed",
+        "acquistion_rate": {
+            "number_of_times": 1,
+            "time_window": {"value": 5, "unit": "min"},
+        },
+        "external_datasheets": {
+            "datasheet_type": "source_device",
+            "datasheet_reference": "iri-of-cgm-device",
+        },
+        "timezone": props_dict["timezone"],
+    }
 
-    # JSON STRING TO DICT, PROPERTY NESTING, AND JSON OUTPUT FILE#
-    parsed = json.loads(df_data)
-    # create a deep copy because we will convert this to csv later
-    parsed_copy = copy.deepcopy(parsed)
-    # convert data point properties to nested properties if needed
-    # parsed_copy values not assigned nested properties because we will be converting it to csv later which does not have nested properties
-    for data in range(len(parsed["body"]["cgm"])):
-        # copies exist so value can be embedded in nested property
-        # copies exist so value can be embedded in nested property
-        copy_effective_time_frame = parsed["body"]["cgm"][data]["effective_time_frame"]
-        parsed["body"]["cgm"][data]["effective_time_frame"] = {
-            "time_interval": {
-                "start_date_time": copy_effective_time_frame,
-                "end_date_time": copy_effective_time_frame,
-            }
-        }
-        copy_blood_glucose = parsed["body"]["cgm"][data]["blood_glucose"]
-        if copy_blood_glucose != "Low" and copy_blood_glucose != "High":
-            parsed["body"]["cgm"][data]["blood_glucose"] = {
-                "unit": "mg/dL",
-                "value": int(copy_blood_glucose),
-            }
-        else:
-            parsed["body"]["cgm"][data]["blood_glucose"] = {
-                "unit": "mg/dL",
-                "value": copy_blood_glucose,
-            }
-        copy_transmitter_time = parsed["body"]["cgm"][data]["transmitter_time"]
-        parsed["body"]["cgm"][data]["transmitter_time"] = {
-            "unit": "long integer",
-            "value": int(copy_transmitter_time),
-        }
+    # Normalize the columns once, every output below is built from these
+    effective_time_frame = iso_timestamps(df["effective_time_frame"])
+    blood_glucose = glucose_values(df["blood_glucose"])
+    transmitter_time = pd.to_numeric(df["transmitter_time"]).astype("int64")
 
     # create output JSON file
     args_output_list = output_path.split("/")
     json_file = args_output_list[-1]
-    with open(
-        output_path.rstrip(".json") + "/" + json_file, "w", encoding="utf-8"
-    ) as json_file_handler:
-        json_file_handler.write(json.dumps(parsed, indent=4))
-
-    # DATAFRAME TO CSV AND DICT TO CSV CONVERSION, AND COMPARISON#
-    # convert dataframe version of .xlsx and .csv file to csv and create output file
-    df.to_csv(
-        output_path.rstrip(".json") + "/" + json_file.rstrip(".json") + "_df_to_csv.csv"
+    output_folder = output_path.rstrip(".json")
+    output_name = json_file.rstrip(".json")
+
+    write_json(
+        output_folder + "/" + json_file,
+        header,
+        df,
+        effective_time_frame,
+        blood_glucose,
+        transmitter_time,
     )
-    # convert json output file to csv and create output file
-    # change all float values to int
-    for data in range(len(parsed_copy["body"]["cgm"])):
-        parsed_copy["body"]["cgm"][data]["transmitter_time"] = int(
-            parsed_copy["body"]["cgm"][data]["transmitter_time"]
+
+    if debug_csv:
+        # convert dataframe version of .xlsx and .csv file to csv and create output file
+        df.to_csv(output_folder + "/" + output_name + "_df_to_csv.csv")
+
+        # the standard JSON records with their nested properties flattened
+        standard = df.copy()
+        standard["effective_time_frame"] = effective_time_frame
+        standard["blood_glucose"] = blood_glucose
+        standard["transmitter_time"] = transmitter_time
+        standard.to_csv(
+            output_folder + "/" + output_name + "_standard_json_to_csv.csv",
+            index=False,
+            lineterminator="\r\n",
+        )
+
+    if qc:
+        write_qc(
+            output_folder,
+            output_name,
+            df,
+            effective_time_frame,
+            blood_glucose,
+            transmitter_time,
+            plots=qc_plots,
         )
-        if (
-            parsed_copy["body"]["cgm"][data]["blood_glucose"] != "High"
-            and parsed_copy["body"]["cgm"][data]["blood_glucose"] != "Low"
-        ):
-            parsed_copy["body"]["cgm"][data]["blood_glucose"] = int(
-                parsed_copy["body"]["cgm"][data]["blood_glucose"]
+
+
+def iso_timestamps(column):
+    """UTC timestamps as ISO 8601 strings ending in Z, NaT as NaN"""
+    seconds = column.dt.tz_convert(None).to_numpy().astype("datetime64[s]")
+    strings = pd.Series(
+        np.char.add(np.datetime_as_string(seconds, unit="s"), "Z"),
+        index=column.index,
+        dtype=object,
+    )
+
+    return strings.where(column.notna())
+
+
+def glucose_values(column):
+    """Glucose readings as ints, keeping the "Low" and "High" markers as strings"""
+    markers = column.isin(["Low", "High"])
+
+    readings = pd.to_numeric(column[~markers]).astype("int64")
+
+    values = column.astype(object)
+    values[~markers] = pd.Series(readings.tolist(), index=readings.index, dtype=object)
+
+    return values
+
+
+def encode_column(column):
+    """The JSON text of every value in a column, NaN as null"""
+    encoded = {}
+    values = column.astype(object).where(column.notna(), None).tolist()
+
+    for value in values:
+        if value not in encoded:
+            encoded[value] = json.dumps(value)
+
+    return [encoded[value] for value in values]
+
+
+def format_records(df, effective_time_frame, blood_glucose, transmitter_time):
+    """The indented JSON text of every record, the cgm list sits three levels deep"""
+    fields = []
+
+    for column in df.columns:
+        key = " " * 16 + json.dumps(column) + ": "
+
+        if column == "effective_time_frame":
+            # ISO timestamps need no escaping
+            timestamps = [
+                f'"{value}"' if isinstance(value, str) else "null"
+                for value in effective_time_frame.tolist()
+            ]
+            values = [
+                (
+                    "{\n"
+                    + " " * 20
+                    + '"time_interval": {\n'
+                    + " " * 24
+                    + f'"start_date_time": {value},\n'
+                    + " " * 24
+                    + f'"end_date_time": {value}\n'
+                    + " " * 20
+                    + "}\n"
+                    + " " * 16
+                    + "}"
+                )
+                for value in timestamps
+            ]
+        elif column == "blood_glucose":
+            values = [
+                "{\n"
+                + " " * 20
+                + '"unit": "mg/dL",\n'
+                + " " * 20
+                + f'"value": {value}\n'
+                + " " * 16
+                + "}"
+                for value in encode_column(blood_glucose)
+            ]
+        elif column == "transmitter_time":
+            values = [
+                "{\n"
+                + " " * 20
+                + '"unit": "long integer",\n'
+                + " " * 20
+                + f'"value": {value}\n'
+                + " " * 16
+                + "}"
+                for value in transmitter_time.astype(str).tolist()
+            ]
+        else:
+            values = encode_column(df[column])
+
+        fields.append([key + value for value in values])
+
+    return [
+        " " * 12 + "{\n" + ",\n".join(record) + "\n" + " " * 12 + "}"
+        for record in zip(*fields)
+    ]
+
+
+def write_json(path, header, df, effective_time_frame, blood_glucose, transmitter_time):
+    """
+    Write the Open mHealth document, streaming the records in blocks.
+
+    The output is the same text json.dumps(document, indent=4) gives for the nested
+    records, without ever holding the document as Python objects.
+    """
+    if df.empty:
+        document = {"header": header, "body": {"cgm": []}}
+
+        with open(path, "w", encoding="utf-8") as json_file_handler:
+            json_file_handler.write(json.dumps(document, indent=4))
+
+        return
+
+    # Lay out the document around a placeholder record and fill the records in
+    placeholder = 0
+    document = {"header": header, "body": {"cgm": [placeholder]}}
+    prefix, suffix = json.dumps(document, indent=4).split(
+        "\n" + " " * 12 + str(placeholder) + "\n"
+    )
+
+    with open(path, "w", encoding="utf-8") as json_file_handler:
+        json_file_handler.write(prefix + "\n")
+
+        for start in range(0, len(df), WRITE_BLOCK_ROWS):
+            end = start + WRITE_BLOCK_ROWS
+
+            if start:
+                json_file_handler.write(",\n")
+
+            json_file_handler.write(
+                ",\n".join(
+                    format_records(
+                        df.iloc[start:end],
+                        effective_time_frame.iloc[start:end],
+                        blood_glucose.iloc[start:end],
+                        transmitter_time.iloc[start:end],
+                    )
+                )
             )
-    fieldnames = parsed_copy["body"]["cgm"][0].keys()
-
-    with open(
-        output_path.rstrip(".json")
-        + "/"
-        + json_file.rstrip(".json")
-        + "_standard_json_to_csv.csv",
-        "w",
-    ) as json_convert:
-        writer = csv.DictWriter(json_convert, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(parsed_copy["body"]["cgm"])
+
+        json_file_handler.write("\n" + suffix)
+
+
+def qc_values(values):
+    """Values as the QC module compares them, "High" as 401 and "Low" as 69"""
+    return pd.to_numeric(values.replace({"High": 401, "Low": 69})).astype("int64")
+
+
+def write_qc(
+    output_folder,
+    output_name,
+    df,
+    effective_time_frame,
+    blood_glucose,
+    transmitter_time,
+    plots=False,
+):
+    """Write QC_results.txt, and the histograms of the values when plots is set"""
+    # the input columns other than the time and the identifiers
+    input_columns = df.drop(
+        [
+            "effective_time_frame",
+            "event_type",
+            "source_device_id",
+            "transmitter_id",
+        ],
+        axis=1,
+    )
+    output_columns = {
+        "blood_glucose": ("Blood Glucose", blood_glucose),
+        "transmitter_time": ("Transmitter Time", transmitter_time),
+    }
 
     # PERFORM QUALITY CONTROL TESTS#
-    with open(
-        output_path.rstrip(".json") + "/" + "QC_results.txt", "w", encoding="utf-8"
-    ) as f:
+    with open(output_folder + "/" + "QC_results.txt", "w", encoding="utf-8") as f:
         f.write("##QC ON THE INPUT DATAFRAME VALUES##")
         f.write("\n")
         # print out min, max, and hist values of dataframe
         f.write("effective_time_frame START_TIME: ")
-        f.write(QC.df_min(df["effective_time_frame"]))
+        f.write(str(df["effective_time_frame"].min()))
         f.write("\n")
         f.write("effective_time_frame END_TIME: ")
-        f.write(QC.df_max(df["effective_time_frame"]))
+        f.write(str(df["effective_time_frame"].max()))
         f.write("\n")
-        df.drop(
-            [
-                "effective_time_frame",
-                "event_type",
-                "source_device_id",
-                "transmitter_id",
-            ],
-            axis=1,
-            inplace=True,
-        )
-        for column in df.columns:
+        for column in input_columns.columns:
+            values = qc_values(input_columns[column])
             f.write(column)
             f.write(" MIN: ")
-            f.write(QC.df_min(df[column]))
+            f.write(str(values.min()))
             f.write("\n")
             f.write(column)
             f.write(" MAX: ")
-            f.write(QC.df_max(df[column]))
+            f.write(str(values.max()))
             f.write("\n")
-            QC.df_hist(
-                df[column],
-                output_path.rstrip(".json")
-                + "/"
-                + json_file.rstrip(".json")
-                + "_input_"
-                + column,
-            )
-
-        # place all values from relevant JSON dict values in to lists
-        effective_time_frame_list = []
-        blood_glucose_list = []
-        transmitter_time_list = []
-
-        for data in range(len(parsed["body"]["cgm"])):
-            effective_time_frame_list.append(
-                parsed["body"]["cgm"][data]["effective_time_frame"]["time_interval"][
-                    "start_date_time"
-                ]
-            )
-            blood_glucose_list.append(
-                parsed["body"]["cgm"][data]["blood_glucose"]["value"]
-            )
-            transmitter_time_list.append(
-                parsed["body"]["cgm"][data]["transmitter_time"]["value"]
-            )
+            if plots:
+                QC.df_hist(
+                    input_columns[column],
+                    output_folder + "/" + output_name + "_input_" + column,
+                )
 
         f.write("\n\n")
         f.write("##QC ON THE STANDARD JSON DICT VALUES##\n")
         # print out min, max, and hist values of relevant json dict keys
         f.write("effective_time_frame START_TIME: ")
-        f.write(QC.list_min(effective_time_frame_list))
+        f.write(str(effective_time_frame.dropna().min()))
         f.write("\n")
         f.write("effective_time_frame END_TIME: ")
-        f.write(QC.list_max(effective_time_frame_list))
-        f.write("\n")
-        f.write("blood_glucose MIN: ")
-        f.write(QC.list_min(blood_glucose_list))
+        f.write(str(effective_time_frame.dropna().max()))
         f.write("\n")
-        f.write("blood_glucose MAX: ")
-        f.write(QC.list_max(blood_glucose_list))
-        f.write("\n")
-        QC.list_hist(
-            blood_glucose_list,
-            "Blood Glucose",
-            output_path.rstrip(".json") + "/" + json_file.rstrip(".json"),
-        )
-        f.write("transmitter_time MIN: ")
-        f.write(QC.list_min(transmitter_time_list))
-        f.write("\n")
-        f.write("transmitter_time MAX: ")
-        f.write(QC.list_max(transmitter_time_list))
-        QC.list_hist(
-            transmitter_time_list,
-            "Transmitter Time",
-            output_path.rstrip(".json") + "/" + json_file.rstrip(".json"),
-        )
+        for index, (column, (title, values)) in enumerate(output_columns.items()):
+            values = qc_values(values)
+            f.write(column)
+            f.write(" MIN: ")
+            f.write(str(values.min()))
+            f.write("\n")
+            f.write(column)
+            f.write(" MAX: ")
+            f.write(str(values.max()))
+            if index < len(output_columns) - 1:
+                f.write("\n")
+            if plots:
+                QC.list_hist(values.tolist(), title, output_folder + "/" + output_name)
@@ -135,22 +135,30 @@ class CGMManifest:
                         manufacturer = "Dexcom"  # As an example
                         manufacturer_model_name = "G6"  # As an example
 
+                        row = [
+                            participant_id,
+                            glucose_filepath,
+                            num_records,
+                            average_glucose,
+                            len(unique_days),
+                            glucose_sensor_id,
+                            manufacturer,
+                            manufacturer_model_name,
+                        ]
+
                         # Append metadata for CSV
-                        self.output_data.append(
-                            [
-                                participant_id,
-                                glucose_filepath,
-                                num_records,
-                                average_glucose,
-                                len(unique_days),
-                                glucose_sensor_id,
-                                manufacturer,
-                                manufacturer_model_name,
-                            ]
-                        )
+                        self.output_data.append(row)
+
+                        return row
                 except (KeyError, IndexError, json.JSONDecodeError) as e:
                     print(f"Error processing file {file_path}: {e}")
 
+        return None
+
+    def add_entries(self, rows):
+        # Rows recorded by an earlier run
+        self.output_data.extend(rows)
+
     def write_tsv(
         self,
         file_path: str,
@@ -1,4 +1,5 @@
 import pydicom
+from imaging.imaging_conversion_rules import memoize_file, read_references
 
 
 def source_image_sequence(dataset, x):
@@ -279,7 +280,7 @@ def ophthalmic_image_type_code_sequence(dataset, x):
     dataset.OphthalmicImageTypeCodeSequence = ophthalmic_image_type_code_seq
 
 
-def get_reference_coordinates(oct_file):
+def _read_reference_coordinates(oct_file):
     """
     Extract reference coordinates from an OCT (Optical Coherence Tomography) DICOM file.
 
@@ -306,7 +307,7 @@ def get_reference_coordinates(oct_file):
     """
 
     list_coordinates = []
-    a = pydicom.dcmread(oct_file)
+    a = pydicom.dcmread(oct_file, stop_before_pixels=True, specific_tags=["52009230"])
 
     for i in range(len(a["52009230"].value)):
         x = a["52009230"].value[i]["00220031"].value[0]["00220032"].value
@@ -354,6 +355,24 @@ def get_reference_coordinates(oct_file):
     return final_coordinates
 
 
+def get_reference_coordinates(oct_file):
+    """
+    Bounding box [x_min, y_max, x_max, y_min] of an OCT volume, see _read_reference_coordinates.
+
+    Only the per-frame coordinates are read from the file, and the result is memoized
+    for the batch since every en face image of a volume references the same OCT.
+
+    Args:
+        oct_file (str): The path to the OCT DICOM file.
+
+    Returns:
+        list: The bounding box coordinates.
+    """
+    return list(
+        memoize_file(oct_file, "reference_coordinates", _read_reference_coordinates)
+    )
+
+
 def ophthalmic_frame_location_sequence(dataset, x, opt, op):
     """
     Add an Ophthalmic Frame Location Sequence to a DICOM dataset.
@@ -382,13 +401,15 @@ def ophthalmic_frame_location_sequence(dataset, x, opt, op):
         KeyError: If the required DICOM tags are missing or improperly formatted in the input file.
     """
     coordinates = get_reference_coordinates(opt)
-    a = pydicom.dcmread(opt)
-    b = pydicom.dcmread(op)
+    references = read_references(op)[0]
     ophthalmic_image_type_code_seq = pydicom.Sequence()
     ophthalmic_image_type_code_item = pydicom.Dataset()
 
-    ophthalmic_image_type_code_item.ReferencedSOPClassUID = b.SOPClassUID
-    ophthalmic_image_type_code_item.ReferencedSOPInstanceUID = b.SOPInstanceUID
+    sop_class_uid = references["00080016"].value[0]
+    sop_instance_uid = references["00080018"].value[0]
+
+    ophthalmic_image_type_code_item.ReferencedSOPClassUID = sop_class_uid
+    ophthalmic_image_type_code_item.ReferencedSOPInstanceUID = sop_instance_uid
     ophthalmic_image_type_code_item.ReferenceCoordinates = coordinates
     ophthalmic_image_type_code_seq.append(ophthalmic_image_type_code_item)
     dataset.OphthalmicFrameLocationSequence = ophthalmic_image_type_code_seq
@@ -1,5 +1,16 @@
-import os
 import pydicom
+from imaging.imaging_conversion_rules import (
+    BLANK,
+    HARMONIZE,
+    DESIGNATE,
+    ConversionRule,
+    HeaderElement,
+    Element,
+    Sequence,
+    extract_dicom_dict,
+    keyword,
+    write_file_meta,
+)
 import numpy as np
 from PIL import Image
 from cirrus.cirrus_heightmap_converter_functional_groups import (
@@ -11,6 +22,12 @@ from cirrus.cirrus_heightmap_converter_functional_groups import (
     referenced_series_sequence,
 )
 
+# File meta values written instead of the ones of the input files
+FILE_META = {
+    "00020002": "1.2.840.10008.5.1.4.xxxxx.1",
+    "00020010": pydicom.uid.ExplicitVRLittleEndian,
+}
+
 
 class ZeissSegmentationConverter:
     """
@@ -23,13 +40,13 @@ class ZeissSegmentationConverter:
     Attributes:
         segmentation_file (str): The path to the DICOM segmentation file.
         pixel_array (numpy.ndarray): The pixel data array read from the DICOM file.
-        change_indices_dict (dict): A dictionary that stores the indices where transitions
-                                    from 0 to 255 and 255 to 0 occur for each pixel line.
+        change_indices (dict): A dictionary that stores, for each B-scan and A-scan column, the first index
+                               where transitions from 0 to 255 ("0") and 255 to 0 ("1") occur.
         final_array (numpy.ndarray): A 3D array storing the heightmap representation of segmentation data.
 
     Methods:
         read_segmentation_file(): Reads the pixel data from the DICOM file.
-        find_change_indices(): Identifies the indices where pixel values transition
+        find_change_indices(): Identifies the first indices where pixel values transition
                                from 0 to 255 and from 255 to 0 in each B-scan.
         build_final_array(): Builds the final heightmap array based on the identified transition indices.
         zeiss_segmentation_to_heightmap(): Executes the full process to convert the segmentation
@@ -45,7 +62,7 @@ class ZeissSegmentationConverter:
         """
         self.segmentation_file = segmentation_file
         self.pixel_array = None
-        self.change_indices_dict = {}
+        self.change_indices = {}
         self.final_array = None
 
     def read_segmentation_file(self):
@@ -60,36 +77,45 @@ class ZeissSegmentationConverter:
 
     def find_change_indices(self):
         """
-        Identifies the indices where pixel values change from 0 to 255 and from 255 to 0 in each B-scan.
+        Identifies the first index where pixel values change from 0 to 255 and from 255 to 0 in each A-scan.
 
-        The method scans through each pixel row in the B-scans, detects transitions in pixel values
-        from 0 to 255 and from 255 to 0, and stores these indices in the change_indices_dict.
+        The transitions are detected for every B-scan and A-scan column at once by comparing
+        each pixel with the next one along the depth axis. The index of the first transition
+        in each column (0 if the column has none) is stored in change_indices.
 
         Returns:
             None
         """
-        self.change_indices_dict = {
-            a: {"0": {}, "1": {}} for a in range(self.pixel_array.shape[0])
+        pixel_array = self.pixel_array
+        upper = pixel_array[:, 1:, :]
+        lower = pixel_array[:, :-1, :]
+
+        low_before = lower <= 1
+        high_before = lower >= 254
+
+        # (num_slices, depth - 1, num_columns) masks of the transitions
+        rising = low_before & (upper >= 254)
+        falling = high_before & (upper <= 1)
+
+        self.change_indices = {
+            "0": self._first_transition(rising),
+            "1": self._first_transition(falling),
         }
 
-        for a in range(self.pixel_array.shape[0]):
-            for i in range(self.pixel_array.shape[2]):
-                pixel_values = self.pixel_array[a, :, i]
-
-                # Get indices where transitions occur
-                change_indices_0_to_255 = (
-                    np.where((pixel_values[:-1] <= 1) & (pixel_values[1:] >= 254))[0]
-                    + 1
-                )
-                change_indices_255_to_0 = (
-                    np.where((pixel_values[:-1] >= 254) & (pixel_values[1:] <= 1))[0]
-                    + 1
-                )
-
-                if change_indices_0_to_255.size > 0:
-                    self.change_indices_dict[a]["0"][i] = change_indices_0_to_255
-                if change_indices_255_to_0.size > 0:
-                    self.change_indices_dict[a]["1"][i] = change_indices_255_to_0
+    @staticmethod
+    def _first_transition(mask):
+        """
+        Returns the index of the first transition along the depth axis of a transition mask.
+
+        Args:
+            mask (numpy.ndarray): Boolean array of shape (num_slices, depth - 1, num_columns).
+
+        Returns:
+            numpy.ndarray: Array of shape (num_slices, num_columns) holding the first transition
+                           index (shifted by one like the pixel it lands on), or 0 where there is none.
+        """
+        first = mask.argmax(axis=1) + 1
+        return np.where(mask.any(axis=1), first, 0)
 
     def build_final_array(self):
         """
@@ -101,22 +127,9 @@ class ZeissSegmentationConverter:
         Returns:
             None
         """
-        # Initialize the transformed data array
-        self.final_array = np.zeros(
-            (2, self.pixel_array.shape[0], self.pixel_array.shape[2]), dtype=np.float32
-        )
-
-        # Populate the final array using the change_indices_dict
-        for a in range(self.pixel_array.shape[0]):
-            for i in range(self.pixel_array.shape[2]):
-                if i in self.change_indices_dict[a]["0"]:
-                    self.final_array[0, a, i] = float(
-                        self.change_indices_dict[a]["0"][i][0]
-                    )
-                if i in self.change_indices_dict[a]["1"]:
-                    self.final_array[1, a, i] = float(
-                        self.change_indices_dict[a]["1"][i][0]
-                    )
+        self.final_array = np.stack(
+            (self.change_indices["0"], self.change_indices["1"])
+        ).astype(np.float32)
 
     def zeiss_segmentation_to_heightmap(self):
         """
@@ -170,178 +183,6 @@ def get_heightmap_array(seg_file):
     return pixel_array
 
 
-KEEP = 0
-BLANK = 1
-HARMONIZE = 2
-DESIGNATE = 3
-
-
-class ConversionRule:
-    """
-    Represents a conversion rule for processing data.
-
-    This class defines a rule used for data conversion and processing. It contains attributes
-    such as the rule's name, header elements, individual elements, and sequences of elements.
-
-    Attributes:
-        name (str): The name of the conversion rule.
-        header_elements (list): List of Element instances representing header elements.
-        elements (list): List of Element instances representing individual elements.
-        sequences (list): List of Sequence instances representing sequences of elements.
-
-    Methods:
-        header_tags(): Extracts unique tags from header elements.
-        tags(): Extracts unique tags from individual elements.
-        sequence_tags(): Generates a dictionary of sequence tags and associated element tags.
-    """
-
-    def __init__(self, name, header_elements, elements, sequences):
-        """
-        Initialize the ConversionRule class with its name, header elements, elements, and sequences.
-
-        Parameters:
-            name (str): The name of the conversion rule.
-            header_elements (list): List of Element instances representing header elements.
-            elements (list): List of Element instances representing individual elements.
-            sequences (list): List of Sequence instances representing sequences of elements.
-        """
-        self.name = name
-        self.header_elements = header_elements
-        self.elements = elements
-        self.sequences = sequences
-
-    def header_tags(self):
-        """
-        Extracts unique tags from header elements.
-
-        Returns:
-            list: A list of unique tags from the header elements.
-        """
-        headertags = set()
-        for header_element in self.header_elements:
-            headertags.add(header_element.tag)
-        return list(headertags)
-
-    def tags(self):
-        """
-        Extracts unique tags from individual elements.
-
-        Returns:
-            list: A list of unique tags from the individual elements.
-        """
-        tags = set()
-        for element in self.elements:
-            tags.add(element.tag)
-
-        return list(tags)
-
-    def sequence_tags(self):
-        """
-        Generates a dictionary of sequence tags and associated element tags.
-
-        Returns:
-            dict: A dictionary where keys are sequence tags and values are lists of lists of element tags.
-        """
-        tags_dict = {}
-        for sequence in self.sequences:
-            element_lists_tags = []
-            for element_list in sequence.element_lists:
-                element_tags = [element.tag for element in element_list]
-                element_lists_tags.append(element_tags)
-            tags_dict[sequence.tag] = element_lists_tags
-
-        return tags_dict
-
-
-class HeaderElement:
-    """
-    Represents a header element in the system.
-
-    Attributes:
-        name (str): The name of the header element.
-        tag (str): The tag associated with the header element.
-        vr (str): The value representation of the header element.
-    """
-
-    def __init__(self, name, tag, vr):
-        """
-        Initializes a new instance of the HeaderElement class.
-
-        Args:
-            name (str): The name of the header element.
-            tag (str): The tag associated with the header element.
-            vr (str): The value representation of the header element.
-        """
-        self.name = name
-        self.tag = tag
-        self.vr = vr
-
-
-class Element:
-    """
-    Represents an element in the system.
-
-    Attributes:
-        name (str): The name of the element.
-        tag (str): The tag associated with the element.
-        vr (str): The value representation of the element.
-        decision (int): The decision value of the element.
-        harmonized_value (int): The harmonized value of the element.
-        designated_value (int): The designated value of the element.
-    """
-
-    def __init__(
-        self, name, tag, vr, decision=0, harmonized_value=0, designated_value=0
-    ):
-        """
-        Initializes a new instance of the Element class.
-
-        Args:
-            name (str): The name of the element.
-            tag (str): The tag associated with the element.
-            vr (str): The value representation of the element.
-            decision (int, optional): The decision value of the element. Defaults to 0.
-            harmonized_value (int, optional): The harmonized value of the element. Defaults to 0.
-            designated_value (int, optional): The designated value of the element. Defaults to 0.
-        """
-        self.name = name
-        self.tag = tag
-        self.vr = vr
-        self.decision = decision
-        self.harmonized_value = harmonized_value
-        self.designated_value = designated_value
-
-
-class Sequence:
-    """
-    Represents a sequence in the system.
-
-    Attributes:
-        name (str): The name of the sequence.
-        tag (str): The tag associated with the sequence.
-        vr (str): The value representation of the sequence.
-        element_lists (list): A list of element lists in the sequence.
-        sequences (list): A list of sequences contained within this sequence.
-    """
-
-    def __init__(self, name, tag, vr, *element_lists, sequences=None):
-        """
-        Initializes a new instance of the Sequence class.
-
-        Args:
-            name (str): The name of the sequence.
-            tag (str): The tag associated with the sequence.
-            vr (str): The value representation of the sequence.
-            *element_lists: Variable length argument list of element lists.
-            sequences (list, optional): A list of sequences contained within this sequence. Defaults to None.
-        """
-        self.name = name
-        self.tag = tag
-        self.vr = vr
-        self.element_lists = element_lists if element_lists else []
-        self.sequences = sequences if sequences is not None else []
-
-
 class MappingRule:
     """
     Represents a mapping rule in the system.
@@ -619,149 +460,15 @@ oct_b = ConversionRule(
 )
 
 
-def process_tags(tags, dicom):
+def prepare_dataset(dataset):
     """
-    Process DICOM tags and create a structured output.
-
-    This function processes a list of DICOM tags and their values, creating a structured output
-    containing information about each tag and its associated values.
+    Set the values written instead of the ones of the input file.
 
     Args:
-        tags (list): List of DICOM tags to be processed.
-        dicom (dict): Dictionary containing DICOM tag information.
-
-    Returns:
-        dict: A structured output containing processed DICOM tag information.
-    """
-    output = dict()
-    for tag in tags:
-        if tag in dicom:
-            element_name = pydicom.datadict.keyword_for_tag(tag)
-            vr = dicom[tag]["vr"]
-            value = dicom[tag].get("Value", [])
-
-            if not value or not isinstance(value[0], dict):
-                output[tag] = DicomEntry(tag, element_name, vr, value)
-            else:
-                nested_output = []
-                for item in value:
-                    keys_list = list(item.keys())
-                    nested_output.append(process_tags(keys_list, item))
-                output[tag] = DicomEntry(tag, element_name, vr, nested_output)
-    return output
-
-
-class DicomEntry:
+        dataset (pydicom.Dataset): The dataset read from the input file.
     """
-    Represents an entry containing DICOM tag information.
-
-    This class defines an entry containing attributes such as the DICOM tag, its name,
-    value representation (vr), and the associated value.
-
-    Attributes:
-        tag (str): The DICOM tag associated with the entry.
-        name (str): The name of the DICOM tag.
-        vr (str): The value representation of the DICOM tag.
-        value (Any): The value associated with the DICOM tag.
-
-    Methods:
-        is_empty(): Checks if the value of the DICOM entry is empty.
-    """
-
-    def __init__(self, tag, name, vr, value):
-        """
-        Initializes a new instance of the DicomEntry class.
-
-        Args:
-            tag (str): The DICOM tag associated with the entry.
-            name (str): The name of the DICOM tag.
-            vr (str): The value representation of the DICOM tag.
-            value (Any): The value associated with the DICOM tag.
-        """
-        self.tag = tag
-        self.name = name
-        self.vr = vr
-        self.value = value
-
-    def is_empty(self):
-        """
-        Checks if the value of the DICOM entry is empty.
-
-        Returns:
-            bool: True if the value is empty, False otherwise.
-        """
-        return len(self.value) == 0
-
-
-def extract_dicom_dict(file, tags):
-    """
-    Extract DICOM information from a file and create a structured dictionary.
-
-    This function reads a DICOM file, extracts relevant header and data information,
-    and creates a structured dictionary containing header elements, metadata,
-    and processed DICOM tag information.
-
-    Args:
-        file (str): Path to the DICOM file.
-        tags (list): List of DICOM tags to be processed.
-
-    Returns:
-        tuple: A tuple containing the structured dictionary, transfer syntax information,
-               and pixel data of the DICOM file.
-    """
-    if not os.path.exists(file):
-        raise FileNotFoundError(f"File {file} not found.")
-
-    output = dict()
-    output["filepath"] = file
-
-    dataset = pydicom.dcmread(file)
-
     dataset.ImageType = ["DERIVED", "PRIMARY"]
 
-    header_elements = {
-        "00020000": {
-            "vr": "UL",
-            "Value": [dataset.file_meta.FileMetaInformationGroupLength],
-        },
-        "00020001": {
-            "vr": "OB",
-            "Value": [dataset.file_meta.FileMetaInformationVersion],
-        },
-        "00020002": {"vr": "UI", "Value": ["1.2.840.10008.5.1.4.xxxxx.1"]},
-        "00020003": {
-            "vr": "UI",
-            "Value": [dataset.file_meta.MediaStorageSOPInstanceUID],
-        },
-        "00020010": {"vr": "UI", "Value": [pydicom.uid.ExplicitVRLittleEndian]},
-        "00020012": {"vr": "UI", "Value": [dataset.file_meta.ImplementationClassUID]},
-        "00020013": {
-            "vr": "SH",
-            "Value": [dataset.file_meta.ImplementationVersionName],
-        },
-    }
-
-    json_dict = {}
-    json_dict.update(header_elements)
-    info = dataset.to_json_dict()
-
-    patient_name = dataset.PatientName
-    info["00100010"]["Value"] = [patient_name]
-    physician_name = dataset.ReferringPhysicianName
-    info["00080090"]["Value"] = [physician_name]
-
-    json_dict.update(info)
-
-    dicom = json_dict
-
-    output = process_tags(tags, dicom)
-
-    transfersyntax = [dataset.is_little_endian, dataset.is_implicit_VR]
-
-    pixeldata = None  # dataset.FloatPixelData
-
-    return output, transfersyntax, pixeldata
-
 
 def write_dicom(protocol, seg_dic, oct_dic, op_dic, seg_file, oct_file, file_path):
     """
@@ -779,25 +486,12 @@ def write_dicom(protocol, seg_dic, oct_dic, op_dic, seg_file, oct_file, file_pat
         tuple: A tuple containing the structured dictionary, transfer syntax information,
                and pixel data of the DICOM file.
     """
-    headertags = protocol.header_tags()
-    tags = protocol.tags()
-    sequencetags = protocol.sequence_tags()
-
-    file_meta = pydicom.Dataset()
-
-    for headertag in headertags:
-        value = seg_dic[0][headertag].value
-        element_name = pydicom.datadict.keyword_for_tag(seg_dic[0][headertag].tag)
-        setattr(file_meta, element_name, value)
-
     dataset = pydicom.Dataset()
-    dataset.file_meta = file_meta
+    dataset.file_meta = write_file_meta(protocol, seg_dic[0])
     dataset.ImageLaterality = oct_dic[0]["00200062"].value
 
-    for tag in tags:
-        for element in protocol.elements:
-            if element.tag == tag:
-                desired_element = element
+    for tag in protocol.tags():
+        desired_element = protocol.element(tag)
 
         if desired_element.decision == BLANK:
             value = []
@@ -818,12 +512,7 @@ def write_dicom(protocol, seg_dic, oct_dic, op_dic, seg_file, oct_file, file_pat
         else:
             value = []
 
-        element_name = (
-            pydicom.datadict.keyword_for_tag(seg_dic[0][tag].tag)
-            if tag in seg_dic[0]
-            else pydicom.datadict.keyword_for_tag(tag)
-        )
-        setattr(dataset, element_name, value)
+        setattr(dataset, keyword(tag), value)
 
     pixel_array = get_heightmap_array(seg_file)
     dataset.Rows = pixel_array.shape[1]
@@ -844,7 +533,7 @@ def write_dicom(protocol, seg_dic, oct_dic, op_dic, seg_file, oct_file, file_pat
     dimension_organization_sequence(dataset, seg_dic, oct_dic)
     segment_sequence(dataset, seg_dic, oct_dic)
     referenced_series_sequence(dataset, seg_dic, oct_dic, op_dic)
-    pydicom.filewriter.write_file(file_path, dataset, write_like_original=False)
+    pydicom.filewriter.dcmwrite(file_path, dataset, enforce_file_format=True)
 
 
 def convert_dicom(inputseg, inputoct, inputop, output):
@@ -861,25 +550,25 @@ def convert_dicom(inputseg, inputoct, inputop, output):
         output (str): Path to the output DICOM file.
     """
     conversion_rule = heightmap
-    tags = (
-        conversion_rule.header_tags()
-        + conversion_rule.tags()
-        + list(conversion_rule.sequence_tags().keys())
-        + ["52009230", "52009229", "00620002", "00081115", "00209221", "00209222"]
+    tags = conversion_rule.extraction_tags(
+        ["52009230", "52009229", "00620002", "00081115", "00209221", "00209222"]
     )
 
     conversion_rule1 = oct_b
-    tags1 = (
-        conversion_rule1.header_tags()
-        + conversion_rule1.tags()
-        + list(conversion_rule1.sequence_tags().keys())
-        + ["52009230", "52009229", "00620002", "00081115", "00209221", "00209222"]
+    tags1 = conversion_rule1.extraction_tags(
+        ["52009230", "52009229", "00620002", "00081115", "00209221", "00209222"]
     )
-    x = extract_dicom_dict(inputseg, tags)
+    x = extract_dicom_dict(inputseg, tags, prepare_dataset, FILE_META, pixel_data=())
 
-    y = extract_dicom_dict(inputoct, tags1)
+    y = extract_dicom_dict(inputoct, tags1, prepare_dataset, FILE_META, pixel_data=())
 
-    z = extract_dicom_dict(inputop, ["0020000E", "00080016", "00080018"])
+    z = extract_dicom_dict(
+        inputop,
+        ["0020000E", "00080016", "00080018"],
+        prepare_dataset,
+        FILE_META,
+        pixel_data=(),
+    )
 
     filename = inputseg.split("/")[-1]
 
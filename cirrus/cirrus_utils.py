@@ -1,7 +1,7 @@
 import os
 import pydicom
-import shutil
 import imaging.imaging_utils as imaging_utils
+import utils.file_stage as file_stage
 
 
 device_folder_mapping = {
@@ -113,7 +113,7 @@ def format_cirrus_file(file, output):
         os.makedirs(full_dir_path, exist_ok=True)
         filename = os.path.basename(file)
         full_file_path = os.path.join(full_dir_path, filename)
-        shutil.copy(file, full_file_path)
+        file_stage.stage_file(file, full_file_path)
     else:
         # try:
         #     # Check if dataset has pixel data
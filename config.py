@@ -75,3 +75,41 @@ FAIRHUB_SPECTRALIS_LOG_ENDPOINT = get_env(
 )
 FAIRHUB_FLIO_LOG_ENDPOINT = get_env("FAIRHUB_FLIO_LOG_ENDPOINT", optional=True)
 FAIRHUB_CIRRUS_LOG_ENDPOINT = get_env("FAIRHUB_CIRRUS_LOG_ENDPOINT", optional=True)
+
+# Logwatch transport tuning
+FAIRHUB_LOG_QUEUE_SIZE = get_env("FAIRHUB_LOG_QUEUE_SIZE", optional=True)
+FAIRHUB_LOG_BATCH_SIZE = get_env("FAIRHUB_LOG_BATCH_SIZE", optional=True)
+FAIRHUB_LOG_FLUSH_INTERVAL = get_env("FAIRHUB_LOG_FLUSH_INTERVAL", optional=True)
+FAIRHUB_LOG_DROP_POLICY = get_env("FAIRHUB_LOG_DROP_POLICY", optional=True)
+FAIRHUB_LOG_PAYLOAD = get_env("FAIRHUB_LOG_PAYLOAD", optional=True)
+
+# Output upload tuning
+FAIRHUB_UPLOAD_MAX_CONCURRENCY = get_env(
+    "FAIRHUB_UPLOAD_MAX_CONCURRENCY", optional=True
+)
+FAIRHUB_UPLOAD_MAX_IN_FLIGHT_MB = get_env(
+    "FAIRHUB_UPLOAD_MAX_IN_FLIGHT_MB", optional=True
+)
+FAIRHUB_UPLOAD_CHUNK_SIZE_MB = get_env("FAIRHUB_UPLOAD_CHUNK_SIZE_MB", optional=True)
+FAIRHUB_UPLOAD_MAX_ATTEMPTS = get_env("FAIRHUB_UPLOAD_MAX_ATTEMPTS", optional=True)
+
+# Input download tuning
+FAIRHUB_DOWNLOAD_MAX_CONCURRENCY = get_env(
+    "FAIRHUB_DOWNLOAD_MAX_CONCURRENCY", optional=True
+)
+FAIRHUB_DOWNLOAD_MAX_IN_FLIGHT_MB = get_env(
+    "FAIRHUB_DOWNLOAD_MAX_IN_FLIGHT_MB", optional=True
+)
+FAIRHUB_DOWNLOAD_CHUNK_SIZE_MB = get_env(
+    "FAIRHUB_DOWNLOAD_CHUNK_SIZE_MB", optional=True
+)
+
+# Work queue ordering, "size" (largest inputs first) or "listing"
+FAIRHUB_WORK_QUEUE_ORDER = get_env("FAIRHUB_WORK_QUEUE_ORDER", optional=True)
+
+# Pixel data check of the imaging format step, "structural" or "strict" (full decode)
+FAIRHUB_FORMAT_PIXEL_CHECK = get_env("FAIRHUB_FORMAT_PIXEL_CHECK", optional=True)
+
+# How the imaging steps pass files to the next step folder, "link" (hardlink or
+# reflink, copy when neither works), "reflink" (reflink or copy) or "copy"
+FAIRHUB_FILE_STAGE_MODE = get_env("FAIRHUB_FILE_STAGE_MODE", optional=True)
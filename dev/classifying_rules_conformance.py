@@ -0,0 +1,190 @@
+"""
+Conformance check for the compiled classification rule index.
+
+Builds synthetic DICOM entries from random combinations of the values the rules test
+(devices, SOP class UIDs, file names, slice thicknesses, frame counts, dimensions and
+the Spectralis series descriptions, gaze and private tags) and verifies that
+find_rule's indexed dispatch picks the same rule as the linear walk over the rule
+list. Any DICOM files under the given folders are checked as well. Timings for both
+evaluators are printed.
+
+Usage:
+    python -m dev.classifying_rules_conformance
+    python -m dev.classifying_rules_conformance --samples 1000000 --seed 7
+    python -m dev.classifying_rules_conformance path/to/dicom/folder
+"""
+
+import argparse
+import os
+import random
+import time
+
+import imaging.imaging_classifying_rules as imaging_classifying_rules
+from imaging.imaging_classifying_rules import DicomEntry
+
+DEVICES = ["3DOCT-1Maestro2", "Triton plus", "Spectralis", "Aurora", "Eidon FA", "N/A"]
+FILENAMES = [
+    "scan.4.1.dcm",
+    "scan.2.1.dcm",
+    "scan.1.1.dcm",
+    "0-infrared.dcm",
+    "0-AF-blue.dcm",
+    "0-visible.dcm",
+    "3-visible.dcm",
+    "4-visible.dcm",
+    "11-visible.dcm",
+    "12345678",
+]
+SLICE_THICKNESSES = [0, 0.01, 0.025, 0.04, 0.07, 0.035]
+DIMENSIONS = [(496, 768), (496, 1536), (496, 512), (496, 384), (768, 768), (1536, 1536)]
+DIMENSIONS += [(512, 512), "N/A"]
+FRAME_NUMBERS = [27, 61, 512, 384, "N/A"]
+SERIES_DESCRIPTIONS = ["IR", "Volume IR", "N/A"]
+GAZES = ["Primary gaze", "N/A"]
+PRIVATE_TAGS = ["N/A", "Super Slim"]
+FILESIZES = [0.5, 3, 50, 250]
+ERRORS = ["no", "no laterality: scan.dcm"]
+
+
+def sopclassuids():
+    uids = {"1.2.840.10008.5.1.4.1.1.66.4", "1.2.840.10008.5.1.4.1.1.77.1.5.10"}
+    uids |= {"nosopclassuid", "1.2.3.4"}
+
+    for rule in imaging_classifying_rules.rules:
+        uids |= {rule.sopclassuid, rule.sopclassuid_prefix}
+
+    uids.discard(None)
+    return sorted(uids)
+
+
+def synthetic_entries(samples, seed):
+    # The full product of the values is far too large, a seeded sample of it is used
+    rng = random.Random(seed)
+    values = [
+        DEVICES,
+        sopclassuids(),
+        FILENAMES,
+        SLICE_THICKNESSES,
+        DIMENSIONS,
+        FRAME_NUMBERS,
+        SERIES_DESCRIPTIONS,
+        GAZES,
+        PRIVATE_TAGS,
+        FILESIZES,
+        ERRORS,
+    ]
+
+    for _ in range(samples):
+        (
+            device,
+            sopclassuid,
+            filename,
+            slicethickness,
+            dimensions,
+            framenumber,
+            seriesdescription,
+            gaze,
+            privatetag,
+            filesize,
+            error,
+        ) = [rng.choice(choices) for choices in values]
+        rows, columns = dimensions if dimensions != "N/A" else ("N/A", "N/A")
+
+        yield DicomEntry(
+            filename,
+            filesize,
+            "1001",
+            sopclassuid,
+            "1.2.3.4.5",
+            "L",
+            rows,
+            columns,
+            device,
+            framenumber,
+            "N/A",
+            slicethickness,
+            privatetag,
+            "N/A",
+            "N/A",
+            seriesdescription,
+            "N/A",
+            gaze,
+            "1.2.3.4.6",
+            error,
+            "no name",
+        )
+
+
+def folder_entries(folders):
+    for folder in folders:
+        for root, _, files in os.walk(folder):
+            for name in files:
+                file = os.path.join(root, name)
+
+                if not (file.endswith(".dcm") or file[-8:].isdigit()):
+                    continue
+                if not imaging_classifying_rules.is_dicom_file(file):
+                    continue
+
+                # Files find_rule could not classify either are left out
+                try:
+                    entry = imaging_classifying_rules.extract_dicom_entry(file)
+                except Exception:
+                    continue
+
+                yield entry
+
+
+def time_evaluator(classify, entries):
+    start = time.perf_counter()
+
+    for entry in entries:
+        try:
+            classify(entry)
+        except Exception:
+            pass
+
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("folders", nargs="*", help="Folders of DICOM files to check")
+    parser.add_argument("--samples", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    failures = 0
+
+    for name, entries in [
+        ("synthetic", list(synthetic_entries(args.samples, args.seed))),
+        ("folders", list(folder_entries(args.folders))),
+    ]:
+        if not entries:
+            continue
+
+        mismatches = imaging_classifying_rules.check_rule_index(entries)
+        linear_time = time_evaluator(
+            imaging_classifying_rules.find_rule_linear, entries
+        )
+        index_time = time_evaluator(
+            imaging_classifying_rules.rule_index.classify, entries
+        )
+
+        for entry, linear, indexed in mismatches[:10]:
+            print(f"  {entry.device} {entry.sopclassuid} {entry.filename}: ", end="")
+            print(f"linear {linear}, indexed {indexed}")
+
+        failures += len(mismatches)
+
+        print(
+            f"{name}: {len(entries)} entries, {len(mismatches)} mismatches | "
+            f"linear {linear_time:.3f}s, indexed {index_time:.3f}s"
+        )
+
+    if failures:
+        raise SystemExit(f"{failures} entries classified differently by the index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Conformance check for the ECG waveform decoder against sierraecg.read_file.
+
+ecg_utils.read_ecg_waveforms decodes the leads from the dict the metadata was parsed from
+and calls the helpers of sierraecg's lib and xli modules, which are not part of its public
+API (hence the pin in requirements.txt). This builds synthetic PageWriter TC30 files (see
+dev/synthetic_data.py) in every layout the decoder handles: uncompressed and XLI
+compressed waveforms, with and without the leadlabels attribute, and verifies that both
+give the same document type and version, labels, sampling rates, durations and samples.
+Any ECG .xml files given are checked as well. Timings for both readers are printed.
+
+Usage:
+    python -m dev.ecg_reader_conformance
+    python -m dev.ecg_reader_conformance --samples 50 --seed 7
+    python -m dev.ecg_reader_conformance path/to/1001_ecg.xml
+"""
+
+import argparse
+import base64
+import os
+import re
+import tempfile
+import time
+from unittest import mock
+
+import numpy as np
+import sierraecg
+import sierraecg.lib
+
+import ecg.ecg_utils as ecg_utils
+from dev import synthetic_data
+
+LZW_BITS = 10
+
+SPLIT_LEADS = sierraecg.lib.split_leads
+
+
+def lzw_encode(data, bits=LZW_BITS):
+    """LZW with fixed width codes packed most significant bit first, as XLI stores it"""
+    max_code = (1 << bits) - 2
+    strings = {bytes([code]): code for code in range(256)}
+    next_code = 256
+    codes = []
+
+    current = b""
+    for byte in data:
+        extended = current + bytes([byte])
+        if extended in strings:
+            current = extended
+            continue
+
+        codes.append(strings[current])
+        if next_code <= max_code:
+            strings[extended] = next_code
+            next_code += 1
+        current = bytes([byte])
+
+    if current:
+        codes.append(strings[current])
+
+    packed = 0
+    for code in codes:
+        packed = (packed << bits) | code
+
+    padding = -len(codes) * bits % 8
+    return (packed << padding).to_bytes((len(codes) * bits + padding) // 8, "big")
+
+
+def xli_encode(leads):
+    """
+    XLI compress the leads: each is stored as second differences offset by 64, with the
+    high bytes ahead of the low bytes, and LZW compressed behind an 8 byte chunk header.
+    """
+    data = b""
+
+    for samples in leads:
+        samples = [int(sample) for sample in samples]
+
+        deltas = samples[:2]
+        for index in range(2, len(samples) - 1):
+            deltas.append(
+                2 * samples[index] - samples[index - 1] - samples[index + 1] + 64
+            )
+        deltas.append(0)
+
+        packed = np.array(deltas, dtype=">i2").tobytes()
+        chunk = lzw_encode(packed[0::2] + packed[1::2])
+        start = 2 * samples[1] - samples[0] - samples[2]
+
+        data += (
+            len(chunk).to_bytes(4, "little")
+            + bytes(2)
+            + start.to_bytes(2, "little", signed=True)
+            + chunk
+        )
+
+    return data
+
+
+def make_ecg_xml(seed, compressed, labelled):
+    """A synthetic ECG with its waveforms in the given layout, and its leads as stored"""
+    xml = synthetic_data.make_ecg_xml("1001", seconds=1 + seed % 10, seed=seed).decode(
+        "latin-1"
+    )
+
+    match = re.search(r"(<parsedwaveforms [^>]*>)\s*([^<]*?)\s*</parsedwaveforms>", xml)
+    tag, encoded = match.groups()
+
+    leads = np.frombuffer(base64.b64decode(encoded), dtype="<i2").reshape(12, -1)
+
+    if compressed:
+        # A random walk keeps the second differences in the range real leads have
+        rng = np.random.default_rng(seed)
+        leads = np.cumsum(rng.integers(-4, 5, size=leads.shape), axis=1).astype("<i2")
+        tag = tag.replace('compression="Uncompressed"', 'compressmethod="XLI"')
+        encoded = base64.b64encode(xli_encode(leads)).decode()
+
+    if not labelled:
+        tag = re.sub(r' leadlabels="[^"]*"', "", tag)
+
+    xml = (
+        xml[: match.start()]
+        + f"{tag}\n{encoded}\n</parsedwaveforms>"
+        + xml[match.end() :]
+    )
+
+    return xml.encode("latin-1"), leads
+
+
+def writable_split_leads(waveform_data, lead_count, samples):
+    return [lead.copy() for lead in SPLIT_LEADS(waveform_data, lead_count, samples)]
+
+
+def read_both(path):
+    # read_file derives the limb leads in place, which fails on the read-only views
+    # split_leads returns for uncompressed waveforms, so those are copied first
+    start = time.perf_counter()
+    with mock.patch.object(sierraecg.lib, "split_leads", writable_split_leads):
+        expected = sierraecg.read_file(path)
+    sierraecg_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = ecg_utils.read_ecg_waveforms(ecg_utils.parse_ecg_xml(path))
+    decoder_time = time.perf_counter() - start
+
+    return expected, actual, (sierraecg_time, decoder_time)
+
+
+def differences(expected, actual):
+    found = []
+
+    for field in ("doc_type", "doc_ver"):
+        if getattr(expected, field) != getattr(actual, field):
+            found.append(field)
+
+    if len(expected.leads) != len(actual.leads):
+        return found + ["lead count"]
+
+    for expected_lead, actual_lead in zip(expected.leads, actual.leads):
+        for field in ("label", "sampling_freq", "duration"):
+            if getattr(expected_lead, field) != getattr(actual_lead, field):
+                found.append(f"{expected_lead.label} {field}")
+
+        if not np.array_equal(
+            np.asarray(expected_lead.samples, dtype=np.int16),
+            np.asarray(actual_lead.samples, dtype=np.int16),
+        ):
+            found.append(f"{expected_lead.label} samples")
+
+    return found
+
+
+def check_file(path, label):
+    expected, actual, timing = read_both(path)
+    found = differences(expected, actual)
+
+    if found:
+        print(f"  {label}: {', '.join(found)} differ")
+
+    return int(bool(found)), timing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("files", nargs="*", help="ECG .xml files to check")
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    failures = 0
+    timing = [0.0, 0.0]
+
+    with tempfile.TemporaryDirectory() as work:
+        for sample in range(args.samples):
+            seed = args.seed + sample
+
+            for compressed in (False, True):
+                for labelled in (True, False):
+                    label = (
+                        f"sample {sample} "
+                        f"{'XLI' if compressed else 'uncompressed'}"
+                        f"{'' if labelled else ' without lead labels'}"
+                    )
+                    xml, leads = make_ecg_xml(seed, compressed, labelled)
+
+                    path = os.path.join(work, f"{seed}.xml")
+                    with open(path, "wb") as f:
+                        f.write(xml)
+
+                    # The stored leads I, II and V1-V6 come back unchanged
+                    stored = ecg_utils.read_ecg_waveforms(ecg_utils.parse_ecg_xml(path))
+                    if not all(
+                        np.array_equal(stored.leads[index].samples, leads[index])
+                        for index in (0, 1, *range(6, 12))
+                    ):
+                        failures += 1
+                        print(f"  {label}: stored leads do not round trip")
+
+                    file_failures, file_timing = check_file(path, label)
+                    failures += file_failures
+                    timing = [total + t for total, t in zip(timing, file_timing)]
+
+    for path in args.files:
+        file_failures, file_timing = check_file(path, path)
+        failures += file_failures
+        timing = [total + t for total, t in zip(timing, file_timing)]
+
+    print(
+        f"sierraecg {sierraecg.__version__}: {args.samples * 4} samples, "
+        f"{len(args.files)} files, {failures} mismatches | "
+        f"read_file {timing[0]:.3f}s, read_ecg_waveforms {timing[1]:.3f}s"
+    )
+
+    if failures:
+        raise SystemExit(f"{failures} checks failed against sierraecg {sierraecg.__version__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Conformance check for the columnar environmental sensor csv reader.
+
+Builds synthetic env sensor deployments, damages their lines at random (truncated and
+overlong rows, broken and out of order timestamps, stray header and column lines,
+whitespace, CRLF line ends, non-ASCII and undecodable bytes, blank lines) and verifies
+that read_files gives the same headers, column names, rows, errors and counts with
+read_csvs_columnar as with the line by line read_single_csv, and that find_short_run
+finds the same chops on both. Any env sensor folders given are checked as well.
+Timings for both readers are printed.
+
+Usage:
+    python -m dev.es_reader_conformance
+    python -m dev.es_reader_conformance --samples 200 --seed 7
+    python -m dev.es_reader_conformance path/to/ENV-1001-011
+"""
+
+import argparse
+import io
+import logging
+import os
+import random
+import tempfile
+import time
+import zipfile
+from datetime import timedelta
+
+import env_sensor.es_utils as es_utils
+from dev import synthetic_data
+
+
+def damage_line(rng, lines, index):
+    line = lines[index]
+    kind = rng.randrange(12 if rng.random() < 0.05 else 10)
+
+    if kind == 0:  # truncated row
+        return line[: rng.randrange(len(line) + 1)]
+    if kind == 1:  # overlong row
+        return line + b"," * rng.randrange(100, 200)
+    if kind == 2:  # timestamp of an earlier or the same row
+        return lines[rng.randrange(max(index, 1))][:19] + line[19:]
+    if kind == 3:  # broken timestamp character
+        position = rng.randrange(19)
+        return line[:position] + bytes([rng.choice(b"0123459:- xT")]) + line[19:]
+    if kind == 4:  # whitespace around the row
+        return rng.choice([b" ", b"\t", b""]) + line + rng.choice([b" ", b"\r", b""])
+    if kind == 5:  # extra or missing field
+        return rng.choice([line + b",0", line.rsplit(b",", 1)[0]])
+    if kind == 6:  # stray header or column line
+        return rng.choice([b"; Version: 1.2.5", b"; SEN55 0000", b"# note", b"ts,x"])
+    if kind == 7:  # unpadded timestamp, accepted by strptime
+        return line[:5] + line[5:7].lstrip(b"0") + line[7:]
+    if kind == 8:  # non-ASCII or undecodable byte
+        return line[:30] + rng.choice([b"\xc3\xa9", b"\xf1"]) + line[30:]
+    if kind == 9:  # lone carriage return
+        return line[:60] + b"\r" + line[60:]
+    if kind == 10:  # blank line
+        return b""
+    return None  # dropped line
+
+
+def damaged_files(seed, hours):
+    rng = random.Random(seed)
+    data = synthetic_data.make_env_sensor_zip(
+        "1001", "C796DB182B49FC0C", "2024-03-04", hours=hours, seed=seed
+    )
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        files = {name: archive.read(name) for name in sorted(archive.namelist())}
+
+    for name, content in files.items():
+        lines = content.split(b"\n")
+
+        # Most files are left clean or get only a few damaged lines
+        for _ in range(rng.choice([0, 0, 1, 2, 5, 20])):
+            index = rng.randrange(len(lines))
+            damaged = damage_line(rng, lines, index)
+
+            if damaged is None:
+                del lines[index]
+            else:
+                lines[index] = damaged
+
+        content = b"\n".join(lines)
+        if rng.random() < 0.1:
+            content = content.replace(b"\n", b"\r\n")
+        if rng.random() < 0.1:
+            content = content.rstrip(b"\n")
+
+        files[name] = content
+
+    return files
+
+
+def read_both(file_list, filter_level):
+    results = []
+    times = []
+
+    for columnar in (False, True):
+        start = time.perf_counter()
+
+        try:
+            result = es_utils.read_files(file_list, filter_level, columnar=columnar)
+        except Exception as e:
+            result = type(e).__name__
+        else:
+            result = result[:2] + (list(result[2]),) + result[3:]
+
+        times.append(time.perf_counter() - start)
+        results.append(result)
+
+    return results, times
+
+
+def check_short_runs(file_list):
+    # Chops as pipeline_filter_visit_dates makes them, on the rows of both readers
+    data_list = es_utils.read_files(file_list, 0, columnar=False)[2]
+    data_rows = es_utils.read_files(file_list, 0, columnar=True)[2]
+    mismatches = 0
+
+    for start in range(0, min(len(data_list), 2000), 97):
+        for gap in (5, 30, 600):
+            found = es_utils.find_short_run(
+                data_list[start:], timedelta(seconds=gap), max_lines=360
+            )
+            found_rows = es_utils.find_short_run(
+                data_rows[start:], timedelta(seconds=gap), max_lines=360
+            )
+            mismatches += found != found_rows
+
+    return mismatches
+
+
+def check_folder(folder, label):
+    file_list = sorted(
+        os.path.join(folder, name)
+        for name in os.listdir(folder)
+        if name.endswith(".csv")
+    )
+    failures = 0
+    timing = [0.0, 0.0]
+
+    for filter_level in (0, 1):
+        (lines, columnar), times = read_both(file_list, filter_level)
+        timing = [total + t for total, t in zip(timing, times)]
+
+        if lines != columnar:
+            failures += 1
+            print(f"  {label} filter_level {filter_level}: readers differ")
+
+    if not isinstance(lines, str):
+        short_runs = check_short_runs(file_list)
+        if short_runs:
+            failures += 1
+            print(f"  {label}: {short_runs} find_short_run results differ")
+
+    return failures, timing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("folders", nargs="*", help="Env sensor folders to check")
+    parser.add_argument("--samples", type=int, default=50)
+    parser.add_argument("--hours", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # The readers log every damaged line
+    logging.disable(logging.CRITICAL)
+
+    failures = 0
+    timing = [0.0, 0.0]
+
+    with tempfile.TemporaryDirectory() as work:
+        for sample in range(args.samples):
+            folder = os.path.join(work, str(sample))
+            os.makedirs(folder)
+
+            for name, content in damaged_files(args.seed + sample, args.hours).items():
+                with open(os.path.join(folder, name), "wb") as f:
+                    f.write(content)
+
+            sample_failures, sample_timing = check_folder(folder, f"sample {sample}")
+            failures += sample_failures
+            timing = [total + t for total, t in zip(timing, sample_timing)]
+
+    for folder in args.folders:
+        folder_failures, folder_timing = check_folder(folder, folder)
+        failures += folder_failures
+        timing = [total + t for total, t in zip(timing, folder_timing)]
+
+    print(
+        f"{args.samples} samples, {len(args.folders)} folders, {failures} mismatches | "
+        f"read_single_csv {timing[0]:.3f}s, read_csvs_columnar {timing[1]:.3f}s"
+    )
+
+    if failures:
+        raise SystemExit(f"{failures} checks read differently by the columnar reader")
+
+
+if __name__ == "__main__":
+    main()
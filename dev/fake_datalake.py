@@ -0,0 +1,639 @@
+"""
+Filesystem backed fake of the Azure Data Lake clients used by the pipelines.
+
+Every file system (container) is a folder under the fake's root and every path in it is a
+plain file or folder, so a pipeline can be pointed at synthetic data without production
+storage. Each request sleeps for a fixed latency and every transferred byte is throttled to
+the configured bandwidth, which keeps the number and size of round trips visible in
+benchmarks. The calls made and the bytes moved are counted in FakeDataLake.stats.
+
+Only the calls the pipelines make are implemented: FileSystemClient.get_paths,
+get_file_client, get_directory_client, create_directory, delete_directory, delete_file and
+exists; the file client download, upload, append/flush, property and metadata calls; and the
+directory client create, delete, rename and property calls.
+
+Usage:
+    from dev.fake_datalake import FakeDataLake
+
+    lake = FakeDataLake("/tmp/lake", latency=0.02, bandwidth=50 * 1024 * 1024)
+    lake.write_file("stage-1-container", "AI-READI/pooled-data/ECG/x.xml", data)
+
+    with lake.patch():
+        ecg_pipeline.pipeline("AI-READI")
+
+    print(lake.stats)
+"""
+
+import collections
+import contextlib
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest import mock
+
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    ResourceExistsError,
+    ResourceModifiedError,
+    ResourceNotFoundError,
+    ServiceResponseError,
+)
+from azure.storage.filedatalake import FileSystemClient
+
+# Size of the pieces StorageStreamDownloader.chunks() yields
+DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Number of entries returned by one get_paths page (the service default)
+PATHS_PAGE_SIZE = 5000
+
+
+class FakeDataLake:
+    """Shared state of the fake: the root folder, the transfer model and the counters"""
+
+    def __init__(
+        self,
+        root: str,
+        latency: float = 0.0,
+        bandwidth: float = None,
+        upload_failure_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        """
+        Args:
+            root (str): Local folder that holds one sub folder per file system.
+            latency (float): Seconds added to every request.
+            bandwidth (float): Bytes per second of each upload or download, None for unlimited.
+            upload_failure_rate (float): Fraction of upload_data calls that fail with a
+                transient error before writing anything, to exercise retries.
+            seed (int): Seed for the injected failures.
+        """
+        self.root = root
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.upload_failure_rate = upload_failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        # (file_system_name, path) -> user metadata of the file or folder
+        self.metadata = {}
+        self.stats = collections.Counter()
+
+        os.makedirs(root, exist_ok=True)
+
+    def local_path(self, file_system_name: str, path: str = "") -> str:
+        """Return the local path that backs a path of a file system"""
+        path = normalize_path(path)
+
+        if path:
+            return os.path.join(self.root, file_system_name, *path.split("/"))
+
+        return os.path.join(self.root, file_system_name)
+
+    def get_file_system_client(self, file_system_name: str):
+        """Return a client for a file system, creating its folder if needed"""
+        os.makedirs(self.local_path(file_system_name), exist_ok=True)
+
+        return FakeFileSystemClient(self, file_system_name)
+
+    def write_file(self, file_system_name: str, path: str, data: bytes):
+        """Seed a file without going through the transfer model or the counters"""
+        local_path = self.local_path(file_system_name, path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+
+        with open(local_path, "wb") as f:
+            f.write(data)
+
+    def request(self, operation: str):
+        """Count a request and wait for its round trip"""
+        with self.lock:
+            self.stats[operation] += 1
+
+        if self.latency:
+            time.sleep(self.latency)
+
+    def maybe_fail(self, operation: str):
+        """Raise a transient error for the configured fraction of calls"""
+        with self.lock:
+            failed = self.random.random() < self.upload_failure_rate
+
+            if failed:
+                self.stats[f"{operation}_failures"] += 1
+
+        if failed:
+            raise ServiceResponseError(f"Injected {operation} failure")
+
+    def transfer(self, direction: str, nbytes: int):
+        """Count transferred bytes and wait for them at the configured bandwidth"""
+        with self.lock:
+            self.stats[f"bytes_{direction}"] += nbytes
+
+        if self.bandwidth and nbytes:
+            time.sleep(nbytes / self.bandwidth)
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats.clear()
+
+    @contextlib.contextmanager
+    def patch(self):
+        """
+        Route FileSystemClient.from_connection_string to this fake.
+
+        The connection string is ignored and the requested file system is served from the
+        fake's root. Processes forked while the patch is active inherit it.
+        """
+
+        def from_connection_string(conn_str, file_system_name, **kwargs):
+            return self.get_file_system_client(file_system_name)
+
+        with mock.patch.object(
+            FileSystemClient,
+            "from_connection_string",
+            staticmethod(from_connection_string),
+        ):
+            yield self
+
+
+def normalize_path(path) -> str:
+    """Return a path (or anything with a name, like PathProperties) without slashes around it"""
+    path = getattr(path, "name", path) or ""
+
+    return str(path).replace("\\", "/").strip("/")
+
+
+class PathProperties:
+    """One entry returned by get_paths"""
+
+    def __init__(self, name, is_directory, last_modified, content_length, etag):
+        self.name = name
+        self.is_directory = is_directory
+        self.last_modified = last_modified
+        self.content_length = content_length
+        self.etag = etag
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+
+class FileProperties(PathProperties):
+    """Properties returned by get_file_properties and get_directory_properties"""
+
+    def __init__(self, name, is_directory, last_modified, content_length, etag, metadata):
+        super().__init__(name, is_directory, last_modified, content_length, etag)
+        self.size = content_length
+        self.metadata = metadata
+        self.creation_time = last_modified
+        self.content_settings = SimpleNamespace(
+            content_type=None if is_directory else "application/octet-stream",
+            content_md5=None,
+        )
+
+
+class StorageStreamDownloader:
+    """Result of download_file; the bytes are only transferred when they are read"""
+
+    def __init__(self, lake, local_path, properties, offset=None, length=None):
+        self.lake = lake
+        self.local_path = local_path
+        self.properties = properties
+        self.name = properties.name
+
+        total = properties.size
+        self.offset = min(offset or 0, total)
+        end = total if length is None else min(self.offset + length, total)
+        self.size = end - self.offset
+
+    def chunks(self):
+        """Yield the content in pieces of DOWNLOAD_CHUNK_SIZE bytes"""
+        remaining = self.size
+
+        with open(self.local_path, "rb") as f:
+            f.seek(self.offset)
+
+            while remaining > 0:
+                chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+
+                if not chunk:
+                    break
+
+                remaining -= len(chunk)
+                self.lake.transfer("downloaded", len(chunk))
+
+                yield chunk
+
+    def readall(self) -> bytes:
+        return b"".join(self.chunks())
+
+    def readinto(self, stream) -> int:
+        written = 0
+
+        for chunk in self.chunks():
+            stream.write(chunk)
+            written += len(chunk)
+
+        return written
+
+    def content_as_bytes(self) -> bytes:
+        return self.readall()
+
+
+class _PathClient:
+    """Behaviour shared by the file and directory clients"""
+
+    def __init__(self, lake, file_system_name, path):
+        self.lake = lake
+        self.file_system_name = file_system_name
+        self.path_name = normalize_path(path)
+        self.local_path = lake.local_path(file_system_name, self.path_name)
+
+    def exists(self) -> bool:
+        self.lake.request("exists")
+
+        return os.path.exists(self.local_path)
+
+    def set_metadata(self, metadata=None, **kwargs):
+        self.lake.request("set_metadata")
+        self._assert_exists()
+
+        with self.lake.lock:
+            self.lake.metadata[(self.file_system_name, self.path_name)] = dict(
+                metadata or {}
+            )
+
+    def _assert_exists(self):
+        if not os.path.exists(self.local_path):
+            raise ResourceNotFoundError(
+                f"The specified path does not exist: {self.file_system_name}/{self.path_name}"
+            )
+
+    def _properties(self) -> FileProperties:
+        self._assert_exists()
+
+        return _path_properties(
+            self.lake, self.file_system_name, self.path_name, self.local_path, True
+        )
+
+    def _forget_metadata(self):
+        prefix = f"{self.path_name}/"
+
+        with self.lake.lock:
+            for key in list(self.lake.metadata):
+                if key[0] == self.file_system_name and (
+                    key[1] == self.path_name or key[1].startswith(prefix)
+                ):
+                    del self.lake.metadata[key]
+
+    def _rename_to(self, new_name, client_class):
+        # new_name is "<file system>/<path>", as the SDK expects
+        file_system_name, _, new_path = normalize_path(new_name).partition("/")
+        self._assert_exists()
+
+        destination = self.lake.local_path(file_system_name, new_path)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.replace(self.local_path, destination)
+        self._forget_metadata()
+
+        return client_class(self.lake, file_system_name, new_path)
+
+
+class FakeFileClient(_PathClient):
+    """Fake of DataLakeFileClient"""
+
+    def get_file_properties(self, **kwargs) -> FileProperties:
+        self.lake.request("get_file_properties")
+
+        return self._properties()
+
+    def download_file(
+        self, offset=None, length=None, etag=None, match_condition=None, **kwargs
+    ):
+        self.lake.request("download_file")
+
+        if not os.path.isfile(self.local_path):
+            raise ResourceNotFoundError(
+                f"The specified path does not exist: {self.file_system_name}/{self.path_name}"
+            )
+
+        properties = self._properties()
+
+        if match_condition == MatchConditions.IfNotModified and etag != properties.etag:
+            raise ResourceModifiedError(
+                f"The condition specified using HTTP conditional header(s) is not met: "
+                f"{self.file_system_name}/{self.path_name}"
+            )
+
+        return StorageStreamDownloader(
+            self.lake, self.local_path, properties, offset, length
+        )
+
+    def upload_data(self, data, length=None, overwrite=False, metadata=None, **kwargs):
+        self.lake.request("upload_data")
+        self.lake.maybe_fail("upload_data")
+
+        if not overwrite and os.path.exists(self.local_path):
+            raise ResourceExistsError(
+                f"The specified path already exists: {self.file_system_name}/{self.path_name}"
+            )
+
+        os.makedirs(os.path.dirname(self.local_path), exist_ok=True)
+
+        # Written next to the target and swapped in, so readers never see half a file
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.local_path))
+
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in _iter_upload_data(data, length):
+                    self.lake.transfer("uploaded", len(chunk))
+                    f.write(chunk)
+
+            os.replace(temp_path, self.local_path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(temp_path)
+            raise
+
+        with self.lake.lock:
+            self.lake.metadata[(self.file_system_name, self.path_name)] = dict(
+                metadata or {}
+            )
+
+        return {"etag": _etag(os.stat(self.local_path))}
+
+    def create_file(self, metadata=None, **kwargs):
+        self.lake.request("create_file")
+
+        os.makedirs(os.path.dirname(self.local_path), exist_ok=True)
+        open(self.local_path, "wb").close()
+
+        with self.lake.lock:
+            self.lake.metadata[(self.file_system_name, self.path_name)] = dict(
+                metadata or {}
+            )
+
+    def append_data(self, data, offset, length=None, **kwargs):
+        self.lake.request("append_data")
+        self._assert_exists()
+
+        with open(self.local_path, "r+b") as f:
+            f.seek(offset)
+
+            for chunk in _iter_upload_data(data, length):
+                self.lake.transfer("uploaded", len(chunk))
+                f.write(chunk)
+
+    def flush_data(self, offset, **kwargs):
+        self.lake.request("flush_data")
+        self._assert_exists()
+
+        with open(self.local_path, "r+b") as f:
+            f.truncate(offset)
+
+    def delete_file(self, **kwargs):
+        self.lake.request("delete_file")
+
+        if not os.path.isfile(self.local_path):
+            raise ResourceNotFoundError(
+                f"The specified path does not exist: {self.file_system_name}/{self.path_name}"
+            )
+
+        os.remove(self.local_path)
+        self._forget_metadata()
+
+    def rename_file(self, new_name, **kwargs):
+        self.lake.request("rename_file")
+
+        return self._rename_to(new_name, FakeFileClient)
+
+
+class FakeDirectoryClient(_PathClient):
+    """Fake of DataLakeDirectoryClient"""
+
+    def get_directory_properties(self, **kwargs) -> FileProperties:
+        self.lake.request("get_directory_properties")
+
+        return self._properties()
+
+    def create_directory(self, metadata=None, **kwargs):
+        self.lake.request("create_directory")
+
+        os.makedirs(self.local_path, exist_ok=True)
+
+        with self.lake.lock:
+            self.lake.metadata[(self.file_system_name, self.path_name)] = dict(
+                metadata or {}
+            )
+
+        return self
+
+    def delete_directory(self, **kwargs):
+        self.lake.request("delete_directory")
+
+        if not os.path.isdir(self.local_path):
+            raise ResourceNotFoundError(
+                f"The specified path does not exist: {self.file_system_name}/{self.path_name}"
+            )
+
+        shutil.rmtree(self.local_path)
+        self._forget_metadata()
+
+    def rename_directory(self, new_name, **kwargs):
+        self.lake.request("rename_directory")
+
+        return self._rename_to(new_name, FakeDirectoryClient)
+
+    def get_file_client(self, file):
+        return FakeFileClient(
+            self.lake, self.file_system_name, f"{self.path_name}/{normalize_path(file)}"
+        )
+
+    def get_sub_directory_client(self, sub_directory):
+        return FakeDirectoryClient(
+            self.lake,
+            self.file_system_name,
+            f"{self.path_name}/{normalize_path(sub_directory)}",
+        )
+
+    def create_file(self, file, **kwargs):
+        file_client = self.get_file_client(file)
+        file_client.create_file(**kwargs)
+
+        return file_client
+
+    def create_sub_directory(self, sub_directory, **kwargs):
+        return self.get_sub_directory_client(sub_directory).create_directory(**kwargs)
+
+
+class FakeFileSystemClient:
+    """Fake of FileSystemClient for one file system (container)"""
+
+    def __init__(self, lake, file_system_name):
+        self.lake = lake
+        self.file_system_name = file_system_name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        pass
+
+    def exists(self) -> bool:
+        self.lake.request("exists")
+
+        return os.path.isdir(self.lake.local_path(self.file_system_name))
+
+    def create_file_system(self, **kwargs):
+        self.lake.request("create_file_system")
+
+        os.makedirs(self.lake.local_path(self.file_system_name), exist_ok=True)
+
+    def get_file_client(self, file_path):
+        return FakeFileClient(self.lake, self.file_system_name, file_path)
+
+    def get_directory_client(self, directory):
+        return FakeDirectoryClient(self.lake, self.file_system_name, directory)
+
+    def create_directory(self, directory, metadata=None, **kwargs):
+        return self.get_directory_client(directory).create_directory(metadata=metadata)
+
+    def delete_directory(self, directory, **kwargs):
+        directory_client = self.get_directory_client(directory)
+        directory_client.delete_directory()
+
+        return directory_client
+
+    def create_file(self, file, **kwargs):
+        file_client = self.get_file_client(file)
+        file_client.create_file(**kwargs)
+
+        return file_client
+
+    def delete_file(self, file, **kwargs):
+        file_client = self.get_file_client(file)
+        file_client.delete_file()
+
+        return file_client
+
+    def get_paths(self, path=None, recursive=True, max_results=None, **kwargs):
+        """
+        List the paths under path, depth first in name order.
+
+        Like the SDK, nothing is requested until the result is iterated, a missing path
+        raises ResourceNotFoundError at that point and one request is counted per page.
+        """
+        path = normalize_path(path)
+        page_size = max_results or PATHS_PAGE_SIZE
+        local_root = self.lake.local_path(self.file_system_name, path)
+
+        def walk(local_folder, folder):
+            with os.scandir(local_folder) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+
+            for entry in entries:
+                entry_path = f"{folder}/{entry.name}" if folder else entry.name
+
+                yield _path_properties(
+                    self.lake, self.file_system_name, entry_path, entry.path, False
+                )
+
+                if recursive and entry.is_dir():
+                    yield from walk(entry.path, entry_path)
+
+        self.lake.request("get_paths")
+
+        if not os.path.isdir(local_root):
+            raise ResourceNotFoundError(
+                f"The specified path does not exist: {self.file_system_name}/{path}"
+            )
+
+        for index, item in enumerate(walk(local_root, path)):
+            if index and index % page_size == 0:
+                self.lake.request("get_paths")
+
+            yield item
+
+
+def _etag(stat_result) -> str:
+    return f'"0x{stat_result.st_mtime_ns:X}"'
+
+
+def _path_properties(lake, file_system_name, path, local_path, with_metadata):
+    stat_result = os.stat(local_path)
+    is_directory = os.path.isdir(local_path)
+    # The service keeps whole seconds
+    last_modified = datetime.fromtimestamp(int(stat_result.st_mtime), tz=timezone.utc)
+    content_length = 0 if is_directory else stat_result.st_size
+
+    if not with_metadata:
+        return PathProperties(
+            path, is_directory, last_modified, content_length, _etag(stat_result)
+        )
+
+    with lake.lock:
+        metadata = dict(lake.metadata.get((file_system_name, path), {}))
+
+    if is_directory:
+        metadata["hdi_isfolder"] = "true"
+
+    return FileProperties(
+        path,
+        is_directory,
+        last_modified,
+        content_length,
+        _etag(stat_result),
+        metadata,
+    )
+
+
+def _iter_upload_data(data, length=None):
+    """Yield the bytes of anything upload_data accepts: bytes, str, a stream or an iterable"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data)
+        yield data if length is None else data[:length]
+        return
+
+    remaining = length
+
+    if hasattr(data, "read"):
+        while remaining is None or remaining > 0:
+            size = DOWNLOAD_CHUNK_SIZE if remaining is None else min(
+                DOWNLOAD_CHUNK_SIZE, remaining
+            )
+            chunk = data.read(size)
+
+            if not chunk:
+                break
+
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+
+            if remaining is not None:
+                remaining -= len(chunk)
+
+            yield chunk
+        return
+
+    for chunk in data:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+
+        if remaining is not None:
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+
+        yield chunk
+
+        if remaining is not None and remaining <= 0:
+            break
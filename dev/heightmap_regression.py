@@ -0,0 +1,149 @@
+"""
+Regression check for the Cirrus heightmap layer extraction.
+
+Builds synthetic Zeiss segmentation volumes (Cirrus 512x128 and 200x200 cubes plus a few
+edge cases), runs them through both the array based ZeissSegmentationConverter and the
+original per column implementation kept below, and verifies that the heightmaps are
+bit-identical. Timings for both implementations are printed for each volume.
+
+Usage:
+    python -m dev.heightmap_regression
+"""
+
+import time
+
+import numpy as np
+
+from cirrus.cirrus_heightmap_converter import ZeissSegmentationConverter
+
+
+class LoopZeissSegmentationConverter(ZeissSegmentationConverter):
+    """The original per B-scan / per A-scan implementation, used as the reference"""
+
+    def find_change_indices(self):
+        self.change_indices_dict = {
+            a: {"0": {}, "1": {}} for a in range(self.pixel_array.shape[0])
+        }
+
+        for a in range(self.pixel_array.shape[0]):
+            for i in range(self.pixel_array.shape[2]):
+                pixel_values = self.pixel_array[a, :, i]
+
+                change_indices_0_to_255 = (
+                    np.where((pixel_values[:-1] <= 1) & (pixel_values[1:] >= 254))[0]
+                    + 1
+                )
+                change_indices_255_to_0 = (
+                    np.where((pixel_values[:-1] >= 254) & (pixel_values[1:] <= 1))[0]
+                    + 1
+                )
+
+                if change_indices_0_to_255.size > 0:
+                    self.change_indices_dict[a]["0"][i] = change_indices_0_to_255
+                if change_indices_255_to_0.size > 0:
+                    self.change_indices_dict[a]["1"][i] = change_indices_255_to_0
+
+    def build_final_array(self):
+        self.final_array = np.zeros(
+            (2, self.pixel_array.shape[0], self.pixel_array.shape[2]), dtype=np.float32
+        )
+
+        for a in range(self.pixel_array.shape[0]):
+            for i in range(self.pixel_array.shape[2]):
+                if i in self.change_indices_dict[a]["0"]:
+                    self.final_array[0, a, i] = float(
+                        self.change_indices_dict[a]["0"][i][0]
+                    )
+                if i in self.change_indices_dict[a]["1"]:
+                    self.final_array[1, a, i] = float(
+                        self.change_indices_dict[a]["1"][i][0]
+                    )
+
+
+def synthetic_segmentation(num_slices, depth, num_columns, seed=0):
+    """
+    Create a segmentation volume with one or more 255 bands per A-scan.
+
+    Columns may have no band, a band touching the top or bottom of the scan, several
+    bands, and near-binary values (1 and 254) so every branch of the threshold is hit.
+
+    Returns:
+        numpy.ndarray: uint8 array of shape (num_slices, depth, num_columns).
+    """
+    rng = np.random.default_rng(seed)
+    volume = np.zeros((num_slices, depth, num_columns), dtype=np.uint8)
+
+    top = rng.integers(0, depth, size=(num_slices, num_columns))
+    thickness = rng.integers(1, max(2, depth // 4), size=(num_slices, num_columns))
+    bottom = np.minimum(top + thickness, depth)
+
+    rows = np.arange(depth)[None, :, None]
+    band = (rows >= top[:, None, :]) & (rows < bottom[:, None, :])
+    volume[band] = 255
+
+    # A second band in some columns
+    second_top = np.minimum(bottom + rng.integers(2, 20, size=bottom.shape), depth)
+    second_bottom = np.minimum(second_top + 5, depth)
+    second = (
+        (rows >= second_top[:, None, :])
+        & (rows < second_bottom[:, None, :])
+        & (rng.random(bottom.shape) < 0.3)[:, None, :]
+    )
+    volume[second] = 255
+
+    # Empty columns
+    volume[:, :, rng.random(num_columns) < 0.05] = 0
+
+    # Near-binary values and intermediate values that must not count as a transition
+    noise = rng.random(volume.shape)
+    volume[(noise < 0.01) & (volume == 0)] = 1
+    volume[(noise > 0.99) & (volume == 255)] = 254
+    volume[(noise > 0.499) & (noise < 0.5)] = 128
+
+    return volume
+
+
+def heightmap(converter_class, pixel_array):
+    converter = converter_class(segmentation_file=None)
+    converter.pixel_array = pixel_array
+    start = time.perf_counter()
+    converter.find_change_indices()
+    converter.build_final_array()
+    return converter.final_array, time.perf_counter() - start
+
+
+def main():
+    cases = {
+        "cirrus_512x128": synthetic_segmentation(128, 1024, 512, seed=1),
+        "cirrus_200x200": synthetic_segmentation(200, 1024, 200, seed=2),
+        "all_zero": np.zeros((4, 64, 32), dtype=np.uint8),
+        "all_255": np.full((4, 64, 32), 255, dtype=np.uint8),
+        "single_row": synthetic_segmentation(3, 2, 16, seed=3),
+    }
+
+    failures = 0
+
+    for name, volume in cases.items():
+        expected, loop_time = heightmap(LoopZeissSegmentationConverter, volume)
+        actual, array_time = heightmap(ZeissSegmentationConverter, volume)
+
+        identical = (
+            expected.dtype == actual.dtype
+            and expected.shape == actual.shape
+            and expected.tobytes() == actual.tobytes()
+        )
+
+        if not identical:
+            failures += 1
+
+        print(
+            f"{name}: {'identical' if identical else 'MISMATCH'} | "
+            f"loop {loop_time:.3f}s, array {array_time:.3f}s"
+        )
+
+    if failures:
+        raise SystemExit(f"{failures} heightmap(s) differ from the reference")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Check of the incremental mode of the pipelines against the local Data Lake fake.
+
+Runs a pipeline in full on synthetic data (see dev/pipeline_benchmark.py), then with
+--incremental, and verifies that the second run rewrites no outputs and uploads the same
+manifest. It then strips the fields older versions of the pipelines did not record
+(input_etag, input_digest, pipeline_version and manifest) from the file map and runs
+again: every input has to be processed once more, so the manifest keeps all of them, and
+the run after that skips them all again.
+
+A pipeline that keeps no manifest in its file map (eidon, optomed) has to skip the
+inputs of the stripped file map as well, since nothing is missing from its entries.
+
+Usage:
+    python -m dev.incremental_check
+    python -m dev.incremental_check ecg cgm --files 6 --workers 2
+"""
+
+import argparse
+import contextlib
+import fnmatch
+import json
+import os
+import shutil
+import tempfile
+
+from dev import synthetic_data
+from dev.pipeline_benchmark import (
+    FILE_SYSTEM_NAME,
+    PARTICIPANT_FILTER_FILE,
+    PIPELINES,
+    STUDY_ID,
+    load_pipeline,
+    silence_log_shipping,
+)
+
+# The pipelines with an incremental mode that run on the synthetic data
+INCREMENTAL_PIPELINES = ["cgm", "ecg", "env_sensor", "eidon", "optomed"]
+
+# Those that keep the manifest entries of each input in the file map
+MANIFEST_PIPELINES = ["cgm", "ecg", "env_sensor"]
+
+# Fields of a file map entry that older versions of the pipelines did not write
+LEGACY_MISSING_FIELDS = ["input_etag", "input_digest", "pipeline_version", "manifest"]
+
+
+def find_file(root, pattern):
+    """The single file matching the pattern under root"""
+    found = [
+        os.path.join(folder, file_name)
+        for folder, _, files in os.walk(root)
+        for file_name in fnmatch.filter(files, pattern)
+    ]
+
+    if len(found) != 1:
+        raise SystemExit(f"Expected one {pattern} under {root}, found {found}")
+
+    return found[0]
+
+
+def read_manifest(path):
+    """The header and the sorted rows, since the workers finish in any order"""
+    with open(path) as f:
+        header, *rows = f.read().splitlines()
+
+    return header, sorted(rows)
+
+
+def output_mtimes(lake, file_map):
+    """Modification time of every output listed in the file map, data plots included"""
+    return {
+        output_file: os.stat(lake.local_path(FILE_SYSTEM_NAME, output_file)).st_mtime_ns
+        for entry in file_map
+        for output_file in entry["output_files"] + entry.get("extra_output_files", [])
+    }
+
+
+class Run:
+    """One pipeline on one fake lake, rerun as often as needed"""
+
+    def __init__(self, name, files, workers, work_folder):
+        from dev.fake_datalake import FakeDataLake
+
+        module_file, populate = PIPELINES[name]
+        self.pipeline_module = load_pipeline(module_file)
+        self.workers = workers
+        self.records_manifest = name in MANIFEST_PIPELINES
+
+        self.home = os.path.join(work_folder, "home")
+        os.makedirs(self.home, exist_ok=True)
+
+        self.lake = FakeDataLake(os.path.join(work_folder, "lake"))
+        self.root = self.lake.local_path(FILE_SYSTEM_NAME)
+
+        patient_ids = synthetic_data.participant_ids(files)
+        populate(self.lake, self.home, patient_ids)
+        self.lake.write_file(
+            FILE_SYSTEM_NAME,
+            PARTICIPANT_FILTER_FILE,
+            synthetic_data.make_participant_filter_csv(patient_ids),
+        )
+
+    def __call__(self, incremental):
+        original_home = os.environ.get("HOME")
+        os.environ["HOME"] = self.home
+
+        try:
+            with open(os.devnull, "w") as sink, self.lake.patch():
+                with contextlib.redirect_stdout(sink):
+                    self.pipeline_module.pipeline(
+                        STUDY_ID, self.workers, [], incremental=incremental
+                    )
+        finally:
+            if original_home is None:
+                os.environ.pop("HOME", None)
+            else:
+                os.environ["HOME"] = original_home
+
+        with open(find_file(self.root, "file_map.json")) as f:
+            file_map = json.load(f)["logs"]
+
+        manifest = None
+        if self.records_manifest:
+            manifest = read_manifest(find_file(self.root, "manifest*.tsv"))
+
+        return file_map, manifest, output_mtimes(self.lake, file_map)
+
+    def strip_file_map(self):
+        """Rewrite the file map as a version without the incremental fields wrote it"""
+        path = find_file(self.root, "file_map.json")
+
+        with open(path) as f:
+            file_map = json.load(f)
+
+        for entry in file_map["logs"]:
+            for field in LEGACY_MISSING_FIELDS:
+                entry.pop(field, None)
+
+        with open(path, "w") as f:
+            json.dump(file_map, f, indent=4)
+
+
+def check_manifest_runs(run, check, files):
+    file_map, manifest, mtimes = run(incremental=False)
+    check("full run converts every input", len(file_map) == files and bool(mtimes))
+    check("full run has a manifest row per input", len(manifest[1]) == files)
+    check(
+        "full run records a manifest per input",
+        all("manifest" in entry for entry in file_map),
+    )
+
+    _, kept_manifest, kept_mtimes = run(incremental=True)
+    check("incremental run keeps the outputs", kept_mtimes == mtimes)
+    check("incremental run keeps the manifest", kept_manifest == manifest)
+
+    run.strip_file_map()
+
+    legacy_map, legacy_manifest, legacy_mtimes = run(incremental=True)
+    check(
+        "legacy file map reprocesses every input",
+        all(legacy_mtimes[path] != mtimes[path] for path in mtimes),
+    )
+    check("legacy file map keeps the manifest", legacy_manifest == manifest)
+    check(
+        "legacy file map records the manifests again",
+        all("manifest" in entry for entry in legacy_map),
+    )
+
+    _, after_manifest, after_mtimes = run(incremental=True)
+    check("run after the legacy run keeps the outputs", after_mtimes == legacy_mtimes)
+    check("run after the legacy run keeps the manifest", after_manifest == manifest)
+
+
+def check_runs_without_manifest(run, check, files):
+    file_map, _, mtimes = run(incremental=False)
+    check("full run converts every input", len(file_map) == files and bool(mtimes))
+    check(
+        "full run records no manifest",
+        not any("manifest" in entry for entry in file_map),
+    )
+
+    _, _, kept_mtimes = run(incremental=True)
+    check("incremental run keeps the outputs", kept_mtimes == mtimes)
+
+    run.strip_file_map()
+
+    _, _, legacy_mtimes = run(incremental=True)
+    check("legacy file map keeps the outputs", legacy_mtimes == mtimes)
+
+
+def check_pipeline(name, files, workers):
+    failures = []
+
+    def check(label, ok):
+        print(f"{name} {label}: {'ok' if ok else 'FAILED'}")
+        if not ok:
+            failures.append(label)
+
+    work_folder = tempfile.mkdtemp(prefix="incremental_check_")
+
+    try:
+        run = Run(name, files, workers, work_folder)
+
+        if run.records_manifest:
+            check_manifest_runs(run, check, files)
+        else:
+            check_runs_without_manifest(run, check, files)
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "pipelines",
+        nargs="*",
+        help=f"Pipelines to check, all of {', '.join(INCREMENTAL_PIPELINES)} by default",
+    )
+    parser.add_argument("--files", type=int, default=4, help="Number of input files")
+    # The data plots are drawn with pyplot, which is not thread safe
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Number of workers to use"
+    )
+    args = parser.parse_args()
+
+    for name in args.pipelines:
+        if name not in INCREMENTAL_PIPELINES:
+            parser.error(f"{name} is not one of {', '.join(INCREMENTAL_PIPELINES)}")
+
+    silence_log_shipping()
+
+    failures = []
+    for name in args.pipelines or INCREMENTAL_PIPELINES:
+        failures.extend(
+            f"{name} {label}"
+            for label in check_pipeline(name, args.files, args.workers)
+        )
+
+    if failures:
+        raise SystemExit(f"{len(failures)} checks failed: {', '.join(failures)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Check of the Logwatch shipper against a local HTTP sink.
+
+Starts an HTTP server on localhost that records every POST it receives (optionally
+answering slowly or with errors), points LogShipper at it and verifies:
+batching by size and by flush interval with the array and record payloads, each
+drop policy when the queue is full, that failed posts are counted, and that close()
+ships everything still queued. Use --serve to only run the sink and print what a
+pipeline sends to it, e.g. with FAIRHUB_CATCH_ALL_LOG_ENDPOINT=http://127.0.0.1:8765.
+
+Usage:
+    python -m dev.logwatch_sink
+    python -m dev.logwatch_sink --serve --port 8765
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dev.pipeline_benchmark import REQUIRED_SETTINGS
+
+# config.py requires these settings, the shipper under test does not use them
+for key in REQUIRED_SETTINGS:
+    os.environ.setdefault(key, "sink")
+
+from utils.logwatch import LogShipper  # noqa: E402
+
+
+class Sink:
+    """A local drain that keeps the decoded body of every POST"""
+
+    def __init__(self, port=0, delay=0.0, status=200, echo=False):
+        self.posts = []
+        self.delay = delay
+        self.status = status
+        self.lock = threading.Lock()
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                time.sleep(sink.delay)
+
+                with sink.lock:
+                    sink.posts.append(json.loads(body))
+
+                if echo:
+                    print(body.decode())
+
+                self.send_response(sink.status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def records(self):
+        with self.lock:
+            posts = list(self.posts)
+
+        return [
+            record
+            for post in posts
+            for record in (post if isinstance(post, list) else [post])
+        ]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def messages(records):
+    return [record["message"] for record in records]
+
+
+def check_batch_size(sink):
+    shipper = LogShipper(sink.url, batch_size=10, flush_interval=5, payload="array")
+
+    for index in range(25):
+        shipper.put({"level": "info", "message": str(index)})
+
+    shipper.close()
+    sizes = [len(post) for post in sink.posts]
+
+    assert messages(sink.records()) == [str(index) for index in range(25)], sizes
+    assert sizes == [10, 10, 5], sizes
+
+
+def check_flush_interval(sink):
+    # Records trickling in faster than the interval share a post
+    shipper = LogShipper(sink.url, batch_size=100, flush_interval=0.5, payload="array")
+
+    for index in range(10):
+        shipper.put({"level": "info", "message": str(index)})
+        time.sleep(0.02)
+
+    time.sleep(1)
+    assert len(sink.posts) == 1, [len(post) for post in sink.posts]
+
+    shipper.put({"level": "info", "message": "late"})
+    time.sleep(1)
+    shipper.close()
+
+    assert len(sink.posts) == 2, [len(post) for post in sink.posts]
+    assert messages(sink.records())[-1] == "late"
+
+
+def check_record_payload(sink):
+    shipper = LogShipper(sink.url, batch_size=10, flush_interval=0.2)
+
+    for index in range(5):
+        shipper.put({"level": "info", "message": str(index)})
+
+    shipper.close()
+
+    assert all(isinstance(post, dict) for post in sink.posts), sink.posts
+    assert messages(sink.posts) == [str(index) for index in range(5)]
+
+
+def fill_queue(sink, drop_policy):
+    # A slow sink holds the thread on the first post while the queue fills up
+    sink.delay = 0.5
+    shipper = LogShipper(
+        sink.url,
+        queue_size=5,
+        batch_size=1,
+        flush_interval=0.1,
+        drop_policy=drop_policy,
+        payload="array",
+    )
+
+    shipper.put({"level": "info", "message": "first"})
+    time.sleep(0.2)
+
+    start = time.monotonic()
+    for index in range(10):
+        shipper.put({"level": "info", "message": str(index)})
+    put_time = time.monotonic() - start
+
+    sink.delay = 0
+    shipper.close()
+
+    return shipper, messages(sink.records()), put_time
+
+
+def check_drop_oldest(sink):
+    shipper, received, put_time = fill_queue(sink, "drop_oldest")
+
+    assert shipper.dropped == 5, shipper.dropped
+    assert received == ["first", "5", "6", "7", "8", "9"], received
+    assert put_time < 0.1, put_time
+
+
+def check_drop_newest(sink):
+    shipper, received, put_time = fill_queue(sink, "drop_newest")
+
+    assert shipper.dropped == 5, shipper.dropped
+    assert received == ["first", "0", "1", "2", "3", "4"], received
+    assert put_time < 0.1, put_time
+
+
+def check_block(sink):
+    shipper, received, put_time = fill_queue(sink, "block")
+
+    assert shipper.dropped == 0, shipper.dropped
+    assert received == ["first"] + [str(index) for index in range(10)], received
+    assert put_time > 0.2, put_time
+
+
+def check_failed_posts(sink):
+    sink.status = 400
+    shipper = LogShipper(sink.url, batch_size=10, flush_interval=0.1)
+
+    for index in range(3):
+        shipper.put({"level": "info", "message": str(index)})
+
+    shipper.close()
+
+    assert shipper.failed == 3, shipper.failed
+
+
+def check_close_flushes(sink):
+    # close() ships the queued records without waiting for the interval
+    shipper = LogShipper(sink.url, batch_size=1000, flush_interval=60)
+
+    for index in range(50):
+        shipper.put({"level": "info", "message": str(index)})
+
+    start = time.monotonic()
+    shipper.close()
+
+    assert messages(sink.records()) == [str(index) for index in range(50)]
+    assert time.monotonic() - start < 5
+
+
+CHECKS = [
+    check_batch_size,
+    check_flush_interval,
+    check_record_payload,
+    check_drop_oldest,
+    check_drop_newest,
+    check_block,
+    check_failed_posts,
+    check_close_flushes,
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--serve", action="store_true", help="Only run the sink")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.serve:
+        sink = Sink(args.port, echo=True)
+        print(f"Listening on {sink.url}")
+        sink.thread.join()
+        return
+
+    failures = 0
+
+    for check in CHECKS:
+        sink = Sink()
+
+        try:
+            check(sink)
+        except AssertionError as e:
+            failures += 1
+            print(f"{check.__name__}: FAILED {e}")
+        else:
+            print(f"{check.__name__}: ok")
+        finally:
+            sink.close()
+
+    if failures:
+        raise SystemExit(f"{failures} of {len(CHECKS)} shipper checks failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+"""
+End to end throughput benchmark for the processing pipelines.
+
+Generates synthetic inputs (see dev/synthetic_data.py), serves them from the filesystem
+backed Data Lake fake (see dev/fake_datalake.py) and runs the pipeline's own pipeline()
+function against it. Nothing touches production storage and no logs are shipped. Reports
+wall time, the inputs converted and failed (from the file map), converted files per
+second, peak memory and the storage requests made, so runs before and after a change can
+be compared on a laptop. A run that converts nothing exits with an error.
+
+The storage requests are not reported with --processes: each worker process counts into
+its own copy of the fake.
+
+Peak RSS covers the whole benchmark process (including data generation) plus the largest
+worker process, if the pipeline forks any. --tracemalloc adds the peak of Python
+allocations during the pipeline run only, at a noticeable cost in speed.
+
+Usage:
+    python -m dev.pipeline_benchmark ecg --files 50 --workers 4
+    python -m dev.pipeline_benchmark eidon --files 24 --latency 0.02 --bandwidth 50
+    python -m dev.pipeline_benchmark env_sensor --files 8 --json results.json
+    python -m dev.pipeline_benchmark eidon --latency 0.05 --upload-concurrency 1
+    python -m dev.pipeline_benchmark ecg --upload-failure-rate 0.1
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from dev import synthetic_data
+
+STUDY_ID = "AI-READI"
+FILE_SYSTEM_NAME = "stage-1-container"
+
+PARTICIPANT_FILTER_FILE = f"{STUDY_ID}/dependency/PatientID/AllParticipantIDs07-01-2023through05-01-2025.csv"
+REDCAP_FILE = (
+    f"{STUDY_ID}/pooled-data/REDCap/AIREADiPilot-2024Sep13_EnviroPhysSensorInfo.csv"
+)
+
+# Settings config.py refuses to start without; placeholders are enough for the fake
+REQUIRED_SETTINGS = [
+    "FAIRHUB_ACCESS_TOKEN",
+    "FAIRHUB_ENVIRONMENT",
+    "AZURE_STORAGE_ACCESS_KEY",
+    "AZURE_STORAGE_CONNECTION_STRING",
+    "AZURE_STORAGE_PRODUCTION_DANGEROUS_CONNECTION_STRING",
+    "FAIRHUB_CATCH_ALL_LOG_ENDPOINT",
+]
+
+VISIT_DATE = "2024-03-04"
+RETURN_DATE = "2024-03-14"
+
+
+def populate_ecg(lake, home, patient_ids):
+    for index, patient_id in enumerate(patient_ids):
+        lake.write_file(
+            FILE_SYSTEM_NAME,
+            f"{STUDY_ID}/pooled-data/ECG/site01_ecg_20240101-20240401/{patient_id}_{index}.xml",
+            synthetic_data.make_ecg_xml(patient_id, seed=index),
+        )
+
+
+def populate_cgm(lake, home, patient_ids):
+    for index, patient_id in enumerate(patient_ids):
+        lake.write_file(
+            FILE_SYSTEM_NAME,
+            f"{STUDY_ID}/pooled-data/CGM/DEX-{patient_id}.csv",
+            synthetic_data.make_cgm_csv(patient_id, seed=index),
+        )
+
+
+def populate_env_sensor(lake, home, patient_ids):
+    from env_sensor.es_utils import build_es_dict
+
+    sensors = sorted(build_es_dict().items())
+    visits = []
+
+    for index, patient_id in enumerate(patient_ids):
+        sensor_id, sensor = sensors[index % len(sensors)]
+        visits.append(
+            {
+                "patient_id": patient_id,
+                "sensor_id": sensor_id,
+                "visit_date": VISIT_DATE,
+                "return_date": RETURN_DATE,
+            }
+        )
+
+        lake.write_file(
+            FILE_SYSTEM_NAME,
+            f"{STUDY_ID}/pooled-data/EnvSensor/ENV-{patient_id}-{sensor_id}.zip",
+            synthetic_data.make_env_sensor_zip(
+                patient_id, sensor["sen55"], VISIT_DATE, seed=index
+            ),
+        )
+
+    lake.write_file(
+        FILE_SYSTEM_NAME, REDCAP_FILE, synthetic_data.make_redcap_export(visits)
+    )
+    os.makedirs(
+        lake.local_path(
+            FILE_SYSTEM_NAME, f"{STUDY_ID}/pooled-data/EnvSensor-manual-year2"
+        ),
+        exist_ok=True,
+    )
+
+
+def _populate_dicom(lake, patient_ids, folder, device, file_name):
+    for index, patient_id in enumerate(patient_ids):
+        laterality = "R" if index % 2 == 0 else "L"
+
+        lake.write_file(
+            FILE_SYSTEM_NAME,
+            f"{STUDY_ID}/pooled-data/{folder}/{file_name(patient_id, laterality, index)}",
+            synthetic_data.make_dicom(
+                patient_id, device=device, laterality=laterality, seed=index
+            ),
+        )
+
+
+def populate_eidon(lake, home, patient_ids):
+    _populate_dicom(
+        lake,
+        patient_ids,
+        "Eidon/site01_eidon_20240101-20240401",
+        "Eidon",
+        synthetic_data.eidon_file_name,
+    )
+
+
+def populate_optomed(lake, home, patient_ids):
+    _populate_dicom(
+        lake,
+        patient_ids,
+        "Optomed/site01_optomed_20240101-20240401",
+        "Aurora",
+        lambda patient_id, laterality, index: f"{patient_id}_{laterality}_{index:04d}.dcm",
+    )
+
+
+def populate_garmin(lake, home, patient_ids):
+    # The Garmin pipeline reads its inputs from ~/Downloads/FitnessTracker
+    input_folder = os.path.join(home, "Downloads", "FitnessTracker")
+
+    for index, patient_id in enumerate(patient_ids):
+        synthetic_data.write_garmin_folder(input_folder, patient_id, seed=index)
+
+    lake.write_file(
+        FILE_SYSTEM_NAME,
+        REDCAP_FILE,
+        synthetic_data.make_redcap_export(
+            [
+                {
+                    "patient_id": patient_id,
+                    "sensor_id": "011",
+                    "visit_date": VISIT_DATE,
+                    "return_date": RETURN_DATE,
+                }
+                for patient_id in patient_ids
+            ]
+        ),
+    )
+    os.makedirs(
+        lake.local_path(
+            FILE_SYSTEM_NAME, f"{STUDY_ID}/pooled-data/FitnessTracker-manual"
+        ),
+        exist_ok=True,
+    )
+
+
+# Benchmark name -> (pipeline module file, input generator)
+PIPELINES = {
+    "cgm": ("cgm_pipeline-remote.py", populate_cgm),
+    "ecg": ("ecg_pipeline.py", populate_ecg),
+    "eidon": ("eidon_pipeline.py", populate_eidon),
+    "env_sensor": ("env_sensor_pipeline.py", populate_env_sensor),
+    "garmin": ("garmin_pipeline.py", populate_garmin),
+    "optomed": ("optomed_pipeline.py", populate_optomed),
+}
+
+
+def load_pipeline(file_name):
+    """Import a module from process_pipeline by file name (some contain a dash)"""
+    stem = os.path.splitext(file_name)[0]
+    module_name = f"process_pipeline.{stem}"
+
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    spec = importlib.util.spec_from_file_location(
+        module_name, os.path.join(root, "process_pipeline", file_name)
+    )
+    module = importlib.util.module_from_spec(spec)
+    # Registered first so worker processes can unpickle references to it
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def silence_log_shipping():
+    """Fill in the settings config.py requires and turn off every log endpoint"""
+    for key in REQUIRED_SETTINGS:
+        os.environ.setdefault(key, "benchmark")
+
+    import config
+
+    for key in dir(config):
+        if key.startswith("FAIRHUB_") and key.endswith("_LOG_ENDPOINT"):
+            setattr(config, key, None)
+
+
+def conversion_counts(lake):
+    """Inputs converted and inputs that failed, from the file map the run uploaded"""
+    dependency_folder = lake.local_path(FILE_SYSTEM_NAME, f"{STUDY_ID}/dependency")
+    succeeded = failed = 0
+
+    for folder, _, files in os.walk(dependency_folder):
+        if "file_map.json" not in files:
+            continue
+
+        with open(os.path.join(folder, "file_map.json")) as f:
+            file_map = json.load(f)
+
+        for entry in file_map["logs"]:
+            if entry["error"]:
+                failed += 1
+            else:
+                succeeded += 1
+
+    return succeeded, failed
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of its largest child, in MB"""
+    self_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+
+    return self_peak / scale, children_peak / scale
+
+
+def run_benchmark(
+    name,
+    files=10,
+    workers=4,
+    latency=0.0,
+    bandwidth_mb=None,
+    trace_memory=False,
+    verbose=False,
+    keep=None,
+    upload_concurrency=None,
+    upload_failure_rate=0.0,
+    processes=False,
+):
+    """
+    Run one pipeline against synthetic data and return the measurements.
+
+    Args:
+        name (str): A key of PIPELINES.
+        files (int): Number of input files (participants for garmin and env_sensor).
+        workers (int): Passed to pipeline().
+        latency (float): Seconds added to every storage request.
+        bandwidth_mb (float): Storage bandwidth in MB/s, None for unlimited.
+        trace_memory (bool): Also record the tracemalloc peak of the run.
+        verbose (bool): Keep the pipeline's console output.
+        keep (str): Folder to create the fake storage and home folder in, kept afterwards.
+        upload_concurrency (int): Overrides UPLOAD_MAX_CONCURRENCY of the upload stage.
+        upload_failure_rate (float): Fraction of uploads that fail and have to be retried.
+        processes (bool): Run the pipeline's workers in processes, for the imaging
+            pipelines that support it.
+    """
+    silence_log_shipping()
+
+    import utils.upload_stage as upload_stage
+
+    if upload_concurrency:
+        upload_stage.UPLOAD_MAX_CONCURRENCY = upload_concurrency
+
+    from dev.fake_datalake import FakeDataLake
+
+    module_file, populate = PIPELINES[name]
+    pipeline_module = load_pipeline(module_file)
+
+    work_folder = keep or tempfile.mkdtemp(prefix="pipeline_benchmark_")
+    home = os.path.join(work_folder, "home")
+    os.makedirs(home, exist_ok=True)
+
+    lake = FakeDataLake(
+        os.path.join(work_folder, "lake"),
+        latency=latency,
+        bandwidth=bandwidth_mb * 1024 * 1024 if bandwidth_mb else None,
+        upload_failure_rate=upload_failure_rate,
+    )
+
+    patient_ids = synthetic_data.participant_ids(files)
+
+    populate(lake, home, patient_ids)
+    lake.write_file(
+        FILE_SYSTEM_NAME,
+        PARTICIPANT_FILTER_FILE,
+        synthetic_data.make_participant_filter_csv(patient_ids),
+    )
+
+    original_home = os.environ.get("HOME")
+    os.environ["HOME"] = home
+
+    output = contextlib.nullcontext() if verbose else open(os.devnull, "w")
+
+    try:
+        with output as sink, lake.patch():
+            redirect = (
+                contextlib.nullcontext() if verbose else contextlib.redirect_stdout(sink)
+            )
+
+            if trace_memory:
+                tracemalloc.start()
+
+            start = time.perf_counter()
+
+            with redirect:
+                if processes:
+                    pipeline_module.pipeline(STUDY_ID, workers, [], processes=True)
+                else:
+                    pipeline_module.pipeline(STUDY_ID, workers, [])
+
+            elapsed = time.perf_counter() - start
+
+            traced_peak = None
+            if trace_memory:
+                traced_peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+                tracemalloc.stop()
+
+        succeeded, failed = conversion_counts(lake)
+    finally:
+        if original_home is None:
+            os.environ.pop("HOME", None)
+        else:
+            os.environ["HOME"] = original_home
+
+        if keep is None:
+            shutil.rmtree(work_folder, ignore_errors=True)
+
+    self_rss, children_rss = peak_rss_mb()
+
+    return {
+        "pipeline": name,
+        "files": files,
+        "workers": workers,
+        "latency": latency,
+        "bandwidth_mb": bandwidth_mb,
+        "upload_concurrency": upload_stage.UPLOAD_MAX_CONCURRENCY,
+        "upload_failure_rate": upload_failure_rate,
+        "processes": processes,
+        "seconds": round(elapsed, 3),
+        "succeeded": succeeded,
+        "failed": failed,
+        "files_per_second": round(succeeded / elapsed, 3) if elapsed else None,
+        "peak_rss_mb": round(self_rss, 1),
+        "peak_worker_rss_mb": round(children_rss, 1),
+        "peak_traced_mb": round(traced_peak, 1) if traced_peak is not None else None,
+        # Worker processes count into their own copy of the fake
+        "storage": None if processes else dict(sorted(lake.stats.items())),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark a pipeline against synthetic data and a local Data Lake fake"
+    )
+    parser.add_argument("pipeline", choices=sorted(PIPELINES))
+    parser.add_argument("--files", type=int, default=10, help="Number of input files")
+    parser.add_argument("--workers", type=int, default=4, help="Number of workers to use")
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds added to every request"
+    )
+    parser.add_argument(
+        "--bandwidth", type=float, default=None, help="Storage bandwidth in MB/s"
+    )
+    parser.add_argument(
+        "--upload-concurrency",
+        type=int,
+        default=None,
+        help="Uploads in flight per pipeline worker",
+    )
+    parser.add_argument(
+        "--upload-failure-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of uploads that fail once and are retried",
+    )
+    parser.add_argument(
+        "--processes",
+        action="store_true",
+        help="Run the workers in processes instead of threads",
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        action="store_true",
+        help="Also report the peak of Python allocations during the run",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="Show the pipeline's console output"
+    )
+    parser.add_argument(
+        "--keep", help="Create the fake storage in this folder and keep it afterwards"
+    )
+    parser.add_argument("--json", help="Append the results as a JSON line to this file")
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        args.pipeline,
+        files=args.files,
+        workers=args.workers,
+        latency=args.latency,
+        bandwidth_mb=args.bandwidth,
+        trace_memory=args.tracemalloc,
+        verbose=args.verbose,
+        keep=args.keep,
+        upload_concurrency=args.upload_concurrency,
+        upload_failure_rate=args.upload_failure_rate,
+        processes=args.processes,
+    )
+
+    print(
+        f"{results['pipeline']}: {results['succeeded']} of {results['files']} files "
+        f"converted, {results['failed']} failed, in {results['seconds']:.2f}s "
+        f"({results['files_per_second']} files/s) with {results['workers']} workers"
+    )
+    print(
+        f"peak RSS {results['peak_rss_mb']} MB, "
+        f"largest worker process {results['peak_worker_rss_mb']} MB"
+        + (
+            f", traced peak {results['peak_traced_mb']} MB"
+            if results["peak_traced_mb"] is not None
+            else ""
+        )
+    )
+    if results["storage"] is None:
+        print("storage: not counted, the worker processes have their own fake")
+    else:
+        print(
+            "storage: "
+            + ", ".join(f"{key}={value}" for key, value in results["storage"].items())
+        )
+
+    if args.json:
+        with open(args.json, "a") as f:
+            f.write(json.dumps(results) + "\n")
+
+    if not results["succeeded"]:
+        raise SystemExit(f"{results['pipeline']}: no input was converted")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,595 @@
+"""
+Synthetic inputs for the pipelines: Dexcom Clarity CGM exports, Garmin FIT folders,
+Philips ECG XML, environmental sensor CSV archives and ophthalmic photography DICOM.
+
+The files follow the layouts the converters read, so a pipeline runs its full path on
+them, but the values are random and carry no meaning. Every generator is seeded, so the
+same arguments always produce the same bytes (DICOM UIDs aside, which are derived from the
+seed as well).
+
+Usage:
+    from dev import synthetic_data
+
+    xml = synthetic_data.make_ecg_xml("1001", seed=1)
+    synthetic_data.write_garmin_folder("/tmp/FitnessTracker", "1001", days=2)
+"""
+
+import base64
+import csv
+import io
+import os
+import random
+import struct
+import zipfile
+from datetime import datetime, timedelta
+
+import numpy as np
+import pydicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+# Garmin FIT timestamps count seconds from this date
+FIT_EPOCH = datetime(1989, 12, 31)
+
+# Ophthalmic Photography 8 Bit Image Storage
+OPHTHALMIC_PHOTOGRAPHY_SOP_CLASS_UID = "1.2.840.10008.5.1.4.1.1.77.1.5.1"
+
+# File name markers the Eidon classifying rules look for
+EIDON_PROTOCOLS = [
+    "0-Visible",
+    "0-Infrared",
+    "0-AF-Blue",
+    "3-Visible",
+    "4-Visible",
+    "11-Visible",
+]
+
+ENV_SENSOR_COLUMNS = (
+    "ts,lch0,lch1,lch2,lch3,lch6,lch7,lch8,lch9,lch10,lch11,"
+    "pm1,pm2.5,pm4,pm10,hum,temp,voc,nox,screen,ff,inttemp"
+)
+
+CLARITY_COLUMNS = [
+    "Index",
+    "Timestamp (YYYY-MM-DDThh:mm:ss)",
+    "Event Type",
+    "Event Subtype",
+    "Patient Info",
+    "Device Info",
+    "Source Device ID",
+    "Glucose Value (mg/dL)",
+    "Insulin Value (u)",
+    "Carb Value (grams)",
+    "Duration (hh:mm:ss)",
+    "Glucose Rate of Change (mg/dL/min)",
+    "Transmitter Time (Long Integer)",
+    "Transmitter ID",
+]
+
+REDCAP_COLUMNS = [
+    "studyid",
+    "siteid",
+    "visdat",
+    "pacmpdat",
+    "dvenvendat",
+    "dvenvdwnd",
+    "dvenvsn",
+    "dvenvlocn",
+    "dvenvenyn",
+    "dvenvyn",
+    "dvenvstcrcid",
+    "dvamwstcrcid",
+    "dvamwendwnd",
+    "dvamwenhand",
+    "dvamwendhand",
+]
+
+
+def participant_ids(count, first=1001):
+    """Return count participant IDs as strings, starting at first"""
+    return [str(first + index) for index in range(count)]
+
+
+def make_participant_filter_csv(patient_ids):
+    """The participant filter list the pipelines download: a header, then one ID per row"""
+    return ("participant_id\n" + "".join(f"{pid}\n" for pid in patient_ids)).encode()
+
+
+def make_redcap_export(visits):
+    """
+    The REDCap export read by the environmental sensor and Garmin pipelines.
+
+    Args:
+        visits (list): dicts with patient_id, sensor_id (the 3 digit esID), visit_date and
+            return_date (YYYY-MM-DD).
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(REDCAP_COLUMNS)
+
+    for visit in visits:
+        writer.writerow(
+            [
+                visit["patient_id"],
+                "site_01",
+                f"{visit['visit_date']} 09:00",
+                visit["visit_date"],
+                visit["return_date"],
+                "1.0",
+                str(int(visit["sensor_id"])),
+                "bedroom",
+                "1",
+                "1",
+                "1",
+                "1",
+                "1",
+                "1",
+                "1",
+            ]
+        )
+
+    return buffer.getvalue().encode()
+
+
+def make_cgm_csv(patient_id, days=10, start=datetime(2024, 3, 4, 8), seed=0):
+    """A Dexcom Clarity export with one EGV reading every 5 minutes"""
+    rng = random.Random(seed)
+    transmitter_id = f"8{rng.randrange(16 ** 5):05X}"
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(CLARITY_COLUMNS)
+
+    # Metadata rows come before the readings; the converter takes the patient from row 2
+    metadata = [
+        ("FirstName", "AIREADI", ""),
+        ("LastName", patient_id, ""),
+        ("PatientInfo", f"AIREADI-{patient_id}", ""),
+        ("Device", "", "Dexcom G6 Mobile App"),
+    ]
+
+    index = 0
+    for event_type, patient_info, device_info in metadata:
+        index += 1
+        writer.writerow(
+            [index, "", event_type, "", patient_info, device_info]
+            + [""] * (len(CLARITY_COLUMNS) - 6)
+        )
+
+    glucose = 110
+    for reading in range(days * 24 * 12):
+        index += 1
+        glucose = min(max(glucose + rng.randint(-6, 6), 35), 405)
+
+        if glucose < 40:
+            value = "Low"
+        elif glucose > 400:
+            value = "High"
+        else:
+            value = glucose
+
+        timestamp = start + timedelta(minutes=5 * reading)
+        writer.writerow(
+            [
+                index,
+                timestamp.strftime("%Y-%m-%dT%H:%M:%S"),
+                "EGV",
+                "",
+                "",
+                "",
+                "iOS G6",
+                value,
+                "",
+                "",
+                "",
+                "",
+                300 * reading + rng.randint(0, 3),
+                transmitter_id,
+            ]
+        )
+
+    return buffer.getvalue().encode()
+
+
+# FIT base types: (identifier, struct format)
+_ENUM = (0x00, "B")
+_UINT8 = (0x02, "B")
+_SINT16 = (0x83, "h")
+_UINT16 = (0x84, "H")
+_UINT32 = (0x86, "I")
+_BYTE = (0x0D, "B")
+
+_FIT_CRC_TABLE = (
+    0x0000, 0xCC01, 0xD801, 0x1400, 0xF001, 0x3C00, 0x2800, 0xE401,
+    0xA001, 0x6C00, 0x7800, 0xB401, 0x5000, 0x9C01, 0x8801, 0x4400,
+)  # fmt: skip
+
+
+def fit_crc(data, crc=0):
+    """The CRC-16 FIT files end with"""
+    for byte in data:
+        for nibble in (byte & 0xF, byte >> 4):
+            tmp = _FIT_CRC_TABLE[crc & 0xF]
+            crc = (crc >> 4) & 0x0FFF
+            crc = crc ^ tmp ^ _FIT_CRC_TABLE[nibble]
+
+    return crc
+
+
+class FitWriter:
+    """Minimal little endian FIT encoder: definition messages, data messages and the CRCs"""
+
+    def __init__(self):
+        self.records = bytearray()
+        self.formats = {}
+
+    def define(self, local_type, global_type, fields):
+        """fields is a list of (field number, base type) pairs, in record order"""
+        self.records += struct.pack(
+            "<BBBHB", 0x40 | local_type, 0, 0, global_type, len(fields)
+        )
+
+        for field_number, (base_type, fmt) in fields:
+            self.records += struct.pack(
+                "<BBB", field_number, struct.calcsize(fmt), base_type
+            )
+
+        self.formats[local_type] = struct.Struct(
+            "<B" + "".join(fmt for _, (_, fmt) in fields)
+        )
+
+    def write(self, local_type, *values):
+        self.records += self.formats[local_type].pack(local_type, *values)
+
+    def getvalue(self):
+        header = struct.pack("<BBHI4s", 14, 0x10, 2093, len(self.records), b".FIT")
+        header += struct.pack("<H", fit_crc(header))
+        data = header + self.records
+
+        return data + struct.pack("<H", fit_crc(data))
+
+
+def _fit_timestamp(value):
+    return int((value - FIT_EPOCH).total_seconds())
+
+
+def make_monitor_fit(start, hours=24, seed=0):
+    """
+    A monitoring FIT file in the layout the activity reader expects.
+
+    Heart rate every minute, active calories and activity type every 15 minutes, stress
+    every 3 minutes, respiration every 2 minutes, SpO2 every hour and one resting heart rate.
+    """
+    rng = random.Random(seed)
+    fit = FitWriter()
+    begin = _fit_timestamp(start)
+
+    # file_id: type, manufacturer, time_created
+    fit.define(0, 0, [(0, _ENUM), (1, _UINT16), (4, _UINT32)])
+    fit.write(0, 32, 1, begin)
+
+    # monitoring with only a full timestamp, which the reader takes as the base time
+    fit.define(1, 55, [(253, _UINT32)])
+    # monitoring heart rate: timestamp_16, heart_rate
+    fit.define(2, 55, [(26, _UINT16), (27, _UINT8)])
+    # monitoring calories: timestamp_16, active_calories, active_time, cycles, activity byte
+    fit.define(
+        3, 55, [(26, _UINT16), (19, _UINT16), (4, _UINT32), (3, _UINT32), (24, _BYTE)]
+    )
+    # stress_level: value, time
+    fit.define(4, 227, [(0, _SINT16), (1, _UINT32)])
+    # undocumented Garmin messages; each message also marks the data that follows it
+    fit.define(5, 211, [(0, _UINT8), (1, _UINT8), (253, _UINT32)])
+    fit.define(6, 297, [(0, _UINT16), (253, _UINT32)])
+    fit.define(7, 269, [(0, _UINT8), (1, _UINT8), (2, _ENUM), (253, _UINT32)])
+    # monitoring activity type: full timestamp and the activity byte
+    fit.define(8, 55, [(253, _UINT32), (24, _BYTE)])
+
+    heart_rate = 70
+    for minute in range(hours * 60):
+        now = begin + 60 * minute
+
+        if minute % 15 == 0:
+            activity_type = rng.choice([0, 1, 6, 8])
+            intensity = rng.randint(0, 7)
+            activity_byte = activity_type | (intensity << 5)
+
+            fit.write(1, now)
+            fit.write(8, now, activity_byte)
+            fit.write(
+                3,
+                now & 0xFFFF,
+                rng.randint(0, 40),
+                rng.randint(0, 900000),
+                rng.randint(0, 2000),
+                activity_byte,
+            )
+
+        heart_rate = min(max(heart_rate + rng.randint(-3, 3), 45), 160)
+        fit.write(2, (now + 30) & 0xFFFF, heart_rate)
+
+        if minute % 3 == 0:
+            fit.write(4, rng.randint(-2, 99), now)
+
+        if minute % 2 == 0:
+            fit.write(6, rng.randint(1000, 2000), now)
+
+        if minute % 60 == 0:
+            fit.write(7, rng.randint(90, 100), rng.randint(1, 4), 3, now)
+
+    fit.write(5, rng.randint(50, 70), rng.randint(50, 70), begin + 3600 * hours - 60)
+
+    return fit.getvalue()
+
+
+def make_sleep_fit(start, hours=8, seed=0):
+    """A sleep FIT file with one sleep stage record per minute"""
+    rng = random.Random(seed)
+    fit = FitWriter()
+    begin = _fit_timestamp(start)
+
+    fit.define(0, 0, [(0, _ENUM), (1, _UINT16), (4, _UINT32)])
+    fit.write(0, 49, 1, begin)
+
+    fit.define(1, 275, [(0, _UINT8), (253, _UINT32)])
+
+    stage = 2
+    for minute in range(hours * 60):
+        if rng.random() < 0.1:
+            stage = rng.randint(1, 4)
+
+        fit.write(1, stage, begin + 60 * minute)
+
+    return fit.getvalue()
+
+
+def make_activity_fit(start, minutes=45, seed=0):
+    """An activity FIT file with one record (timestamp, heart rate) per second"""
+    rng = random.Random(seed)
+    fit = FitWriter()
+    begin = _fit_timestamp(start)
+
+    fit.define(0, 0, [(0, _ENUM), (1, _UINT16), (4, _UINT32)])
+    fit.write(0, 4, 1, begin)
+
+    fit.define(1, 20, [(253, _UINT32), (3, _UINT8)])
+
+    heart_rate = 100
+    for second in range(minutes * 60):
+        heart_rate = min(max(heart_rate + rng.randint(-2, 2), 80), 180)
+        fit.write(1, begin + second, heart_rate)
+
+    return fit.getvalue()
+
+
+def write_garmin_folder(
+    root, patient_id, days=2, start=datetime(2024, 3, 4), activities=1, seed=0
+):
+    """
+    Write FIT-<patient_id>/GARMIN/{Monitor,Sleep,Activity} under root, one monitoring and one
+    sleep file per day plus the given number of activities.
+
+    Returns:
+        str: The participant folder.
+    """
+    folder = os.path.join(root, f"FIT-{patient_id}", "GARMIN")
+    files = {}
+
+    for day in range(days):
+        date = start + timedelta(days=day)
+        stem = f"{_fit_timestamp(date)}"
+
+        files[os.path.join("Monitor", f"{stem}.FIT")] = make_monitor_fit(
+            date, seed=seed + day
+        )
+        files[os.path.join("Sleep", f"{stem}.fit")] = make_sleep_fit(
+            date - timedelta(hours=2), seed=seed + day
+        )
+
+    for activity in range(activities):
+        date = start + timedelta(days=activity % max(days, 1), hours=17)
+        files[os.path.join("Activity", f"{_fit_timestamp(date)}.fit")] = (
+            make_activity_fit(date, seed=seed + activity)
+        )
+
+    for name, data in files.items():
+        path = os.path.join(folder, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, "wb") as f:
+            f.write(data)
+
+    return os.path.dirname(folder)
+
+
+def make_ecg_xml(patient_id, seconds=10, acquired=datetime(2023, 11, 28, 8, 44), seed=0):
+    """A Philips PageWriter TC30 resting 12 lead ECG with uncompressed Base64 waveforms"""
+    rng = np.random.default_rng(seed)
+    samples = seconds * 500
+
+    waveforms = rng.integers(-250, 250, size=(12, samples)).astype("<i2")
+    encoded = base64.b64encode(waveforms.tobytes()).decode()
+    encoded = "\n".join(encoded[i : i + 76] for i in range(0, len(encoded), 76))
+
+    date = acquired.strftime("%Y-%m-%d")
+    time = acquired.strftime("%H:%M:%S")
+
+    xml = f"""<?xml version="1.0" encoding="ISO-8859-1"?>
+<restingecgdata xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+  <documentinfo>
+    <documentname>{patient_id}_{seed}.xml</documentname>
+    <documenttype>PhilipsECG</documenttype>
+    <documentversion>1.04</documentversion>
+  </documentinfo>
+  <reportinfo date="{date}" time="{time}">
+    <reportdescription>Standard 12 Lead Report</reportdescription>
+    <reportgain>
+      <amplitudegain unit="mm/mv"><overallgain>10.00</overallgain></amplitudegain>
+      <timegain unit="mm/s">25.00</timegain>
+    </reportgain>
+    <reportbandwidth>
+      <highpassfiltersetting>0.15</highpassfiltersetting>
+      <lowpassfiltersetting>150</lowpassfiltersetting>
+      <notchfiltersetting>60</notchfiltersetting>
+      <notchharmonicssetting>1</notchharmonicssetting>
+      <artifactfilterflag>False</artifactfilterflag>
+      <hysteresisfilterflag>True</hysteresisfilterflag>
+    </reportbandwidth>
+  </reportinfo>
+  <userdefines>
+    <userdefine><label>Position</label><value>Supine</value></userdefine>
+    <userdefine><label>Technician</label><value>AIREADI</value></userdefine>
+  </userdefines>
+  <patient criteriaversionforpatientdata="0C">
+    <generalpatientdata>
+      <name><lastname>AIREADI</lastname><firstname>{patient_id}</firstname></name>
+    </generalpatientdata>
+  </patient>
+  <dataacquisition date="{date}" time="{time}">
+    <machine detaildescription="Philips Medical Products:860306:A.07.07.07">PageWriter TC30</machine>
+    <signalcharacteristics>
+      <samplingrate>500</samplingrate>
+      <acquisitiontype>STD-12</acquisitiontype>
+      <numberchannelsallocated>12</numberchannelsallocated>
+      <notchfiltered>True</notchfiltered>
+      <acsetting>60</acsetting>
+    </signalcharacteristics>
+  </dataacquisition>
+  <internalmeasurements measurementversion="11"/>
+  <interpretations>
+    <interpretation criteriaversion="0C">
+      <globalmeasurements>
+        <heartrate editedflag="False">{60 + seed % 40}</heartrate>
+        <print editedflag="False">160</print>
+        <qrsdur editedflag="False">90</qrsdur>
+        <qtint editedflag="False">400</qtint>
+        <qtcb editedflag="False">420</qtcb>
+        <pfrontaxis editedflag="False">60</pfrontaxis>
+        <qrsfrontaxis editedflag="False">45</qrsfrontaxis>
+        <tfrontaxis editedflag="False">40</tfrontaxis>
+      </globalmeasurements>
+      <mdsignatureline>Unconfirmed Diagnosis</mdsignatureline>
+      <severity code="NO" id="1">- NORMAL ECG -</severity>
+      <statement editedflag="False"><statementcode>SR    </statementcode><leftstatement>Sinus rhythm</leftstatement><rightstatement>normal P axis, V-rate  50- 99</rightstatement></statement>
+    </interpretation>
+  </interpretations>
+  <waveforms>
+    <parsedwaveforms dataencoding="Base64" compression="Uncompressed" durationperchannel="{seconds * 1000}" numberofleads="12" leadlabels="I II III aVR aVL aVF V1 V2 V3 V4 V5 V6">
+{encoded}
+    </parsedwaveforms>
+  </waveforms>
+</restingecgdata>
+"""
+
+    return xml.encode("latin-1")
+
+
+def make_env_sensor_zip(patient_id, sen55, visit_date, hours=24, seed=0):
+    """
+    An environmental sensor archive: one CSV per hour, each named after its first
+    timestamp, with a row every 5 seconds starting 16:00 UTC on the visit date.
+
+    Args:
+        sen55 (str): The 16 character SEN55 ID the sensor writes in the CSV headers.
+        visit_date (str): YYYY-MM-DD, matching the REDCap export.
+    """
+    rng = random.Random(seed)
+    start = datetime.strptime(visit_date, "%Y-%m-%d") + timedelta(hours=16)
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for hour in range(hours):
+            file_start = start + timedelta(hours=hour)
+            lines = ["; Version: 1.2.4", f"; SEN55 {sen55}", ENV_SENSOR_COLUMNS]
+
+            for row in range(720):
+                timestamp = file_start + timedelta(seconds=5 * row)
+                light = ",".join(str(rng.randint(0, 4000)) for _ in range(10))
+                particles = ",".join(f"{rng.uniform(0, 50):.1f}" for _ in range(4))
+
+                lines.append(
+                    f"{timestamp:%Y-%m-%d %H:%M:%S},{light},{particles},"
+                    f"{rng.uniform(20, 60):.2f},{rng.uniform(15, 30):.2f},"
+                    f"{rng.randint(50, 300)},{rng.randint(1, 20)},"
+                    f"{rng.randint(0, 1)},{rng.randint(0, 100)},{rng.uniform(20, 40):.2f}"
+                )
+
+            archive.writestr(
+                f"{file_start:%Y%m%d%H%M%S}.csv", "\n".join(lines) + "\n"
+            )
+
+    return buffer.getvalue()
+
+
+def make_dicom(
+    patient_id,
+    device="Eidon",
+    laterality="R",
+    rows=768,
+    columns=768,
+    acquired=datetime(2024, 3, 4, 9, 30),
+    seed=0,
+):
+    """
+    An ophthalmic photography DICOM (uncompressed RGB) as written by the Eidon or,
+    with device="Aurora", the Optomed camera.
+    """
+    rng = np.random.default_rng(seed)
+    uid_seed = f"{patient_id}-{device}-{laterality}-{seed}"
+
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = OPHTHALMIC_PHOTOGRAPHY_SOP_CLASS_UID
+    file_meta.MediaStorageSOPInstanceUID = generate_uid(
+        entropy_srcs=[uid_seed, "instance"]
+    )
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta = file_meta
+    ds.SOPClassUID = file_meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+    ds.StudyInstanceUID = generate_uid(entropy_srcs=[patient_id, "study"])
+    ds.SeriesInstanceUID = generate_uid(entropy_srcs=[uid_seed, "series"])
+    ds.Modality = "OP"
+    ds.Manufacturer = "Optomed" if device == "Aurora" else "CenterVue SpA"
+    ds.ManufacturerModelName = device
+    ds.PatientID = patient_id
+    ds.PatientName = f"AIREADI^{patient_id}"
+    ds.ReferringPhysicianName = "AIREADI^Benchmark"
+    ds.PatientSex = "O"
+    ds.PatientBirthDate = ""
+    ds.StudyDate = acquired.strftime("%Y%m%d")
+    ds.StudyTime = acquired.strftime("%H%M%S")
+    ds.SeriesDate = ds.StudyDate
+    ds.SeriesTime = ds.StudyTime
+    ds.ContentDate = ds.StudyDate
+    ds.ContentTime = ds.StudyTime
+    ds.AcquisitionDateTime = acquired.strftime("%Y%m%d%H%M%S")
+    ds.SeriesDescription = "Color"
+    ds.SeriesNumber = 1
+    ds.InstanceNumber = seed + 1
+    ds.ImageLaterality = laterality
+    ds.Laterality = laterality
+    ds.ImageType = ["ORIGINAL", "PRIMARY"]
+    ds.SamplesPerPixel = 3
+    ds.PhotometricInterpretation = "RGB"
+    ds.PlanarConfiguration = 0
+    ds.Rows = rows
+    ds.Columns = columns
+    ds.BitsAllocated = 8
+    ds.BitsStored = 8
+    ds.HighBit = 7
+    ds.PixelRepresentation = 0
+    ds.PixelData = rng.integers(0, 256, size=(rows, columns, 3), dtype=np.uint8).tobytes()
+
+    buffer = io.BytesIO()
+    pydicom.dcmwrite(buffer, ds, enforce_file_format=True)
+
+    return buffer.getvalue()
+
+
+def eidon_file_name(patient_id, laterality, index):
+    """A file name carrying one of the protocol markers the Eidon rules classify on"""
+    protocol = EIDON_PROTOCOLS[index % len(EIDON_PROTOCOLS)]
+
+    return f"{patient_id}_{laterality}_{index:04d}_{protocol}.dcm"
@@ -1,10 +1,8 @@
 import logging
 
 import pandas as pd
-import shutil
 
-from sierraecg import read_file as read_ecg_file
-from wfdb.io.convert.csv import csv_to_wfdb
+from wfdb import wrsamp
 
 from ecg import ecg_utils as ecg_utils
 
@@ -56,7 +54,7 @@ def audit_ecg_metadata(meta_dict):
 def rescale_signals(df, divide_by=200):
     """Accepts a pandas DataFrame of 12 lead values and applies a conversion.
 
-    The 2-step process of *.xml --> *.csv --> *.wfdb is handling the default ADC gain
+    Writing the *.xml lead values to *.wfdb with an ADC gain of 200 handles the gain
     factor in an unexpected way; reversing this effect is accomplished by dividing out the
     factor of 200. Rescaling is evaluated by examining the trailing square pulse which should
     be 1mV tall and 0.2 seconds wide in the final signal traces.
@@ -149,18 +147,25 @@ def convert_ecg(ecg_xml_path, temp_csv_folder, output_wfdb_folder):
     """Reads the xml file and converts to wfdb format, consisting of
         *.dat - waveform data only in binary format
         *.hea - header data to assist in reading the binary and to provide other annotations
+    The xml is parsed once and the *.dat and *.hea files are written straight to
+    output_wfdb_folder, so conversions can run concurrently.
     Args:
         ecg_xml_path (string): full path the xml file to convert
-        temp_csv_folder (string): full path to a folder that can hold the intermediate csv file
-        output_wfdb_folder (string): full path to the folder where the final *.dat and *.hea files should be moved
+        temp_csv_folder (string): no longer used; the signals are not staged as csv
+        output_wfdb_folder (string): full path to the folder where the final *.dat and *.hea files are written
     Returns:
         participant ID (string)
         full path to the output *.hea file (string)
     """
     conv_dict = dict()
 
+    # parse the xml once for both the meta data and the waveforms
+    restingecg = ecg_utils.parse_ecg_xml(ecg_xml_path)
+
     # read meta data
-    key_meta = ecg_utils.fetch_key_metadata(ecg_xml_path, extended_meta=True)
+    key_meta = ecg_utils.fetch_key_metadata(
+        ecg_xml_path, extended_meta=True, restingecg=restingecg
+    )
     pID = key_meta["participant_id"]
     conv_dict["participantID"] = pID
 
@@ -180,10 +185,9 @@ def convert_ecg(ecg_xml_path, temp_csv_folder, output_wfdb_folder):
     conv_logger.debug(f"dtstamp for file disambiguation is {dtstamp}")
 
     ecg_fname_base = f"{pID}_ecg_{dtstamp_md5[-8:]}"
-    temp_csv_file = temp_csv_folder + f"/{ecg_fname_base}.csv"
 
-    # read the xml file and separate out the values for the leads
-    f = read_ecg_file(ecg_xml_path)
+    # decode the waveforms and separate out the values for the leads
+    f = ecg_utils.read_ecg_waveforms(restingecg)
     lead_dict = dict()
     for lead in f.leads:
         lead_dict[lead.label] = lead
@@ -191,57 +195,40 @@ def convert_ecg(ecg_xml_path, temp_csv_folder, output_wfdb_folder):
             f"{lead.label}:\tduration={lead.duration} sampling_freq={lead.sampling_freq} {lead.samples[0:6]}..."
         )
     lead_simple_dict = {k: lead_dict[k].samples for k in lead_dict.keys()}
-    # read_ecg_file lead values are all integers from about -250 to + 250, although in the df they
-    #  get saved as 200.000000 with 6 zeros
+    # lead values are all integers from about -250 to + 250
 
-    # load signals into a df, rescale, convert to csv in preparation for csv_to_wfdb
+    # load signals into a df and rescale
     df = pd.DataFrame(lead_simple_dict)
     df = rescale_signals(
         df, divide_by=200
     )  # rescale xml lead signals to get correct test pulse
-    df.to_csv(temp_csv_file, index=False)
-    conv_logger.debug(f"ECG intermediate csv file has been written to {temp_csv_file}")
+    n_sig = len(df.columns)
 
-    # outut wfdb file
-    # wfdb.io.convert.csv.csv_to_wfdb -- not our own routine
-    # creates both *.dat and *.hea
-    # ~/opt/anaconda3/envs/ai_readi_311/lib/python3.11/site-packages/wfdb/io/convert/csv.py # if we want to modify it
     comments_to_insert = assemble_hea_comments(f, key_meta)
 
-    # print("temp_csv_file", temp_csv_file)
-
-    # reminder that csv_to_wfdb() writes to the current dir and is not configurable
+    # output wfdb files; creates both *.dat and *.hea in output_wfdb_folder
+    # the arguments match what wfdb.io.convert.csv.csv_to_wfdb passed to wrsamp for the
+    # intermediate csv file used previously, so the output is unchanged
     # note that the adc_gain and the required rescaling above are likely linked; future work will
     # try to disentangle this; for now, just check the gain settings so that this approach provides
     # consistent output
-    csv_to_wfdb(
-        temp_csv_file,
+    wrsamp(
+        ecg_fname_base,
         fs=lead.sampling_freq,  # sampling freq is 500 for ECG data from the Philips device
-        fmt="16",  # fmt must be a list or else a single string that will be applied to all channels
-        # Accepted formats are: '80','212','16','24', and '32'
-        adc_gain=200,  # Default is 200
-        units="mV",
+        units=["mV"] * n_sig,
+        sig_name=df.columns.tolist(),
+        p_signal=df.to_numpy(dtype="float64"),
+        fmt=["16"] * n_sig,  # Accepted formats are: '80','212','16','24', and '32'
+        adc_gain=[200] * n_sig,  # Default is 200
+        baseline=[0] * n_sig,
         comments=comments_to_insert,  # comments will be added to the *.hea file only
-        verbose=False,
-    )  # has no return value
-
-    # move the wfdb output files from the current directory to the intended directory
-
-    ecg_as_dat = ecg_fname_base + ".dat"
-    ecg_as_hea = ecg_fname_base + ".hea"
-
-    src_dat = f"./{ecg_as_dat}"
-    src_hea = f"./{ecg_as_hea}"
-
-    dest_dat = f"{output_wfdb_folder}/{ecg_as_dat}"
-    dest_hea = f"{output_wfdb_folder}/{ecg_as_hea}"
-
-    conv_logger.info(f"ECG data file moved from {src_dat} to {dest_dat}")
+        write_dir=output_wfdb_folder,
+    )
 
-    ret_dat = shutil.move(src_dat, dest_dat)
-    ret_hea = shutil.move(src_hea, dest_hea)
+    dest_dat = f"{output_wfdb_folder}/{ecg_fname_base}.dat"
+    dest_hea = f"{output_wfdb_folder}/{ecg_fname_base}.hea"
 
-    conv_logger.debug(f"Return values from shutil.move are {ret_dat} and {ret_hea}")
+    conv_logger.info(f"ECG data file written to {dest_dat}")
 
     conv_dict["output_hea_file"] = dest_hea
     conv_dict["output_dat_file"] = dest_dat
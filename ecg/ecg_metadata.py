@@ -78,6 +78,10 @@ class ECGManifest:
 
         self.manifest.append(entry)
 
+    def add_entries(self, entries):
+        # Entries recorded by an earlier run, with their file paths already set
+        self.manifest.extend(entries)
+
     def write_tsv(
         self,
         file_path: str,
@@ -1,8 +1,13 @@
 import logging
 
-from defusedxml import minidom
 import xmltodict
 import hashlib
+from sierraecg import EcgLead, SierraEcgFile, UnsupportedXmlFileError
+
+# Not part of the public API of sierraecg, which is pinned for them in requirements.txt;
+# python -m dev.ecg_reader_conformance checks a new version against sierraecg.read_file
+from sierraecg.lib import get_lead_name, read_base64_encoding, split_leads
+from sierraecg.xli import xli_decode
 
 utils_logger = logging.getLogger("ecg.utils")
 
@@ -116,21 +121,127 @@ def get_text_if_exists(element):
     return return_val
 
 
-def fetch_key_metadata(ecg_file, extended_meta=False):
+def parse_ecg_xml(ecg_file):
+    """Parses an ecg .xml file once; the result feeds both the metadata and the waveforms.
+    Args:
+        ecg_file (string): complete path to the xml file, e.g. /path/to/ecg.xml
+    Returns:
+        dict: the restingecgdata element as parsed by xmltodict
+    """
+    with open(ecg_file, "rb") as f:
+        xml_dict = xmltodict.parse(f)
+
+    return xml_dict["restingecgdata"]
+
+
+def get_xml_text(element):
+    """Returns the text of a parsed xml element, with or without attributes.
+    Args:
+        element: a string, a dict holding #text, or None for an empty element
+    Returns:
+        string
+    """
+    if element is None:
+        return ""
+    if isinstance(element, dict):
+        return element.get("#text", "")
+    return element
+
+
+def read_ecg_waveforms(restingecg):
+    """Decodes the lead waveforms of a parsed ecg .xml.
+
+    Follows sierraecg.read_file, which would parse the file a second time; the limb leads
+    III, aVR, aVL and aVF are derived from the stored values in the same way.
+    Args:
+        restingecg (dict): output of parse_ecg_xml
+    Returns:
+        sierraecg.SierraEcgFile with doc_type, doc_ver and leads
+    """
+    doc_info = restingecg["documentinfo"]
+    doc_type = get_xml_text(doc_info["documenttype"])
+    doc_ver = get_xml_text(doc_info["documentversion"])
+    if doc_type not in ["SierraECG", "PhilipsECG"] or doc_ver not in [
+        "1.03",
+        "1.04",
+        "1.04.01",
+        "1.04.02",
+    ]:
+        raise UnsupportedXmlFileError(
+            f"Files of type {doc_type} {doc_ver} are unsupported"
+        )
+
+    signal_details = restingecg["dataacquisition"]["signalcharacteristics"]
+    parsed_waveforms = restingecg["waveforms"]["parsedwaveforms"]
+
+    sampling_freq = int(get_xml_text(signal_details["samplingrate"]))
+    duration = int(parsed_waveforms["@durationperchannel"])
+    sample_count = int(duration * (sampling_freq / 1000))
+
+    lead_labels = parsed_waveforms.get("@leadlabels", "")
+    if lead_labels != "":
+        labels = lead_labels.split(" ")[: int(parsed_waveforms["@numberofleads"])]
+    else:
+        good_channels = int(get_xml_text(signal_details["numberchannelsallocated"]))
+        leads_used = get_xml_text(signal_details["acquisitiontype"])
+        labels = [get_lead_name(leads_used, x + 1) for x in range(good_channels)]
+
+    encoding = parsed_waveforms["@dataencoding"]
+    if encoding != "Base64":
+        raise UnsupportedXmlFileError(f"Waveform data encoding unsupported: {encoding}")
+    waveform_data = read_base64_encoding(get_xml_text(parsed_waveforms))
+
+    compression_method = parsed_waveforms.get(
+        "@compressmethod", parsed_waveforms.get("@compression", "Uncompressed")
+    )
+    if compression_method == "XLI":
+        samples = xli_decode(waveform_data, labels)
+    elif compression_method == "Uncompressed":
+        samples = split_leads(waveform_data, len(labels), sample_count)
+    else:
+        raise UnsupportedXmlFileError(
+            f"Waveform data compression algorithm unsupported: {compression_method}"
+        )
+
+    # the stored limb leads are differences; int16 arithmetic and floor division
+    # match the per sample loop in sierraecg.read_file
+    lead_i, lead_ii, lead_iii, lead_avr, lead_avl, lead_avf = samples[:6]
+    lead_iii = lead_ii - lead_i - lead_iii
+    samples[2] = lead_iii
+    samples[3] = -lead_avr - (lead_i + lead_ii) // 2
+    samples[4] = (lead_i - lead_iii) // 2 - lead_avl
+    samples[5] = (lead_ii + lead_iii) // 2 - lead_avf
+
+    leads = []
+    for label, lead_samples in zip(labels, samples):
+        lead = EcgLead()
+        lead.label = label
+        lead.sampling_freq = sampling_freq
+        lead.duration = duration
+        lead.samples = lead_samples
+        leads.append(lead)
+
+    ecg_file = SierraEcgFile()
+    ecg_file.doc_type = doc_type
+    ecg_file.doc_ver = doc_ver
+    ecg_file.leads = leads
+
+    return ecg_file
+
+
+def fetch_key_metadata(ecg_file, extended_meta=False, restingecg=None):
     """Reads an ecg .xml file and returns selected text data. No waveforms are returned or processed.
     Args:
         ecg_file (string): complete path to the xml file, e.g. /path/to/ecg.xml
         extended_meta (boolean):
             True: return more data for the hea files
             False: return limited data for the manifest
+        restingecg (dict): output of parse_ecg_xml, when the file has already been parsed
     Returns:
         dict: structured output of text information from the *.xml; no waveforms are included
     """
-    xdom = minidom.parse(ecg_file)
-    content = xdom.documentElement.toxml()  # a very long string!
-    xml_dict = xmltodict.parse(content)
-
-    restingecg = xml_dict["restingecgdata"]
+    if restingecg is None:
+        restingecg = parse_ecg_xml(ecg_file)
 
     key_items = dict()
 
@@ -4,10 +4,13 @@ from pathlib import Path
 import os
 import pkgutil
 
+from . import es_metadata
 from . import es_utils
 
 conv_logger = logging.getLogger("es.converter")
 
+CONST_EXPORT_BLOCK_BYTES = 4 * 1024 * 1024  # size of the blocks of data rows written
+
 
 def customize_selfdoc_header(chdr):
     """Reads the self-documenting header template and inserts custom meta data
@@ -54,6 +57,30 @@ def customize_selfdoc_header(chdr):
     return hdr_line_list  # return the customized header
 
 
+def data_row_blocks(data_list, block_bytes=CONST_EXPORT_BLOCK_BYTES):
+    """Yields the rows of data as large blocks of bytes, each row ending with a newline
+
+    DataRows already hold the rows this way and are written straight from their
+    buffer; a list of rows is joined into blocks of about block_bytes.
+
+    Args:
+        data_list (DataRows or list): rows of data, as in s["t"]["data_list"]
+        block_bytes (int): (Optional) size of the blocks
+    Returns:
+        generator of bytes-like blocks
+    """
+    if isinstance(data_list, es_utils.DataRows):
+        text = data_list.text
+        for start in range(0, len(text), block_bytes):
+            yield text[start : start + block_bytes]
+        return
+
+    rows_per_block = max(1, block_bytes // 160)  # rows are at most 160 characters
+    for start in range(0, len(data_list), rows_per_block):
+        block = data_list[start : start + rows_per_block]
+        yield "".join(f"{line}\n" for line in block).encode("utf-8")
+
+
 def pipeline_es_export(s):
     """Writes out env sensor data as an enhanced csv with self-documenting header info.
 
@@ -62,7 +89,7 @@ def pipeline_es_export(s):
         col_names (string): csv row providing the columns names
         hdr_custom_values (dict): header element keys, values used to customize the header section
     Returns:
-        s (dict): status, error counts, etc.
+        s (dict): status, error counts, manifest metadata of the output file, etc.
     """
     hdr_line_list = customize_selfdoc_header(s["r"])
 
@@ -78,20 +105,26 @@ def pipeline_es_export(s):
 
     if qa_complete and (s["t"]["errorCount"] == 0):
         try:
-            with open(s["t"]["outfile_posixpath"], "w") as f:
-                # write header
-                for k in hdr_line_list:
-                    f.write(f"{k}\n")  # \n confirm this is needed
-
-                # write column names
-                f.write(f"{s['r']['column_names']}\n")
-                # TODO: check vs template
+            with open(s["t"]["outfile_posixpath"], "wb") as f:
+                # write header and column names in one block
+                # TODO: check column names vs template
+                header = "".join(f"{k}\n" for k in hdr_line_list)
+                header += f"{s['r']['column_names']}\n"
+                f.write(header.encode("utf-8"))
 
                 # write rows of data
-                for line in s["t"]["data_list"]:
-                    f.write(f"{line}\n")
+                for block in data_row_blocks(s["t"]["data_list"]):
+                    f.write(block)
             s["output_file"] = str(s["t"]["outfile_posixpath"])
             s["conversion_success"] = True
+
+            # same values metadata_env_sensor would read back from the header
+            try:
+                s["metadata"] = es_metadata.metadata_from_header(hdr_line_list)
+            except Exception as e:  # as metadata_env_sensor, the output file is kept
+                conv_logger.error(
+                    f'Exception {e} for {s["output_file"]} when trying to fill meta_dict.'
+                )
         except Exception as e:
             err_msg = (
                 f'Problem {e} writing the output file {s["t"]["outfile_posixpath"]}'
@@ -189,6 +222,7 @@ def create_struct_s(input_path, output_folder, filter_level):
         "output_file": None,  # str will be set if export (conversion) is a success
         "conversion_success": False,  # will be set by export() if errorCount == 0
         "conversion_issues": [],  # start with default
+        "metadata": {},  # manifest values, set by export() with the output_file
     }
     return s
 
@@ -214,7 +248,7 @@ def convert_env_sensor(
         build_file (string): Full path to a csv file with sensor ID mapped to SEN55
             Default is to use the es_sensor_id.csv included with the ES code files
     Returns:
-        dict containing status, issues, and the full path to the output_file
+        dict containing status, issues, the full path to the output_file and its metadata
     """
     # Default struct values enable QA to proceed where possible
     s = create_struct_s(input_path, output_folder, filter_level)
@@ -29,23 +29,7 @@ def metadata_env_sensor(input_csv_file):
         return meta_dict
 
     try:
-        header_dict = dict()
-        for line in header_list:
-            myline = line.strip().split(":")
-            k = myline[0][1:].strip()
-            header_dict[k] = myline[1].strip()
-
-        meta_dict["modality"] = "environmental_sensor"
-        meta_dict["manufacturer"] = header_dict["environmental_sensor_manufacturer"]
-        meta_dict["device"] = header_dict["environmental_sensor_device_model"]
-        meta_dict["laterality"] = "none"
-        meta_dict["participant_id"] = header_dict["meta_participant_id"]
-        meta_dict["sensor_id"] = header_dict["meta_sensor_id"]
-        meta_dict["sensor_location"] = header_dict["meta_sensor_location"]
-        meta_dict["number_of_observations"] = header_dict["meta_number_of_observations"]
-        meta_dict["sensor_sampling_extent_in_days"] = header_dict[
-            "meta_extent_of_observation_in_days"
-        ]
+        meta_dict = metadata_from_header(header_list)
     except Exception as e:  # reading a non-self-documenting csv if most likely
         meta_logger.error(
             f"Exception {e} for {input_csv_file} when trying to fill meta_dict."
@@ -55,6 +39,41 @@ def metadata_env_sensor(input_csv_file):
     return meta_dict
 
 
+def metadata_from_header(header_list):
+    """
+    Retrieve the metadata from the lines of a self-documenting header.
+    The converter passes the header it wrote, so the metadata of a new file comes
+    without reading it back.
+
+    Args:
+        header_list (list): lines of the self-documenting header, "# key: value"
+
+    Returns:
+        dictionary of metadata
+    """
+    meta_dict = dict()
+
+    header_dict = dict()
+    for line in header_list:
+        myline = line.strip().split(":")
+        k = myline[0][1:].strip()
+        header_dict[k] = myline[1].strip()
+
+    meta_dict["modality"] = "environmental_sensor"
+    meta_dict["manufacturer"] = header_dict["environmental_sensor_manufacturer"]
+    meta_dict["device"] = header_dict["environmental_sensor_device_model"]
+    meta_dict["laterality"] = "none"
+    meta_dict["participant_id"] = header_dict["meta_participant_id"]
+    meta_dict["sensor_id"] = header_dict["meta_sensor_id"]
+    meta_dict["sensor_location"] = header_dict["meta_sensor_location"]
+    meta_dict["number_of_observations"] = header_dict["meta_number_of_observations"]
+    meta_dict["sensor_sampling_extent_in_days"] = header_dict[
+        "meta_extent_of_observation_in_days"
+    ]
+
+    return meta_dict
+
+
 class ESManifest:
     def __init__(self):
         self.manifest = []
@@ -65,6 +84,10 @@ class ESManifest:
 
         self.manifest.append(entry)
 
+    def add_entries(self, entries):
+        # Entries recorded by an earlier run, with their file paths already set
+        self.manifest.extend(entries)
+
     def write_tsv(
         self,
         file_path: str,
@@ -50,6 +50,7 @@ class EnvironmentalSensor(DataDomain):
     metadata() will
         expect a self-documenting CSV-like file
         return a dictionary of metadata
+        (convert() already returns it for the file it writes, under "metadata")
         # TODO: update description of metadata() after code is final #30
 
     dataplot() will
@@ -98,6 +99,8 @@ class EnvironmentalSensor(DataDomain):
             output_file (string) : path to the file with the selfdocumenting header
             conversion_success (boolean): whether or not the final conversion was completed
             conversion_issues (list of strings): issues that interfered with conversion
+            metadata (dict): what metadata() returns for the output_file, empty if
+                the conversion was not completed
         """
         logger.info(f"ES conversion starting for {input_path}")
         conv_dict = es_conv.convert_env_sensor(
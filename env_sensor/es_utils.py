@@ -6,10 +6,12 @@ import glob
 import os
 import pkgutil  # to get access to the sensor_id asset file
 import io  # for io.BytesIO to read the asset file
+import locale  # the encoding read_single_csv reads files with
 
 # plotting
 # import matplotlib.pyplot as plt
 
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta, date
 
@@ -276,6 +278,18 @@ def find_short_run(data_list, min_gap_delta, max_lines=240):
     found_chop = False
     if len(data_list) < 2:
         return False, 0  # found_chop cannot be found, trim_nlines is 0
+
+    if isinstance(data_list, DataRows):
+        # Same scan on the parsed timestamps: the first gap within max_lines + 1 rows
+        last_line = min(len(data_list) - 1, max_lines + 1)
+        t_deltas = np.diff(data_list.timestamps[: last_line + 1])
+        gaps = np.flatnonzero(t_deltas > np.timedelta64(min_gap_delta))
+        if len(gaps):
+            m = f"...reached max_t_delta at line {gaps[0] + 1}"
+            utils_logger.debug(m)
+            return True, int(gaps[0]) + 1
+        return False, last_line
+
     tstr0 = data_list[0].split(",")[0]  # string
     timestamp0 = get_datetime_from_timestr(tstr0)  # datetime
 
@@ -528,7 +542,7 @@ def eh(s, emsg):
     return s
 
 
-def read_files(file_list, filter_level=1):
+def read_files(file_list, filter_level=1, columnar=True):
     """Reads each file in the file_list and gathers
         header, column name, and data
     information for further checking and exporting.
@@ -539,10 +553,13 @@ def read_files(file_list, filter_level=1):
             0 - no filtering
             1 - remove files with fewer data lines than CONST_MIN_DATA_LINES
             ... additional levels of filtering are not performed here
+        columnar (bool): (Optional) Read the files with read_csvs_columnar and
+            return the data as DataRows; False reads them line by line with
+            read_single_csv and returns a list
     Returns:
         header_list_all (list): List of strings, one for each file header
         column_dict_all (dict): One dict for each file ...
-        data_list_all (list): List of strings, one for each row of the file data
+        data_list_all (list or DataRows): One string for each row of the file data
         err_dict (dict): Errors and warnings encountered
     """
     # reminders for when switch to passing in s
@@ -551,7 +568,7 @@ def read_files(file_list, filter_level=1):
 
     header_list_all = list()
     column_dict_all = dict()
-    data_list_all = list()
+    data_parts = list()
     err_dict = dict()
     num_orig_data_lines = 0
 
@@ -560,13 +577,18 @@ def read_files(file_list, filter_level=1):
     date_prev = None
     num_final_files = 0
 
-    for idx, fname in enumerate(file_list):
+    if columnar:
+        file_contents = read_csvs_columnar(file_list)
+    else:
+        file_contents = (
+            read_single_csv(fname, return_errs=True) for fname in file_list
+        )
+
+    for idx, (fname, contents) in enumerate(zip(file_list, file_contents)):
 
         keep_file_data = True  # True until we find a reason not to keep it
         fname_short = os.path.basename(fname)
-        sen55_id, header_list, column_dict, data_list, f_err_dict = read_single_csv(
-            fname, return_errs=True
-        )
+        sen55_id, header_list, column_dict, data_list, f_err_dict = contents
 
         nlines = len(data_list)
         # add all readable lines to the count of original lines prior to any filtering
@@ -614,9 +636,14 @@ def read_files(file_list, filter_level=1):
         if keep_file_data:
             num_final_files += 1
             header_list_all.extend(header_list)
-            data_list_all.extend(data_list)
+            data_parts.append(data_list)
             column_dict_all[fname_short] = column_dict
 
+    if columnar:
+        data_list_all = DataRows.concat(data_parts)
+    else:
+        data_list_all = [row for data_list in data_parts for row in data_list]
+
     return (
         header_list_all,
         column_dict_all,
@@ -781,6 +808,466 @@ def read_single_csv(fname, return_errs=True):
     return sen55_id, header_list, column_string, data_list, err_dict
 
 
+# Columnar reader: parses the csv files of a deployment as arrays instead of line by line
+
+# Bytes that str.strip() removes from an ASCII line
+CONST_STRIP_BYTES = b" \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f"
+CONST_TIMESTR_LEN = 19  # YYYY-MM-DD HH:mm:ss
+# Positions of the digits and separators in a YYYY-MM-DD HH:mm:ss timestring
+CONST_TIMESTR_DIGITS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+CONST_TIMESTR_SEPARATORS = {4: "-", 7: "-", 10: " ", 13: ":", 16: ":"}
+
+_is_strip_byte = np.zeros(256, dtype=bool)
+_is_strip_byte[list(CONST_STRIP_BYTES)] = True
+
+
+class DataRows:
+    """The data rows of a deployment, held column-wise instead of as a list of strings
+
+    The rows are stored back to back in one byte array, each followed by a newline,
+    with the offset where each row starts and its timestamp as datetime64[s]. Indexing
+    returns a row as a string and slicing returns a view, so the pipeline steps that
+    treat the rows as a list keep working.
+
+    Args:
+        text (np.ndarray): uint8 array of the rows, each ending with a newline
+        starts (np.ndarray): int64 offset of each row in text
+        timestamps (np.ndarray): datetime64[s] timestamp of each row
+    """
+
+    def __init__(self, text, starts, timestamps):
+        self.text = text
+        self.starts = starts
+        self.timestamps = timestamps
+
+    @classmethod
+    def from_list(cls, data_list):
+        """Builds DataRows from rows read by read_single_csv; all have valid timestamps"""
+        text = "".join(f"{line}\n" for line in data_list).encode("utf-8")
+        lengths = [len(line.encode("utf-8")) + 1 for line in data_list]
+        starts = np.cumsum([0] + lengths[:-1], dtype=np.int64)[: len(data_list)]
+
+        # The timestrings are parsed as arrays, as read_csvs_columnar does
+        first_fields = [line.split(",", 1)[0] for line in data_list]
+        window = np.array(first_fields, dtype=f"U{CONST_TIMESTR_LEN}")
+        window = window.view(np.uint32).reshape(-1, CONST_TIMESTR_LEN)
+        window = np.where(window < 128, window, 0).astype(np.uint8)
+        strict = np.array([len(f) == CONST_TIMESTR_LEN for f in first_fields], bool)
+        seconds, _ = parse_timestrings(window, strict, first_fields.__getitem__)
+
+        return cls(
+            np.frombuffer(text, dtype=np.uint8),
+            starts,
+            seconds.astype("datetime64[s]"),
+        )
+
+    @classmethod
+    def concat(cls, parts):
+        """Joins DataRows one after the other"""
+        offsets = np.cumsum([0] + [len(p.text) for p in parts[:-1]], dtype=np.int64)
+        return cls(
+            np.concatenate([p.text for p in parts] or [np.zeros(0, dtype=np.uint8)]),
+            np.concatenate(
+                [p.starts + o for p, o in zip(parts, offsets)]
+                or [np.zeros(0, dtype=np.int64)]
+            ),
+            np.concatenate(
+                [p.timestamps for p in parts] or [np.zeros(0, dtype="datetime64[s]")]
+            ),
+        )
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _end(self, index):
+        # Offset just past the newline of row index
+        return self.starts[index + 1] if index + 1 < len(self) else len(self.text)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("DataRows only supports contiguous slices")
+            if start >= stop:
+                return DataRows(self.text[:0], self.starts[:0], self.timestamps[:0])
+            first = self.starts[start]
+            return DataRows(
+                self.text[first : self._end(stop - 1)],
+                self.starts[start:stop] - first,
+                self.timestamps[start:stop],
+            )
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("DataRows index out of range")
+        row = self.text[self.starts[index] : self._end(index) - 1]
+        return row.tobytes().decode("utf-8")
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+def _strip_bounds(buf, starts, ends):
+    """Moves the start and end of each line past the bytes str.strip() would remove"""
+    starts = starts.copy()
+    ends = ends.copy()
+
+    while True:
+        lead = starts < ends
+        lead[lead] = _is_strip_byte[buf[starts[lead]]]
+        if not lead.any():
+            break
+        starts[lead] += 1
+
+    while True:
+        trail = starts < ends
+        trail[trail] = _is_strip_byte[buf[ends[trail] - 1]]
+        if not trail.any():
+            break
+        ends[trail] -= 1
+
+    return starts, ends
+
+
+def _strip_non_ascii_lines(raw, line_starts, line_ends, starts, ends, lengths):
+    """Strips the lines holding non-ASCII characters as str.strip() does
+
+    Only these lines are decoded; their stripped bounds stay byte offsets and their
+    lengths become counts of characters, as len() gives them for read_single_csv.
+    """
+    is_high = np.frombuffer(raw, dtype=np.uint8) >= 128
+    has_high = np.add.reduceat(is_high, line_starts) > 0 if len(line_starts) else []
+
+    for line in np.flatnonzero(has_high):
+        text = raw[line_starts[line] : line_ends[line]].decode("utf-8")
+        lead = len(text) - len(text.lstrip())
+        stripped = text.strip()
+        starts[line] = line_starts[line] + len(text[:lead].encode("utf-8"))
+        ends[line] = starts[line] + len(stripped.encode("utf-8"))
+        lengths[line] = len(stripped)
+
+
+def scan_csv(fname):
+    """Splits one raw csv into lines and classifies them as arrays
+
+    Lines end at a newline, a carriage return or both, as iterating over the file
+    in text mode splits them. Returns None for a file the array path would not read
+    exactly as read_single_csv does: one that does not decode as UTF-8 or that holds
+    non-ASCII text while read_single_csv would read it with another encoding.
+
+    Args:
+        fname (string): Path to the *.csv to read
+    Returns:
+        scan (dict): buffer, stripped line bounds, line kinds, data line fields
+    """
+    with open(fname, "rb") as f:
+        raw = f.read()
+
+    is_ascii = raw.isascii()
+    if not is_ascii:
+        if locale.getpreferredencoding(False).lower().replace("-", "") != "utf8":
+            return None
+        try:
+            raw.decode("utf-8")
+        except UnicodeDecodeError:  # read_single_csv stops at the undecodable chunk
+            return None
+
+    buf = np.frombuffer(raw, dtype=np.uint8)
+    is_newline = buf == ord("\n")
+    is_break = is_newline.copy()
+    # A carriage return ends a line unless it is the start of a CRLF
+    is_break[:-1] |= (buf[:-1] == ord("\r")) & ~is_newline[1:]
+    if len(buf):
+        is_break[-1] |= buf[-1] == ord("\r")
+
+    breaks = np.flatnonzero(is_break)
+    line_starts = np.concatenate([[0], breaks + 1])
+    line_ends = np.concatenate([breaks, [len(buf)]])
+    if line_starts[-1] == len(buf):  # nothing after the last line break
+        line_starts = line_starts[:-1]
+        line_ends = line_ends[:-1]
+
+    starts, ends = _strip_bounds(buf, line_starts, line_ends)
+    lengths = ends - starts
+    if not is_ascii:
+        _strip_non_ascii_lines(raw, line_starts, line_ends, starts, ends, lengths)
+
+    # Blank lines are never data; read_single_csv fails on them
+    is_blank = lengths == 0
+    first = buf[np.minimum(starts, len(buf) - 1)]
+    second = buf[np.minimum(starts + 1, len(buf) - 1)]
+    is_long = lengths > 160
+    is_header = ~is_long & ~is_blank & ((first == ord(";")) | (first == ord("#")))
+    is_columns = (
+        ~is_long
+        & ~is_header
+        & (lengths >= 2)
+        & (first == ord("t"))
+        & (second == ord("s"))
+    )
+    is_data = ~is_long & ~is_blank & ~is_header & ~is_columns
+
+    data_lines = np.flatnonzero(is_data)
+    data_starts = starts[data_lines]
+    data_lengths = lengths[data_lines]
+
+    # Lines can hold no commas past their stripped end, only whitespace
+    commas = np.add.reduceat(buf == ord(","), starts, dtype=np.int64)
+    num_fields = commas[data_lines] + 1
+
+    # The first field is a strict timestring when it is exactly 19 characters long
+    wide = data_lengths >= CONST_TIMESTR_LEN
+    window = np.zeros((len(data_lines), CONST_TIMESTR_LEN), dtype=np.uint8)
+    positions = data_starts[wide, None] + np.arange(CONST_TIMESTR_LEN)
+    window[wide] = buf[positions]
+    after = np.full(len(data_lines), ord(","), dtype=np.uint8)
+    longer = data_lengths > CONST_TIMESTR_LEN
+    after[longer] = buf[data_starts[longer] + CONST_TIMESTR_LEN]
+    strict = wide & (after == ord(","))
+
+    return {
+        "buf": buf,
+        "line_starts": line_starts,
+        "line_ends": line_ends,
+        "starts": starts,
+        "ends": ends,
+        "lengths": lengths,
+        "is_blank": is_blank,
+        "is_long": is_long,
+        "is_header": is_header,
+        "is_columns": is_columns,
+        "data_lines": data_lines,
+        "num_fields": num_fields,
+        "window": window,
+        "strict": strict,
+    }
+
+
+def parse_timestrings(window, strict, first_fields):
+    """Converts timestrings to seconds since the epoch, as strptime would accept them
+
+    Strict YYYY-MM-DD HH:mm:ss timestrings are converted as arrays; the rare other
+    first fields go through get_datetime_from_timestr, which is more lenient
+    (e.g. unpadded 2024-3-4).
+
+    Args:
+        window (np.ndarray): (n, 19) uint8 bytes at the start of each row
+        strict (np.ndarray): bool, rows whose first field is 19 characters long
+        first_fields (callable): returns the first field of row i as a string
+    Returns:
+        seconds (np.ndarray): int64 seconds since the epoch
+        valid (np.ndarray): bool, whether the timestring is valid
+    """
+    digits = window[:, CONST_TIMESTR_DIGITS].astype(np.int32) - ord("0")
+    pattern = ((digits >= 0) & (digits <= 9)).all(axis=1)
+    for position, separator in CONST_TIMESTR_SEPARATORS.items():
+        pattern &= window[:, position] == ord(separator)
+    pattern &= strict
+
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 4] * 10 + digits[:, 5]
+    day = digits[:, 6] * 10 + digits[:, 7]
+    hour = digits[:, 8] * 10 + digits[:, 9]
+    minute = digits[:, 10] * 10 + digits[:, 11]
+    second = digits[:, 12] * 10 + digits[:, 13]
+
+    valid = pattern & (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1)
+    valid &= (hour <= 23) & (minute <= 59) & (second <= 59)
+
+    months = np.where(valid, (year - 1970) * 12 + month - 1, 0)
+    month_start = months.astype("datetime64[M]")
+    dates = month_start.astype("datetime64[D]") + np.where(valid, day - 1, 0)
+    valid &= dates.astype("datetime64[M]") == month_start  # day fits the month
+
+    seconds = dates.astype(np.int64) * 86400 + hour * 3600 + minute * 60 + second
+    seconds[~valid] = 0
+
+    for index in np.flatnonzero(~pattern):
+        try:
+            dto = datetime.strptime(first_fields(index), "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            continue
+        seconds[index] = int(np.datetime64(dto, "s").astype(np.int64))
+        valid[index] = True
+
+    return seconds, valid
+
+
+def _line_text(scan, line):
+    # The line as iterating over the file in text mode returns it
+    buf = scan["buf"]
+    end = scan["line_ends"][line]
+    text = buf[scan["line_starts"][line] : end].tobytes().decode("utf-8")
+    if end < len(buf):  # ends with a line break, which text mode makes a newline
+        text = text.rstrip("\r") + "\n"
+    return text
+
+
+def _stripped_text(scan, line):
+    return (
+        scan["buf"][scan["starts"][line] : scan["ends"][line]].tobytes().decode("utf-8")
+    )
+
+
+def _kept_rows(scan, kept_lines, timestamps):
+    """Copies the stripped data lines to keep into DataRows, each ending with a newline"""
+    buf = scan["buf"]
+    starts = scan["starts"][kept_lines]
+    ends = scan["ends"][kept_lines]
+
+    # The byte after each stripped row is whitespace (or past the end), so it can
+    # become the newline of the row
+    padded = np.empty(len(buf) + 1, dtype=np.uint8)
+    padded[:-1] = buf
+    padded[ends] = ord("\n")
+
+    edges = np.zeros(len(padded) + 1, dtype=np.int8)
+    edges[starts] += 1
+    edges[ends + 1] -= 1
+    text = padded[np.cumsum(edges[:-1], dtype=np.int8).astype(bool)]
+
+    lengths = ends - starts + 1
+    row_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+    return DataRows(text, row_starts[: len(kept_lines)], timestamps)
+
+
+def read_csvs_columnar(file_list):
+    """Reads raw csv files as read_single_csv does, with the checks done as arrays
+
+    Lines are split and classified per file, then the timestamps of the data lines
+    of all files are parsed and checked in one pass. Per file, as in parse_data_row,
+    a data line is kept if its timestring is valid and it has CONST_NUMCOLS_RAWCSV
+    fields, and the first valid timestring that is not later than the last kept one
+    discards the rest of the file (TimestampRetro). Files the array path cannot read
+    exactly are read with read_single_csv.
+
+    Args:
+        file_list (list of strings): Paths to the *.csv files to read
+    Returns:
+        list with one tuple per file, as read_single_csv returns them but with
+            the data as DataRows
+    """
+    scans = [scan_csv(fname) for fname in file_list]
+    array_scans = [(idx, scan) for idx, scan in enumerate(scans) if scan is not None]
+
+    # Parse the timestamps of all data lines of all files at once
+    windows = [scan.pop("window") for _, scan in array_scans]
+    stricts = [scan["strict"] for _, scan in array_scans]
+    sizes = [len(scan["data_lines"]) for _, scan in array_scans]
+    data_file = np.repeat(np.arange(len(array_scans)), sizes)
+    data_index = np.concatenate([np.arange(n) for n in sizes] or [np.zeros(0, int)])
+
+    def first_field(i):
+        scan = array_scans[data_file[i]][1]
+        line = scan["data_lines"][data_index[i]]
+        return _stripped_text(scan, line).split(",")[0]
+
+    seconds, valid = parse_timestrings(
+        np.concatenate(windows or [np.zeros((0, CONST_TIMESTR_LEN), np.uint8)]),
+        np.concatenate(stricts or [np.zeros(0, bool)]),
+        first_field,
+    )
+    num_fields = np.concatenate(
+        [scan["num_fields"] for _, scan in array_scans] or [np.zeros(0, int)]
+    )
+    good = valid & (num_fields == CONST_NUMCOLS_RAWCSV)
+
+    # The file index in the high bits restarts the running maximum for each file;
+    # while no line was discarded the last kept timestamp is the largest one.
+    # Seconds are offset by 2**36 to be positive back to year 1.
+    file_base = data_file.astype(np.int64) << 40
+    key = file_base + seconds + (1 << 36)
+    running = np.maximum.accumulate(np.where(good, key, -1)) if len(key) else key
+    last_kept = np.concatenate([[-1], running[:-1]]) if len(key) else key
+    retro = valid & (last_kept >= file_base) & (key <= last_kept)
+
+    results = [None] * len(file_list)
+    offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+
+    for position, (idx, scan) in enumerate(array_scans):
+        fname = file_list[idx]
+        block = slice(offsets[position], offsets[position + 1])
+        data_lines = scan["data_lines"]
+        f_retro = retro[block]
+        f_valid = valid[block]
+        f_good = good[block]
+
+        err_dict = dict()
+        num_lines = len(scan["starts"])
+        stop = num_lines  # lines from the first TimestampRetro on are discarded
+        if f_retro.any():
+            first_retro = np.flatnonzero(f_retro)[0]
+            stop = data_lines[first_retro]
+            kept = f_good & (np.arange(len(data_lines)) < first_retro)
+            last_kept_line = data_lines[np.flatnonzero(kept)[-1]]
+            msg = (
+                f"CUSTOM_EXCEPTION TimestampRetro {_stripped_text(scan, last_kept_line).split(',')[0]}"
+                + f" then {_stripped_text(scan, stop).split(',')[0]} in {fname} at line {stop + 2};"
+                + " remaining lines in file will be discarded."
+            )
+            utils_logger.warning(msg)
+        else:
+            kept = f_good
+
+        in_range = np.arange(num_lines) < stop
+        if (scan["is_blank"] & in_range).any():
+            raise IndexError("string index out of range")  # as read_single_csv
+
+        long_lines = np.flatnonzero(scan["is_long"] & in_range)
+        if len(long_lines):
+            line = long_lines[-1]
+            length = scan["lengths"][line]
+            err_dict["ExtremeLineLength"] = f"line {line + 2} has {length} characters"
+            utils_logger.info(
+                f"{len(long_lines)} lines of extreme length in {fname}, omitting them."
+            )
+
+        bad_count = np.flatnonzero(f_valid & ~f_good & (data_lines < stop))
+        if len(bad_count):
+            err_dict["IncorrectFieldCount"] = f"line {data_lines[bad_count[-1]] + 2}"
+            utils_logger.info(
+                f"{len(bad_count)} lines with IncorrectFieldCount in {fname}, omitting them."
+            )
+
+        sen55_id = "unknown"
+        header_list = list()
+        for line in np.flatnonzero(scan["is_header"] & in_range):
+            header_list.append(_line_text(scan, line))
+            myline = _stripped_text(scan, line)
+            if myline[0] == ";" and "SEN55" in myline:
+                sen55_id = myline.split(" ")[-1]
+
+        column_string = "no_cols_yet"
+        column_lines = np.flatnonzero(scan["is_columns"] & in_range)
+        if len(column_lines):
+            column_string = _stripped_text(scan, column_lines[-1]).strip("'")
+
+        kept_seconds = seconds[block][kept]
+        data_rows = _kept_rows(
+            scan, data_lines[kept], kept_seconds.astype("datetime64[s]")
+        )
+        results[idx] = (sen55_id, header_list, column_string, data_rows, err_dict)
+        scan.clear()  # the rows to keep are copied out, release the raw buffer
+
+    for idx, scan in enumerate(scans):
+        if scan is None:
+            fname = file_list[idx]
+            sen55_id, header_list, column_string, data_list, err_dict = read_single_csv(
+                fname, return_errs=True
+            )
+            results[idx] = (
+                sen55_id,
+                header_list,
+                column_string,
+                DataRows.from_list(data_list),
+                err_dict,
+            )
+
+    return results
+
+
 def pipeline_qa_match_sen55(s):
     """Check that sen55 in the raw csv match expected sen55 from sensor_dict"""
     if len(s["t"]["sen55_list"]) > 0:
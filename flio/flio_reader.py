@@ -1,7 +1,24 @@
+import mmap
+import os
 import struct
 import numpy as np
 import matplotlib.pyplot as plt
 
+# struct codes for the (datatype, length) pairs used by the SDT modules
+STRUCT_CODES = {
+    ("short", 2): "h",
+    ("long", 4): "i",
+    ("unsigned short", 2): "H",
+    ("unsigned long", 4): "I",
+    ("int", 2): "H",
+    ("float", 4): "f",
+}
+
+# Each data block is a 22 byte block header followed by a 256x256x1024 uint16 image
+IMAGE_SIZE = 256
+NUMBER_OF_TIME_BINS = 1024
+DATA_BLOCK_HEADER_LENGTH = 22
+
 
 class Module:
     def __init__(self, name, elements):
@@ -14,6 +31,27 @@ class Module:
         """
         self.name = name
         self.elements = elements
+        self._struct = None
+
+    @property
+    def struct(self):
+        """
+        Compile the elements of the module into a single little endian struct.
+
+        Elements without a datatype (the image payload) are not read and are skipped.
+
+        Returns:
+            struct.Struct: The compiled struct for the readable elements.
+        """
+        if self._struct is None:
+            codes = []
+            for element in self.elements:
+                if element.datatype == "char":
+                    codes.append(f"{element.length}s")
+                elif element.datatype:
+                    codes.append(STRUCT_CODES[(element.datatype, element.length)])
+            self._struct = struct.Struct("<" + "".join(codes))
+        return self._struct
 
     def calculate_total_length(self):
         """
@@ -228,17 +266,26 @@ def file_information(file_path):
     Returns:
         dict: A dictionary containing extracted information.
     """
-    with open(file_path, "rb") as file:
-        file_content = file.read()
+    extracted_info = {}
 
-    # Find the start and end indexes of the relevant section
-    start_index = file_content.find(b"*IDENTIFICATION")
-    end_index = file_content.find(b"*END", start_index)
+    if os.path.getsize(file_path) == 0:
+        return extracted_info
+
+    # Search the memory mapped file instead of reading it into memory
+    with open(file_path, "rb") as file, mmap.mmap(
+        file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as file_content:
+        # Find the start and end indexes of the relevant section
+        start_index = file_content.find(b"*IDENTIFICATION")
+        end_index = (
+            file_content.find(b"*END", start_index) if start_index != -1 else -1
+        )
 
-    extracted_info = {}
+        relevant_content = b""
+        if start_index != -1 and end_index != -1:
+            relevant_content = file_content[start_index:end_index]
 
-    if start_index != -1 and end_index != -1:
-        relevant_content = file_content[start_index:end_index]
+    if relevant_content:
 
         # Split the content into lines
         lines = relevant_content.split(b"\n")
@@ -308,11 +355,8 @@ def get_char(byte_value):
     Returns:
         str: The string of characters obtained from the bytes.
     """
-    accumulated_characters = ""
-    for byte in byte_value:
-        character = chr(byte)
-        accumulated_characters += character
-    return accumulated_characters
+    # latin-1 maps every byte to the code point of the same value, like chr()
+    return bytes(byte_value).decode("latin-1")
 
 
 def get_module_data(module, file):
@@ -326,14 +370,16 @@ def get_module_data(module, file):
     Returns:
         dict: A dictionary containing extracted data from the file.
     """
+    values = iter(module.struct.unpack(file.read(module.struct.size)))
+
     data_dictionary = {}
     for element in module.elements:
-        value = read_element(file, element.datatype, element.length)
         if element.datatype == "char":
-            char_value = get_char(value)
-            data_dictionary[element.name] = char_value
+            data_dictionary[element.name] = get_char(next(values))
+        elif element.datatype:
+            data_dictionary[element.name] = next(values)
         else:
-            data_dictionary[element.name] = value
+            data_dictionary[element.name] = "Image data"
     return data_dictionary
 
 
@@ -563,40 +609,25 @@ def image_summary_view(file_path):
     Returns:
         None
     """
-    with open(file_path, "rb") as file:
-        module_data_flio_header = get_module_data(flioheader, file)
-        img_size = 256
-        array = np.fromfile(file_path, dtype="<H")
-        offset = int((module_data_flio_header.get("data_block_offset") + 22) / 2)
-        pixel_array = array[offset : offset + img_size**2 * 1024].reshape(
-            256, 256, 1024
-        )
+    array1, array2 = get_array(file_path)
 
-        avg_pixel_array = np.average(pixel_array, axis=2)
-        plt.suptitle(
-            "from Datablock 0 - image shape: 256*256*1024, average of 1024 slices:"
-        )
-        plt.imshow(avg_pixel_array)
-        plt.show()
+    pixel_array = array1.reshape(256, 256, 1024)
 
-        offset2 = int(
-            (
-                module_data_flio_header.get("data_block_length")
-                + module_data_flio_header.get("data_block_offset")
-                + 22
-            )
-            / 2
-        )
-        pixel_array = array[offset2 : offset2 + img_size**2 * 1024].reshape(
-            256, 256, 1024
-        )
+    avg_pixel_array = np.average(pixel_array, axis=2)
+    plt.suptitle(
+        "from Datablock 0 - image shape: 256*256*1024, average of 1024 slices:"
+    )
+    plt.imshow(avg_pixel_array)
+    plt.show()
 
-        avg_pixel_array = np.average(pixel_array, axis=2)
-        plt.suptitle(
-            "from Datablock 1 - image shape: 256*256*1024, average of 1024 slices:"
-        )
-        plt.imshow(avg_pixel_array)
-        plt.show()
+    pixel_array = array2.reshape(256, 256, 1024)
+
+    avg_pixel_array = np.average(pixel_array, axis=2)
+    plt.suptitle(
+        "from Datablock 1 - image shape: 256*256*1024, average of 1024 slices:"
+    )
+    plt.imshow(avg_pixel_array)
+    plt.show()
 
 
 # block number is 0 or 1 and slice number is between 0 and 1023
@@ -612,35 +643,17 @@ def image_slice_view(file_path, block_number, slice_number):
     Returns:
         None
     """
-    with open(file_path, "rb") as file:
-        module_data_flio_header = get_module_data(flioheader, file)
+    array1, array2 = get_array(file_path)
 
     if block_number == 0:
-        img_size = 256
-        array = np.fromfile(file_path, dtype="<H")
-        offset = int((module_data_flio_header.get("data_block_offset") + 22) / 2)
-        pixel_array = array[offset : offset + img_size**2 * 1024].reshape(
-            256, 256, 1024
-        )
+        pixel_array = array1.reshape(256, 256, 1024)
 
         plt.suptitle(f"from Datablock{block_number}, slicenumber: {slice_number} ")
         plt.imshow(pixel_array[:, :, slice_number])
         plt.show()
 
     elif block_number == 1:
-        img_size = 256
-        array = np.fromfile(file_path, dtype="<H")
-        offset2 = int(
-            (
-                module_data_flio_header.get("data_block_length")
-                + module_data_flio_header.get("data_block_offset")
-                + 22
-            )
-            / 2
-        )
-        pixel_array = array[offset2 : offset2 + img_size**2 * 1024].reshape(
-            256, 256, 1024
-        )
+        pixel_array = array2.reshape(256, 256, 1024)
 
         plt.suptitle(f"from Datablock{block_number}, slicenumber: {slice_number} ")
 
@@ -651,34 +664,55 @@ def image_slice_view(file_path, block_number, slice_number):
 # block number is 0 or 1 and slice number is between 0 and 1023
 def get_array(file_path):
     """
-    Generate and display a specific slice of an image from a binary data block.
+    Get the pixel data of both data blocks (short and long wavelength channels).
+
+    The file is memory mapped read-only and the channels are returned as views into
+    the mapping, so no pixel data is copied or read until it is accessed.
 
     Args:
         file_path (str): The path to the binary file.
 
 
     Returns:
-        array
+        tuple: Two flat uint16 arrays of 256*256*1024 values, one per data block.
     """
     with open(file_path, "rb") as file:
         module_data_flio_header = get_module_data(flioheader, file)
 
-    img_size = 256
-    array = np.fromfile(file_path, dtype="<H")
-    offset = int((module_data_flio_header.get("data_block_offset") + 22) / 2)
-    pixel_array1 = array[
-        offset : offset + img_size**2 * 1024
-    ]  # .reshape(256, 256, 1024)
+    count = IMAGE_SIZE**2 * NUMBER_OF_TIME_BINS
+    array = np.memmap(
+        file_path, dtype="<H", mode="r", shape=(os.path.getsize(file_path) // 2,)
+    )
+
+    offset = int(
+        (module_data_flio_header.get("data_block_offset") + DATA_BLOCK_HEADER_LENGTH)
+        / 2
+    )
+    pixel_array1 = array[offset : offset + count]
 
-    array = np.fromfile(file_path, dtype="<H")
     offset2 = int(
         (
             module_data_flio_header.get("data_block_length")
             + module_data_flio_header.get("data_block_offset")
-            + 22
+            + DATA_BLOCK_HEADER_LENGTH
         )
         / 2
     )
-    pixel_array2 = array[offset2 : offset2 + img_size**2 * 1024]
+    pixel_array2 = array[offset2 : offset2 + count]
 
     return pixel_array1, pixel_array2
+
+
+def get_frames(channel):
+    """
+    Arrange a channel from get_array as 1024 frames of 256x256 pixels.
+
+    Args:
+        channel (numpy.ndarray): A flat channel array returned by get_array.
+
+    Returns:
+        numpy.ndarray: A (1024, 256, 256) view of the channel, no data is copied.
+    """
+    return np.transpose(
+        channel.reshape(IMAGE_SIZE, IMAGE_SIZE, NUMBER_OF_TIME_BINS), (2, 0, 1)
+    )
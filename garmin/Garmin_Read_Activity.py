@@ -1,6 +1,7 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 
+import io
 import os
 
 import numpy as np
@@ -52,7 +53,7 @@ def garmin_to_datetime(garmin_timestamp):
     return result_datetime
 
 
-def append_resting_heart_rate_to_csv(resting_heart_rate_data, base_time, csv_path):
+def append_resting_heart_rate_to_csv(resting_heart_rate_data, base_time, csv_file):
     """
     Appends resting heart rate data (identified by the fields 'unknown_0', 'unknown_1', and 'unknown_253')
     to the specified CSV. The 'unknown_0' is the resting heart rate, 'unknown_1' is the current day resting heart rate,
@@ -61,7 +62,7 @@ def append_resting_heart_rate_to_csv(resting_heart_rate_data, base_time, csv_pat
     Parameters:
     - resting_heart_rate_data: Dictionary containing resting heart rate data.
     - base_time: Base timestamp from the .fit file.
-    - csv_path: Path to the CSV file.
+    - csv_file: Open CSV file (or buffer) the row is written to.
     """
     resting_heart_rate = resting_heart_rate_data["unknown_0"]
     current_day_resting_heart_rate = resting_heart_rate_data["unknown_1"]
@@ -69,13 +70,12 @@ def append_resting_heart_rate_to_csv(resting_heart_rate_data, base_time, csv_pat
     # Convert the 'unknown_253' to datetime using Garmin epoch
     final_timestamp = garmin_to_datetime(resting_heart_rate_data["unknown_253"])
 
-    with open(csv_path, "a") as csv_file:
-        csv_file.write(
-            f"{resting_heart_rate},{current_day_resting_heart_rate},{final_timestamp}\n"
-        )
+    csv_file.write(
+        f"{resting_heart_rate},{current_day_resting_heart_rate},{final_timestamp}\n"
+    )
 
 
-def append_respiration_rate_to_csv(respiration_rate_data, base_time, csv_path):
+def append_respiration_rate_to_csv(respiration_rate_data, base_time, csv_file):
     """
     Appends respiration rate data (identified by the fields 'unknown_0' and 'unknown_253') to the specified CSV.
     The 'unknown_0' is treated as respiration rate in hundredths, and the 'unknown_253' field is treated as a UNIX timestamp, but only its time part is considered.
@@ -83,7 +83,7 @@ def append_respiration_rate_to_csv(respiration_rate_data, base_time, csv_path):
     Parameters:
     - respiration_rate_data: Dictionary containing respiration rate data.
     - base_time: Base timestamp from the .fit file.
-    - csv_path: Path to the CSV file.
+    - csv_file: Open CSV file (or buffer) the row is written to.
     """
     # Convert the 'unknown_0' to its correct value by dividing by 100
     respiration_rate = respiration_rate_data["unknown_0"] / 100
@@ -91,11 +91,10 @@ def append_respiration_rate_to_csv(respiration_rate_data, base_time, csv_path):
     # Convert the 'unknown_253' to datetime using Garmin epoch
     final_timestamp = garmin_to_datetime(respiration_rate_data["unknown_253"])
 
-    with open(csv_path, "a") as csv_file:
-        csv_file.write(f"{respiration_rate},{final_timestamp}\n")
+    csv_file.write(f"{respiration_rate},{final_timestamp}\n")
 
 
-def append_spo2_to_csv(spo2_data, base_time, csv_path):
+def append_spo2_to_csv(spo2_data, base_time, csv_file):
     """
     Appends SpO2 data (identified by the fields 'unknown_0', 'unknown_1', 'unknown_2', and 'unknown_253') to the specified CSV.
     The 'unknown_253' field is treated as a UNIX timestamp, but only its time part is considered.
@@ -103,7 +102,7 @@ def append_spo2_to_csv(spo2_data, base_time, csv_path):
     Parameters:
     - spo2_data: Dictionary containing SpO2 data.
     - base_time: Base timestamp from the .fit file.
-    - csv_path: Path to the CSV file.
+    - csv_file: Open CSV file (or buffer) the row is written to.
     """
 
     # Convert the 'unknown_253' to datetime using Garmin epoch
@@ -115,20 +114,19 @@ def append_spo2_to_csv(spo2_data, base_time, csv_path):
     else:
         unknown_2_value = spo2_data["unknown_2"]
 
-    with open(csv_path, "a") as csv_file:
-        csv_file.write(
-            f"{spo2_data['unknown_0']},{spo2_data['unknown_1']},{unknown_2_value},{final_timestamp}\n"
-        )
+    csv_file.write(
+        f"{spo2_data['unknown_0']},{spo2_data['unknown_1']},{unknown_2_value},{final_timestamp}\n"
+    )
 
 
-def append_heart_rate_to_csv(heart_rate_data, base_time, csv_path):
+def append_heart_rate_to_csv(heart_rate_data, base_time, csv_file):
     """
     Appends heart rate data to the specified CSV.
 
     Parameters:
     - heart_rate_data: Dictionary containing heart rate data.
     - base_time: Base timestamp from the .fit file.
-    - csv_path: Path to the CSV file.
+    - csv_file: Open CSV file (or buffer) the row is written to.
     """
     # adjusted_timestamp = base_time + timedelta(seconds=heart_rate_data['timestamp_16'])
     # Localize the timestamp to UTC (or whichever timezone it's originally in)
@@ -140,18 +138,17 @@ def append_heart_rate_to_csv(heart_rate_data, base_time, csv_path):
     # Extract the timestamp_16 value
     adjusted_dt = convert_garmin_timestamp(base_time, heart_rate_data["timestamp_16"])
 
-    with open(csv_path, "a") as csv_file:
-        csv_file.write(f"{heart_rate_data['heart_rate']},{adjusted_dt}\n")
+    csv_file.write(f"{heart_rate_data['heart_rate']},{adjusted_dt}\n")
 
 
-def append_active_calories_to_csv(calories_data, base_time, csv_path):
+def append_active_calories_to_csv(calories_data, base_time, csv_file):
     """
     Appends active calories data to the specified CSV.
 
     Parameters:
     - calories_data: Dictionary containing active calories data.
     - base_time: Base timestamp from the .fit file.
-    - csv_path: Path to the CSV file.
+    - csv_file: Open CSV file (or buffer) the row is written to.
     """
 
     # adjusted_timestamp = base_time + timedelta(seconds=calories_data['timestamp_16'])
@@ -170,19 +167,18 @@ def append_active_calories_to_csv(calories_data, base_time, csv_path):
     cycles = calories_data["cycles"]
     intensity = calories_data["intensity"]
 
-    with open(csv_path, "a") as csv_file:
-        csv_file.write(
-            f"{active_calories},{active_time},{activity_type},{current_activity_type_intensity},{cycles},{intensity},{adjusted_timestamp}\n"
-        )
+    csv_file.write(
+        f"{active_calories},{active_time},{activity_type},{current_activity_type_intensity},{cycles},{intensity},{adjusted_timestamp}\n"
+    )
 
 
-def activity_type_to_csv(activity_data, csv_path):
+def activity_type_to_csv(activity_data, csv_file):
     """
     Appends activity type data to the specified CSV.
 
     Parameters:
     - activity_data: Dictionary containing activity type data.
-    - csv_path: Path to the CSV file.
+    - csv_file: Open CSV file (or buffer) the row is written to.
     """
     timestamp = activity_data["timestamp"]
     activity_type = activity_data["activity_type"]
@@ -193,46 +189,65 @@ def activity_type_to_csv(activity_data, csv_path):
         else ""
     )
 
-    with open(csv_path, "a") as csv_file:
-        csv_file.write(
-            f"{activity_type},{current_activity_type_intensity},{intensity},{timestamp}\n"
-        )
+    csv_file.write(
+        f"{activity_type},{current_activity_type_intensity},{intensity},{timestamp}\n"
+    )
 
 
-def stress_level_to_csv(stress_data, csv_path):
+def stress_level_to_csv(stress_data, csv_file):
     """
     Appends stress level data to the specified CSV.
 
     Parameters:
     - stress_data: Dictionary containing stress level data.
-    - csv_path: Path to the CSV file.
+    - csv_file: Open CSV file (or buffer) the row is written to.
     """
     stress_timestamp = stress_data["stress_level_time"]
     stress_value = stress_data["stress_level_value"]
 
-    with open(csv_path, "a") as csv_file:
-        csv_file.write(f"{stress_value},{stress_timestamp}\n")
-
-
-def parse_fit_file(
-    input_fit_path,
-    heart_rate_csv_path,
-    active_calories_csv_path,
-    activity_type_csv_path,
-    stress_level_csv_path,
-    spo2_csv_path,
-    respiration_rate_csv_path,
-    resting_heart_rate_csv_path,
-):
+    csv_file.write(f"{stress_value},{stress_timestamp}\n")
+
+
+# Output file name prefix and header of each per-metric CSV
+CSV_FILES = {
+    "heart_rate": ("heart_rate_data", "heart_rate (bpm),datetime\n"),
+    "active_calories": (
+        "active_calories_data",
+        "active_calories,active_time,activity_type,current_activity_type_intensity,cycles,intensity,datetime\n",
+    ),
+    "activity_type": (
+        "activity_type_data",
+        "activity_type,current_activity_type_intensity,intensity,datetime\n",
+    ),
+    "stress_level": ("stress_level_data", "stress_value (per minute),datetime\n"),
+    "spo2": ("spo2_data", "spo2 (per minute),confidence,mode,datetime\n"),
+    "respiration_rate": (
+        "respiration_rate_data",
+        "respiration_rate(breaths/min),datetime\n",
+    ),
+    "resting_heart_rate": (
+        "resting_heart_rate_data",
+        "resting_heart_rate,current_day_resting_heart_rate,datetime\n",
+    ),
+}
+
+
+def parse_fit_file(input_fit_path, csv_files, keep_fit_data=False):
     """
-    Parses the FIT file and writes the relevant data to individual CSV files.
+    Parses the FIT file in a single pass and routes the relevant records to the per-metric CSV files.
 
     Parameters:
     - input_fit_path: Path to the input .fit file.
-    - heart_rate_csv_path, active_calories_csv_path, activity_type_csv_path, stress_level_csv_path: Paths to the output CSV files.
+    - csv_files: Dictionary mapping each key of CSV_FILES to an open file (or buffer) the rows are written to.
+    - keep_fit_data: Whether to collect every decoded record, grouped by message name, for the fit_data.csv dump.
+
+    Returns:
+    - tuple: The collection date (date of the first timestamp record, or None) and the collected records
+      (empty unless keep_fit_data is set).
     """
     fit_data = {}
     base_time = None
+    collection_date = None
     has_seen_unknown_211 = False
     has_seen_unknown_297 = False
     has_seen_unknown_269 = False
@@ -248,26 +263,6 @@ def parse_fit_file(
     calories_previous_timestamp = 0
     calories_rollover_offset = 0
 
-    # Writing headers to the CSV files.
-    with open(resting_heart_rate_csv_path, "w") as csv_file:
-        csv_file.write("resting_heart_rate,current_day_resting_heart_rate,datetime\n")
-    with open(respiration_rate_csv_path, "w") as csv_file:
-        csv_file.write("respiration_rate(breaths/min),datetime\n")
-    with open(spo2_csv_path, "w") as csv_file:
-        csv_file.write("spo2 (per minute),confidence,mode,datetime\n")
-    with open(heart_rate_csv_path, "w") as csv_file:
-        csv_file.write("heart_rate (bpm),datetime\n")
-    with open(active_calories_csv_path, "w") as csv_file:
-        csv_file.write(
-            "active_calories,active_time,activity_type,current_activity_type_intensity,cycles,intensity,datetime\n"
-        )
-    with open(activity_type_csv_path, "w") as csv_file:
-        csv_file.write(
-            "activity_type,current_activity_type_intensity,intensity,datetime\n"
-        )
-    with open(stress_level_csv_path, "w") as csv_file:
-        csv_file.write("stress_value (per minute),datetime\n")
-
     with FitFile(input_fit_path) as fitfile:
         for record in fitfile.get_messages():
             message_name = record.name
@@ -275,29 +270,31 @@ def parse_fit_file(
 
             for record_field in record:
                 field_name = record_field.name
-                field_value = record_field.value
 
                 if field_name != "unknown":
-                    record_data[field_name] = field_value
-
-                if message_name == "unknown_211":
-                    has_seen_unknown_211 = True
-                    has_seen_unknown_297 = False
-                    has_seen_unknown_269 = False
-                elif message_name == "unknown_297":
-                    has_seen_unknown_297 = True
-                    has_seen_unknown_211 = False
-                    has_seen_unknown_269 = False
-                elif message_name == "unknown_269":
-                    has_seen_unknown_269 = True
-                    has_seen_unknown_211 = False
-                    has_seen_unknown_297 = False
-
-            if list(record_data.keys())[0] == "timestamp" and isinstance(
+                    record_data[field_name] = record_field.value
+
+            if message_name == "unknown_211":
+                has_seen_unknown_211 = True
+                has_seen_unknown_297 = False
+                has_seen_unknown_269 = False
+            elif message_name == "unknown_297":
+                has_seen_unknown_297 = True
+                has_seen_unknown_211 = False
+                has_seen_unknown_269 = False
+            elif message_name == "unknown_269":
+                has_seen_unknown_269 = True
+                has_seen_unknown_211 = False
+                has_seen_unknown_297 = False
+
+            if next(iter(record_data), None) == "timestamp" and isinstance(
                 record_data["timestamp"], datetime
             ):
                 base_time = record_data["timestamp"]
 
+                if collection_date is None:
+                    collection_date = base_time.date()
+
             if (
                 "heart_rate" in record_data
                 and "timestamp_16" in record_data
@@ -311,7 +308,9 @@ def parse_fit_file(
                 adjusted_timestamp = current_timestamp + rollover_offset
                 record_data["timestamp_16"] = adjusted_timestamp
 
-                append_heart_rate_to_csv(record_data, base_time, heart_rate_csv_path)
+                append_heart_rate_to_csv(
+                    record_data, base_time, csv_files["heart_rate"]
+                )
 
                 # Update previous_timestamp for next iteration
                 previous_timestamp = current_timestamp
@@ -332,7 +331,7 @@ def parse_fit_file(
                 record_data["timestamp_16"] = calories_adjusted_timestamp
 
                 append_active_calories_to_csv(
-                    record_data, base_time, active_calories_csv_path
+                    record_data, base_time, csv_files["active_calories"]
                 )
 
                 # Update previous_timestamp for next iteration
@@ -343,43 +342,54 @@ def parse_fit_file(
                 and "timestamp" in record_data
                 and "timestamp_16" not in record_data
             ):
-                activity_type_to_csv(record_data, activity_type_csv_path)
+                activity_type_to_csv(record_data, csv_files["activity_type"])
 
             if "stress_level_time" in record_data:
-                stress_level_to_csv(record_data, stress_level_csv_path)
+                stress_level_to_csv(record_data, csv_files["stress_level"])
+
+            record_keys = record_data.keys()
 
             if (
-                set(record_data.keys())
-                == set(["unknown_0", "unknown_1", "unknown_2", "unknown_253"])
+                record_keys == {"unknown_0", "unknown_1", "unknown_2", "unknown_253"}
                 and base_time
                 and has_seen_unknown_269
             ):
-                append_spo2_to_csv(record_data, base_time, spo2_csv_path)
+                append_spo2_to_csv(record_data, base_time, csv_files["spo2"])
 
             if (
-                set(record_data.keys()) == set(["unknown_0", "unknown_253"])
+                record_keys == {"unknown_0", "unknown_253"}
                 and base_time
                 and has_seen_unknown_297
             ):
                 append_respiration_rate_to_csv(
-                    record_data, base_time, respiration_rate_csv_path
+                    record_data, base_time, csv_files["respiration_rate"]
                 )
 
             if (
-                set(record_data.keys())
-                == set(["unknown_0", "unknown_1", "unknown_253"])
+                record_keys == {"unknown_0", "unknown_1", "unknown_253"}
                 and base_time
                 and has_seen_unknown_211
             ):
                 append_resting_heart_rate_to_csv(
-                    record_data, base_time, resting_heart_rate_csv_path
+                    record_data, base_time, csv_files["resting_heart_rate"]
                 )
 
-            if message_name not in fit_data:
-                fit_data[message_name] = []
-            fit_data[message_name].append(record_data)
+            if keep_fit_data:
+                if message_name not in fit_data:
+                    fit_data[message_name] = []
+                fit_data[message_name].append(record_data)
+
+    return collection_date, fit_data
 
-    return fit_data
+
+def write_fit_data_csv(fit_data, directory_name):
+    """Dump every decoded record, grouped by message name, to fit_data.csv"""
+    with open(os.path.join(directory_name, "fit_data.csv"), "w") as csv_file:
+        for message_name, message_records in fit_data.items():
+            csv_file.write(f"Message: {message_name}\n")
+            csv_file.writelines(
+                "\t" + str(record_data) + "\n" for record_data in message_records
+            )
 
 
 def plot_csv_data(file_path, y_axis_label, x_axis_label, ignore_condition=None):
@@ -473,7 +483,19 @@ def plot_csv_data(file_path, y_axis_label, x_axis_label, ignore_condition=None):
 def convert(
     input_fit_path: str,
     output_path: str,
+    write_fit_data: bool = False,
 ):
+    """
+    Convert a FIT file into one CSV per metric.
+
+    The file is decoded once. Rows are buffered in memory per metric and each CSV is opened
+    and written once at the end, since the file names depend on the collection date.
+
+    Parameters:
+    - input_fit_path: Path to the input .fit file.
+    - output_path: Folder the CSV files are written to.
+    - write_fit_data: Also dump every decoded record to fit_data.csv (debugging aid).
+    """
     # directory_name = os.path.splitext(os.path.basename(input_fit_path))[0]
     directory_name = output_path
 
@@ -484,26 +506,14 @@ def convert(
     if not os.path.exists(directory_name):
         os.makedirs(directory_name)
 
-    collection_date = None
-
-    # Find the collection date
-    with FitFile(input_fit_path) as fitfile:
-        for record in fitfile.get_messages():
-            message_name = record.name
-            record_data = {}
-
-            for record_field in record:
-                field_name = record_field.name
-                field_value = record_field.value
-
-                if field_name != "unknown":
-                    record_data[field_name] = field_value
+    csv_buffers = {}
+    for metric, (_, header) in CSV_FILES.items():
+        csv_buffers[metric] = io.StringIO()
+        csv_buffers[metric].write(header)
 
-            if list(record_data.keys())[0] == "timestamp" and isinstance(
-                record_data["timestamp"], datetime
-            ):
-                collection_date = record_data["timestamp"].date()
-                break  # Exit after finding the collection date
+    collection_date, fit_data = parse_fit_file(
+        input_fit_path, csv_buffers, keep_fit_data=write_fit_data
+    )
 
     # Use "NoCollectionDate" if collection_date is None
     date_str = (
@@ -513,44 +523,16 @@ def convert(
     )
 
     # Include input filename in the CSV filenames
-    heart_rate_csv_path = os.path.join(
-        directory_name, f"heart_rate_data_{date_str}_{input_filename}.csv"
-    )
-    active_calories_csv_path = os.path.join(
-        directory_name, f"active_calories_data_{date_str}_{input_filename}.csv"
-    )
-    activity_type_csv_path = os.path.join(
-        directory_name, f"activity_type_data_{date_str}_{input_filename}.csv"
-    )
-    stress_level_csv_path = os.path.join(
-        directory_name, f"stress_level_data_{date_str}_{input_filename}.csv"
-    )
-    spo2_csv_path = os.path.join(
-        directory_name, f"spo2_data_{date_str}_{input_filename}.csv"
-    )  # Define path for SpO2 CSV
-    respiration_rate_csv_path = os.path.join(
-        directory_name, f"respiration_rate_data_{date_str}_{input_filename}.csv"
-    )
-    resting_heart_rate_csv_path = os.path.join(
-        directory_name, f"resting_heart_rate_data_{date_str}_{input_filename}.csv"
-    )
+    for metric, (file_prefix, _) in CSV_FILES.items():
+        csv_path = os.path.join(
+            directory_name, f"{file_prefix}_{date_str}_{input_filename}.csv"
+        )
 
-    fit_data = parse_fit_file(
-        input_fit_path,
-        heart_rate_csv_path,
-        active_calories_csv_path,
-        activity_type_csv_path,
-        stress_level_csv_path,
-        spo2_csv_path,
-        respiration_rate_csv_path,
-        resting_heart_rate_csv_path,
-    )
+        with open(csv_path, "w") as csv_file:
+            csv_file.write(csv_buffers[metric].getvalue())
 
-    with open(os.path.join(directory_name, "fit_data.csv"), "w") as csv_file:
-        for message_name, message_records in fit_data.items():
-            csv_file.write(f"Message: {message_name}\n")
-            for record_data in message_records:
-                csv_file.write("\t" + str(record_data) + "\n")
+    if write_fit_data:
+        write_fit_data_csv(fit_data, directory_name)
 
     # plot_csv_data(
     #     respiration_rate_csv_path,
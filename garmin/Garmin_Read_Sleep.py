@@ -14,7 +14,7 @@ def garmin_to_datetime(garmin_timestamp):
     return garmin_epoch + delta
 
 
-def append_sleep_to_csv(sleep_data, csv_path):
+def append_sleep_to_csv(sleep_data, csv_file):
     """
     Appends resting sleep data (identified by the fields 'unknown_0' and 'unknown_253')
     to the specified CSV. The 'unknown_0' is the sleep type and the 'unknown_253' field
@@ -22,7 +22,7 @@ def append_sleep_to_csv(sleep_data, csv_path):
 
     Parameters:
     - sleep_data: Dictionary containing sleep data.
-    - csv_path: Path to the CSV file.
+    - csv_file: Open CSV file the row is written to.
     """
 
     sleep_type_mapping = {1: "awake", 2: "light", 3: "deep", 4: "rem"}
@@ -32,48 +32,52 @@ def append_sleep_to_csv(sleep_data, csv_path):
     # Convert the 'unknown_253' to datetime using Garmin epoch
     final_timestamp = garmin_to_datetime(sleep_data["unknown_253"])
 
-    with open(csv_path, "a") as csv_file:
-        csv_file.write(f"{sleep_type},{final_timestamp}\n")
+    csv_file.write(f"{sleep_type},{final_timestamp}\n")
 
 
-def parse_fit_file(input_fit_path, sleep_csv_path):
+def parse_fit_file(input_fit_path, sleep_csv_path, keep_fit_data=False):
     """
-    Parses the FIT file and writes the relevant data to individual CSV files.
+    Parses the FIT file in a single pass and writes the sleep records to the sleep CSV file.
 
     Parameters:
     - input_fit_path: Path to the input .fit file.
     - sleep_csv_path: Paths to the output CSV files.
+    - keep_fit_data: Whether to collect every decoded record, grouped by message name, for the fit_data.csv dump.
+
+    Returns:
+    - dict: The collected records (empty unless keep_fit_data is set).
     """
     fit_data = {}
+    has_seen_unknown_275 = False
 
-    # Writing headers to the CSV files.
-    with open(sleep_csv_path, "w") as csv_file:
+    # The CSV is opened once and written through the file buffer
+    with open(sleep_csv_path, "w") as csv_file, FitFile(input_fit_path) as fitfile:
+        # Writing headers to the CSV files.
         csv_file.write("sleep_type,adjusted_timestamp\n")
 
-    with FitFile(input_fit_path) as fitfile:
         for record in fitfile.get_messages():
             message_name = record.name
             record_data = {}
 
             for record_field in record:
                 field_name = record_field.name
-                field_value = record_field.value
 
                 if field_name != "unknown":
-                    record_data[field_name] = field_value
+                    record_data[field_name] = record_field.value
 
-                if message_name == "unknown_275":
-                    has_seen_unknown_275 = True
+            if message_name == "unknown_275":
+                has_seen_unknown_275 = True
 
             if (
-                set(record_data.keys()) == {"unknown_0", "unknown_253"}
+                record_data.keys() == {"unknown_0", "unknown_253"}
                 and has_seen_unknown_275
             ):
-                append_sleep_to_csv(record_data, sleep_csv_path)
+                append_sleep_to_csv(record_data, csv_file)
 
-            if message_name not in fit_data:
-                fit_data[message_name] = []
-            fit_data[message_name].append(record_data)
+            if keep_fit_data:
+                if message_name not in fit_data:
+                    fit_data[message_name] = []
+                fit_data[message_name].append(record_data)
 
     return fit_data
 
@@ -81,7 +85,16 @@ def parse_fit_file(input_fit_path, sleep_csv_path):
 def convert(
     input_fit_path: str,
     output_path: str,
+    write_fit_data: bool = False,
 ):
+    """
+    Convert a sleep FIT file into sleep_data.csv.
+
+    Parameters:
+    - input_fit_path: Path to the input .fit file.
+    - output_path: Folder the CSV files are written to.
+    - write_fit_data: Also dump every decoded record to fit_data.csv (debugging aid).
+    """
     # directory_name = os.path.splitext(os.path.basename(input_fit_path))[0]
     directory_name = output_path
 
@@ -92,13 +105,16 @@ def convert(
     #    heart_rate_csv_path = os.path.join(directory_name, 'heart_rate_data.csv')
     sleep_csv_path = os.path.join(directory_name, "sleep_data.csv")
 
-    fit_data = parse_fit_file(input_fit_path, sleep_csv_path)
+    fit_data = parse_fit_file(
+        input_fit_path, sleep_csv_path, keep_fit_data=write_fit_data
+    )
 
-    with open(os.path.join(directory_name, "fit_data.csv"), "w") as csv_file:
-        for message_name, message_records in fit_data.items():
-            csv_file.write(f"Message: {message_name}\n")
-            for record_data in message_records:
-                csv_file.write("\t" + str(record_data) + "\n")
+    if write_fit_data:
+        with open(os.path.join(directory_name, "fit_data.csv"), "w") as csv_file:
+            for message_name, message_records in fit_data.items():
+                csv_file.write(f"Message: {message_name}\n")
+                for record_data in message_records:
+                    csv_file.write("\t" + str(record_data) + "\n")
 
     return
 
@@ -1,125 +1,63 @@
 import pandas as pd
-from datetime import datetime
-import json
-import glob
-import os
-from pathlib import Path
 from traceback import format_exc
 
-
-def merge_json_files(file_paths, outdir, ptname):
-    # Initialize variables to store the combined header and bodies
-    combined_header = None
-    combined_body_heart_rate = []
-
-    for file_path in file_paths:
-        # Load the current JSON file
-        with open(file_path, "r") as file:
-            data = json.load(file)
-
-            # If the combined_header is not set, take the header from the first file
-            if combined_header is None:
-                combined_header = data["header"]
-
-            # Extend the combined_body_heart_rate list with the heart_rate list from the current file
-            combined_body_heart_rate.extend(data["body"]["heart_rate"])
-
-    # Sort the combined_body_heart_rate list by date_time
-    combined_body_heart_rate.sort(key=lambda x: x["effective_time_frame"]["date_time"])
-
-    # Create the combined dictionary
-    combined_data = {
-        "header": combined_header,
-        "body": {"heart_rate": combined_body_heart_rate},
-    }
-
-    # Write the combined dictionary to a new JSON file
-    with open(outdir + "/" + ptname + "_heartrate" + ".json", "w") as combined_file:
-        json.dump(combined_data, combined_file, indent=4)
+from garmin.standard_utils import (
+    build_header,
+    find_csv_files,
+    format_timestamps,
+    write_standardized_json,
+)
 
 
 def standardize_heart_rate(
     root_dir, patient_id, output_folder, final_output, timezone="pst"
 ):
-    pt = patient_id
-
-    pt_hr_count = 0
+    """
+    Combine every heart_rate_data CSV of a participant into one sorted heart rate JSON.
 
-    pt_heartrate_files = []
+    output_folder is no longer written to, the combined file is built in memory and
+    written once to final_output/<patient_id>/<patient_id>_heartrate.json.
+    """
+    pt = patient_id
 
     try:
-        if os.path.isdir(root_dir):
-            for entry in os.listdir(root_dir):
-                hr_file = root_dir + "/" + entry + "/heart_rate_data_*.csv"
-
-                for filename in glob.glob(hr_file):
-                    pt_heartrate_files.append(filename)
-
-        # Print out the list of found CSV files
-        for file_path in pt_heartrate_files:
-
-            # Get patient ID
-            # patient_ID = file_path.split(root_dir)[1].split("/")[0]
-            patient_ID = patient_id
-
-            # Get HR file name
-            hr_file_name = file_path.split("heart_rate_data_")[1].replace(".csv", "")
+        combined_header = None
+        combined_body_heart_rate = []
 
+        for file_path in find_csv_files(root_dir, "heart_rate_data_*.csv"):
             # Load the CSV file
             heart_rate_df = pd.read_csv(file_path)
 
-            # Prepare the JSON structure again
-            json_output = {
-                "header": {
-                    "uuid": f"AIREADI-{patient_ID}",
-                    "creation_date_time": datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"),
-                    "user_id": f"AIREADI-{patient_ID}",
-                    "schema_id": {
-                        "namespace": "omh",
-                        "name": "heart-rate",
-                        "version": 2.0,
-                    },
-                    "timezone": timezone,
-                },
-                "body": {"heart_rate": []},
-            }
-
-            for index, row in heart_rate_df.iterrows():
-                original_timestamp = pd.to_datetime(row["datetime"])
-                formatted_timestamp = original_timestamp.strftime("%Y-%m-%dT%H:%M:%SZ")
-
-                heart_rate_entry = {
-                    "heart_rate": {
-                        "value": row["heart_rate (bpm)"],
-                        "unit": "beats/min",
-                    },
-                    "effective_time_frame": {"date_time": formatted_timestamp},
+            if combined_header is None:
+                combined_header = build_header(
+                    pt,
+                    {"namespace": "omh", "name": "heart-rate", "version": 2.0},
+                    timezone,
+                )
+
+            combined_body_heart_rate.extend(
+                {
+                    "heart_rate": {"value": value, "unit": "beats/min"},
+                    "effective_time_frame": {"date_time": date_time},
                 }
-                pt_hr_count = pt_hr_count + 1
-                json_output["body"]["heart_rate"].append(heart_rate_entry)
-
-            formatted_json = json.dumps(json_output, indent=4, sort_keys=False)
-
-            # To save the formatted JSON to a file
-            # output_dir = Path("heart_rate_jsons/" + patient_ID + "_HR")
-            output_dir = Path(output_folder)
-            output_dir.mkdir(parents=True, exist_ok=True)
-            output_filename = patient_ID + "_" + hr_file_name + ".json"
-            output_file_path = os.path.join(output_dir, output_filename)
-
-            with open(output_file_path, "w") as f:
-                f.write(formatted_json)
-
-        pt_directory = output_folder
-        pt_directory_path = Path(pt_directory)
-
-        out_directory = os.path.join(final_output, pt)
-        out_directory_path = Path(out_directory)
-        out_directory_path.mkdir(parents=True, exist_ok=True)
-
-        file_paths = list(pt_directory_path.glob("*.json"))
-
-        merge_json_files(file_paths, out_directory, pt)
+                for value, date_time in zip(
+                    heart_rate_df["heart_rate (bpm)"].tolist(),
+                    format_timestamps(heart_rate_df["datetime"]),
+                )
+            )
+
+        # Sort the combined_body_heart_rate list by date_time
+        combined_body_heart_rate.sort(
+            key=lambda x: x["effective_time_frame"]["date_time"]
+        )
+
+        write_standardized_json(
+            final_output,
+            pt,
+            "_heartrate",
+            combined_header,
+            {"heart_rate": combined_body_heart_rate},
+        )
 
     except Exception:
         print(format_exc())
@@ -0,0 +1,79 @@
+"""Helpers shared by the Garmin Open mHealth standardizers"""
+
+import glob
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+# Timestamp format used in the standardized JSON files
+JSON_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+# Timestamp format the FIT to CSV converters write whole second timestamps in
+CSV_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def find_csv_files(root_dir, *file_patterns):
+    """
+    Return the CSV files matching file_patterns in every folder of root_dir.
+
+    Folders are visited in sorted order and, within a folder, the patterns are matched in
+    the order given, so the combined output does not depend on the order the file system
+    lists them in.
+    """
+    csv_files = []
+
+    if os.path.isdir(root_dir):
+        for entry in sorted(os.listdir(root_dir)):
+            for file_pattern in file_patterns:
+                csv_files.extend(
+                    sorted(glob.glob(os.path.join(root_dir, entry, file_pattern)))
+                )
+
+    return csv_files
+
+
+def format_timestamps(values):
+    """
+    Format a column of CSV timestamps as JSON timestamps.
+
+    The whole column is parsed at once when it uses the converter format. Anything else
+    (fractional seconds, missing values) is parsed one value at a time, which behaves
+    exactly like calling pd.to_datetime on each row.
+
+    Returns:
+        list: The formatted timestamps, one per row.
+    """
+    try:
+        parsed = pd.to_datetime(values, format=CSV_TIMESTAMP_FORMAT)
+    except (ValueError, TypeError):
+        parsed = None
+
+    if parsed is None or parsed.isna().any():
+        return [pd.to_datetime(value).strftime(JSON_TIMESTAMP_FORMAT) for value in values]
+
+    return parsed.dt.strftime(JSON_TIMESTAMP_FORMAT).tolist()
+
+
+def build_header(patient_id, schema_id, timezone):
+    """Return the Open mHealth header for a participant"""
+    return {
+        "uuid": f"AIREADI-{patient_id}",
+        "creation_date_time": datetime.now().strftime(JSON_TIMESTAMP_FORMAT),
+        "user_id": f"AIREADI-{patient_id}",
+        "schema_id": schema_id,
+        "timezone": timezone,
+    }
+
+
+def write_standardized_json(final_output, patient_id, file_suffix, header, body):
+    """Write the combined file to final_output/<patient_id>/<patient_id><file_suffix>.json"""
+    out_directory = os.path.join(final_output, patient_id)
+    Path(out_directory).mkdir(parents=True, exist_ok=True)
+
+    with open(
+        os.path.join(out_directory, patient_id + file_suffix + ".json"), "w"
+    ) as combined_file:
+        json.dump({"header": header, "body": body}, combined_file, indent=4)
@@ -1,8 +1,7 @@
 import os
 import imaging.imaging_utils as imaging_utils
 import imaging.imaging_classifying_rules as imaging_classifying_rules
-import shutil
-import pydicom
+import utils.file_stage as file_stage
 
 
 def filter_cirrus_files(folder, output):
@@ -49,7 +48,7 @@ def filter_cirrus_files(folder, output):
                                 original_folder_basename = os.path.basename(
                                     os.path.dirname(file_path)
                                 )
-                                data = pydicom.dcmread(file_path)
+                                data = imaging_classifying_rules.read_dicom_header(file_path)
                                 laterality = data.ImageLaterality
                                 patientid = data.PatientID
 
@@ -58,7 +57,7 @@ def filter_cirrus_files(folder, output):
                                     f"{output}/{protocol}/{protocol}_{patientid}_{laterality}_{original_folder_basename}",
                                     exist_ok=True,
                                 )
-                                shutil.copytree(
+                                file_stage.stage_tree(
                                     folder,
                                     f"{output}/{protocol}/{protocol}_{patientid}_{laterality}_{original_folder_basename}",
                                     dirs_exist_ok=True,
@@ -78,7 +77,7 @@ def filter_cirrus_files(folder, output):
                                             original_folder_basename = os.path.basename(
                                                 os.path.dirname(file_path)
                                             )
-                                            data = pydicom.dcmread(file_path)
+                                            data = imaging_classifying_rules.read_dicom_header(file_path)
                                             laterality = data.ImageLaterality
                                             patientid = data.PatientID
                                             protocol = (
@@ -117,7 +116,9 @@ def filter_cirrus_files(folder, output):
                                             )
 
                                             # Copy the file
-                                            shutil.copy2(file_path, destination)
+                                            file_stage.stage_file(
+                                                file_path, destination
+                                            )
 
                             else:
                                 for root, dirs, files in os.walk(folder):
@@ -127,7 +128,7 @@ def filter_cirrus_files(folder, output):
                                             original_folder_basename = os.path.basename(
                                                 os.path.dirname(file_path)
                                             )
-                                            data = pydicom.dcmread(file_path)
+                                            data = imaging_classifying_rules.read_dicom_header(file_path)
                                             laterality = data.ImageLaterality
                                             patientid = data.PatientID
                                             protocol = "wrong_angio_protocol"
@@ -157,7 +158,9 @@ def filter_cirrus_files(folder, output):
                                             )
 
                                             # Copy the file
-                                            shutil.copy2(file_path, destination)
+                                            file_stage.stage_file(
+                                                file_path, destination
+                                            )
                         else:
                             for root, dirs, files in os.walk(folder):
                                 for file in files:
@@ -166,7 +169,7 @@ def filter_cirrus_files(folder, output):
                                         original_folder_basename = os.path.basename(
                                             os.path.dirname(file_path)
                                         )
-                                        data = pydicom.dcmread(file_path)
+                                        data = imaging_classifying_rules.read_dicom_header(file_path)
                                         laterality = data.ImageLaterality
                                         patientid = data.PatientID
                                         protocol = (
@@ -204,7 +207,7 @@ def filter_cirrus_files(folder, output):
                                         )
 
                                         # Copy the file
-                                        shutil.copy2(file_path, destination)
+                                        file_stage.stage_file(file_path, destination)
 
             else:
 
@@ -212,7 +215,7 @@ def filter_cirrus_files(folder, output):
 
                 outputfolder = f"{output}/{protocol}"
 
-                a = pydicom.dcmread(filtered_list[0])
+                a = imaging_classifying_rules.read_dicom_header(filtered_list[0])
                 patientid = a.PatientID if hasattr(a, "PatientID") else "N/A"
                 laterality = (
                     a.ImageLaterality if hasattr(a, "ImageLaterality") else "N/A"
@@ -226,7 +229,7 @@ def filter_cirrus_files(folder, output):
                 os.makedirs(source_folder, exist_ok=True)
 
                 # Copy the entire folder to the output directory
-                shutil.copytree(source_folder, outputfolder, dirs_exist_ok=True)
+                file_stage.stage_tree(source_folder, outputfolder, dirs_exist_ok=True)
 
             dic = {
                 "Rule": protocol,
@@ -250,7 +253,7 @@ def filter_cirrus_files(folder, output):
             os.makedirs(source_folder, exist_ok=True)
 
             # Copy the entire folder to the output directory
-            shutil.copytree(source_folder, outputfolder, dirs_exist_ok=True)
+            file_stage.stage_tree(source_folder, outputfolder, dirs_exist_ok=True)
 
             dic = {
                 "Rule": protocol,
@@ -273,7 +276,7 @@ def filter_cirrus_files(folder, output):
         os.makedirs(source_folder, exist_ok=True)
 
         # Copy the entire folder to the output directory
-        shutil.copytree(source_folder, outputfolder, dirs_exist_ok=True)
+        file_stage.stage_tree(source_folder, outputfolder, dirs_exist_ok=True)
 
         dic = {
             "Rule": protocol,
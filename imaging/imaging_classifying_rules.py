@@ -1,6 +1,15 @@
 import os
+import threading
+from collections import OrderedDict
+
 import pydicom
 
+# Maximum number of files kept in the DICOM header cache
+HEADER_CACHE_SIZE = 4096
+
+_header_cache = OrderedDict()
+_header_cache_lock = threading.Lock()
+
 
 # Class representing a rule for classifying DICOM entries
 class ClassifyingRule:
@@ -11,17 +20,35 @@ class ClassifyingRule:
     It contains attributes such as the rule's name and a list of conditions that must be met
     for the rule to apply.
 
+    The optional device, sopclassuid and sopclassuid_prefix keys only index the rule in
+    the RuleIndex. They must be implied by the conditions (which still test them), so a
+    rule whose keys do not match an entry can never apply to it.
+
     Attributes:
         name (str): The name of the classification rule.
         conditions (list): List of lambda functions representing the conditions.
+        device (str): Device the conditions require, or None.
+        sopclassuid (str): SOP class UID the conditions require, or None.
+        sopclassuid_prefix (str): Prefix of the SOP class UID the conditions require, or None.
 
     Methods:
         apply(dicom_entry): Checks if the DICOM entry meets all conditions.
+        matches_keys(device, sopclassuid): Checks if the index keys allow the rule.
     """
 
-    def __init__(self, name, conditions):
+    def __init__(
+        self,
+        name,
+        conditions,
+        device=None,
+        sopclassuid=None,
+        sopclassuid_prefix=None,
+    ):
         self.name = name
         self.conditions = conditions
+        self.device = device
+        self.sopclassuid = sopclassuid
+        self.sopclassuid_prefix = sopclassuid_prefix
 
     def apply(self, dicom_entry):
         # Apply all conditions to the DICOM entry
@@ -30,12 +57,77 @@ class ClassifyingRule:
                 return False
         return True
 
+    def matches_keys(self, device, sopclassuid):
+        # Check the index keys only, the conditions decide the match
+        if self.device is not None and device != self.device:
+            return False
+        if self.sopclassuid is not None and sopclassuid != self.sopclassuid:
+            return False
+        if self.sopclassuid_prefix is not None and not sopclassuid.startswith(
+            self.sopclassuid_prefix
+        ):
+            return False
+        return True
+
+
+class RuleIndex:
+    """
+    Classification rules compiled into a dispatch on device and SOP class UID.
+
+    Every (device, SOP class UID) pair maps to the rules whose index keys allow it, in
+    the order of the rule list, so classifying an entry is a dict lookup followed by
+    the conditions of the few candidate rules. The first candidate that applies wins,
+    which is the same rule the linear walk over the list finds first. Devices no rule
+    is keyed on share one bucket. The pairs named by the rules are compiled up front,
+    any other SOP class UID is compiled the first time it is seen.
+
+    Attributes:
+        rules (list): The classification rules, in order of precedence.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._devices = {rule.device for rule in self.rules} - {None}
+        self._candidates = {}
+
+        uids = {rule.sopclassuid for rule in self.rules}
+        uids |= {rule.sopclassuid_prefix for rule in self.rules}
+        uids.discard(None)
+
+        for device in [None, *sorted(self._devices)]:
+            for uid in sorted(uids):
+                self.candidates(device, uid)
+
+    def candidates(self, device, sopclassuid):
+        """Rules that can apply to an entry with this device and SOP class UID"""
+        device = device if device in self._devices else None
+        sopclassuid = str(sopclassuid)
+        key = (device, sopclassuid)
+
+        candidates = self._candidates.get(key)
+        if candidates is None:
+            candidates = tuple(
+                rule for rule in self.rules if rule.matches_keys(device, sopclassuid)
+            )
+            self._candidates[key] = candidates
+
+        return candidates
+
+    def classify(self, dicom_entry):
+        """Name of the first rule that applies to the entry, or no_rules_apply"""
+        for rule in self.candidates(dicom_entry.device, dicom_entry.sopclassuid):
+            if rule.apply(dicom_entry):
+                return str(rule.name)
+        return "no_rules_apply"
+
 
 # List of classification rules
 rules = [
     # Define various classification rules with specific conditions
     ClassifyingRule(
         "maestro2_octa_segmentation",
+        device="3DOCT-1Maestro2",
+        sopclassuid="1.2.840.10008.5.1.4.1.1.66.5",
         conditions=[
             lambda entry: entry.device == "3DOCT-1Maestro2"
             and str(entry.filename).endswith("4.1.dcm")
@@ -44,6 +136,8 @@ rules = [
     ),
     ClassifyingRule(
         "triton_octa_segmentation",
+        device="Triton plus",
+        sopclassuid="1.2.840.10008.5.1.4.1.1.66.5",
         conditions=[
             lambda entry: entry.device == "Triton plus"
             and str(entry.filename).endswith("4.1.dcm")
@@ -52,6 +146,7 @@ rules = [
     ),
     ClassifyingRule(
         "raw_data_storage",
+        sopclassuid_prefix="1.2.840.10008.5.1.4.1.1.66",
         conditions=[
             lambda entry: entry.sopclassuid.startswith("1.2.840.10008.5.1.4.1.1.66")
         ],
@@ -62,6 +157,8 @@ rules = [
     ),
     ClassifyingRule(
         "optomed_mac_or_disk_centered_cfp",
+        device="Aurora",
+        sopclassuid_prefix="1.2.840.10008.5.1.4.1.1.77.1.5.1",
         conditions=[
             lambda entry: "Aurora" == entry.device
             and entry.sopclassuid.startswith("1.2.840.10008.5.1.4.1.1.77.1.5.1")
@@ -70,6 +167,7 @@ rules = [
     # eidon
     ClassifyingRule(
         "eidon_uwf_central_ir",
+        sopclassuid_prefix="1.2.840.10008.5.1.4.1.1.77.1.5.1",
         conditions=[
             lambda entry: "0-infrared" in entry.filename.lower()
             and "Eidon" in entry.device
@@ -78,6 +176,7 @@ rules = [
     ),
     ClassifyingRule(
         "eidon_uwf_central_faf",
+        sopclassuid_prefix="1.2.840.10008.5.1.4.1.1.77.1.5.1",
         conditions=[
             lambda entry: "0-af-" in entry.filename.lower()
             and "Eidon" in entry.device
@@ -86,6 +185,7 @@ rules = [
     ),
     ClassifyingRule(
         "eidon_uwf_central_cfp",
+        sopclassuid_prefix="1.2.840.10008.5.1.4.1.1.77.1.5.1",
         conditions=[
             lambda entry: "0-visible" in entry.filename.lower()
             and "Eidon" in entry.device
@@ -94,6 +194,7 @@ rules = [
     ),
     ClassifyingRule(
         "eidon_uwf_nasal_cfp",
+        sopclassuid_prefix="1.2.840.10008.5.1.4.1.1.77.1.5.1",
         conditions=[
             lambda entry: "3-visible" in entry.filename.lower()
             and "Eidon" in entry.device
@@ -102,6 +203,7 @@ rules = [
     ),
     ClassifyingRule(
         "eidon_uwf_temporal_cfp",
+        sopclassuid_prefix="1.2.840.10008.5.1.4.1.1.77.1.5.1",
         conditions=[
             lambda entry: "4-visible" in entry.filename.lower()
             and "Eidon" in entry.device
@@ -110,6 +212,7 @@ rules = [
     ),
     ClassifyingRule(
         "eidon_mosaic_cfp",
+        sopclassuid_prefix="1.2.840.10008.5.1.4.1.1.77.1.5.1",
         conditions=[
             lambda entry: "11-visible" in entry.filename.lower()
             and "Eidon" in entry.device
@@ -119,6 +222,8 @@ rules = [
     # maestro
     ClassifyingRule(
         "maestro2_retinal_photography",
+        device="3DOCT-1Maestro2",
+        sopclassuid_prefix="1.2.840.10008.5.1.4.1.1.77.1.5.1",
         conditions=[
             lambda entry: entry.device == "3DOCT-1Maestro2"
             and entry.sopclassuid.startswith("1.2.840.10008.5.1.4.1.1.77.1.5.1")
@@ -127,6 +232,8 @@ rules = [
     ),
     ClassifyingRule(
         "triton_retinal_photography",
+        device="Triton plus",
+        sopclassuid_prefix="1.2.840.10008.5.1.4.1.1.77.1.5.1",
         conditions=[
             lambda entry: entry.device == "Triton plus"
             and entry.sopclassuid.startswith("1.2.840.10008.5.1.4.1.1.77.1.5.1")
@@ -135,6 +242,7 @@ rules = [
     ),
     ClassifyingRule(
         "maestro2_3d_macula_oct_oct",
+        device="3DOCT-1Maestro2",
         conditions=[
             lambda entry: entry.device == "3DOCT-1Maestro2"
             and 0.03 < entry.slicethickness < 0.05
@@ -143,6 +251,7 @@ rules = [
     ),
     ClassifyingRule(
         "maestro2_3d_wide_oct_oct",
+        device="3DOCT-1Maestro2",
         conditions=[
             lambda entry: entry.device == "3DOCT-1Maestro2"
             and 0.06 < entry.slicethickness < 0.08
@@ -151,6 +260,7 @@ rules = [
     ),
     ClassifyingRule(
         "maestro2_mac_6x6_octa_oct",
+        device="3DOCT-1Maestro2",
         conditions=[
             lambda entry: entry.device == "3DOCT-1Maestro2"
             and 0.0 < entry.slicethickness < 0.02
@@ -159,6 +269,7 @@ rules = [
     ),
     ClassifyingRule(
         "triton_3d_radial_oct_oct",
+        device="Triton plus",
         conditions=[
             lambda entry: entry.device == "Triton plus"
             and str(entry.slicethickness).startswith("0.03")
@@ -166,6 +277,7 @@ rules = [
     ),
     ClassifyingRule(
         "triton_macula_6x6_octa_oct",
+        device="Triton plus",
         conditions=[
             lambda entry: entry.device == "Triton plus"
             and str(entry.slicethickness).startswith("0.01")
@@ -173,6 +285,7 @@ rules = [
     ),
     ClassifyingRule(
         "triton_macula_12x12_octa_oct",
+        device="Triton plus",
         conditions=[
             lambda entry: entry.device == "Triton plus"
             and str(entry.slicethickness).startswith("0.02")
@@ -182,6 +295,8 @@ rules = [
     # 496, 768, 27
     ClassifyingRule(
         "spectralis_onh_rc_hr_oct",
+        device="Spectralis",
+        sopclassuid="1.2.840.10008.5.1.4.1.1.77.1.5.4",
         conditions=[
             lambda entry: entry.device == "Spectralis"
             and entry.sopclassuid == "1.2.840.10008.5.1.4.1.1.77.1.5.4"
@@ -195,6 +310,8 @@ rules = [
     # 496, 768, 61
     ClassifyingRule(
         "spectralis_ppol_mac_hr_oct_small",
+        device="Spectralis",
+        sopclassuid="1.2.840.10008.5.1.4.1.1.77.1.5.4",
         conditions=[
             lambda entry: entry.device == "Spectralis"
             and entry.sopclassuid == "1.2.840.10008.5.1.4.1.1.77.1.5.4"
@@ -208,6 +325,8 @@ rules = [
     # 496, 1536, 61
     ClassifyingRule(
         "spectralis_ppol_mac_hr_oct",
+        device="Spectralis",
+        sopclassuid="1.2.840.10008.5.1.4.1.1.77.1.5.4",
         conditions=[
             lambda entry: entry.device == "Spectralis"
             and entry.sopclassuid == "1.2.840.10008.5.1.4.1.1.77.1.5.4"
@@ -219,6 +338,7 @@ rules = [
     ),  # 496, 512, 512
     ClassifyingRule(
         "spectralis_mac_20x20_hs_octa_oct",
+        device="Spectralis",
         conditions=[
             lambda entry: entry.device == "Spectralis"
             and entry.seriesdescription == "Volume IR"
@@ -231,6 +351,8 @@ rules = [
     # 496, 384, 284
     ClassifyingRule(
         "spectralis_retired_octa_oct",
+        device="Spectralis",
+        sopclassuid="1.2.840.10008.5.1.4.1.1.77.1.5.4",
         conditions=[
             lambda entry: entry.device == "Spectralis"
             and entry.sopclassuid == "1.2.840.10008.5.1.4.1.1.77.1.5.4"
@@ -243,6 +365,8 @@ rules = [
     # 768, 768
     ClassifyingRule(
         "spectralis_ppol_mac_hr_retinal_photography_small",
+        device="Spectralis",
+        sopclassuid_prefix="1.2.840.10008.5.1.4.1.1.77.1.5.1",
         conditions=[
             lambda entry: entry.device == "Spectralis"
             and entry.sopclassuid.startswith("1.2.840.10008.5.1.4.1.1.77.1.5.1")
@@ -257,6 +381,8 @@ rules = [
     # 1536, 1536
     ClassifyingRule(
         "spectralis_ppol_mac_hr_retinal_photography",
+        device="Spectralis",
+        sopclassuid_prefix="1.2.840.10008.5.1.4.1.1.77.1.5.1",
         conditions=[
             lambda entry: entry.device == "Spectralis"
             and entry.sopclassuid.startswith("1.2.840.10008.5.1.4.1.1.77.1.5.1")
@@ -271,6 +397,8 @@ rules = [
     # 1536 1536
     ClassifyingRule(
         "spectralis_onh_rc_hr_retinal_photography",
+        device="Spectralis",
+        sopclassuid_prefix="1.2.840.10008.5.1.4.1.1.77.1.5.1",
         conditions=[
             lambda entry: entry.device == "Spectralis"
             and entry.sopclassuid.startswith("1.2.840.10008.5.1.4.1.1.77.1.5.1")
@@ -283,6 +411,8 @@ rules = [
     # 768, 768
     ClassifyingRule(
         "spectralis_mac_20x20_hs_octa_retinal_photography",
+        device="Spectralis",
+        sopclassuid_prefix="1.2.840.10008.5.1.4.1.1.77.1.5.1",
         conditions=[
             lambda entry: entry.device == "Spectralis"
             and entry.sopclassuid.startswith("1.2.840.10008.5.1.4.1.1.77.1.5.1")
@@ -296,6 +426,8 @@ rules = [
     # 1536 1536
     ClassifyingRule(
         "spectralis_retired_octa_retinal_photography",
+        device="Spectralis",
+        sopclassuid_prefix="1.2.840.10008.5.1.4.1.1.77.1.5.1",
         conditions=[
             lambda entry: entry.device == "Spectralis"
             and entry.sopclassuid.startswith("1.2.840.10008.5.1.4.1.1.77.1.5.1")
@@ -306,16 +438,20 @@ rules = [
     ),
     ClassifyingRule(
         "secondary_capture",
+        sopclassuid="1.2.840.10008.5.1.4.1.1.7",
         conditions=[lambda entry: entry.sopclassuid == "1.2.840.10008.5.1.4.1.1.7"],
     ),
     ClassifyingRule(
         "pdf",
+        sopclassuid_prefix="1.2.840.10008.5.1.4.1.1.104.1",
         conditions=[
             lambda entry: entry.sopclassuid.startswith("1.2.840.10008.5.1.4.1.1.104.1")
         ],
     ),
     ClassifyingRule(
         "maestro_octa_enface",
+        device="3DOCT-1Maestro2",
+        sopclassuid="1.2.840.10008.5.1.4.1.1.77.1.5.7",
         conditions=[
             lambda entry: entry.device == "3DOCT-1Maestro2"
             and str(entry.sopclassuid) == "1.2.840.10008.5.1.4.1.1.77.1.5.7"
@@ -323,6 +459,8 @@ rules = [
     ),
     ClassifyingRule(
         "triton_octa_enface",
+        device="Triton plus",
+        sopclassuid="1.2.840.10008.5.1.4.1.1.77.1.5.7",
         conditions=[
             lambda entry: entry.device == "Triton plus"
             and str(entry.sopclassuid) == "1.2.840.10008.5.1.4.1.1.77.1.5.7"
@@ -330,6 +468,8 @@ rules = [
     ),
     ClassifyingRule(
         "maestro_octa_volume",
+        device="3DOCT-1Maestro2",
+        sopclassuid="1.2.840.10008.5.1.4.1.1.77.1.5.8",
         conditions=[
             lambda entry: entry.device == "3DOCT-1Maestro2"
             and str(entry.sopclassuid) == "1.2.840.10008.5.1.4.1.1.77.1.5.8"
@@ -337,6 +477,8 @@ rules = [
     ),
     ClassifyingRule(
         "triton_octa_volume",
+        device="Triton plus",
+        sopclassuid="1.2.840.10008.5.1.4.1.1.77.1.5.8",
         conditions=[
             lambda entry: entry.device == "Triton plus"
             and str(entry.sopclassuid) == "1.2.840.10008.5.1.4.1.1.77.1.5.8"
@@ -344,6 +486,9 @@ rules = [
     ),
 ]
 
+# The rules compiled into a dispatch, used by find_rule
+rule_index = RuleIndex(rules)
+
 
 # Class representing a DICOM entry
 class DicomEntry:
@@ -458,6 +603,79 @@ class DicomSummary:
         self.sopinstanceuid = sopinstanceuid
 
 
+def _get_cached_header(file):
+    """
+    Return the cache record for a file, reading its header on a miss.
+
+    The cache is keyed by the absolute path together with the modification time and
+    size of the file, so a file that is rewritten in place is read again. Only the
+    header is parsed (``stop_before_pixels``), the pixel data is never loaded.
+
+    Args:
+        file (str): The path to the file.
+
+    Returns:
+        dict: A record with the header ``dataset`` (None when the file is not a valid
+        DICOM file) and the ``entry`` built from it by extract_dicom_entry.
+    """
+    stat = os.stat(file)
+    key = (os.path.abspath(file), stat.st_mtime_ns, stat.st_size)
+
+    with _header_cache_lock:
+        record = _header_cache.get(key)
+        if record is not None:
+            _header_cache.move_to_end(key)
+            return record
+
+    try:
+        dataset = pydicom.dcmread(file, stop_before_pixels=True)
+    except pydicom.errors.InvalidDicomError:
+        dataset = None
+
+    record = {"dataset": dataset, "entry": None}
+
+    with _header_cache_lock:
+        record = _header_cache.setdefault(key, record)
+        _header_cache.move_to_end(key)
+        while len(_header_cache) > HEADER_CACHE_SIZE:
+            _header_cache.popitem(last=False)
+
+    return record
+
+
+def read_dicom_header(file):
+    """
+    Read the header of a DICOM file without its pixel data.
+
+    The dataset is cached per file (path, mtime and size) and shared with every caller
+    in the organize step, so a file is only read once no matter how many times it is
+    classified. The returned dataset must be treated as read-only.
+
+    Args:
+        file (str): The path to the DICOM file.
+
+    Returns:
+        pydicom.Dataset: The header of the DICOM file.
+
+    Raises:
+        pydicom.errors.InvalidDicomError: If the file is not a valid DICOM file.
+    """
+    dataset = _get_cached_header(file)["dataset"]
+
+    if dataset is None:
+        raise pydicom.errors.InvalidDicomError(
+            f"File is missing DICOM File Meta Information header: {file}"
+        )
+
+    return dataset
+
+
+def clear_dicom_header_cache():
+    """Drop every cached DICOM header"""
+    with _header_cache_lock:
+        _header_cache.clear()
+
+
 # Function to extract information from a DICOM file and create a DicomEntry object
 def extract_dicom_entry(file):
     """
@@ -472,17 +690,30 @@ def extract_dicom_entry(file):
     if not os.path.exists(file):
         raise FileNotFoundError(f"File {file} not found.")
 
-    dicom = pydicom.dcmread(file).to_json_dict()
-    ds = pydicom.dcmread(file)
+    record = _get_cached_header(file)
+
+    if record["entry"] is None:
+        record["entry"] = _build_dicom_entry(file, read_dicom_header(file))
+
+    return record["entry"]
+
+
+def _build_dicom_entry(file, dataset):
+    """
+    Build a DicomEntry from the header of a DICOM file.
+
+    Args:
+        file (str): The path to the DICOM file.
+        dataset (pydicom.Dataset): The header of the DICOM file.
+
+    Returns:
+        DicomEntry: An object containing detailed information about the DICOM file.
+    """
+    dicom = dataset.to_json_dict()
 
     filename = os.path.basename(file)
-    bottom_file_name = os.path.basename(file)
-    directory_one_level_up = os.path.dirname(file)
-    second_to_bottom_file_name = os.path.basename(directory_one_level_up)
 
     filesize = os.path.getsize(file) / (1000 * 1000)
-    folder_path = os.path.dirname(file)
-    folder_files = os.listdir(folder_path)
     error = "no"
 
     if "0020000E" in dicom:
@@ -715,12 +946,55 @@ def find_rule(file):
     """
     if file.endswith(".dcm") or file[-8:].isdigit():
         dicomentry = extract_dicom_entry(file)
-        matching_rules = [rule for rule in rules if rule.apply(dicomentry)]
-        if matching_rules:
-            for rule in matching_rules:
-                return str(rule.name)
-        else:
-            return "no_rules_apply"
+        return rule_index.classify(dicomentry)
+
+
+def find_rule_linear(dicom_entry):
+    """
+    Classify a DICOM entry by walking the whole rule list, without the rule index.
+
+    This is the reference find_rule is checked against, see check_rule_index.
+
+    Args:
+        dicom_entry (DicomEntry): The entry to classify.
+
+    Returns:
+        str: The name of the first rule that applies, or "no_rules_apply" if none apply.
+    """
+    for rule in rules:
+        if rule.apply(dicom_entry):
+            return str(rule.name)
+    return "no_rules_apply"
+
+
+def check_rule_index(dicom_entries):
+    """
+    Check that the rule index classifies entries the same as the linear walk.
+
+    A condition that raises counts as an outcome too, so both evaluators must fail
+    with the same exception type on the same entries.
+
+    Args:
+        dicom_entries (iterable): DicomEntry objects to classify.
+
+    Returns:
+        list: (entry, linear outcome, indexed outcome) for every entry they disagree on.
+    """
+    mismatches = []
+
+    for dicom_entry in dicom_entries:
+        outcomes = []
+
+        for classify in (find_rule_linear, rule_index.classify):
+            try:
+                outcomes.append(classify(dicom_entry))
+            except Exception as error:
+                outcomes.append(type(error).__name__)
+
+        if outcomes[0] != outcomes[1]:
+            mismatches.append((dicom_entry, *outcomes))
+
+    return mismatches
 
 
 def is_dicom_file(file_path):
@@ -737,7 +1011,7 @@ def is_dicom_file(file_path):
         str: The name of the classification rule that applies, or "no_rules_apply" if none apply.
     """
     try:
-        pydicom.dcmread(file_path)
+        read_dicom_header(file_path)
         return True
     except pydicom.errors.InvalidDicomError:
         return False
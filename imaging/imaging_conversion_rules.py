@@ -0,0 +1,676 @@
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import pydicom
+
+KEEP = 0
+BLANK = 1
+HARMONIZE = 2
+DESIGNATE = 3
+
+# Elements whose JSON value is replaced by the raw value read from the file
+RAW_VALUE_TAGS = {
+    "00100010": "PatientName",
+    "00080090": "ReferringPhysicianName",
+}
+
+# File meta elements available to the header elements of a conversion rule
+FILE_META_ELEMENTS = {
+    "00020000": ("UL", "FileMetaInformationGroupLength"),
+    "00020001": ("OB", "FileMetaInformationVersion"),
+    "00020002": ("UI", "MediaStorageSOPClassUID"),
+    "00020003": ("UI", "MediaStorageSOPInstanceUID"),
+    "00020010": ("UI", "TransferSyntaxUID"),
+    "00020012": ("UI", "ImplementationClassUID"),
+    "00020013": ("SH", "ImplementationVersionName"),
+}
+
+# Tags read from the files an output only references
+REFERENCE_TAGS = ["0020000D", "0020000E", "00080016", "00080018"]
+
+# Maximum number of file results kept by memoize_file
+FILE_CACHE_SIZE = 4096
+
+_file_cache = OrderedDict()
+_file_cache_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def keyword(tag):
+    """
+    Get the DICOM keyword of a tag, looked up once per tag.
+
+    Args:
+        tag (str): The DICOM tag, e.g. "00100010".
+
+    Returns:
+        str: The keyword of the tag, e.g. "PatientName".
+    """
+    return pydicom.datadict.keyword_for_tag(tag)
+
+
+class HeaderElement:
+    """
+    Represents a file meta element of the output dataset.
+
+    Attributes:
+        name (str): The name of the header element.
+        tag (str): The tag associated with the header element.
+        vr (str): The value representation of the header element.
+    """
+
+    def __init__(self, name, tag, vr):
+        self.name = name
+        self.tag = tag
+        self.vr = vr
+
+
+class Element:
+    """
+    Represents an element of the output dataset and how its value is decided.
+
+    Attributes:
+        name (str): The name of the element.
+        tag (str): The tag associated with the element.
+        vr (str): The value representation of the element.
+        decision (int): KEEP, BLANK, HARMONIZE or DESIGNATE (default is KEEP).
+        harmonized_value: The value written when the decision is HARMONIZE.
+        designated_value: The mapping used when the decision is DESIGNATE.
+    """
+
+    def __init__(
+        self, name, tag, vr, decision=KEEP, harmonized_value=0, designated_value=0
+    ):
+        self.name = name
+        self.tag = tag
+        self.vr = vr
+        self.decision = decision
+        self.harmonized_value = harmonized_value
+        self.designated_value = designated_value
+
+
+class Sequence:
+    """
+    Represents a sequence whose first item is built from one or more element lists.
+
+    The item is appended to the output sequence once for every element list.
+
+    Attributes:
+        name (str): The name of the sequence.
+        tag (str): The tag associated with the sequence.
+        vr (str): The value representation of the sequence.
+        element_lists (list): The lists of elements of the sequence item.
+        sequences (list): Nested sequences, kept for compatibility (default is empty).
+    """
+
+    def __init__(self, name, tag, vr, *element_lists, sequences=None):
+        self.name = name
+        self.tag = tag
+        self.vr = vr
+        self.element_lists = element_lists if element_lists else []
+        self.sequences = sequences if sequences is not None else []
+
+    def element_tags(self):
+        """
+        Tags of the elements of the sequence, one list per element list.
+
+        Returns:
+            list: List of lists of element tags.
+        """
+        return [
+            [element.tag for element in element_list]
+            for element_list in self.element_lists
+        ]
+
+
+class ElementList:
+    """
+    Represents a sequence whose first item is built from a single list of elements.
+
+    Attributes:
+        name (str): The name of the element list.
+        tag (str): The tag associated with the element list.
+        vr (str): The value representation of the element list.
+        elements (list): The elements of the sequence item (default is an empty list).
+    """
+
+    def __init__(self, name, tag, vr, elements=None):
+        self.name = name
+        self.tag = tag
+        self.vr = vr
+        self.elements = elements if elements is not None else []
+
+    @property
+    def element_lists(self):
+        return [self.elements]
+
+    def element_tags(self):
+        """
+        Tags of the elements of the sequence.
+
+        Returns:
+            list: List of element tags.
+        """
+        return [element.tag for element in self.elements]
+
+
+class SequencePlan:
+    """
+    Compiled write plan of a single sequence of a conversion rule.
+
+    Attributes:
+        tag (str): The tag of the sequence.
+        keyword (str): The keyword of the sequence.
+        element_lists (list): One list of (tag, keyword, Element) per element list of
+            the sequence, where the Element is the last one declared for the tag.
+    """
+
+    def __init__(self, sequence):
+        self.tag = sequence.tag
+        self.keyword = keyword(sequence.tag)
+
+        elements = {}
+        for element_list in sequence.element_lists:
+            for element in element_list:
+                elements[element.tag] = element
+
+        self.element_lists = [
+            [
+                (element.tag, keyword(element.tag), elements[element.tag])
+                for element in element_list
+            ]
+            for element_list in sequence.element_lists
+        ]
+
+
+class ConversionRule:
+    """
+    Represents a conversion rule for processing data.
+
+    The tag lists of the rule are compiled once, when the rule is created, into
+    lookups that the extraction and the writing of every file reuse, so a
+    conversion does not scan the rule for each element it writes.
+
+    Attributes:
+        name (str): The name of the conversion rule.
+        header_elements (list): List of HeaderElement instances for the file meta.
+        elements (list): List of Element instances representing individual elements.
+        sequences (list): List of Sequence or ElementList instances.
+
+    Methods:
+        header_tags(): Extracts unique tags from header elements.
+        tags(): Extracts unique tags from individual elements.
+        sequence_tags(): Generates a dictionary of sequence tags and associated element tags.
+        extraction_tags(extra): Tags to extract from an input file for this rule.
+        element(tag): The element that decides the value of a tag.
+        sequence(tag): The compiled write plan of a sequence.
+    """
+
+    def __init__(self, name, headers, elements, sequences):
+        self.name = name
+        self.header_elements = headers
+        self.elements = elements
+        self.sequences = sequences
+
+        # dict keeps the declaration order and the last element declared for a tag
+        self._header_tags = list(
+            dict.fromkeys(element.tag for element in self.header_elements)
+        )
+        self._elements = {element.tag: element for element in self.elements}
+        self._sequences = {
+            sequence.tag: SequencePlan(sequence) for sequence in self.sequences
+        }
+        self._sequence_tags = {
+            sequence.tag: sequence.element_tags() for sequence in self.sequences
+        }
+
+    def header_tags(self):
+        """
+        Extracts unique tags from header elements.
+
+        :return: List of unique header element tags.
+        """
+        return list(self._header_tags)
+
+    def tags(self):
+        """
+        Extracts unique tags from individual elements.
+
+        :return: List of unique element tags.
+        """
+        return list(self._elements)
+
+    def sequence_tags(self):
+        """
+        Generates a dictionary of sequence tags and associated element tags.
+
+        :return: Dictionary with sequence tags as keys and the element tags as values.
+        """
+        return dict(self._sequence_tags)
+
+    def extraction_tags(self, extra=()):
+        """
+        Tags to extract from an input file for this rule.
+
+        Args:
+            extra (iterable): Additional tags read by the functional groups.
+
+        Returns:
+            list: The header, element and sequence tags followed by the extra tags.
+        """
+        return (
+            self._header_tags
+            + list(self._elements)
+            + list(self._sequences)
+            + list(extra)
+        )
+
+    def element(self, tag):
+        """
+        The element that decides the value of a tag, the last one declared.
+
+        Args:
+            tag (str): The DICOM tag.
+
+        Returns:
+            Element: The element of the tag.
+        """
+        return self._elements[tag]
+
+    def sequence(self, tag):
+        """
+        The compiled write plan of a sequence, the last one declared for the tag.
+
+        Args:
+            tag (str): The DICOM tag of the sequence.
+
+        Returns:
+            SequencePlan: The plan of the sequence.
+        """
+        return self._sequences[tag]
+
+
+class DicomEntry:
+    """
+    Represents an entry containing DICOM tag information.
+
+    Attributes:
+        tag (str): The DICOM tag associated with the entry.
+        name (str): The name of the DICOM tag.
+        vr (str): The value representation of the DICOM tag.
+        value (Any): The value associated with the DICOM tag.
+
+    Methods:
+        is_empty(): Checks if the value of the DICOM entry is empty.
+    """
+
+    def __init__(self, tag, name, vr, value):
+        self.tag = tag
+        self.name = name
+        self.vr = vr
+        self.value = value
+
+    def is_empty(self):
+        """
+        Checks if the value of the DICOM entry is empty.
+
+        Returns:
+            bool: True if the value is empty, False otherwise.
+        """
+        return len(self.value) == 0
+
+
+def process_tags(tags, dicom):
+    """
+    Process DICOM tags and create a structured output.
+
+    Sequences become a list with one dictionary of DicomEntry instances per item.
+
+    Args:
+        tags (list): List of DICOM tags to be processed.
+        dicom (dict): Dictionary containing DICOM tag information in the JSON model.
+
+    Returns:
+        dict: A structured output containing processed DICOM tag information.
+    """
+    output = dict()
+    for tag in tags:
+        if tag in dicom:
+            element_name = keyword(tag)
+            vr = dicom[tag]["vr"]
+            value = dicom[tag].get("Value", [])
+
+            if not value or not isinstance(value[0], dict):
+                output[tag] = DicomEntry(tag, element_name, vr, value)
+            else:
+                nested_output = []
+                for item in value:
+                    keys_list = list(item.keys())
+                    nested_output.append(process_tags(keys_list, item))
+                output[tag] = DicomEntry(tag, element_name, vr, nested_output)
+    return output
+
+
+def dicom_json(dataset, tags, file_meta=None):
+    """
+    Convert the elements of a dataset that are in tags to the DICOM JSON model.
+
+    Only the requested top level elements are converted, so the pixel data and
+    the elements no rule reads are never encoded. The values are the same as in
+    dataset.to_json_dict(), except for the names in RAW_VALUE_TAGS, which keep
+    the value read from the file.
+
+    Args:
+        dataset (pydicom.Dataset): The dataset read from the input file.
+        tags (list): List of DICOM tags to convert.
+        file_meta (dict): File meta values to use instead of the ones of the file.
+
+    Returns:
+        dict: The converted elements keyed by tag, including the file meta elements.
+    """
+    file_meta = file_meta or {}
+    wanted = set(tags)
+
+    json_dict = {}
+    for tag, (vr, name) in FILE_META_ELEMENTS.items():
+        value = file_meta[tag] if tag in file_meta else getattr(dataset.file_meta, name)
+        json_dict[tag] = {"vr": vr, "Value": [value]}
+
+    # Read before converting anything so a file without them fails as before
+    raw_values = {tag: getattr(dataset, name) for tag, name in RAW_VALUE_TAGS.items()}
+
+    for key in dataset.keys():
+        json_key = f"{key:08X}"
+
+        if json_key in wanted or json_key in raw_values:
+            json_dict[json_key] = dataset[key].to_json_dict(
+                bulk_data_element_handler=None, bulk_data_threshold=1024
+            )
+
+    for tag, value in raw_values.items():
+        json_dict[tag]["Value"] = [value]
+
+    return json_dict
+
+
+def extract_entries(dataset, tags, file_meta=None):
+    """
+    Extract the DicomEntry instances of tags from a dataset.
+
+    Args:
+        dataset (pydicom.Dataset): The dataset read from the input file.
+        tags (list): List of DICOM tags to be processed.
+        file_meta (dict): File meta values to use instead of the ones of the file.
+
+    Returns:
+        dict: A structured output containing processed DICOM tag information.
+    """
+    return process_tags(tags, dicom_json(dataset, tags, file_meta))
+
+
+def extract_dicom_dict(
+    file, tags, prepare=None, file_meta=None, pixel_data=("PixelData",), copy=()
+):
+    """
+    Extract DICOM information from a file and create a structured dictionary.
+
+    The file is read once and only the elements in tags, the RAW_VALUE_TAGS
+    elements, the copied elements and the pixel data are read from it, the other
+    elements are skipped without being decoded.
+
+    Args:
+        file (str): Path to the DICOM file.
+        tags (list): List of DICOM tags to be processed.
+        prepare (callable): Called with the dataset before the extraction, to set
+            the values the converter writes instead of the ones of the file.
+        file_meta (dict): File meta values to use instead of the ones of the file.
+        pixel_data (tuple): Keywords of the pixel data elements, the first one the
+            file has is returned. A file without any of them fails, unless the
+            keywords end with None, which returns None instead.
+        copy (list): Keywords of the elements written to the output as read.
+
+    Returns:
+        tuple: A tuple containing the structured dictionary, transfer syntax
+               information, pixel data and the copied elements by keyword.
+    """
+    if not os.path.exists(file):
+        raise FileNotFoundError(f"File {file} not found.")
+
+    pixel_keywords = [name for name in pixel_data if name is not None]
+    dataset = pydicom.dcmread(
+        file,
+        stop_before_pixels=not pixel_keywords,
+        specific_tags=list(tags) + list(RAW_VALUE_TAGS) + list(copy) + pixel_keywords,
+    )
+
+    if prepare is not None:
+        prepare(dataset)
+
+    output = extract_entries(dataset, tags, file_meta)
+
+    transfersyntax = [dataset.is_little_endian, dataset.is_implicit_VR]
+
+    pixeldata = None
+    for name in pixel_data:
+        if name is None:
+            break
+
+        # The last keyword is read even when missing, so the file fails on it
+        if name in dataset or name == pixel_data[-1]:
+            pixeldata = getattr(dataset, name)
+            break
+
+    copied = {name: getattr(dataset, name) for name in copy}
+
+    return output, transfersyntax, pixeldata, copied
+
+
+def write_file_meta(protocol, entries):
+    """
+    Build the file meta of the output dataset from the header elements of a rule.
+
+    Args:
+        protocol (ConversionRule): The conversion rule.
+        entries (dict): The DicomEntry instances extracted from the input file.
+
+    Returns:
+        pydicom.Dataset: The file meta dataset.
+    """
+    file_meta = pydicom.Dataset()
+
+    for tag in protocol.header_tags():
+        setattr(file_meta, keyword(tag), entries[tag].value)
+
+    return file_meta
+
+
+def write_elements(protocol, entries, dataset):
+    """
+    Set the elements of a rule on the output dataset.
+
+    BLANK elements are written empty, HARMONIZE elements with their harmonized
+    value and the others with the value of the input file, or empty if the input
+    file does not have them.
+
+    Args:
+        protocol (ConversionRule): The conversion rule.
+        entries (dict): The DicomEntry instances extracted from the input file.
+        dataset (pydicom.Dataset): The output dataset.
+    """
+    for tag in protocol.tags():
+        element = protocol.element(tag)
+
+        if element.decision == BLANK:
+            value = []
+
+        elif element.decision == HARMONIZE:
+            value = [element.harmonized_value]
+
+        elif tag in entries:
+            value = entries[tag].value
+
+        else:
+            value = []
+
+        setattr(dataset, keyword(tag), value)
+
+
+def write_sequence(protocol, entries, dataset, tag):
+    """
+    Set a sequence of a rule on the output dataset.
+
+    The item of the sequence is built from the first item of the input sequence,
+    with the decision of every element taken from the sequence's own elements.
+    The sequence is written empty if the input file does not have items for it.
+
+    Args:
+        protocol (ConversionRule): The conversion rule.
+        entries (dict): The DicomEntry instances extracted from the input file.
+        dataset (pydicom.Dataset): The output dataset.
+        tag (str): The tag of the sequence.
+    """
+    plan = protocol.sequence(tag)
+    seq = pydicom.Sequence()
+
+    if tag in entries and entries[tag].value:
+        first_item = entries[tag].value[0]
+        item = pydicom.Dataset()
+
+        for element_list in plan.element_lists:
+            for element_tag, element_keyword, element in element_list:
+                # Every element of the rule has to be present in the input item
+                entry = first_item[element_tag]
+
+                if element.decision == BLANK:
+                    value = []
+
+                elif element.decision == HARMONIZE:
+                    value = element.harmonized_value
+
+                else:
+                    value = entry.value
+
+                setattr(item, element_keyword, value)
+
+            seq.append(item)
+
+    setattr(dataset, plan.keyword, seq)
+
+
+def write_dicom(protocol, dicom_dict_list, file_path, write_extra=None):
+    """
+    Write the output DICOM file of a conversion rule.
+
+    The file meta, elements and sequences of the rule are written from the
+    extracted entries, together with the pixel data and the elements copied from
+    the input file.
+
+    Args:
+        protocol (ConversionRule): The conversion rule.
+        dicom_dict_list (tuple): The result of extract_dicom_dict for the input file.
+        file_path (str): Path to the output DICOM file.
+        write_extra (callable): Called with the output dataset before it is written,
+            to add the functional groups and values of the converter.
+    """
+    entries = dicom_dict_list[0]
+
+    dataset = pydicom.Dataset()
+    dataset.file_meta = write_file_meta(protocol, entries)
+
+    write_elements(protocol, entries, dataset)
+
+    dataset.is_little_endian = dicom_dict_list[1][0]
+    dataset.is_implicit_VR = dicom_dict_list[1][1]
+    dataset.PixelData = dicom_dict_list[2]
+
+    for name, value in dicom_dict_list[3].items():
+        setattr(dataset, name, value)
+
+    for key in protocol.sequence_tags():
+        write_sequence(protocol, entries, dataset, key)
+
+    if write_extra is not None:
+        write_extra(dataset)
+
+    pydicom.filewriter.dcmwrite(file_path, dataset, enforce_file_format=True)
+
+
+def memoize_file(file, name, read):
+    """
+    Result of read(file), memoized per file for the whole conversion batch.
+
+    The cache is keyed by the absolute path together with the modification time and
+    size of the file, so a file that is rewritten in place is read again. Results are
+    shared between threads and must be treated as read-only.
+
+    Args:
+        file (str): The path to the file.
+        name (str): Name of what read returns, files can be memoized under many names.
+        read (callable): Reads the result from the file on a miss.
+
+    Returns:
+        The result of read(file).
+    """
+    stat = os.stat(file)
+    key = (os.path.abspath(file), stat.st_mtime_ns, stat.st_size, name)
+
+    with _file_cache_lock:
+        if key in _file_cache:
+            _file_cache.move_to_end(key)
+            return _file_cache[key]
+
+    result = read(file)
+
+    with _file_cache_lock:
+        result = _file_cache.setdefault(key, result)
+        _file_cache.move_to_end(key)
+        while len(_file_cache) > FILE_CACHE_SIZE:
+            _file_cache.popitem(last=False)
+
+    return result
+
+
+def clear_file_cache():
+    """Drop every memoized file result"""
+    with _file_cache_lock:
+        _file_cache.clear()
+
+
+def _read_references(file):
+    dataset = pydicom.dcmread(
+        file, stop_before_pixels=True, specific_tags=REFERENCE_TAGS
+    )
+
+    dicom = {
+        f"{key:08X}": dataset[key].to_json_dict(
+            bulk_data_element_handler=None, bulk_data_threshold=1024
+        )
+        for key in dataset.keys()
+    }
+
+    return (
+        process_tags(REFERENCE_TAGS, dicom),
+        [dataset.is_little_endian, dataset.is_implicit_VR],
+        None,
+        {},
+    )
+
+
+def read_references(file):
+    """
+    Read the study, series, SOP class and SOP instance UIDs of a referenced file.
+
+    Only those elements are read, the pixel data is never loaded, and the result is
+    memoized, so a volume referenced by many outputs of a batch is read once.
+
+    Args:
+        file (str): The path to the DICOM file.
+
+    Returns:
+        tuple: The DicomEntry instances of REFERENCE_TAGS, the transfer syntax
+               information, None for the pixel data and no copied elements, the
+               same layout as extract_dicom_dict.
+    """
+    return memoize_file(file, "references", _read_references)
@@ -502,7 +502,7 @@ def write_dicom(protocol, dicom_dict_list, file_path):
             value = pydicom.Sequence()
             element_name = pydicom.datadict.keyword_for_tag(key)
             setattr(dataset, element_name, value)
-    pydicom.filewriter.write_file(file_path, dataset, write_like_original=False)
+    pydicom.filewriter.dcmwrite(file_path, dataset, enforce_file_format=True)
 
 
 def convert_dicom(input, output):
@@ -3,8 +3,7 @@ import pydicom
 from bs4 import BeautifulSoup
 import flio.flio_reader as flio_reader
 from pydicom.dataset import Dataset, FileMetaDataset
-from flio.flio_reader import get_array
-import numpy as np
+from flio.flio_reader import get_array, get_frames
 import json
 import re
 import imaging.imaging_utils as imaging_utils
@@ -272,12 +271,15 @@ def extract_dicom_info_from_html(html_file):
     return dicom_info
 
 
-def make_min_info_dicom_from_sdt(sdtpath):
+def make_min_info_dicom_from_sdt(sdtpath, include_pixel_data=True):
     """
     Create minimal DICOM datasets from an SDT file.
 
     Args:
         sdtpath (str): The path to the SDT file.
+        include_pixel_data (bool): Whether to attach the pixel data of both channels. When False
+            the datasets are returned without PixelData so the caller can attach one channel
+            at a time.
 
     Returns:
         tuple: Two DICOM datasets, one for short wavelength and one for long wavelength.
@@ -324,14 +326,11 @@ def make_min_info_dicom_from_sdt(sdtpath):
     ds_long.SOPClassUID = "1.2.840.10008.5.1.4.1.1.77.1.5.2"
     ds_long.SOPInstanceUID = ""
 
-    array1, array2 = get_array(sdtpath)
+    if include_pixel_data:
+        array1, array2 = get_array(sdtpath)
 
-    ds_short.PixelData = np.transpose(
-        array1.reshape(256, 256, 1024), (2, 0, 1)
-    ).tobytes()
-    ds_long.PixelData = np.transpose(
-        array2.reshape(256, 256, 1024), (2, 0, 1)
-    ).tobytes()
+        ds_short.PixelData = get_frames(array1).tobytes()
+        ds_long.PixelData = get_frames(array2).tobytes()
 
     return ds_short, ds_long
 
@@ -559,7 +558,9 @@ def make_flio_dicom(folder_path, output, json_path):
             }
 
         else:
-            a, b = make_min_info_dicom_from_sdt(inputsdt)
+            # Pixel data is attached one channel at a time right before it is written
+            a, b = make_min_info_dicom_from_sdt(inputsdt, include_pixel_data=False)
+            short_channel, long_channel = get_array(inputsdt)
             dicom_info = extract_dicom_info_from_html(inputhtml)
 
             with open(json_path, "r") as file:
@@ -600,17 +601,25 @@ def make_flio_dicom(folder_path, output, json_path):
 
             # Process short wavelength
             try:
+                a.PixelData = get_frames(short_channel).tobytes()
                 short_add_html_sdt_info(a, inputsdt, dicom_info, short_output_path)
                 short_status = "complete", short_output_path.split("/")[-1]
             except Exception as e:
                 short_status = f"error: {e}"
+            finally:
+                if "PixelData" in a:
+                    del a.PixelData
 
             # Process long wavelength
             try:
+                b.PixelData = get_frames(long_channel).tobytes()
                 long_add_html_sdt_info(b, inputsdt, dicom_info, long_output_path)
                 long_status = "complete", long_output_path.split("/")[-1]
             except Exception as e:
                 long_status = f"error: {e}"
+            finally:
+                if "PixelData" in b:
+                    del b.PixelData
 
             # Create and print the dictionary with completion status
             dic = {
@@ -1262,7 +1271,7 @@ def write_dicom(protocol, dicom_dict_list, file_path, input):
     for tag, VR, value in extracted_tags:
         add_tag(dataset, tag, VR, value)
 
-    pydicom.filewriter.write_file(file_path, dataset, write_like_original=False)
+    pydicom.filewriter.dcmwrite(file_path, dataset, enforce_file_format=True)
 
 
 def convert_dicom(input, output):
@@ -1,6 +1,6 @@
-import shutil
 import imaging.imaging_utils as imaging_utils
 import os
+import utils.file_stage as file_stage
 
 
 def filter_flio_files_process(input, output):
@@ -36,7 +36,7 @@ def filter_flio_files_process(input, output):
                 outputpath = f"{output}/flio_{patient}_{side}"
 
                 os.makedirs(os.path.dirname(outputpath), exist_ok=True)
-                shutil.copytree(folder_path, outputpath, dirs_exist_ok=True)
+                file_stage.stage_tree(folder_path, outputpath, dirs_exist_ok=True)
 
                 #  # Copy individual files to overwrite if they already exist
                 # for filename in os.listdir(folder_path):
@@ -1,8 +1,7 @@
 import os
 import imaging.imaging_utils as imaging_utils
 import imaging.imaging_classifying_rules as imaging_classifying_rules
-import pydicom
-import shutil
+import utils.file_stage as file_stage
 
 
 def filter_maestro2_triton_files(folder, output):
@@ -45,7 +44,7 @@ def filter_maestro2_triton_files(folder, output):
                             if file.endswith("1.1.dcm") and file.startswith("2"):
                                 file_path = os.path.join(root, file)
                                 protocol = "unknown_protocol"
-                                a = pydicom.dcmread(file_path)
+                                a = imaging_classifying_rules.read_dicom_header(file_path)
                                 patient_id = a.PatientID
                                 laterality = a.ImageLaterality
                                 outputtt = imaging_utils.topcon_process_folder(
@@ -62,7 +61,7 @@ def filter_maestro2_triton_files(folder, output):
                                 protocol = imaging_classifying_rules.find_rule(
                                     file_path
                                 )
-                                a = pydicom.dcmread(file_path)
+                                a = imaging_classifying_rules.read_dicom_header(file_path)
                                 patient_id = a.PatientID
                                 laterality = a.ImageLaterality
                                 outputtt = imaging_utils.topcon_process_folder(
@@ -76,7 +75,7 @@ def filter_maestro2_triton_files(folder, output):
                         if file.endswith("1.1.dcm") and file.startswith("2"):
                             file_path = os.path.join(root, file)
                             protocol = f"{check}"
-                            a = pydicom.dcmread(file_path)
+                            a = imaging_classifying_rules.read_dicom_header(file_path)
                             patient_id = a.PatientID
                             laterality = a.ImageLaterality
                             outputtt = imaging_utils.topcon_process_folder(
@@ -107,7 +106,7 @@ def filter_maestro2_triton_files(folder, output):
 
         protocol = "no_files"
         outputtt = f"{output}/{protocol}/{protocol}_{folder.split('/')[-1]}"
-        shutil.copytree(folder, outputtt, dirs_exist_ok=True)
+        file_stage.stage_tree(folder, outputtt, dirs_exist_ok=True)
 
         dic = {
             "Rule": "no_files",
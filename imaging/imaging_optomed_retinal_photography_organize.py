@@ -1,6 +1,6 @@
 import os
-import shutil
 import imaging.imaging_classifying_rules as imaging_classifying_rules
+import utils.file_stage as file_stage
 
 
 def filter_optomed_files(file, outputfolder):
@@ -37,7 +37,7 @@ def filter_optomed_files(file, outputfolder):
         original_path = file
         output_path = f"{outputfolder}/{rule}/{rule}_{filename}"
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        shutil.copyfile(original_path, output_path)
+        file_stage.stage_file(original_path, output_path)
 
         dic = {
             "Rule": rule,
@@ -57,7 +57,7 @@ def filter_optomed_files(file, outputfolder):
         original_path = file
         output_path = f"{outputfolder}/{error}/{error}_{filename}"
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        shutil.copyfile(original_path, output_path)
+        file_stage.stage_file(original_path, output_path)
 
         dic = {
             "Input": file,
@@ -1,6 +1,6 @@
 import os
-import shutil
 import imaging.imaging_classifying_rules as imaging_classifying_rules
+import utils.file_stage as file_stage
 
 
 def filter_spectralis_files(file, outputfolder):
@@ -39,7 +39,7 @@ def filter_spectralis_files(file, outputfolder):
         output_path = f"{outputfolder}/{rule}/{rule}_{patientid}_{laterality}_{filename}_{uid}.dcm"
 
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        shutil.copyfile(original_path, output_path)
+        file_stage.stage_file(original_path, output_path)
 
         dic = {
             "Rule": rule,
@@ -60,7 +60,7 @@ def filter_spectralis_files(file, outputfolder):
         original_path_for_name = file.replace("/", "_")
         output_path = f"{outputfolder}/{error}/{error}_{original_path_for_name}"
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        shutil.copyfile(original_path, output_path)
+        file_stage.stage_file(original_path, output_path)
 
         dic = {
             "Input": file,
@@ -2,11 +2,27 @@ import os
 import imaging.imaging_classifying_rules as imaging_classifying_rules
 import shutil
 import pydicom
+import pydicom.encaps
 import zipfile
 import importlib.util
 import string
 from bs4 import BeautifulSoup
 import re
+from io import BytesIO
+
+import config
+import utils.file_stage as file_stage
+
+# "structural" checks the pixel data against the image attributes in format_file,
+# "strict" decodes every frame instead
+FORMAT_PIXEL_CHECK = (config.FAIRHUB_FORMAT_PIXEL_CHECK or "structural").lower()
+
+# Pixel data elements and the bits per sample they always use
+PIXEL_DATA_ELEMENTS = {
+    0x7FE00010: None,  # PixelData, BitsAllocated
+    0x7FE00008: 32,  # FloatPixelData
+    0x7FE00009: 64,  # DoubleFloatPixelData
+}
 
 
 def find_string_in_files(file_list, target_string):
@@ -306,7 +322,7 @@ def filter_flio_files_process(input, output):
                 side = one.split("/")[-1]
 
                 outputpath = f"{output}/flio_{patient}_{side}"
-                shutil.copytree(folder_path, outputpath)
+                file_stage.stage_tree(folder_path, outputpath)
             else:
                 print("missing file", folder_path)
 
@@ -478,11 +494,11 @@ def topcon_process_folder(folder_path, outputpath, rule):
                     if os.path.isdir(source_path):
                         if os.path.exists(dest_path):
                             shutil.rmtree(dest_path)
-                        shutil.copytree(source_path, dest_path)
+                        file_stage.stage_tree(source_path, dest_path)
                     else:
                         new_filename = f"{original_folder_basename}_{item}"
                         dest_path = os.path.join(output, new_filename)
-                        shutil.copy2(source_path, dest_path)
+                        file_stage.stage_file(source_path, dest_path)
                         # shutil.copy2(source_path, dest_path)
 
     # for root, dirs, files in os.walk(outputpath):
@@ -545,7 +561,7 @@ def filter_eidon_files(file, outputfolder):
     original_path = file
     output_path = f"{outputfolder}/{rule}/{rule}_{filename}"
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    shutil.copyfile(original_path, output_path)
+    file_stage.stage_file(original_path, output_path)
 
     dic = {
         "Rule": rule,
@@ -630,7 +646,7 @@ cirrus_submodality_mapping = {
 
 def topcon_submodality(file):
 
-    a = pydicom.dcmread(file)
+    a = imaging_classifying_rules.read_dicom_header(file)
     submodality = ""
     if (
         a.SOPClassUID == "1.2.840.10008.5.1.4.1.1.77.1.5.1"
@@ -849,20 +865,91 @@ def find_id(patientid, patientname):
                 return find_number(patientname)
 
 
-def format_file(file, output):
+def check_pixel_data(dataset):
+    """
+    Check the pixel data of a DICOM dataset without decoding it.
+
+    Native pixel data must hold Rows x Columns x Frames x Samples x BitsAllocated bits.
+    Encapsulated pixel data must have a valid basic offset table and fragment items,
+    with at least one fragment and, when the offset table is used, one offset per
+    frame. The pixel data element itself is not converted, so saving the dataset
+    afterwards writes it back as read.
+
+    Args:
+        dataset (pydicom.Dataset): The dataset read from the DICOM file.
+
+    Raises:
+        ValueError: If the pixel data is missing or does not match the image attributes.
+    """
+    tag = next((tag for tag in PIXEL_DATA_ELEMENTS if tag in dataset), None)
+
+    if tag is None:
+        raise ValueError("The dataset has no pixel data")
+
+    value = dataset.get_item(tag).value
+
+    if not value:
+        raise ValueError("The pixel data is empty")
+
+    transfer_syntax = dataset.file_meta.get("TransferSyntaxUID")
+
+    if transfer_syntax is None or not transfer_syntax.is_transfer_syntax:
+        raise ValueError(f"Unknown transfer syntax {transfer_syntax}")
+
+    rows = int(dataset.get("Rows") or 0)
+    columns = int(dataset.get("Columns") or 0)
+    frames = int(dataset.get("NumberOfFrames") or 1)
+    samples = int(dataset.get("SamplesPerPixel") or 1)
+    bits_allocated = PIXEL_DATA_ELEMENTS[tag] or int(dataset.get("BitsAllocated") or 0)
+
+    if not rows or not columns or not bits_allocated:
+        raise ValueError("Rows, Columns and BitsAllocated must be set")
+
+    if tag == 0x7FE00010 and transfer_syntax.is_encapsulated:
+        buffer = BytesIO(value)
+        offsets = pydicom.encaps.parse_basic_offsets(buffer)
+        fragments, _ = pydicom.encaps.parse_fragments(buffer)
+
+        if fragments < max(frames, 1):
+            raise ValueError(f"{fragments} pixel data fragments for {frames} frames")
+
+        if offsets and len(offsets) != frames:
+            raise ValueError(f"{len(offsets)} frame offsets for {frames} frames")
+
+        return
+
+    expected = rows * columns * frames * samples * bits_allocated
+
+    if dataset.get("PhotometricInterpretation") == "YBR_FULL_422":
+        # Two samples per pixel, the chroma samples are shared by pairs of pixels
+        expected = expected // samples * 2
+
+    expected = (expected + 7) // 8
+
+    if len(value) < expected:
+        raise ValueError(f"The pixel data is {len(value)} bytes, expected {expected}")
+
+
+def format_file(file, output, strict=None):
     """
     Format a DICOM file and save it to an output directory.
 
     This function reads a DICOM file, extracts relevant information, and formats it according to
     specified rules. It then saves the formatted file to the appropriate output directory.
 
+    The pixel data is checked with check_pixel_data, or by decoding every frame in strict
+    mode. Files that fail the check are copied to error_pixel_data.
+
     Args:
         file (str): The path to the DICOM file to be formatted.
         output (str): The base path to the output directory.
+        strict (bool): Decode the pixel data, defaults to FAIRHUB_FORMAT_PIXEL_CHECK.
 
     Returns:
         dict: A dictionary containing protocol, patient ID, and laterality information.
     """
+    if strict is None:
+        strict = FORMAT_PIXEL_CHECK == "strict"
 
     try:
         dataset = pydicom.dcmread(file)
@@ -872,18 +959,21 @@ def format_file(file, output):
         os.makedirs(full_dir_path, exist_ok=True)
         filename = os.path.basename(file)
         full_file_path = os.path.join(full_dir_path, filename)
-        shutil.copy(file, full_file_path)
+        file_stage.stage_file(file, full_file_path)
     else:
         try:
-            # Check if dataset has pixel data
-            pixel = dataset.pixel_array
+            # Check if dataset has valid pixel data
+            if strict:
+                dataset.pixel_array
+            else:
+                check_pixel_data(dataset)
         except Exception:
             # Handle case where pixel_array is not available
             full_dir_path = output + "/error_pixel_data/"
             os.makedirs(full_dir_path, exist_ok=True)
             filename = os.path.basename(file)
             full_file_path = os.path.join(full_dir_path, filename)
-            shutil.copy(file, full_file_path)
+            file_stage.stage_file(file, full_file_path)
 
         else:
             id = find_id(str(dataset.PatientID), str(dataset.PatientName))
@@ -1079,7 +1169,7 @@ def check_critical_info_from_files_in_folder(folder):
 
     file = files[0]
 
-    dataset = pydicom.dcmread(file)
+    dataset = imaging_classifying_rules.read_dicom_header(file)
     try:
         uid = dataset.SOPInstanceUID
     except AttributeError:
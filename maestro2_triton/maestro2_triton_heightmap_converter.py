@@ -1,5 +1,16 @@
-import os
 import pydicom
+from imaging.imaging_conversion_rules import (
+    BLANK,
+    HARMONIZE,
+    DESIGNATE,
+    ConversionRule,
+    HeaderElement,
+    Element,
+    Sequence,
+    extract_dicom_dict,
+    keyword,
+    write_file_meta,
+)
 import numpy as np
 from PIL import Image
 from maestro2_triton.maestro2_triton_heightmap_converter_functional_groups import (
@@ -11,6 +22,9 @@ from maestro2_triton.maestro2_triton_heightmap_converter_functional_groups impor
     referenced_series_sequence,
 )
 
+# File meta values written instead of the ones of the input files
+FILE_META = {"00020002": "1.2.840.10008.5.1.4.xxxxx.1"}
+
 
 class OCTASeg:
     """
@@ -157,178 +171,6 @@ def get_heightmap_float_pixel_data(octfile, segfile):
     return floatpixeldata
 
 
-KEEP = 0
-BLANK = 1
-HARMONIZE = 2
-DESIGNATE = 3
-
-
-class ConversionRule:
-    """
-    Represents a conversion rule for processing data.
-
-    This class defines a rule used for data conversion and processing. It contains attributes
-    such as the rule's name, header elements, individual elements, and sequences of elements.
-
-    Attributes:
-        name (str): The name of the conversion rule.
-        header_elements (list): List of Element instances representing header elements.
-        elements (list): List of Element instances representing individual elements.
-        sequences (list): List of Sequence instances representing sequences of elements.
-
-    Methods:
-        header_tags(): Extracts unique tags from header elements.
-        tags(): Extracts unique tags from individual elements.
-        sequence_tags(): Generates a dictionary of sequence tags and associated element tags.
-    """
-
-    def __init__(self, name, header_elements, elements, sequences):
-        """
-        Initialize the ConversionRule class with its name, header elements, elements, and sequences.
-
-        Parameters:
-            name (str): The name of the conversion rule.
-            header_elements (list): List of Element instances representing header elements.
-            elements (list): List of Element instances representing individual elements.
-            sequences (list): List of Sequence instances representing sequences of elements.
-        """
-        self.name = name
-        self.header_elements = header_elements
-        self.elements = elements
-        self.sequences = sequences
-
-    def header_tags(self):
-        """
-        Extracts unique tags from header elements.
-
-        Returns:
-            list: A list of unique tags from the header elements.
-        """
-        headertags = set()
-        for header_element in self.header_elements:
-            headertags.add(header_element.tag)
-        return list(headertags)
-
-    def tags(self):
-        """
-        Extracts unique tags from individual elements.
-
-        Returns:
-            list: A list of unique tags from the individual elements.
-        """
-        tags = set()
-        for element in self.elements:
-            tags.add(element.tag)
-
-        return list(tags)
-
-    def sequence_tags(self):
-        """
-        Generates a dictionary of sequence tags and associated element tags.
-
-        Returns:
-            dict: A dictionary where keys are sequence tags and values are lists of lists of element tags.
-        """
-        tags_dict = {}
-        for sequence in self.sequences:
-            element_lists_tags = []
-            for element_list in sequence.element_lists:
-                element_tags = [element.tag for element in element_list]
-                element_lists_tags.append(element_tags)
-            tags_dict[sequence.tag] = element_lists_tags
-
-        return tags_dict
-
-
-class HeaderElement:
-    """
-    Represents a header element in the system.
-
-    Attributes:
-        name (str): The name of the header element.
-        tag (str): The tag associated with the header element.
-        vr (str): The value representation of the header element.
-    """
-
-    def __init__(self, name, tag, vr):
-        """
-        Initializes a new instance of the HeaderElement class.
-
-        Args:
-            name (str): The name of the header element.
-            tag (str): The tag associated with the header element.
-            vr (str): The value representation of the header element.
-        """
-        self.name = name
-        self.tag = tag
-        self.vr = vr
-
-
-class Element:
-    """
-    Represents an element in the system.
-
-    Attributes:
-        name (str): The name of the element.
-        tag (str): The tag associated with the element.
-        vr (str): The value representation of the element.
-        decision (int): The decision value of the element.
-        harmonized_value (int): The harmonized value of the element.
-        designated_value (int): The designated value of the element.
-    """
-
-    def __init__(
-        self, name, tag, vr, decision=0, harmonized_value=0, designated_value=0
-    ):
-        """
-        Initializes a new instance of the Element class.
-
-        Args:
-            name (str): The name of the element.
-            tag (str): The tag associated with the element.
-            vr (str): The value representation of the element.
-            decision (int, optional): The decision value of the element. Defaults to 0.
-            harmonized_value (int, optional): The harmonized value of the element. Defaults to 0.
-            designated_value (int, optional): The designated value of the element. Defaults to 0.
-        """
-        self.name = name
-        self.tag = tag
-        self.vr = vr
-        self.decision = decision
-        self.harmonized_value = harmonized_value
-        self.designated_value = designated_value
-
-
-class Sequence:
-    """
-    Represents a sequence in the system.
-
-    Attributes:
-        name (str): The name of the sequence.
-        tag (str): The tag associated with the sequence.
-        vr (str): The value representation of the sequence.
-        element_lists (list): A list of element lists in the sequence.
-        sequences (list): A list of sequences contained within this sequence.
-    """
-
-    def __init__(self, name, tag, vr, *element_lists, sequences=None):
-        """
-        Initializes a new instance of the Sequence class.
-
-        Args:
-            name (str): The name of the sequence.
-            tag (str): The tag associated with the sequence.
-            vr (str): The value representation of the sequence.
-            *element_lists: Variable length argument list of element lists.
-            sequences (list, optional): A list of sequences contained within this sequence. Defaults to None.
-        """
-        self.name = name
-        self.tag = tag
-        self.vr = vr
-        self.element_lists = element_lists if element_lists else []
-        self.sequences = sequences if sequences is not None else []
-
-
 class MappingRule:
     """
     Represents a mapping rule in the system.
@@ -608,149 +450,15 @@ oct_b = ConversionRule(
 )
 
 
-def process_tags(tags, dicom):
-    """
-    Process DICOM tags and create a structured output.
-
-    This function processes a list of DICOM tags and their values, creating a structured output
-    containing information about each tag and its associated values.
-
-    Args:
-        tags (list): List of DICOM tags to be processed.
-        dicom (dict): Dictionary containing DICOM tag information.
-
-    Returns:
-        dict: A structured output containing processed DICOM tag information.
-    """
-    output = dict()
-    for tag in tags:
-        if tag in dicom:
-            element_name = pydicom.datadict.keyword_for_tag(tag)
-            vr = dicom[tag]["vr"]
-            value = dicom[tag].get("Value", [])
-
-            if not value or not isinstance(value[0], dict):
-                output[tag] = DicomEntry(tag, element_name, vr, value)
-            else:
-                nested_output = []
-                for item in value:
-                    keys_list = list(item.keys())
-                    nested_output.append(process_tags(keys_list, item))
-                output[tag] = DicomEntry(tag, element_name, vr, nested_output)
-    return output
-
-
-class DicomEntry:
-    """
-    Represents an entry containing DICOM tag information.
-
-    This class defines an entry containing attributes such as the DICOM tag, its name,
-    value representation (vr), and the associated value.
-
-    Attributes:
-        tag (str): The DICOM tag associated with the entry.
-        name (str): The name of the DICOM tag.
-        vr (str): The value representation of the DICOM tag.
-        value (Any): The value associated with the DICOM tag.
-
-    Methods:
-        is_empty(): Checks if the value of the DICOM entry is empty.
-    """
-
-    def __init__(self, tag, name, vr, value):
-        """
-        Initializes a new instance of the DicomEntry class.
-
-        Args:
-            tag (str): The DICOM tag associated with the entry.
-            name (str): The name of the DICOM tag.
-            vr (str): The value representation of the DICOM tag.
-            value (Any): The value associated with the DICOM tag.
-        """
-        self.tag = tag
-        self.name = name
-        self.vr = vr
-        self.value = value
-
-    def is_empty(self):
-        """
-        Checks if the value of the DICOM entry is empty.
-
-        Returns:
-            bool: True if the value is empty, False otherwise.
-        """
-        return len(self.value) == 0
-
-
-def extract_dicom_dict(file, tags):
+def prepare_dataset(dataset):
     """
-    Extract DICOM information from a file and create a structured dictionary.
-
-    This function reads a DICOM file, extracts relevant header and data information,
-    and creates a structured dictionary containing header elements, metadata,
-    and processed DICOM tag information.
+    Set the values written instead of the ones of the input file.
 
     Args:
-        file (str): Path to the DICOM file.
-        tags (list): List of DICOM tags to be processed.
-
-    Returns:
-        tuple: A tuple containing the structured dictionary, transfer syntax information,
-               and pixel data of the DICOM file.
+        dataset (pydicom.Dataset): The dataset read from the input file.
     """
-    if not os.path.exists(file):
-        raise FileNotFoundError(f"File {file} not found.")
-
-    output = dict()
-    output["filepath"] = file
-
-    dataset = pydicom.dcmread(file)
-
     dataset.ImageType = ["DERIVED", "PRIMARY"]
 
-    header_elements = {
-        "00020000": {
-            "vr": "UL",
-            "Value": [dataset.file_meta.FileMetaInformationGroupLength],
-        },
-        "00020001": {
-            "vr": "OB",
-            "Value": [dataset.file_meta.FileMetaInformationVersion],
-        },
-        "00020002": {"vr": "UI", "Value": ["1.2.840.10008.5.1.4.xxxxx.1"]},
-        "00020003": {
-            "vr": "UI",
-            "Value": [dataset.file_meta.MediaStorageSOPInstanceUID],
-        },
-        "00020010": {"vr": "UI", "Value": [dataset.file_meta.TransferSyntaxUID]},
-        "00020012": {"vr": "UI", "Value": [dataset.file_meta.ImplementationClassUID]},
-        "00020013": {
-            "vr": "SH",
-            "Value": [dataset.file_meta.ImplementationVersionName],
-        },
-    }
-
-    json_dict = {}
-    json_dict.update(header_elements)
-    info = dataset.to_json_dict()
-
-    patient_name = dataset.PatientName
-    info["00100010"]["Value"] = [patient_name]
-    physician_name = dataset.ReferringPhysicianName
-    info["00080090"]["Value"] = [physician_name]
-
-    json_dict.update(info)
-
-    dicom = json_dict
-
-    output = process_tags(tags, dicom)
-
-    transfersyntax = [dataset.is_little_endian, dataset.is_implicit_VR]
-
-    pixeldata = None  # dataset.FloatPixelData
-
-    return output, transfersyntax, pixeldata
-
 
 def write_dicom(protocol, seg_dic, oct_dic, op_dic, seg_file, oct_file, file_path):
     """
@@ -768,25 +476,12 @@ def write_dicom(protocol, seg_dic, oct_dic, op_dic, seg_file, oct_file, file_pat
         tuple: A tuple containing the structured dictionary, transfer syntax information,
                and pixel data of the DICOM file.
     """
-    headertags = protocol.header_tags()
-    tags = protocol.tags()
-    sequencetags = protocol.sequence_tags()
-
-    file_meta = pydicom.Dataset()
-
-    for headertag in headertags:
-        value = seg_dic[0][headertag].value
-        element_name = pydicom.datadict.keyword_for_tag(seg_dic[0][headertag].tag)
-        setattr(file_meta, element_name, value)
-
     dataset = pydicom.Dataset()
-    dataset.file_meta = file_meta
+    dataset.file_meta = write_file_meta(protocol, seg_dic[0])
     dataset.ImageLaterality = oct_dic[0]["00200062"].value
 
-    for tag in tags:
-        for element in protocol.elements:
-            if element.tag == tag:
-                desired_element = element
+    for tag in protocol.tags():
+        desired_element = protocol.element(tag)
 
         if desired_element.decision == BLANK:
             value = []
@@ -807,12 +502,7 @@ def write_dicom(protocol, seg_dic, oct_dic, op_dic, seg_file, oct_file, file_pat
         else:
             value = []
 
-        element_name = (
-            pydicom.datadict.keyword_for_tag(seg_dic[0][tag].tag)
-            if tag in seg_dic[0]
-            else pydicom.datadict.keyword_for_tag(tag)
-        )
-        setattr(dataset, element_name, value)
+        setattr(dataset, keyword(tag), value)
 
     dataset.is_little_endian = seg_dic[1][0]
     dataset.is_implicit_VR = seg_dic[1][1]
@@ -824,7 +514,7 @@ def write_dicom(protocol, seg_dic, oct_dic, op_dic, seg_file, oct_file, file_pat
     dimension_organization_sequence(dataset, seg_dic, oct_dic)
     segment_sequence(dataset, seg_dic, oct_dic)
     referenced_series_sequence(dataset, seg_dic, oct_dic, op_dic)
-    pydicom.filewriter.write_file(file_path, dataset, write_like_original=False)
+    pydicom.filewriter.dcmwrite(file_path, dataset, enforce_file_format=True)
 
 
 def convert_dicom(inputseg, inputoct, inputop, output):
@@ -841,25 +531,25 @@ def convert_dicom(inputseg, inputoct, inputop, output):
         output (str): Path to the output DICOM file.
     """
     conversion_rule = heightmap
-    tags = (
-        conversion_rule.header_tags()
-        + conversion_rule.tags()
-        + list(conversion_rule.sequence_tags().keys())
-        + ["52009230", "52009229", "00620002", "00081115", "00209221", "00209222"]
+    tags = conversion_rule.extraction_tags(
+        ["52009230", "52009229", "00620002", "00081115", "00209221", "00209222"]
     )
 
     conversion_rule1 = oct_b
-    tags1 = (
-        conversion_rule1.header_tags()
-        + conversion_rule1.tags()
-        + list(conversion_rule1.sequence_tags().keys())
-        + ["52009230", "52009229", "00620002", "00081115", "00209221", "00209222"]
+    tags1 = conversion_rule1.extraction_tags(
+        ["52009230", "52009229", "00620002", "00081115", "00209221", "00209222"]
     )
-    x = extract_dicom_dict(inputseg, tags)
+    x = extract_dicom_dict(inputseg, tags, prepare_dataset, FILE_META, pixel_data=())
 
-    y = extract_dicom_dict(inputoct, tags1)
+    y = extract_dicom_dict(inputoct, tags1, prepare_dataset, FILE_META, pixel_data=())
 
-    z = extract_dicom_dict(inputop, ["0020000E", "00080016", "00080018"])
+    z = extract_dicom_dict(
+        inputop,
+        ["0020000E", "00080016", "00080018"],
+        prepare_dataset,
+        FILE_META,
+        pixel_data=(),
+    )
 
     filename = inputseg.split("/")[-1]
 
@@ -18,6 +18,9 @@ import csv
 from utils.file_map_processor import FileMapProcessor
 import utils.logwatch as logging
 from utils.time_estimator import TimeEstimator
+from utils.download_stage import download_to_file
+from utils.upload_stage import UploadStage
+from utils.work_queue import WorkQueue, WorkShare
 from functools import partial
 from multiprocessing.pool import ThreadPool
 import sys
@@ -37,6 +40,8 @@ IMPORTANT: COPY THE RAW DATA FROM THE PRODUCTION 'xx-pilot' CONTAINER TO THE POO
 
 overall_time_estimator = TimeEstimator(1)  # default to 1 for now
 
+PIPELINE_VERSION = "1"
+
 
 def worker(
     workflow_file_dependencies,
@@ -45,7 +50,7 @@ def worker(
     participant_filter_list: list,
     processed_data_qc_folder,
     processed_data_output_folder,
-    file_paths: list,
+    file_paths: WorkShare,
     worker_id: int,
 ):  # sourcery skip: low-code-quality
     """This function handles the work done by the worker threads,
@@ -64,6 +69,8 @@ def worker(
         file_system_name="stage-1-container",
     )
 
+    upload_stage = UploadStage(file_system_client)
+
     total_files = len(file_paths)
     time_estimator = TimeEstimator(total_files)
 
@@ -100,9 +107,12 @@ def worker(
         # download the file to the temp folder
         input_file_client = file_system_client.get_file_client(file_path=path)
 
-        input_last_modified = input_file_client.get_file_properties().last_modified
+        input_file_properties = input_file_client.get_file_properties()
+        input_last_modified = input_file_properties.last_modified
 
-        should_process = file_processor.file_should_process(path, input_last_modified)
+        should_process = file_processor.file_should_process(
+            path, input_last_modified, input_file_properties
+        )
 
         if not should_process:
             logger.debug(
@@ -125,11 +135,21 @@ def worker(
 
             logger.debug(f"Downloading {file_name} to {download_path}")
 
-            with open(download_path, "wb") as data:
-                input_file_client.download_file().readinto(data)
+            download_to_file(
+                input_file_client,
+                download_path,
+                size=input_file_properties.size,
+                etag=input_file_properties.etag,
+            )
 
             logger.info(f"Downloaded {file_name} to {download_path}")
 
+            if file_processor.content_unchanged(path, download_path):
+                logger.debug(f"Skipping {path} - File content has not changed")
+
+                logger.time(time_estimator.step())
+                continue
+
             cgm_path = download_path
 
             with tempfile.TemporaryDirectory(
@@ -206,53 +226,52 @@ def worker(
             output_files = [cgm_final_output_file_path]
 
             workflow_output_files = []
+            manifest_entries = []
 
             outputs_uploaded = True
 
             file_processor.delete_preexisting_output_files(path)
 
-            for file in output_files:
-                with open(file, "rb") as data:
-                    f2 = file.split("/")[-1]
-
-                    output_file_path = f"{processed_data_output_folder}/wearable_blood_glucose/continuous_glucose_monitoring/dexcom_g6/{patient_id}/{patient_id}_DEX.json"
-
-                    logger.debug(f"Uploading {f2} to {output_file_path}")
-
-                    try:
-                        output_blob_client = file_system_client.get_file_client(
-                            file_path=output_file_path
-                        )
+            uploads = [
+                (
+                    file,
+                    f"{processed_data_output_folder}/wearable_blood_glucose/continuous_glucose_monitoring/dexcom_g6/{patient_id}/{patient_id}_DEX.json",
+                )
+                for file in output_files
+            ]
 
-                        output_blob_client.upload_data(data, overwrite=True)
+            for (file, _), (output_file_path, error_exception) in zip(
+                uploads, upload_stage.upload(uploads)
+            ):
+                f2 = file.split("/")[-1]
 
-                        logger.info(f"Uploaded {f2} to {output_file_path}")
-                    except Exception:
-                        outputs_uploaded = False
+                if error_exception is not None:
+                    outputs_uploaded = False
 
-                        logger.error(f"Failed to upload {file}")
+                    logger.error(f"Failed to upload {file}")
+                    logger.error(error_exception)
 
-                        error_exception = format_exc()
-                        error_exception = "".join(error_exception.splitlines())
+                    file_processor.append_errors(error_exception, path)
+                    continue
 
-                        logger.error(error_exception)
+                logger.info(f"Uploaded {f2} to {output_file_path}")
 
-                        file_processor.append_errors(error_exception, path)
-                        continue
+                file_item["output_files"].append(output_file_path)
+                workflow_output_files.append(output_file_path)
 
-                    file_item["output_files"].append(output_file_path)
-                    workflow_output_files.append(output_file_path)
+                manifest_glucose_file_path = f"/wearable_blood_glucose/continuous_glucose_monitoring/dexcom_g6/{patient_id}/{patient_id}_DEX.json"
 
-                    manifest_glucose_file_path = f"/wearable_blood_glucose/continuous_glucose_monitoring/dexcom_g6/{patient_id}/{patient_id}_DEX.json"
+                logger.debug(f"Generating manifest for {f2}")
 
-                    logger.debug(f"Generating manifest for {f2}")
+                # Generate the manifest entry
+                manifest_entry = manifest.calculate_file_sampling_extent(
+                    cgm_final_output_file_path, manifest_glucose_file_path
+                )
 
-                    # Generate the manifest entry
-                    manifest.calculate_file_sampling_extent(
-                        cgm_final_output_file_path, manifest_glucose_file_path
-                    )
+                if manifest_entry is not None:
+                    manifest_entries.append(manifest_entry)
 
-                    logger.info(f"Generated manifest for {f2}")
+                logger.info(f"Generated manifest for {f2}")
 
             logger.info(
                 f"Uploaded the outputs of {file_name} to {processed_data_output_folder}"
@@ -262,6 +281,8 @@ def worker(
             file_processor.confirm_output_files(
                 path, workflow_output_files, input_last_modified
             )
+            # Kept with the file map entry for runs that skip this file
+            file_processor.record_manifest(path, manifest_entries)
 
             if outputs_uploaded:
                 file_item["output_uploaded"] = True
@@ -292,6 +313,8 @@ def worker(
                     )
 
                     output_blob_client.upload_data(data, overwrite=True)
+
+                file_processor.add_extra_output_files(path, [output_qc_file_path])
             except Exception:
                 file_item["qc_uploaded"] = False
 
@@ -312,7 +335,9 @@ def worker(
             os.remove(download_path)
 
 
-def pipeline(study_id: str, workers: int = 4, args: list = None):
+def pipeline(
+    study_id: str, workers: int = 4, args: list = None, incremental: bool = False
+):
     """The function contains the work done by
     the main thread, which runs only once for each operation."""
 
@@ -341,16 +366,24 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
         file_system_name="stage-1-container",
     )
 
-    with contextlib.suppress(Exception):
-        file_system_client.delete_directory(processed_data_output_folder)
+    # An incremental run keeps the outputs of unchanged inputs and replaces or
+    # deletes only those of changed, failed and removed ones
+    if not incremental:
+        with contextlib.suppress(Exception):
+            file_system_client.delete_directory(processed_data_output_folder)
 
-    with contextlib.suppress(Exception):
-        file_system_client.delete_directory(processed_data_qc_folder)
+        with contextlib.suppress(Exception):
+            file_system_client.delete_directory(processed_data_qc_folder)
 
-    with contextlib.suppress(Exception):
-        file_system_client.delete_directory(manifest_folder)
+        with contextlib.suppress(Exception):
+            file_system_client.delete_directory(manifest_folder)
+
+        # The outputs the file map lists are gone, so it has to go as well
+        with contextlib.suppress(Exception):
+            file_system_client.delete_file(f"{dependency_folder}/file_map.json")
 
     file_paths = []
+    input_sizes = {}
     participant_filter_list = []
 
     # Create a temporary folder on the local machine
@@ -387,6 +420,8 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
         if file_name.split(".")[-1] != "csv":
             continue
 
+        input_sizes[t] = path.content_length
+
         file_paths.append(
             {
                 "file_path": t,
@@ -405,15 +440,24 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
     logger.debug(f"Found {total_files} files in {input_folder}")
 
     workflow_file_dependencies = deps.WorkflowFileDependencies()
-    file_processor = FileMapProcessor(dependency_folder, ignore_file, args)
+    file_processor = FileMapProcessor(
+        dependency_folder,
+        ignore_file,
+        args,
+        pipeline_version=PIPELINE_VERSION,
+        requires_manifest=True,
+    )
 
     manifest = cgm_manifest.CGMManifest()
 
-    # Guarantees that all paths are considered, even if the number of items is not evenly divisible by workers.
-    chunk_size = (len(file_paths) + workers - 1) // workers
-    # Comprehension that fills out and pass to worker func final 2 args: chunks and worker_id
-    chunks = [file_paths[i : i + chunk_size] for i in range(0, total_files, chunk_size)]
-    args = [(chunk, index + 1) for index, chunk in enumerate(chunks)]
+    # Workers pull one file at a time from a shared queue, largest files first,
+    # so a worker that drew a large file does not hold up the rest of the run
+    work_queue = WorkQueue(
+        file_paths,
+        workers,
+        size=lambda file_item: input_sizes[file_item["file_path"]],
+    )
+    args = [(share, index + 1) for index, share in enumerate(work_queue.shares())]
     pipe = partial(
         worker,
         workflow_file_dependencies,
@@ -428,6 +472,11 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
     # Distributes the pipe function across the threads in the pool
     pool.starmap(pipe, args)
 
+    # Inputs skipped as unchanged keep their outputs, dependencies and manifest entries
+    manifest.add_entries(
+        file_processor.add_kept_dependencies(workflow_file_dependencies)
+    )
+
     file_processor.delete_out_of_date_output_files()
     file_processor.remove_seen_flag_from_map()
 
@@ -527,10 +576,15 @@ if __name__ == "__main__":
     parser.add_argument(
         "--workers", type=int, default=workers, help="Number of workers to use"
     )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Keep the outputs of unchanged inputs instead of starting over",
+    )
     args = parser.parse_args()
 
     workers = args.workers
 
     print(f"Using {workers} workers to process cgm data files")
 
-    pipeline("AI-READI", workers, sys_args)
+    pipeline("AI-READI", workers, sys_args, incremental=args.incremental)
@@ -19,6 +19,7 @@ import csv
 from utils.file_map_processor import FileMapProcessor
 import utils.logwatch as logging
 from utils.time_estimator import TimeEstimator
+from utils.work_queue import WorkQueue, WorkShare
 from functools import partial
 from multiprocessing.pool import ThreadPool
 import sys
@@ -33,7 +34,7 @@ def worker(
     participant_filter_list: list,
     processed_data_qc_folder,
     processed_data_output_folder,
-    file_paths: list,
+    file_paths: WorkShare,
     worker_id: int,
 ):
     logger = logging.Logwatch(
@@ -368,9 +369,13 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
 
     manifest = cgm_manifest.CGMManifest()
 
-    chunk_size = (len(file_paths) + workers - 1) // workers
-    chunks = [file_paths[i : i + chunk_size] for i in range(0, total_files, chunk_size)]
-    args = [(chunk, index + 1) for index, chunk in enumerate(chunks)]
+    # Workers pull one file at a time from a shared queue, largest files first
+    work_queue = WorkQueue(
+        file_paths,
+        workers,
+        size=lambda file_item: os.path.getsize(file_item["file_path"]),
+    )
+    args = [(share, index + 1) for index, share in enumerate(work_queue.shares())]
     pipe = partial(
         worker,
         workflow_file_dependencies,
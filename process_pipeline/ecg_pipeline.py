@@ -19,11 +19,16 @@ import csv
 import utils.logwatch as logging
 from utils.file_map_processor import FileMapProcessor
 from utils.time_estimator import TimeEstimator
+from utils.download_stage import download_to_file
+from utils.upload_stage import UploadStage
+from utils.work_queue import WorkQueue, WorkShare
 from functools import partial
 from multiprocessing.pool import ThreadPool
 
 overall_time_estimator = TimeEstimator(1)  # default to 1 for now
 
+PIPELINE_VERSION = "1"
+
 
 def worker(
     workflow_file_dependencies,
@@ -32,7 +37,7 @@ def worker(
     participant_filter_list,
     data_plot_output_folder,
     manifest,
-    file_paths: list,
+    file_paths: WorkShare,
     worker_id: int,
 ):  # sourcery skip: low-code-quality
     """This function handles the work done by the worker threads,
@@ -51,6 +56,8 @@ def worker(
         file_system_name="stage-1-container",
     )
 
+    upload_stage = UploadStage(file_system_client)
+
     total_files = len(file_paths)
     time_estimator = TimeEstimator(total_files)
 
@@ -71,9 +78,12 @@ def worker(
         # download the file to the temp folder
         file_client = file_system_client.get_file_client(file_path=path)
 
-        input_last_modified = file_client.get_file_properties().last_modified
+        input_file_properties = file_client.get_file_properties()
+        input_last_modified = input_file_properties.last_modified
 
-        should_process = file_processor.file_should_process(path, input_last_modified)
+        should_process = file_processor.file_should_process(
+            path, input_last_modified, input_file_properties
+        )
 
         if not should_process:
             logger.debug(
@@ -96,11 +106,21 @@ def worker(
 
             download_path = os.path.join(raw_data_folder, original_file_name)
 
-            with open(file=download_path, mode="wb") as f:
-                f.write(file_client.download_file().readall())
+            download_to_file(
+                file_client,
+                download_path,
+                size=input_file_properties.size,
+                etag=input_file_properties.etag,
+            )
 
             logger.info(f"Downloaded {original_file_name} to {download_path}")
 
+            if file_processor.content_unchanged(path, download_path):
+                logger.debug(f"Skipping {path} - File content has not changed")
+
+                logger.time(time_estimator.step())
+                continue
+
             ecg_path = download_path
 
             ecg_temp_folder_path = os.path.join(temp_folder_path, "ecg_temp")
@@ -159,37 +179,29 @@ def worker(
 
             file_processor.delete_preexisting_output_files(path)
 
-            for file in output_files:
-                with open(f"{file}", "rb") as data:
-                    file_name2 = file.split("/")[-1]
-
-                    output_file_path = f"{processed_data_output_folder}/ecg_12lead/philips_tc30/{participant_id}/{file_name2}"
-
-                    try:
-                        output_file_client = file_system_client.get_file_client(
-                            file_path=output_file_path
-                        )
-
-                        # Check if the file already exists. If it does, throw an exception
-                        if output_file_client.exists():
-                            raise Exception(
-                                f"File {output_file_path} already exists. Throwing exception"
-                            )
-
-                        output_file_client.upload_data(data, overwrite=True)
-                    except Exception:
-                        logger.error(f"Failed to upload {file}")
+            uploads = [
+                (
+                    file,
+                    f"{processed_data_output_folder}/ecg_12lead/philips_tc30/{participant_id}/{file.split('/')[-1]}",
+                )
+                for file in output_files
+            ]
 
-                        error_exception = "".join(format_exc().splitlines())
-                        logger.error(error_exception)
+            # Existing files are an error, found with one listing of the folder
+            for (file, _), (output_file_path, error_exception) in zip(
+                uploads, upload_stage.upload(uploads, fail_if_exists=True)
+            ):
+                if error_exception is not None:
+                    logger.error(f"Failed to upload {file}")
+                    logger.error(error_exception)
 
-                        file_processor.append_errors(error_exception, path)
+                    file_processor.append_errors(error_exception, path)
 
-                        outputs_uploaded = False
-                        continue
+                    outputs_uploaded = False
+                    continue
 
-                    file_item["output_files"].append(output_file_path)
-                    workflow_output_files.append(output_file_path)
+                file_item["output_files"].append(output_file_path)
+                workflow_output_files.append(output_file_path)
 
             # Add the new output files to the file map
             file_processor.confirm_output_files(
@@ -223,17 +235,18 @@ def worker(
 
             logger.debug(f"Uploading {original_file_name} to {data_plot_output_folder}")
 
-            for file in dataplot_pngs:
-                with open(f"{file}", "rb") as data:
-                    original_file_name = file.split("/")[-1]
-
-                    output_file_path = f"{data_plot_output_folder}/{original_file_name}"
-
-                    output_file_client = file_system_client.get_file_client(
-                        file_path=output_file_path
+            for output_file_path, error_exception in upload_stage.upload(
+                [
+                    (file, f"{data_plot_output_folder}/{file.split('/')[-1]}")
+                    for file in dataplot_pngs
+                ]
+            ):
+                if error_exception is not None:
+                    raise Exception(
+                        f"Failed to upload {output_file_path}: {error_exception}"
                     )
 
-                    output_file_client.upload_data(data, overwrite=True)
+                file_processor.add_extra_output_files(path, [output_file_path])
 
             logger.debug(f"Uploaded {original_file_name} to {data_plot_output_folder}")
 
@@ -246,6 +259,8 @@ def worker(
             output_hea_file = conv_retval_dict["output_hea_file"]
             output_dat_file = conv_retval_dict["output_dat_file"]
 
+            manifest_entries = []
+
             # Check if the file already exists.
             if os.path.exists(output_hea_file) and os.path.exists(output_dat_file):
                 hea_metadata = xecg.metadata(output_hea_file)
@@ -254,13 +269,19 @@ def worker(
                 output_dat_file = f"/cardiac_ecg/ecg_12lead/philips_tc30/{participant_id}/{output_dat_file.split('/')[-1]}"
 
                 manifest.add_metadata(hea_metadata, output_hea_file, output_dat_file)
+                manifest_entries.append(hea_metadata)
+
+            # Kept with the file map entry for runs that skip this file
+            file_processor.record_manifest(path, manifest_entries)
 
             logger.debug(f"Metadata created for {original_file_name}")
 
             logger.time(time_estimator.step())
 
 
-def pipeline(study_id: str, workers: int = 4, args: list = None):
+def pipeline(
+    study_id: str, workers: int = 4, args: list = None, incremental: bool = False
+):
     """The function contains the work done by
     the main thread, which runs only once for each operation."""
 
@@ -289,16 +310,20 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
         file_system_name="stage-1-container",
     )
 
-    with contextlib.suppress(Exception):
-        file_system_client.delete_directory(data_plot_output_folder)
+    # An incremental run keeps the outputs of unchanged inputs and replaces or
+    # deletes only those of changed, failed and removed ones
+    if not incremental:
+        with contextlib.suppress(Exception):
+            file_system_client.delete_directory(data_plot_output_folder)
 
-    with contextlib.suppress(Exception):
-        file_system_client.delete_directory(processed_data_output_folder)
+        with contextlib.suppress(Exception):
+            file_system_client.delete_directory(processed_data_output_folder)
 
-    with contextlib.suppress(Exception):
-        file_system_client.delete_file(f"{dependency_folder}/file_map.json")
+        with contextlib.suppress(Exception):
+            file_system_client.delete_file(f"{dependency_folder}/file_map.json")
 
     file_paths = []
+    input_sizes = {}
     participant_filter_list = []
 
     meta_temp_folder_path = tempfile.mkdtemp()
@@ -325,7 +350,12 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
         participant_filter_list.pop(0)
 
     paths = file_system_client.get_paths(path=input_folder)
-    file_processor = FileMapProcessor(dependency_folder, ignore_file)
+    file_processor = FileMapProcessor(
+        dependency_folder,
+        ignore_file,
+        pipeline_version=PIPELINE_VERSION,
+        requires_manifest=True,
+    )
 
     for path in paths:
         t = str(path.name)
@@ -349,6 +379,8 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
         start_date = start_date_end_date.split("-")[0]
         end_date = start_date_end_date.split("-")[1]
 
+        input_sizes[t] = path.content_length
+
         file_paths.append(
             {
                 "file_path": t,
@@ -377,15 +409,24 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
     temp_folder_path = tempfile.mkdtemp()
 
     # Create the output folder
-    file_system_client.create_directory(processed_data_output_folder)
+    output_folder_client = file_system_client.get_directory_client(
+        processed_data_output_folder
+    )
+
+    # An incremental run keeps the output folder it finds
+    if not (incremental and output_folder_client.exists()):
+        output_folder_client.create_directory()
 
     overall_time_estimator = TimeEstimator(total_files)
 
-    # Guarantees that all paths are considered, even if the number of items is not evenly divisible by workers.
-    chunk_size = (len(file_paths) + workers - 1) // workers
-    # Comprehension that fills out and pass to worker func final 2 args: chunks and worker_id
-    chunks = [file_paths[i : i + chunk_size] for i in range(0, total_files, chunk_size)]
-    args = [(chunk, index + 1) for index, chunk in enumerate(chunks)]
+    # Workers pull one file at a time from a shared queue, largest files first,
+    # so a worker that drew a large file does not hold up the rest of the run
+    work_queue = WorkQueue(
+        file_paths,
+        workers,
+        size=lambda file_item: input_sizes[file_item["file_path"]],
+    )
+    args = [(share, index + 1) for index, share in enumerate(work_queue.shares())]
     pipe = partial(
         worker,
         workflow_file_dependencies,
@@ -401,6 +442,11 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
     # Distributes the pipe function across the threads in the pool
     pool.starmap(pipe, args)
 
+    # Inputs skipped as unchanged keep their outputs, dependencies and manifest entries
+    manifest.add_entries(
+        file_processor.add_kept_dependencies(workflow_file_dependencies)
+    )
+
     file_processor.delete_out_of_date_output_files()
     file_processor.remove_seen_flag_from_map()
 
@@ -492,13 +538,18 @@ if __name__ == "__main__":
     parser.add_argument(
         "--workers", type=int, default=workers, help="Number of workers to use"
     )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Keep the outputs of unchanged inputs instead of starting over",
+    )
     args = parser.parse_args()
 
     workers = args.workers
 
     print(f"Using {workers} workers to process garmin data files")
 
-    pipeline("AI-READI", workers, sys_args)
+    pipeline("AI-READI", workers, sys_args, incremental=args.incremental)
 
     # delete the ecg.log file
     if os.path.exists("ecg.log"):
@@ -20,18 +20,22 @@ import csv
 import utils.logwatch as logging
 from utils.file_map_processor import FileMapProcessor
 from utils.time_estimator import TimeEstimator
-from functools import partial
-from multiprocessing.pool import ThreadPool
+from utils.download_stage import download_to_file
+from utils.upload_stage import UploadStage, collect_uploads
+from utils.work_queue import WorkShare
+from utils.worker_pool import run_workers
 
 overall_time_estimator = TimeEstimator(1)  # default to 1 for now
 
+PIPELINE_VERSION = "1"
+
 
 def worker(
     workflow_file_dependencies,
     file_processor,
     processed_data_output_folder,
     processed_metadata_output_folder,
-    file_paths: list,
+    file_paths: WorkShare,
     worker_id: int,
 ):  # sourcery skip: low-code-quality
     """This function handles the work done by the worker threads,
@@ -50,6 +54,8 @@ def worker(
         file_system_name="stage-1-container",
     )
 
+    upload_stage = UploadStage(file_system_client)
+
     total_files = len(file_paths)
     time_estimator = TimeEstimator(total_files)
 
@@ -69,9 +75,12 @@ def worker(
 
         # download the file to the temp folder
         input_file_client = file_system_client.get_file_client(file_path=path)
-        input_last_modified = input_file_client.get_file_properties().last_modified
+        input_file_properties = input_file_client.get_file_properties()
+        input_last_modified = input_file_properties.last_modified
 
-        if not file_processor.file_should_process(path, input_last_modified):
+        if not file_processor.file_should_process(
+            path, input_last_modified, input_file_properties
+        ):
             logger.debug(
                 f"The file {path} has not been modified since the last time it was processed",
             )
@@ -98,11 +107,21 @@ def worker(
 
             logger.debug(f"Downloading {file_name} to {download_path}")
 
-            with open(download_path, "wb") as data:
-                input_file_client.download_file().readinto(data)
+            download_to_file(
+                input_file_client,
+                download_path,
+                size=input_file_properties.size,
+                etag=input_file_properties.etag,
+            )
 
             logger.info(f"Downloaded {file_name} to {download_path}")
 
+            if file_processor.content_unchanged(path, download_path):
+                logger.debug(f"Skipping {path} - File content has not changed")
+
+                logger.time(time_estimator.step())
+                continue
+
             filtered_file_names = imaging_utils.get_filtered_file_names(step1_folder)
 
             step2_folder = os.path.join(temp_folder_path, "step2")
@@ -220,87 +239,29 @@ def worker(
 
             file_processor.delete_preexisting_output_files(path)
 
-            for root, dirs, files in os.walk(destination_folder):
-                for file in files:
-                    full_file_path = os.path.join(root, file)
-
-                    f2 = full_file_path.split("/")[-5:]
-
-                    combined_file_name = "/".join(f2)
-
-                    logger.debug(f"Uploading {combined_file_name}")
-
-                    output_file_path = (
-                        f"{processed_data_output_folder}/{combined_file_name}"
-                    )
-
-                    try:
-                        output_file_client = file_system_client.get_file_client(
-                            file_path=output_file_path
-                        )
-
-                        with open(f"{full_file_path}", "rb") as data:
-                            output_file_client.upload_data(data, overwrite=True)
-
-                            logger.info(f"Uploaded {combined_file_name}")
-                    except Exception:
-                        outputs_uploaded = False
-                        logger.error(f"Failed to upload {combined_file_name}")
-
-                        error_exception = "".join(format_exc().splitlines())
-                        logger.error(error_exception)
-
-                        file_processor.append_errors(error_exception, path)
-                        continue
-
-                    file_item["output_files"].append(output_file_path)
-                    workflow_output_files.append(output_file_path)
-
-            logger.info(f"Uploaded outputs for {file_name}")
-
-            logger.debug(f"Uploading metadata for {file_name}")
-
-            for root, dirs, files in os.walk(metadata_folder):
-                for file in files:
-                    full_file_path = os.path.join(root, file)
-
-                    f2 = full_file_path.split("/")[-2:]
-
-                    combined_file_name = "/".join(f2)
-
-                    output_file_path = (
-                        f"{processed_metadata_output_folder}/{combined_file_name}"
-                    )
-
-                    logger.debug(
-                        f"Uploading {full_file_path} to {processed_metadata_output_folder}"
-                    )
-
-                    try:
-                        output_file_client = file_system_client.get_file_client(
-                            file_path=output_file_path
-                        )
+            uploads = collect_uploads(
+                destination_folder, processed_data_output_folder, 5
+            )
+            uploads += collect_uploads(
+                metadata_folder, processed_metadata_output_folder, 2
+            )
 
-                        with open(full_file_path, "rb") as f:
-                            output_file_client.upload_data(f, overwrite=True)
+            for output_file_path, error_exception in upload_stage.upload(uploads):
+                if error_exception is not None:
+                    outputs_uploaded = False
+                    logger.error(f"Failed to upload {output_file_path}")
 
-                            logger.info(
-                                f"Uploaded {file_name} to {processed_metadata_output_folder}"
-                            )
-                    except Exception:
-                        outputs_uploaded = False
-                        logger.error(f"Failed to upload {file_name}")
+                    logger.error(error_exception)
+                    file_processor.append_errors(error_exception, path)
 
-                        error_exception = "".join(format_exc().splitlines())
-                        logger.error(error_exception)
+                    continue
 
-                        file_processor.append_errors(error_exception, path)
-                        continue
+                logger.info(f"Uploaded {output_file_path}")
 
-                    file_item["output_files"].append(output_file_path)
-                    workflow_output_files.append(output_file_path)
+                file_item["output_files"].append(output_file_path)
+                workflow_output_files.append(output_file_path)
 
-            logger.info(f"Uploaded metadata for {file_name}")
+            logger.info(f"Uploaded outputs and metadata for {file_name}")
 
             # Add the new output files to the file map
             file_processor.confirm_output_files(
@@ -325,7 +286,13 @@ def worker(
             logger.time(time_estimator.step())
 
 
-def pipeline(study_id: str, workers: int = 4, args: list = None):
+def pipeline(
+    study_id: str,
+    workers: int = 4,
+    args: list = None,
+    processes: bool = False,
+    incremental: bool = False,
+):
     """The function contains the work done by
     the main thread, which runs only once for each operation."""
 
@@ -354,16 +321,20 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
         file_system_name="stage-1-container",
     )
 
-    with contextlib.suppress(Exception):
-        file_system_client.delete_directory(processed_data_output_folder)
+    # An incremental run keeps the outputs of unchanged inputs and replaces or
+    # deletes only those of changed, failed and removed ones
+    if not incremental:
+        with contextlib.suppress(Exception):
+            file_system_client.delete_directory(processed_data_output_folder)
 
-    with contextlib.suppress(Exception):
-        file_system_client.delete_directory(processed_metadata_output_folder)
+        with contextlib.suppress(Exception):
+            file_system_client.delete_directory(processed_metadata_output_folder)
 
-    with contextlib.suppress(Exception):
-        file_system_client.delete_file(f"{dependency_folder}/file_map.json")
+        with contextlib.suppress(Exception):
+            file_system_client.delete_file(f"{dependency_folder}/file_map.json")
 
     file_paths = []
+    input_sizes = {}
     participant_filter_list = []
 
     # Create a temporary folder on the local machine
@@ -414,6 +385,8 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
         start_date = start_date_end_date.split("-")[0]
         end_date = start_date_end_date.split("-")[1]
 
+        input_sizes[t] = path.content_length
+
         file_paths.append(
             {
                 "file_path": t,
@@ -438,29 +411,35 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
     logger.debug(f"Found {file_paths} items in {input_folder}")
 
     # Create the output folder
-    file_system_client.create_directory(processed_data_output_folder)
+    output_folder_client = file_system_client.get_directory_client(
+        processed_data_output_folder
+    )
+
+    # An incremental run keeps the output folder it finds
+    if not (incremental and output_folder_client.exists()):
+        output_folder_client.create_directory()
 
     workflow_file_dependencies = deps.WorkflowFileDependencies()
-    file_processor = FileMapProcessor(dependency_folder, ignore_file, args)
+    file_processor = FileMapProcessor(
+        dependency_folder, ignore_file, args, pipeline_version=PIPELINE_VERSION
+    )
     overall_time_estimator = TimeEstimator(total_files)
 
-    # Guarantees that all paths are considered, even if the number of items is not evenly divisible by workers.
-    chunk_size = (len(file_paths) + workers - 1) // workers
-    # Comprehension that fills out and pass to worker func final 2 args: chunks and worker_id
-    chunks = [file_paths[i : i + chunk_size] for i in range(0, total_files, chunk_size)]
-    args = [(chunk, index + 1) for index, chunk in enumerate(chunks)]
-    pipe = partial(
+    # Workers pull one file at a time from a shared queue, largest files first,
+    # so a worker that drew a large file does not hold up the rest of the run
+    run_workers(
         worker,
         workflow_file_dependencies,
         file_processor,
-        processed_data_output_folder,
-        processed_metadata_output_folder,
+        (processed_data_output_folder, processed_metadata_output_folder),
+        file_paths,
+        workers,
+        size=lambda file_item: input_sizes[file_item["file_path"]],
+        processes=processes,
     )
 
-    # Thread pool created
-    pool = ThreadPool(workers)
-    # Distributes the pipe function across the threads in the pool
-    pool.starmap(pipe, args)
+    # Inputs skipped as unchanged keep their outputs and dependencies
+    file_processor.add_kept_dependencies(workflow_file_dependencies)
 
     file_processor.delete_out_of_date_output_files()
     file_processor.remove_seen_flag_from_map()
@@ -553,10 +532,26 @@ if __name__ == "__main__":
     parser.add_argument(
         "--workers", type=int, default=workers, help="Number of workers to use"
     )
+    parser.add_argument(
+        "--processes",
+        action="store_true",
+        help="Run the workers in processes instead of threads",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Keep the outputs of unchanged inputs instead of starting over",
+    )
     args = parser.parse_args()
 
     workers = args.workers
 
     print(f"Using {workers} workers to process eidon data files")
 
-    pipeline("AI-READI", workers, sys_args)
+    pipeline(
+        "AI-READI",
+        workers,
+        sys_args,
+        processes=args.processes,
+        incremental=args.incremental,
+    )
@@ -19,12 +19,16 @@ import csv
 import utils.logwatch as logging
 from utils.file_map_processor import FileMapProcessor
 from utils.time_estimator import TimeEstimator
+from utils.download_stage import download_to_file
+from utils.upload_stage import UploadStage
+from utils.work_queue import WorkQueue, WorkShare
 from functools import partial
 from multiprocessing.pool import ThreadPool
 
-
 overall_time_estimator = TimeEstimator(1)  # default to 1 for now
 
+PIPELINE_VERSION = "1"
+
 
 def worker(
     workflow_file_dependencies,
@@ -33,7 +37,7 @@ def worker(
     processed_data_output_folder,
     red_cap_export_file_path,
     data_plot_output_folder,
-    file_paths: list,
+    file_paths: WorkShare,
     worker_id: int,
 ):  # sourcery skip: low-code-quality
     """This function handles the work done by the worker threads,
@@ -71,9 +75,12 @@ def worker(
         # download the file to the temp folder
         input_file_client = file_system_client.get_file_client(file_path=path)
 
-        input_last_modified = input_file_client.get_file_properties().last_modified
+        input_file_properties = input_file_client.get_file_properties()
+        input_last_modified = input_file_properties.last_modified
 
-        should_process = file_processor.file_should_process(path, input_last_modified)
+        should_process = file_processor.file_should_process(
+            path, input_last_modified, input_file_properties
+        )
 
         if not should_process:
             logger.debug(
@@ -98,11 +105,21 @@ def worker(
 
             logger.debug(f"Downloading {file_name} to {download_path}")
 
-            with open(file=download_path, mode="wb") as f:
-                f.write(input_file_client.download_file().readall())
+            download_to_file(
+                input_file_client,
+                download_path,
+                size=input_file_properties.size,
+                etag=input_file_properties.etag,
+            )
 
             logger.info(f"Downloaded {file_name} to {download_path}")
 
+            if file_processor.content_unchanged(path, download_path):
+                logger.debug(f"Skipping {path} - File content has not changed")
+
+                logger.time(time_estimator.step())
+                continue
+
             logger.debug(f"Unzipping {download_path} to {temp_input_folder}")
 
             # unzip the file into the temp folder
@@ -168,11 +185,17 @@ def worker(
             pid = conversion_dict["participantID"]
 
             if conversion_dict["conversion_success"]:
-                meta_dict = env_sensor.metadata(conversion_dict["output_file"])
+                # Before the data plot is uploaded, it may replace one of them
+                file_processor.delete_preexisting_output_files(path)
+
+                # Read from the header the converter wrote, not from the output file
+                meta_dict = conversion_dict["metadata"]
 
                 metadata_output_file_path = f"/environment/environmental_sensor/leelab_anura/{pid}/{output_file.split('/')[-1]}"
 
                 manifest.add_metadata(meta_dict, metadata_output_file_path)
+                # Kept with the file map entry for runs that skip this file
+                file_processor.record_manifest(path, [meta_dict])
 
                 dataplot_dict = env_sensor.dataplot(conversion_dict, data_plot_folder)
 
@@ -196,6 +219,10 @@ def worker(
                 logger.info(
                     f"Uploaded {dataplot_output_file} to {uploaded_dataplot_output_file}"
                 )
+
+                file_processor.add_extra_output_files(
+                    path, [uploaded_dataplot_output_file]
+                )
             else:
                 logger.error(f"Failed to convert {patient_folder_name}")
 
@@ -219,8 +246,9 @@ def worker(
 
             outputs_uploaded = True
 
-            file_processor.delete_preexisting_output_files(path)
-            file_processor.confirm_output_files(path, workflow_output_files, "")
+            file_processor.confirm_output_files(
+                path, workflow_output_files, input_last_modified
+            )
 
             if outputs_uploaded:
                 file_item["output_uploaded"] = True
@@ -240,7 +268,9 @@ def worker(
             logger.time(time_estimator.step())
 
 
-def pipeline(study_id: str, workers: int = 4, args: list = None):
+def pipeline(
+    study_id: str, workers: int = 4, args: list = None, incremental: bool = False
+):
     """The function contains the work done by
     the main thread, which runs only once for each operation."""
 
@@ -274,21 +304,25 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
         file_system_name="stage-1-container",
     )
 
-    with contextlib.suppress(Exception):
-        file_system_client.delete_directory(processed_data_output_folder)
+    # An incremental run keeps the outputs of unchanged inputs and replaces or
+    # deletes only those of changed, failed and removed ones
+    if not incremental:
+        with contextlib.suppress(Exception):
+            file_system_client.delete_directory(processed_data_output_folder)
 
-    with contextlib.suppress(Exception):
-        file_system_client.delete_directory(data_plot_output_folder)
+        with contextlib.suppress(Exception):
+            file_system_client.delete_directory(data_plot_output_folder)
 
-    with contextlib.suppress(Exception):
-        file_system_client.delete_file(f"{dependency_folder}/file_map.json")
+        with contextlib.suppress(Exception):
+            file_system_client.delete_file(f"{dependency_folder}/file_map.json")
 
-    with contextlib.suppress(Exception):
-        file_system_client.delete_file(f"{dependency_folder}/manifest.tsv")
+        with contextlib.suppress(Exception):
+            file_system_client.delete_file(f"{dependency_folder}/manifest.tsv")
 
     # dev_allowed_files = ["ENV-1239-056.zip"]
 
     file_paths = []
+    input_sizes = {}
     participant_filter_list = []
 
     # Create a temporary folder on the local machine
@@ -318,7 +352,13 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
         participant_filter_list.pop(0)
 
     paths = file_system_client.get_paths(path=input_folder, recursive=False)
-    file_processor = FileMapProcessor(dependency_folder, ignore_file, args)
+    file_processor = FileMapProcessor(
+        dependency_folder,
+        ignore_file,
+        args,
+        pipeline_version=PIPELINE_VERSION,
+        requires_manifest=True,
+    )
 
     for path in paths:
         t = str(path.name)
@@ -354,6 +394,8 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
 
         patient_folder_name = file_name.split(".")[0]
 
+        input_sizes[t] = path.content_length
+
         file_paths.append(
             {
                 "file_path": t,
@@ -370,7 +412,13 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
     total_files = len(file_paths)
 
     logger.info(f"Found {total_files} items in {input_folder}")
-    file_processor = FileMapProcessor(dependency_folder, ignore_file, args)
+    file_processor = FileMapProcessor(
+        dependency_folder,
+        ignore_file,
+        args,
+        pipeline_version=PIPELINE_VERSION,
+        requires_manifest=True,
+    )
 
     workflow_file_dependencies = deps.WorkflowFileDependencies()
 
@@ -386,11 +434,14 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
 
     overall_time_estimator = TimeEstimator(total_files)
 
-    # Guarantees that all paths are considered, even if the number of items is not evenly divisible by workers.
-    chunk_size = (len(file_paths) + workers - 1) // workers
-    # Comprehension that fills out and pass to worker func final 2 args: chunks and worker_id
-    chunks = [file_paths[i : i + chunk_size] for i in range(0, total_files, chunk_size)]
-    args = [(chunk, index + 1) for index, chunk in enumerate(chunks)]
+    # Workers pull one file at a time from a shared queue, largest files first,
+    # so a worker that drew a large file does not hold up the rest of the run
+    work_queue = WorkQueue(
+        file_paths,
+        workers,
+        size=lambda file_item: input_sizes[file_item["file_path"]],
+    )
+    args = [(share, index + 1) for index, share in enumerate(work_queue.shares())]
     pipe = partial(
         worker,
         workflow_file_dependencies,
@@ -406,6 +457,11 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
     # Distributes the pipe function across the threads in the pool
     pool.starmap(pipe, args)
 
+    # Inputs skipped as unchanged keep their outputs, dependencies and manifest entries
+    manifest.add_entries(
+        file_processor.add_kept_dependencies(workflow_file_dependencies)
+    )
+
     file_processor.delete_out_of_date_output_files()
     file_processor.remove_seen_flag_from_map()
 
@@ -438,12 +494,13 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
     with tempfile.TemporaryDirectory(
         prefix="env_sensor_manual_"
     ) as manual_temp_folder_path:
+        manual_uploads = []
+        manual_item_paths = []
+
         for item in manual_input_folder_contents:
 
             item_path = str(item.name)
 
-            file_name = item_path.split("/")[-1]
-
             clipped_path = item_path.split(f"{manual_input_folder}/")[-1]
 
             manual_input_file_client = file_system_client.get_file_client(
@@ -458,41 +515,38 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
 
             logger.debug(f"Moving {item_path} to {processed_data_output_folder}")
 
-            # Download the file to the temp folder
-            download_path = os.path.join(manual_temp_folder_path, file_name)
+            # Download the file to the temp folder, keeping the folder structure
+            download_path = os.path.join(manual_temp_folder_path, clipped_path)
+            os.makedirs(os.path.dirname(download_path), exist_ok=True)
 
             logger.debug(f"Downloading {item_path} to {download_path}")
 
-            with open(file=download_path, mode="wb") as f:
-                f.write(manual_input_file_client.download_file().readall())
-
-            # Upload the file to the processed data output folder
-            upload_path = f"{processed_data_output_folder}/{clipped_path}"
-
-            logger.debug(f"Uploading {item_path} to {upload_path}")
-
-            try:
-                output_file_client = file_system_client.get_file_client(
-                    file_path=upload_path,
-                )
+            download_to_file(
+                manual_input_file_client,
+                download_path,
+                size=item.content_length,
+                etag=item.etag,
+            )
 
-                # Check if the file already exists. If it does, throw an exception
-                if output_file_client.exists():
-                    raise Exception(
-                        f"File {upload_path} already exists. Throwing exception"
-                    )
+            manual_uploads.append(
+                (download_path, f"{processed_data_output_folder}/{clipped_path}")
+            )
+            manual_item_paths.append(item_path)
 
-                with open(file=download_path, mode="rb") as f:
-                    output_file_client.upload_data(f, overwrite=True)
+        # Upload the files to the processed data output folder. Files that already
+        # exist are an error, found with one listing per destination folder
+        logger.debug(f"Uploading {len(manual_uploads)} manual files")
 
-                    logger.info(f"Copied {item_path} to {upload_path}")
-            except Exception:
+        for item_path, (upload_path, error_exception) in zip(
+            manual_item_paths,
+            UploadStage(file_system_client).upload(manual_uploads, fail_if_exists=True),
+        ):
+            if error_exception is not None:
                 logger.error(f"Failed to upload {item_path}")
-
-                error_exception = "".join(format_exc().splitlines())
                 logger.error(error_exception)
+                continue
 
-            os.remove(download_path)
+            logger.info(f"Copied {item_path} to {upload_path}")
 
     logger.debug(f"Uploading file map to {dependency_folder}/file_map.json")
     try:
@@ -580,10 +634,15 @@ if __name__ == "__main__":
     parser.add_argument(
         "--workers", type=int, default=workers, help="Number of workers to use"
     )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Keep the outputs of unchanged inputs instead of starting over",
+    )
     args = parser.parse_args()
 
     workers = args.workers
 
     print(f"Using {workers} workers to process env sensor data files")
 
-    pipeline("AI-READI", workers, sys_args)
+    pipeline("AI-READI", workers, sys_args, incremental=args.incremental)
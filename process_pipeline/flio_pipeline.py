@@ -18,10 +18,12 @@ import config
 import utils.dependency as deps
 import csv
 import utils.logwatch as logging
-from utils.file_map_processor import FileMapProcessor
+from utils.file_map_processor import FileMapProcessor, folder_properties
 from utils.time_estimator import TimeEstimator
-from functools import partial
-from multiprocessing.pool import ThreadPool
+from utils.download_stage import download_to_file
+from utils.upload_stage import UploadStage, collect_uploads
+from utils.work_queue import WorkShare
+from utils.worker_pool import run_workers
 
 overall_time_estimator = TimeEstimator(1)  # default to 1 for now
 JSON_PATH = os.path.join(os.path.dirname(__file__), "flio", "flio_uid_data.json")
@@ -32,7 +34,7 @@ def worker(
     file_processor,
     processed_data_output_folder,
     processed_metadata_output_folder,
-    file_paths: list,
+    file_paths: WorkShare,
     worker_id: int,
 ):  # sourcery skip: low-code-quality
     """This function handles the work done by the worker threads,
@@ -51,6 +53,8 @@ def worker(
         file_system_name="stage-1-container",
     )
 
+    upload_stage = UploadStage(file_system_client)
+
     total_files = len(file_paths)
     time_estimator = TimeEstimator(total_files)
 
@@ -59,7 +63,20 @@ def worker(
 
         workflow_input_files = [path]
 
-        file_processor.add_entry(path, time.time())
+        folder_contents = list(file_system_client.get_paths(path=path, recursive=True))
+
+        input_properties = folder_properties(folder_contents)
+        input_last_modified = input_properties.last_modified
+
+        if not file_processor.file_should_process(
+            path, input_last_modified, input_properties
+        ):
+            logger.debug(f"Skipping {path} - Folder has not been modified")
+
+            logger.time(time_estimator.step())
+            continue
+
+        file_processor.add_entry(path, input_last_modified)
 
         file_processor.clear_errors(path)
 
@@ -74,8 +91,6 @@ def worker(
             logger.debug(f"Downloading {patient_folder_name} to {step1_folder}")
 
             # Download the contents of the patient folder to the step1 folder
-            folder_contents = file_system_client.get_paths(path=path, recursive=True)
-
             for item in folder_contents:
                 ip = item_path = str(item.name)
 
@@ -105,9 +120,10 @@ def worker(
 
                 logger.debug(f"Downloading {item_path} to {download_path}")
 
-                with open(file=download_path, mode="wb") as f:
-                    f.write(file_client.download_file().readall())
-                    logger.info(f"Downloaded {item_path} to {download_path}")
+                download_to_file(
+                    file_client, download_path, size=item.content_length, etag=item.etag
+                )
+                logger.info(f"Downloaded {item_path} to {download_path}")
 
             logger.info(f"Downloaded {patient_folder_name} to {step1_folder}")
 
@@ -213,103 +229,46 @@ def worker(
             workflow_output_files = []
 
             outputs_uploaded = True
+            upload_exception = ""
 
             file_processor.delete_preexisting_output_files(path)
 
             logger.debug(f"Uploading outputs for {patient_folder_name}")
 
-            for root, dirs, files in os.walk(step5_folder):
-                for file in files:
-                    full_file_path = os.path.join(root, file)
-
-                    logger.debug(f"Found file {full_file_path}")
-
-                    # Check if is a json metadata file
-                    if full_file_path.endswith(".json"):
-                        logger.debug(f"Skipping {full_file_path} for now")
-                        continue
-
-                    f2 = full_file_path.split("/")[-5:]
-
-                    combined_file_name = "/".join(f2)
-
-                    output_file_path = (
-                        f"{processed_data_output_folder}/{combined_file_name}"
-                    )
-
-                    logger.debug(f"Uploading {full_file_path} to {output_file_path}")
-
-                    try:
-                        output_file_client = file_system_client.get_file_client(
-                            output_file_path
-                        )
-
-                        with open(full_file_path, "rb") as f:
-                            output_file_client.upload_data(f, overwrite=True)
-                            logger.info(f"Uploaded {combined_file_name}")
-                    except Exception:
-                        outputs_uploaded = False
-                        logger.error(f"Failed to upload {combined_file_name}")
-
-                        upload_exception = "".join(format_exc().splitlines())
-
-                        logger.error(upload_exception)
-                        file_processor.append_errors(upload_exception, path)
-
-                        continue
-
-                    file_item["output_files"].append(output_file_path)
-                    workflow_output_files.append(output_file_path)
-
-            logger.info(f"Uploaded outputs for {file_name}")
-
-            logger.debug(f"Uploading metadata for {file_name}")
-
-            for root, dirs, files in os.walk(metadata_folder):
-                for file in files:
-                    full_file_path = os.path.join(root, file)
-
-                    f2 = full_file_path.split("/")[-2:]
-
-                    combined_file_name = "/".join(f2)
-
-                    output_file_path = (
-                        f"{processed_metadata_output_folder}/{combined_file_name}"
-                    )
-
-                    try:
-                        output_file_client = file_system_client.get_file_client(
-                            file_path=output_file_path
-                        )
-
-                        logger.debug(
-                            f"Uploading {full_file_path} to {processed_metadata_output_folder}"
-                        )
+            # json metadata files are skipped for now
+            uploads = [
+                upload
+                for upload in collect_uploads(
+                    step5_folder, processed_data_output_folder, 5
+                )
+                if not upload[0].endswith(".json")
+            ]
+            uploads += collect_uploads(
+                metadata_folder, processed_metadata_output_folder, 2
+            )
 
-                        with open(full_file_path, "rb") as f:
-                            output_file_client.upload_data(f, overwrite=True)
+            for output_file_path, error_exception in upload_stage.upload(uploads):
+                if error_exception is not None:
+                    outputs_uploaded = False
+                    upload_exception = error_exception
+                    logger.error(f"Failed to upload {output_file_path}")
 
-                            logger.info(
-                                f"Uploaded {file_name} to {processed_metadata_output_folder}"
-                            )
-                    except Exception:
-                        outputs_uploaded = False
-                        logger.error(f"Failed to upload {file_name}")
-                        error_exception = format_exc()
-                        error_exception = "".join(error_exception.splitlines())
+                    logger.error(error_exception)
+                    file_processor.append_errors(error_exception, path)
 
-                        logger.error(error_exception)
-                        file_processor.append_errors(error_exception, path)
+                    continue
 
-                        continue
+                logger.info(f"Uploaded {output_file_path}")
 
-                    file_item["output_files"].append(output_file_path)
-                    workflow_output_files.append(output_file_path)
+                file_item["output_files"].append(output_file_path)
+                workflow_output_files.append(output_file_path)
 
-            logger.info(f"Uploaded metadata for {file_name}")
+            logger.info(f"Uploaded outputs and metadata for {file_name}")
 
             # Add the new output files to the file map
-            file_processor.confirm_output_files(path, workflow_output_files, "")
+            file_processor.confirm_output_files(
+                path, workflow_output_files, input_last_modified
+            )
 
             if outputs_uploaded:
                 file_item["output_uploaded"] = True
@@ -330,7 +289,13 @@ def worker(
             logger.time(time_estimator.step())
 
 
-def pipeline(study_id: str, workers: int = 4, args: list = None):
+def pipeline(
+    study_id: str,
+    workers: int = 4,
+    args: list = None,
+    processes: bool = False,
+    incremental: bool = False,
+):
     """The function contains the work done by
     the main thread, which runs only once for each operation."""
 
@@ -359,14 +324,17 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
         file_system_name="stage-1-container",
     )
 
-    with contextlib.suppress(Exception):
-        file_system_client.delete_directory(processed_data_output_folder)
+    # An incremental run keeps the outputs of unchanged inputs and replaces or
+    # deletes only those of changed, failed and removed ones
+    if not incremental:
+        with contextlib.suppress(Exception):
+            file_system_client.delete_directory(processed_data_output_folder)
 
-    with contextlib.suppress(Exception):
-        file_system_client.delete_directory(processed_metadata_output_folder)
+        with contextlib.suppress(Exception):
+            file_system_client.delete_directory(processed_metadata_output_folder)
 
-    with contextlib.suppress(Exception):
-        file_system_client.delete_file(f"{dependency_folder}/file_map.json")
+        with contextlib.suppress(Exception):
+            file_system_client.delete_file(f"{dependency_folder}/file_map.json")
 
     file_paths = []
     participant_filter_list = []
@@ -453,23 +421,20 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
 
     overall_time_estimator = TimeEstimator(total_files)
 
-    # Guarantees that all paths are considered, even if the number of items is not evenly divisible by workers.
-    chunk_size = (len(file_paths) + workers - 1) // workers
-    # Comprehension that fills out and pass to worker func final 2 args: chunks and worker_id
-    chunks = [file_paths[i : i + chunk_size] for i in range(0, total_files, chunk_size)]
-    args = [(chunk, index + 1) for index, chunk in enumerate(chunks)]
-    pipe = partial(
+    # Workers pull one patient folder at a time from a shared queue, so a
+    # worker that drew a large folder does not hold up the rest of the run
+    run_workers(
         worker,
         workflow_file_dependencies,
         file_processor,
-        processed_data_output_folder,
-        processed_metadata_output_folder,
+        (processed_data_output_folder, processed_metadata_output_folder),
+        file_paths,
+        workers,
+        processes=processes,
     )
 
-    # Thread pool created
-    pool = ThreadPool(workers)
-    # Distributes the pipe function across the threads in the pool
-    pool.starmap(pipe, args)
+    # Inputs skipped as unchanged keep their outputs and dependencies
+    file_processor.add_kept_dependencies(workflow_file_dependencies)
 
     file_processor.delete_out_of_date_output_files()
     file_processor.remove_seen_flag_from_map()
@@ -543,10 +508,26 @@ if __name__ == "__main__":
     parser.add_argument(
         "--workers", type=int, default=workers, help="Number of workers to use"
     )
+    parser.add_argument(
+        "--processes",
+        action="store_true",
+        help="Run the workers in processes instead of threads",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Keep the outputs of unchanged inputs instead of starting over",
+    )
     args = parser.parse_args()
 
     workers = args.workers
 
     print(f"Using {workers} workers to process flio data files")
 
-    pipeline("AI-READI", workers, sys_args)
+    pipeline(
+        "AI-READI",
+        workers,
+        sys_args,
+        processes=args.processes,
+        incremental=args.incremental,
+    )
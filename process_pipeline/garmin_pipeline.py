@@ -30,7 +30,11 @@ import csv
 import utils.logwatch as logging
 from utils.file_map_processor import FileMapProcessor
 from utils.time_estimator import TimeEstimator
+from utils.download_stage import download_to_file
+from utils.upload_stage import UploadStage
+from utils.work_queue import WorkQueue, WorkShare
 from functools import partial
+from multiprocessing import Manager
 from multiprocessing.pool import Pool
 import threading
 import json
@@ -115,7 +119,7 @@ def progress_monitor(progress_file, total_files, start_time, stop_event):
 
 def worker(
     processed_data_output_folder,
-    file_paths: list,
+    file_paths: WorkShare,
     worker_id: int,
     progress_file=None,
 ):  # sourcery skip: low-code-quality
@@ -1080,11 +1084,14 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
     with open(progress_file, "w") as f:
         json.dump({"completed": 0}, f)
 
-    # Guarantees that all paths are considered, even if the number of items is not evenly divisible by workers.
-    chunk_size = (len(file_paths) + workers - 1) // workers
-    # Comprehension that fills out and pass to worker func final 2 args: chunks and worker_id
-    chunks = [file_paths[i : i + chunk_size] for i in range(0, total_files, chunk_size)]
-    args = [(chunk, index + 1, progress_file) for index, chunk in enumerate(chunks)]
+    # Worker processes pull one patient folder at a time from a queue held by a
+    # manager process, so a worker that drew a large folder does not hold up the rest
+    queue_manager = Manager()
+    work_queue = WorkQueue(file_paths, workers, manager=queue_manager)
+    args = [
+        (share, index + 1, progress_file)
+        for index, share in enumerate(work_queue.shares())
+    ]
     pipe = partial(
         worker,
         processed_data_output_folder,
@@ -1111,6 +1118,7 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
     finally:
         pool.close()
         pool.join()
+        queue_manager.shutdown()
         stop_event.set()  # Stop progress monitoring
         progress_thread.join(timeout=1)
 
@@ -1194,11 +1202,12 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
     with tempfile.TemporaryDirectory(
         prefix="FitnessTracker_pipeline_manual_"
     ) as manual_temp_folder_path:
+        manual_uploads = []
+        manual_item_paths = []
+
         for item in manual_input_folder_contents:
             item_path = str(item.name)
 
-            file_name = os.path.basename(item_path)
-
             # Remove the manual input folder prefix from the path
             if item_path.startswith(f"{manual_input_folder}/"):
                 clipped_path = item_path[len(f"{manual_input_folder}/") :]
@@ -1217,34 +1226,36 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
 
             logger.debug(f"Moving {item_path} to {processed_data_output_folder}")
 
-            # Download the file to the temp folder
-            download_path = os.path.join(manual_temp_folder_path, file_name)
+            # Download the file to the temp folder, keeping the folder structure
+            download_path = os.path.join(manual_temp_folder_path, clipped_path)
+            os.makedirs(os.path.dirname(download_path), exist_ok=True)
 
             logger.debug(f"Downloading {item_path} to {download_path}")
 
-            with open(file=download_path, mode="wb") as f:
-                f.write(manual_input_file_client.download_file().readall())
-
-            # Upload the file to the processed data output folder
-            upload_path = f"{processed_data_output_folder}/{clipped_path}"
-
-            logger.debug(f"Uploading {item_path} to {upload_path}")
+            download_to_file(
+                manual_input_file_client,
+                download_path,
+                size=item.content_length,
+                etag=item.etag,
+            )
 
-            output_file_client = file_system_client.get_file_client(
-                file_path=upload_path,
+            manual_uploads.append(
+                (download_path, f"{processed_data_output_folder}/{clipped_path}")
             )
+            manual_item_paths.append(item_path)
 
-            # Check if the file already exists. If it does, throw an exception
-            if output_file_client.exists():
-                raise Exception(
-                    f"File {upload_path} already exists. Throwing exception"
-                )
+        # Upload the files to the processed data output folder. Files that already
+        # exist are an error, found with one listing per destination folder
+        logger.debug(f"Uploading {len(manual_uploads)} manual files")
 
-            with open(file=download_path, mode="rb") as f:
-                output_file_client.upload_data(f, overwrite=True)
-                logger.info(f"Uploaded {item_path} to {upload_path}")
+        for item_path, (upload_path, error_exception) in zip(
+            manual_item_paths,
+            UploadStage(file_system_client).upload(manual_uploads, fail_if_exists=True),
+        ):
+            if error_exception is not None:
+                raise Exception(f"Failed to upload {item_path}: {error_exception}")
 
-            os.remove(download_path)
+            logger.info(f"Uploaded {item_path} to {upload_path}")
 
     logger.debug(f"Uploading file map to {dependency_folder}/file_map.json")
 
@@ -16,10 +16,13 @@ import config
 import utils.dependency as deps
 import csv
 import utils.logwatch as logging
+import utils.file_stage as file_stage
 from utils.file_map_processor import FileMapProcessor
 from utils.time_estimator import TimeEstimator
-from functools import partial
-from multiprocessing.pool import ThreadPool
+from utils.download_stage import download_to_file
+from utils.upload_stage import UploadStage
+from utils.work_queue import WorkShare
+from utils.worker_pool import run_workers
 
 # from tqdm import tqdm
 
@@ -30,7 +33,7 @@ def worker(
     workflow_file_dependencies,
     file_processor,
     processed_data_output_folder,
-    file_paths: list,
+    file_paths: WorkShare,
     worker_id: int,
 ):
     """This function handles the work done by the worker threads,
@@ -49,6 +52,8 @@ def worker(
         file_system_name="stage-1-container",
     )
 
+    upload_stage = UploadStage(file_system_client)
+
     total_files = len(file_paths)
     time_estimator = TimeEstimator(total_files)
 
@@ -66,7 +71,8 @@ def worker(
 
         input_file_client = file_system_client.get_file_client(file_path=path)
 
-        input_last_modified = input_file_client.get_file_properties().last_modified
+        input_file_properties = input_file_client.get_file_properties()
+        input_last_modified = input_file_properties.last_modified
 
         should_process = file_processor.file_should_process(path, input_last_modified)
 
@@ -96,8 +102,12 @@ def worker(
 
             logger.debug(f"Downloading {file_name} to {download_path}")
 
-            with open(file=download_path, mode="wb") as f:
-                f.write(input_file_client.download_file().readall())
+            download_to_file(
+                input_file_client,
+                download_path,
+                size=input_file_properties.size,
+                etag=input_file_properties.etag,
+            )
 
             # Get file size for progress tracking
             # file_properties = input_file_client.get_file_properties()
@@ -209,6 +219,9 @@ def worker(
                             ds.PatientID = patient_id
                             ds.ProtocolName = "spectralis mac 20x20 hs octa"
 
+                            # The organized file may be a hardlink of the unzipped one,
+                            # replace it instead of writing through to both
+                            os.remove(file_path)
                             ds.save_as(file_path)
 
                             file_list.append(
@@ -287,7 +300,7 @@ def worker(
 
                     print(f"Copying {file_path} to {new_file_path}")
 
-                    shutil.copy(file_path, new_file_path)
+                    file_stage.stage_file(file_path, new_file_path)
             except Exception:
                 logger.error(f"Failed to rename and copy files to {destination_folder}")
                 error_exception = "".join(format_exc().splitlines())
@@ -315,6 +328,8 @@ def worker(
 
             file_processor.delete_preexisting_output_files(path)
 
+            uploads = []
+
             for root, dirs, files in os.walk(destination_folder):
                 for file in files:
                     full_file_path = os.path.join(root, file)
@@ -322,30 +337,27 @@ def worker(
                     combined_file_name = full_file_path.replace(destination_folder, "")
                     combined_file_name = combined_file_name.replace("\\", "/")
 
-                    output_file_path = (
-                        f"{processed_data_output_folder}{combined_file_name}"
+                    uploads.append(
+                        (
+                            full_file_path,
+                            f"{processed_data_output_folder}{combined_file_name}",
+                        )
                     )
 
-                    print(f"Uploading {full_file_path} to {output_file_path}")
+            logger.debug(f"Uploading {len(uploads)} files to {processed_data_output_folder}")
 
-                    try:
-                        output_file_client = file_system_client.get_file_client(
-                            file_path=output_file_path
-                        )
+            for output_file_path, error_exception in upload_stage.upload(uploads):
+                if error_exception is not None:
+                    outputs_uploaded = False
+                    logger.error(f"Failed to upload {output_file_path}")
+                    logger.error(error_exception)
+                    file_processor.append_errors(error_exception, path)
+                    continue
 
-                        with open(f"{full_file_path}", "rb") as data:
-                            output_file_client.upload_data(data, overwrite=True)
-                            logger.info(f"Uploaded {combined_file_name}")
-                    except Exception:
-                        outputs_uploaded = False
-                        logger.error(f"Failed to upload {combined_file_name}")
-                        error_exception = "".join(format_exc().splitlines())
-                        logger.error(error_exception)
-                        file_processor.append_errors(error_exception, path)
-                        continue
+                logger.info(f"Uploaded {output_file_path}")
 
-                    file_item["output_files"].append(output_file_path)
-                    workflow_output_files.append(output_file_path)
+                file_item["output_files"].append(output_file_path)
+                workflow_output_files.append(output_file_path)
 
             logger.info(f"Uploaded outputs for {file_name}")
 
@@ -370,7 +382,9 @@ def worker(
             logger.time(time_estimator.step())
 
 
-def pipeline(study_id: str, workers: int = 4, args: list = None):
+def pipeline(
+    study_id: str, workers: int = 4, args: list = None, processes: bool = False
+):
     """The function contains the work done by
     the main thread, which runs only once for each operation."""
 
@@ -404,6 +418,7 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
         file_system_client.delete_file(f"{dependency_folder}/file_map.json")
 
     file_paths = []
+    input_sizes = {}
     participant_filter_list = []
 
     # Create a temporary folder on the local machine
@@ -462,6 +477,8 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
         start_date = start_date_end_date.split("-")[0]
         end_date = start_date_end_date.split("-")[1]
 
+        input_sizes[t] = path.content_length
+
         file_paths.append(
             {
                 "file_path": t,
@@ -495,20 +512,19 @@ def pipeline(study_id: str, workers: int = 4, args: list = None):
 
     overall_time_estimator = TimeEstimator(total_files)
 
-    # Guarantees that all paths are considered, even if the number of items is not evenly divisible by workers.
-    chunk_size = (len(file_paths) + workers - 1) // workers
-    # Comprehension that fills out and pass to worker func final 2 args: chunks and worker_id
-    chunks = [file_paths[i : i + chunk_size] for i in range(0, total_files, chunk_size)]
-    args = [(chunk, index + 1) for index, chunk in enumerate(chunks)]
-    pipe = partial(
-        worker, workflow_file_dependencies, file_processor, processed_data_output_folder
+    # Workers pull one file at a time from a shared queue, largest files first,
+    # so a worker that drew a large file does not hold up the rest of the run
+    run_workers(
+        worker,
+        workflow_file_dependencies,
+        file_processor,
+        (processed_data_output_folder,),
+        file_paths,
+        workers,
+        size=lambda file_item: input_sizes[file_item["file_path"]],
+        processes=processes,
     )
 
-    # Thread pool created
-    pool = ThreadPool(workers)
-    # Distributes the pipe function across the threads in the pool
-    pool.starmap(pipe, args)
-
     file_processor.delete_out_of_date_output_files()
     file_processor.remove_seen_flag_from_map()
 
@@ -602,10 +618,15 @@ if __name__ == "__main__":
     parser.add_argument(
         "--workers", type=int, default=workers, help="Number of workers to use"
     )
+    parser.add_argument(
+        "--processes",
+        action="store_true",
+        help="Run the workers in processes instead of threads",
+    )
     args = parser.parse_args()
 
     workers = args.workers
 
     print(f"Using {workers} workers to process spectralis data files")
 
-    pipeline("AI-READI", workers, sys_args)
+    pipeline("AI-READI", workers, sys_args, processes=args.processes)
@@ -0,0 +1,108 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import azure.storage.filedatalake as azurelake
+from azure.core import MatchConditions
+from azure.core.exceptions import IncompleteReadError
+
+import config
+from utils.upload_stage import MB, ByteBudget
+
+# Download defaults, can be overridden through the environment
+DOWNLOAD_MAX_CONCURRENCY = int(config.FAIRHUB_DOWNLOAD_MAX_CONCURRENCY or 4)
+DOWNLOAD_MAX_IN_FLIGHT_BYTES = int(config.FAIRHUB_DOWNLOAD_MAX_IN_FLIGHT_MB or 256) * MB
+DOWNLOAD_CHUNK_SIZE = int(config.FAIRHUB_DOWNLOAD_CHUNK_SIZE_MB or 8) * MB
+
+# Shared by every download in the process, so the cap holds across pipeline workers
+_budget = ByteBudget(DOWNLOAD_MAX_IN_FLIGHT_BYTES)
+
+
+def download_to_file(
+    file_client: azurelake.DataLakeFileClient,
+    download_path: str,
+    size: int = None,
+    etag: str = None,
+    max_concurrency: int = None,
+    chunk_size: int = None,
+    budget: ByteBudget = None,
+) -> int:
+    """
+    Stream a data lake file to a local file in bounded chunks.
+
+    The file is read as ranges of chunk_size bytes, max_concurrency of them at a
+    time, and every range is written to its place in the local file as soon as it
+    arrives. Only the ranges that are in flight are held in memory, and all
+    downloads in the process together keep at most DOWNLOAD_MAX_IN_FLIGHT_BYTES.
+
+    Every range is read on the condition that the file still has the etag it had
+    when its size was taken, so a file rewritten during the download fails with
+    ResourceModifiedError instead of mixing two versions. Ranges that do not add
+    up to the size raise IncompleteReadError.
+
+    Args:
+        file_client (DataLakeFileClient): Client of the file to download.
+        download_path (str): Local file to write, replaced if it exists.
+        size (int): Size of the file if already known.
+        etag (str): Etag of the file, from the same listing or properties as the size.
+            Saves a properties request when both are given.
+        max_concurrency (int): Ranges read in parallel.
+        chunk_size (int): Size of each range in bytes.
+        budget (ByteBudget): Memory budget to draw from instead of the shared one.
+
+    Returns:
+        int: The number of bytes written.
+    """
+    max_concurrency = max(1, max_concurrency or DOWNLOAD_MAX_CONCURRENCY)
+    chunk_size = chunk_size or DOWNLOAD_CHUNK_SIZE
+    budget = budget or _budget
+
+    if size is None or etag is None:
+        properties = file_client.get_file_properties()
+        size, etag = properties.size, properties.etag
+
+    ranges = [
+        (offset, min(chunk_size, size - offset))
+        for offset in range(0, size, chunk_size)
+    ]
+
+    written = 0
+
+    with open(download_path, "wb") as f:
+        write_lock = threading.Lock()
+
+        def read_range(offset: int, length: int):
+            nonlocal written
+            budget.acquire(length)
+
+            try:
+                data = file_client.download_file(
+                    offset=offset,
+                    length=length,
+                    etag=etag,
+                    match_condition=MatchConditions.IfNotModified,
+                ).readall()
+
+                with write_lock:
+                    f.seek(offset)
+                    f.write(data)
+                    written += len(data)
+            finally:
+                budget.release(length)
+
+        if len(ranges) <= 1 or max_concurrency == 1:
+            for offset, length in ranges:
+                read_range(offset, length)
+        else:
+            with ThreadPoolExecutor(
+                max_workers=min(max_concurrency, len(ranges)),
+                thread_name_prefix="download-stage",
+            ) as executor:
+                # list() surfaces the first failed range
+                list(executor.map(lambda item: read_range(*item), ranges))
+
+    if written != size:
+        raise IncompleteReadError(
+            f"Downloaded {written} of {size} bytes of {file_client.path_name}"
+        )
+
+    return size
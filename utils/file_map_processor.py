@@ -1,4 +1,5 @@
 import contextlib
+import hashlib
 import os
 import tempfile
 import config
@@ -8,7 +9,52 @@ from azure.core.exceptions import ResourceNotFoundError
 import pathlib
 import json
 import glob
+import threading
 import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+DIGEST_READ_SIZE = 8 * 1024 * 1024
+
+
+def file_digest(file_path: str) -> str:
+    """MD5 of a local file as hex, comparable with the Content-MD5 of a blob"""
+    md5 = hashlib.md5()
+
+    with open(file_path, "rb") as f:
+        while chunk := f.read(DIGEST_READ_SIZE):
+            md5.update(chunk)
+
+    return md5.hexdigest()
+
+
+def _format_last_modified(input_last_modified) -> str:
+    return input_last_modified.strftime("%Y-%m-%d %H:%M:%S+00:00")
+
+
+def _all_output_files(entry) -> list:
+    return list(entry["output_files"]) + entry.get("extra_output_files", [])
+
+
+def folder_properties(folder_paths) -> SimpleNamespace:
+    """Properties of an input that is a folder, for file_should_process.
+
+    The etag is a digest of the names and etags of the files listed in the folder,
+    so adding, removing or rewriting any of them changes it, and last_modified is
+    the latest last modified of those files."""
+    md5 = hashlib.md5()
+    last_modified = datetime.fromtimestamp(0, timezone.utc)
+
+    for path in sorted(folder_paths, key=lambda path: str(path.name)):
+        if path.is_directory:
+            continue
+
+        md5.update(f"{path.name}\t{path.etag}\n".encode())
+        last_modified = max(last_modified, path.last_modified)
+
+    return SimpleNamespace(
+        etag=md5.hexdigest(), last_modified=last_modified, content_settings=None
+    )
 
 
 class FileMapProcessor:
@@ -19,14 +65,30 @@ class FileMapProcessor:
         dependency_folder: str,
         ignore_file=None,
         args: list = [],
+        pipeline_version: str = None,
+        requires_manifest: bool = False,
     ):
 
         self.file_map = []
+        # input_file -> entry lookup so per-file bookkeeping stays O(1)
+        self.file_map_index = {}
+        # The same instance is shared by every ThreadPool worker
+        self.lock = threading.RLock()
         # where actually ignored files are stored in the array
         self.ignore_files = []
         self.dependency_folder = dependency_folder
         self.start_time = time.time()
         self.args = args
+        # Outputs made by another version of the pipeline are always regenerated
+        self.pipeline_version = pipeline_version
+        # Set by the pipelines that keep their manifest entries in the file map
+        self.requires_manifest = requires_manifest
+        # path -> content digest and etag of the input seen in this run
+        self.input_digests = {}
+        self.input_etags = {}
+        # path -> last modified of inputs whose bytes may be unchanged even though
+        # the blob was rewritten, to be confirmed once downloaded
+        self.pending_digest_checks = {}
 
         # Create a temporary folder on the local machine
         self.meta_temp_folder_path = tempfile.mkdtemp()
@@ -91,95 +153,301 @@ class FileMapProcessor:
             # This is to delete the output files of files that are no longer in the input folder
             entry["seen"] = False
 
+        self._rebuild_index()
+
     def __del__(self):
         shutil.rmtree(self.meta_temp_folder_path)
 
+    def __getstate__(self):
+        # Sent to worker processes without the lock and the storage client
+        state = self.__dict__.copy()
+        del state["lock"]
+        del state["file_system_client"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+        # A copy must not remove the temporary folder of the original
+        self.meta_temp_folder_path = tempfile.mkdtemp()
+        self.file_system_client = azurelake.FileSystemClient.from_connection_string(
+            config.AZURE_STORAGE_CONNECTION_STRING,
+            file_system_name="stage-1-container",
+        )
+
+    def export_paths(self, paths) -> dict:
+        """The bookkeeping of the given input files, for a copy of the processor
+        in a worker process to hand back to the original with merge_paths"""
+        with self.lock:
+            return {
+                path: {
+                    "entry": self._get_entry(path),
+                    "input_digest": self.input_digests.get(path),
+                    "input_etag": self.input_etags.get(path),
+                    "pending_digest_check": self.pending_digest_checks.get(path),
+                }
+                for path in paths
+            }
+
+    def merge_paths(self, exported: dict):
+        """Take over the bookkeeping of input files from export_paths"""
+        with self.lock:
+            for path, state in exported.items():
+                if (entry := state["entry"]) is not None:
+                    if existing := self._get_entry(path):
+                        existing.clear()
+                        existing.update(entry)
+                    else:
+                        self.file_map.append(entry)
+                        self.file_map_index[path] = entry
+
+                for values, key in (
+                    (self.input_digests, "input_digest"),
+                    (self.input_etags, "input_etag"),
+                    (self.pending_digest_checks, "pending_digest_check"),
+                ):
+                    if state[key] is None:
+                        values.pop(path, None)
+                    else:
+                        values[path] = state[key]
+
+    def _rebuild_index(self):
+        # Keep the first entry for a path, matching the old linear scans
+        self.file_map_index = {}
+        for entry in self.file_map:
+            self.file_map_index.setdefault(entry["input_file"], entry)
+
+    def _get_entry(self, path):
+        return self.file_map_index.get(path)
+
     def add_entry(self, path, input_last_modified, additional_data=None):
         # Add files that do not exist in the array
-        entry = [entry for entry in self.file_map if entry["input_file"] == path]
-        if not entry:
-            self.file_map.append(
-                {
-                    "input_file": path,
-                    "output_files": [],
-                    "input_last_modified": input_last_modified,
-                    "seen": True,
-                    "error": [],
-                    "additional_data": additional_data,
-                }
-            )
+        with self.lock:
+            if path in self.file_map_index:
+                return
+
+            entry = {
+                "input_file": path,
+                "output_files": [],
+                "input_last_modified": input_last_modified,
+                "seen": True,
+                "error": [],
+                "additional_data": additional_data,
+            }
+            self.file_map.append(entry)
+            self.file_map_index[path] = entry
 
     def add_additional_data(self, path, additional_data):
-        for entry in self.file_map:
-            if entry["input_file"] == path:
+        with self.lock:
+            if entry := self._get_entry(path):
                 entry["additional_data"] = additional_data
-                break
 
-    def file_should_process(self, path, input_last_modified) -> bool:
+    def file_should_process(
+        self, path, input_last_modified, input_file_properties=None
+    ) -> bool:
         """Check if the file has been modified since the last time it was
-        processed and no errors exist during processing"""
-        for entry in self.file_map:
-            if entry["input_file"] == path:
-                entry["seen"] = True
+        processed and no errors exist during processing.
+
+        With the file properties, a file whose Content-MD5 matches the recorded
+        digest is skipped even if it was re-uploaded or copied since. Without an
+        MD5 a rewritten file is processed, but content_unchanged() can still
+        skip it once downloaded."""
+        with self.lock:
+            entry = self._get_entry(path)
+
+            content_md5 = etag = None
+            if input_file_properties is not None:
+                content_settings = getattr(
+                    input_file_properties, "content_settings", None
+                )
+                if content_settings is not None and content_settings.content_md5:
+                    content_md5 = bytes(content_settings.content_md5).hex()
+                    self.input_digests[path] = content_md5
+
+                etag = getattr(input_file_properties, "etag", None)
+                if etag is not None:
+                    self.input_etags[path] = etag
+
+            if entry is None:
+                return True
 
-                t = input_last_modified.strftime("%Y-%m-%d %H:%M:%S+00:00")
-                count_error = len(entry["error"])
+            entry["seen"] = True
 
-                return t != entry["input_last_modified"] or count_error > 0
+            t = _format_last_modified(input_last_modified)
+            count_error = len(entry["error"])
 
-        return True
+            if count_error > 0:
+                return True
+
+            # Entries written before versions were recorded count as current
+            stored_version = entry.get("pipeline_version")
+            if stored_version is not None and stored_version != self.pipeline_version:
+                return True
+
+            # Entries written before manifests were recorded are processed once
+            # more, otherwise the manifest of this run would leave them out
+            if self.requires_manifest and "manifest" not in entry:
+                return True
+
+            stored_digest = entry.get("input_digest")
+
+            if content_md5 is not None and stored_digest is not None:
+                if content_md5 != stored_digest:
+                    return True
+
+                self._mark_unchanged(path, entry, t)
+                return False
+
+            stored_etag = entry.get("input_etag")
+
+            if etag is not None and etag == stored_etag:
+                entry["kept"] = True
+                return False
+
+            # A recorded etag that differs means the input was rewritten
+            if t == entry["input_last_modified"] and None in (etag, stored_etag):
+                entry["kept"] = True
+                return False
+
+            if stored_digest is not None:
+                self.pending_digest_checks[path] = t
+
+            return True
+
+    def content_unchanged(self, path, download_path) -> bool:
+        """Record the digest of a downloaded input and check whether its bytes
+        are the ones the current outputs were made from, in which case the
+        outputs are kept and the file does not need to be processed again"""
+        digest = self.input_digests.get(path) or file_digest(download_path)
+
+        with self.lock:
+            self.input_digests[path] = digest
+            pending = self.pending_digest_checks.pop(path, None)
+            entry = self._get_entry(path)
+
+            if pending is None or entry is None:
+                return False
+
+            if entry.get("input_digest") != digest:
+                return False
+
+            self._mark_unchanged(path, entry, pending)
+            return True
+
+    def _mark_unchanged(self, path, entry, input_last_modified):
+        # Later runs can then skip the file on the timestamp or etag alone
+        entry["input_last_modified"] = input_last_modified
+        entry["kept"] = True
+        if path in self.input_etags:
+            entry["input_etag"] = self.input_etags[path]
 
     def confirm_output_files(self, path, workflow_output_files, input_last_modified):
         # Add the new output files to the file map
-        for entry in self.file_map:
-            if entry["input_file"] == path:
+        with self.lock:
+            if entry := self._get_entry(path):
                 entry["output_files"] = workflow_output_files
                 entry["input_last_modified"] = input_last_modified
-                break
+                entry["pipeline_version"] = self.pipeline_version
+
+                if path in self.input_digests:
+                    entry["input_digest"] = self.input_digests[path]
+                if path in self.input_etags:
+                    entry["input_etag"] = self.input_etags[path]
+
+                self.pending_digest_checks.pop(path, None)
+
+    def add_extra_output_files(self, path, output_files: list):
+        """Track outputs that are not part of the dependencies, like data plots
+        and QC results, so they are deleted along with the other outputs"""
+        with self.lock:
+            if entry := self._get_entry(path):
+                entry.setdefault("extra_output_files", []).extend(output_files)
+
+    def record_manifest(self, path, manifest_entries: list):
+        """Keep the manifest entries made from an input with its file map entry,
+        so a run that skips the input can still list them"""
+        with self.lock:
+            if entry := self._get_entry(path):
+                entry["manifest"] = manifest_entries
+
+    def kept_entries(self) -> list:
+        """The entries of inputs skipped in this run because their outputs from an
+        earlier run are current"""
+        with self.lock:
+            return [entry for entry in self.file_map if entry.get("kept")]
+
+    def add_kept_dependencies(self, workflow_file_dependencies) -> list:
+        """Add the dependencies of the kept inputs to those of this run and return
+        the manifest entries recorded for them"""
+        manifest_entries = []
+
+        for entry in self.kept_entries():
+            workflow_file_dependencies.add_dependency(
+                [entry["input_file"]], list(entry["output_files"])
+            )
+            manifest_entries.extend(entry.get("manifest") or [])
+
+        return manifest_entries
 
     def delete_preexisting_output_files(self, path):
-        input_path = path
         # Delete the output files associated with the input file
         # We are doing a file level replacement
-        for entry in self.file_map:
-            if entry["input_file"] == input_path:
-                for output_file in entry["output_files"]:
-                    with contextlib.suppress(Exception):
-                        output_file_client = self.file_system_client.get_file_client(
-                            file_path=output_file
-                        )
-                        output_file_client.delete_file()
-                break
+        with self.lock:
+            entry = self._get_entry(path)
+            output_files = _all_output_files(entry) if entry else []
+
+            if entry:
+                entry.pop("extra_output_files", None)
+
+        # The deletes are network calls so they run outside the lock
+        for output_file in output_files:
+            with contextlib.suppress(Exception):
+                output_file_client = self.file_system_client.get_file_client(
+                    file_path=output_file
+                )
+                output_file_client.delete_file()
 
     def delete_out_of_date_output_files(self):
         # Delete the output files that are no longer in the input folder
-        for entry in self.file_map:
-            if not entry["seen"]:
-                for output_file in entry["output_files"]:
-                    with contextlib.suppress(Exception):
-                        output_file_client = self.file_system_client.get_file_client(
-                            file_path=output_file
-                        )
+        with self.lock:
+            output_files = [
+                output_file
+                for entry in self.file_map
+                if not entry["seen"]
+                for output_file in _all_output_files(entry)
+            ]
+
+        for output_file in output_files:
+            with contextlib.suppress(Exception):
+                output_file_client = self.file_system_client.get_file_client(
+                    file_path=output_file
+                )
 
-                        output_file_client.delete_file()
+                output_file_client.delete_file()
 
     def append_errors(self, error_exception, path):
         # This function appends errors to the json
-        entry = [entry for entry in self.file_map if entry["input_file"] == path][0]
-        entry["error"].append(error_exception)
+        with self.lock:
+            entry = self.file_map_index[path]
+            entry["error"].append(error_exception)
 
     def clear_errors(self, path):
         # This function clear errors to the json
-        entry = [entry for entry in self.file_map if entry["input_file"] == path][0]
-        entry["error"] = []
+        with self.lock:
+            entry = self.file_map_index[path]
+            entry["error"] = []
 
     def remove_seen_flag_from_map(self):
-        # Remove the entries that are no longer in the input folder
-        self.file_map = [entry for entry in self.file_map if entry["seen"]]
+        with self.lock:
+            # Remove the entries that are no longer in the input folder
+            self.file_map = [entry for entry in self.file_map if entry["seen"]]
 
-        # Remove the seen flag from the file map
-        for entry in self.file_map:
-            del entry["seen"]
+            # Remove the seen and kept flags from the file map
+            for entry in self.file_map:
+                del entry["seen"]
+                entry.pop("kept", None)
+
+            self._rebuild_index()
 
     def upload_json(self):
         # Write the file map to a file
@@ -192,27 +460,28 @@ class FileMapProcessor:
         error_file_map = []
         error_file_list = []
 
-        for item in self.file_map:
-            if len(item["error"]) > 0:
-                errors_items_count += 1
-                error_file_list.append(item["input_file"])
-                error_file_map.append(item)
-
-        output_dict = {
-            "logs": self.file_map,
-            "errors": {
-                "count": errors_items_count,
-                "files": error_file_list,
-                "items": error_file_map,
-            },
-            "start_time": self.start_time,
-            "end_time": time.time(),
-            "duration": time.time() - self.start_time,
-            "args": " ".join(self.args),
-        }
-
-        with open(file_map_file_path, "w") as f:
-            json.dump(output_dict, f, indent=4, sort_keys=True, default=str)
+        with self.lock:
+            for item in self.file_map:
+                if len(item["error"]) > 0:
+                    errors_items_count += 1
+                    error_file_list.append(item["input_file"])
+                    error_file_map.append(item)
+
+            output_dict = {
+                "logs": self.file_map,
+                "errors": {
+                    "count": errors_items_count,
+                    "files": error_file_list,
+                    "items": error_file_map,
+                },
+                "start_time": self.start_time,
+                "end_time": time.time(),
+                "duration": time.time() - self.start_time,
+                "args": " ".join(self.args),
+            }
+
+            with open(file_map_file_path, "w") as f:
+                json.dump(output_dict, f, indent=4, sort_keys=True, default=str)
 
         with open(file_map_file_path, "rb") as data:
             output_file_client = self.file_system_client.get_file_client(
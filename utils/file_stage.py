@@ -0,0 +1,96 @@
+import os
+import shutil
+import sys
+
+import config
+
+if sys.platform.startswith("linux"):
+    import fcntl
+else:
+    fcntl = None
+
+# "link" tries a hardlink then a reflink, "reflink" only a reflink, "copy" always copies
+FILE_STAGE_MODE = (config.FAIRHUB_FILE_STAGE_MODE or "link").lower()
+
+# ioctl that clones the extents of a file on Linux (btrfs, XFS), fcntl.FICLONE on 3.12+
+FICLONE = 0x40049409
+
+
+def _hardlink(source: str, destination: str) -> bool:
+    try:
+        os.link(source, destination)
+    except OSError:
+        # Another filesystem, or one without hardlinks
+        return False
+
+    return True
+
+
+def _reflink(source: str, destination: str) -> bool:
+    if fcntl is None:
+        return False
+
+    try:
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except OSError:
+        # Another filesystem, or one without copy on write
+        if os.path.lexists(destination):
+            os.remove(destination)
+
+        return False
+
+    shutil.copystat(source, destination)
+
+    return True
+
+
+def stage_file(source: str, destination: str, mode: str = None) -> str:
+    """
+    Pass a file on to the folder of the next step without copying its data.
+
+    With the "link" mode the file is hardlinked, with "reflink" it is cloned copy on
+    write, and a regular copy is made when the filesystem cannot do either (another
+    device, no support). A hardlinked file shares its data with the source, so the
+    steps write new files and never rewrite a staged file in place. An existing
+    destination is replaced, not written through.
+
+    Args:
+        source (str): The file to pass on.
+        destination (str): The new path, or a folder to place the file in.
+        mode (str): "link", "reflink" or "copy", defaults to FAIRHUB_FILE_STAGE_MODE.
+
+    Returns:
+        str: The path of the staged file.
+    """
+    mode = (mode or FILE_STAGE_MODE).lower()
+
+    if os.path.isdir(destination):
+        destination = os.path.join(destination, os.path.basename(source))
+
+    if os.path.lexists(destination):
+        if os.path.exists(destination) and os.path.samefile(source, destination):
+            return destination
+
+        os.remove(destination)
+
+    if mode == "link" and _hardlink(source, destination):
+        return destination
+
+    if mode in ("link", "reflink") and _reflink(source, destination):
+        return destination
+
+    shutil.copy2(source, destination)
+
+    return destination
+
+
+def stage_tree(source: str, destination: str, dirs_exist_ok: bool = False) -> str:
+    """
+    Pass a folder on to the next step, staging every file with stage_file.
+
+    Takes the same arguments as shutil.copytree and returns the destination.
+    """
+    return shutil.copytree(
+        source, destination, copy_function=stage_file, dirs_exist_ok=dirs_exist_ok
+    )
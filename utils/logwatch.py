@@ -1,13 +1,234 @@
 import requests
+import atexit
 import contextlib
 import config
+import os
+import queue
+import sys
 import threading
 import json
+import time
 from colorama import just_fix_windows_console, Fore, Back, Style
 from utils.time_estimator import TimeEstimator
 
 just_fix_windows_console()
 
+# Shipping defaults, can be overridden through the environment
+LOG_QUEUE_SIZE = int(config.FAIRHUB_LOG_QUEUE_SIZE or 10000)
+LOG_BATCH_SIZE = int(config.FAIRHUB_LOG_BATCH_SIZE or 100)
+LOG_FLUSH_INTERVAL = float(config.FAIRHUB_LOG_FLUSH_INTERVAL or 1.0)
+# One of "drop_oldest", "drop_newest" or "block"
+LOG_DROP_POLICY = config.FAIRHUB_LOG_DROP_POLICY or "drop_oldest"
+# "record" posts each record as one JSON object, the format the drains have always
+# received; "array" posts a whole batch as one JSON array, for drains that accept it
+LOG_PAYLOAD = config.FAIRHUB_LOG_PAYLOAD or "record"
+
+DROP_POLICIES = ["drop_oldest", "drop_newest", "block"]
+PAYLOADS = ["record", "array"]
+
+
+class LogShipper:
+    """Background transport that ships log records to a single drain.
+
+    Records are put on a bounded queue and a single daemon thread collects them
+    into batches of up to batch_size, waiting at most flush_interval after the
+    first record of a batch, and posts them over a reused HTTP session. With the
+    "array" payload a batch is one POST of a JSON array, with "record" every
+    record is still posted on its own. When the queue is full the drop policy
+    decides whether the oldest record is discarded, the new record is discarded
+    or the caller blocks until there is room. Dropped and failed records are
+    counted and reported on stderr when the shipper is closed.
+    """
+
+    def __init__(
+        self,
+        drain: str,
+        queue_size: int = LOG_QUEUE_SIZE,
+        batch_size: int = LOG_BATCH_SIZE,
+        flush_interval: float = LOG_FLUSH_INTERVAL,
+        drop_policy: str = LOG_DROP_POLICY,
+        payload: str = LOG_PAYLOAD,
+        timeout: float = 10,
+    ):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"drop_policy must be one of {DROP_POLICIES}")
+        if payload not in PAYLOADS:
+            raise ValueError(f"payload must be one of {PAYLOADS}")
+
+        self.drain = drain
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self.payload = payload
+        self.timeout = timeout
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.session = requests.Session()
+        self.dropped = 0
+        self.failed = 0
+
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="logwatch-shipper", daemon=True
+        )
+        self._thread.start()
+
+    def put(self, record: dict):
+        """Queue a record for shipping without waiting on the network"""
+        if self._closed:
+            return
+
+        if self.drop_policy == "block":
+            self.queue.put(record)
+            return
+
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+            if self.drop_policy == "drop_newest":
+                return
+
+            # drop_oldest: make room for the newest record
+            with contextlib.suppress(queue.Empty):
+                self.queue.get_nowait()
+                self.queue.task_done()
+            with contextlib.suppress(queue.Full):
+                self.queue.put_nowait(record)
+
+    def _run(self):
+        while True:
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            if record is None:
+                self.queue.task_done()
+                return
+
+            batch = [record]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+
+            # Collect until the batch is full or the interval since its first record ends
+            while len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+
+                if record is None:
+                    stop = True
+                    break
+
+                batch.append(record)
+
+            self._send(batch)
+
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self.queue.task_done()
+
+            if stop:
+                return
+
+    def _post(self, payload) -> bool:
+        try:
+            response = self.session.post(
+                self.drain, json.dumps(payload), timeout=self.timeout
+            )
+        except Exception:
+            return False
+
+        return response.ok
+
+    def _send(self, batch: list):
+        if self.payload == "array":
+            if not self._post(batch):
+                self.failed += len(batch)
+            return
+
+        for record in batch:
+            if not self._post(record):
+                self.failed += 1
+
+    def flush(self, timeout: float = None):
+        """Wait until every queued record has been shipped"""
+        if timeout is None:
+            self.queue.join()
+            return
+
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self, timeout: float = 30):
+        """Flush the remaining records and stop the background thread"""
+        if self._closed:
+            return
+
+        self._closed = True
+        # The sentinel is queued even when the buffer is full
+        self.queue.put(None)
+        self._thread.join(timeout)
+        self.session.close()
+
+        if self.dropped or self.failed:
+            print(
+                f"logwatch: {self.dropped} records dropped and {self.failed} failed "
+                f"to ship to {self.drain}",
+                file=sys.stderr,
+            )
+
+
+_shippers: dict = {}
+_shippers_lock = threading.Lock()
+
+
+def get_shipper(drain: str) -> LogShipper:
+    """Return the shipper for a drain, shared by every Logwatch instance"""
+    with _shippers_lock:
+        shipper = _shippers.get(drain)
+
+        if shipper is None or shipper._closed:
+            shipper = LogShipper(drain)
+            _shippers[drain] = shipper
+
+        return shipper
+
+
+def flush(timeout: float = None):
+    """Ship everything that is currently queued on all drains"""
+    with _shippers_lock:
+        shippers = list(_shippers.values())
+
+    for shipper in shippers:
+        shipper.flush(timeout)
+
+
+def _reset_after_fork():
+    # The shipper threads do not survive a fork, so a forked worker process
+    # starts its own shippers instead of queueing on ones that never drain
+    global _shippers_lock
+
+    _shippers.clear()
+    _shippers_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@atexit.register
+def shutdown(timeout: float = 30):
+    """Flush and stop all shippers. Runs automatically on interpreter exit"""
+    with _shippers_lock:
+        shippers = list(_shippers.values())
+        _shippers.clear()
+
+    for shipper in shippers:
+        shipper.close(timeout)
+
 
 class Logwatch:
     """Class for sending logging messages to the logwatch server'"""
@@ -61,31 +282,39 @@ class Logwatch:
         if (channel == "cirrus") and (self.cirrus_drain is not None):
             self.drain = self.cirrus_drain
 
+    def _ship(self, level: str, message: str, with_thread: bool = True):
+        """Queue a record on the shared shipper for this drain"""
+        if self.local or self.drain is None:
+            return
+
+        with contextlib.suppress(Exception):
+            args = {
+                "level": level,
+                "message": message,
+                "type": "text",
+            }
+
+            if with_thread and self.thread_id != 0:
+                args["thread"] = self.thread_id
+
+            get_shipper(self.drain).put(args)
+
+    def flush(self, timeout: float = None):
+        """Block until the queued messages for this drain have been shipped"""
+        if self.local or self.drain is None:
+            return
+
+        get_shipper(self.drain).flush(timeout)
+
     def trace(self, message: str):
         """Send a trace message to the logwatch server"""
         if self.print:
             print(Style.DIM + message + Style.RESET_ALL)
-        if not self.local:
-            with contextlib.suppress(Exception):
-                threading.Thread(
-                    target=requests.post,
-                    args=(
-                        self.drain,
-                        {"level": "trace", "message": message, "type": "text"},
-                    ),
-                ).start()
+        self._ship("trace", message, with_thread=False)
 
     def noPrintTrace(self, message: str):
         """Send a trace message to the logwatch server without printing"""
-        if not self.local:
-            with contextlib.suppress(Exception):
-                threading.Thread(
-                    target=requests.post,
-                    args=(
-                        self.drain,
-                        {"level": "trace", "message": message, "type": "text"},
-                    ),
-                ).start()
+        self._ship("trace", message, with_thread=False)
 
     def debug(self, message: str):  # sourcery skip: class-extract-method
         """Send a debug message to the logwatch server"""
@@ -95,24 +324,7 @@ class Logwatch:
             else:
                 print(f"{Fore.BLUE}{message}{Style.RESET_ALL}")
 
-        if not self.local:
-            with contextlib.suppress(Exception):
-                args = {
-                    "level": "debug",
-                    "message": message,
-                    "type": "text",
-                }
-
-                if self.thread_id != 0:
-                    args["thread"] = self.thread_id
-
-                threading.Thread(
-                    target=requests.post,
-                    args=(
-                        self.drain,
-                        json.dumps(args),
-                    ),
-                ).start()
+        self._ship("debug", message)
 
     def info(self, message: str):
         """Send an info message to the logwatch server"""
@@ -122,38 +334,13 @@ class Logwatch:
             else:
                 print(f"{Fore.CYAN}{message}{Style.RESET_ALL}")
 
-        if not self.local:
-            with contextlib.suppress(Exception):
-                args = {
-                    "level": "info",
-                    "message": message,
-                    "type": "text",
-                }
-
-                if self.thread_id != 0:
-                    args["thread"] = self.thread_id
-
-                threading.Thread(
-                    target=requests.post,
-                    args=(
-                        self.drain,
-                        json.dumps(args),
-                    ),
-                ).start()
+        self._ship("info", message)
 
     def fastInfo(self, message: str):
         """Send a threaded info message to the logwatch server. Used for items that need to be processed quickly"""
         if self.print:
             print(Fore.CYAN + message + Style.RESET_ALL)
-        if not self.local:
-            with contextlib.suppress(Exception):
-                threading.Thread(
-                    target=requests.post,
-                    args=(
-                        self.drain,
-                        {"level": "info", "message": message, "type": "text"},
-                    ),
-                )
+        self._ship("info", message, with_thread=False)
 
     def error(self, message: str):
         """Send an error message to the logwatch server"""
@@ -163,29 +350,13 @@ class Logwatch:
             else:
                 print(f"{Fore.RED}{message}{Style.RESET_ALL}")
 
-        if not self.local:
-            with contextlib.suppress(Exception):
-                args = {
-                    "level": "error",
-                    "message": message,
-                    "type": "text",
-                }
-
-                if self.thread_id != 0:
-                    args["thread"] = self.thread_id
-
-                requests.post(self.drain, json.dumps(args))
+        self._ship("error", message)
 
     def warn(self, message: str):
         """Send a warning message to the logwatch server"""
         if self.print:
             print(Fore.YELLOW + message + Style.RESET_ALL)
-        if not self.local:
-            with contextlib.suppress(Exception):
-                requests.post(
-                    self.drain,
-                    json={"level": "warning", "message": message, "type": "text"},
-                )
+        self._ship("warning", message, with_thread=False)
 
     # Alias for warn
     def warning(self, message: str):
@@ -195,12 +366,7 @@ class Logwatch:
         """Send a critical message to the logwatch server"""
         if self.print:
             print(Back.RED + Fore.WHITE + message + Style.RESET_ALL)
-        if not self.local:
-            with contextlib.suppress(Exception):
-                requests.post(
-                    self.drain,
-                    json={"level": "critical", "message": message, "type": "text"},
-                )
+        self._ship("critical", message, with_thread=False)
 
     def time(self, message: str):
         """Send a time message to the logwatch server"""
@@ -222,26 +388,11 @@ class Logwatch:
             if self.overall_time_estimator is not None:
                 print(f"{Back.GREEN}{Fore.WHITE}{overall_messsage}{Style.RESET_ALL}")
 
-        if not self.local:
-            with contextlib.suppress(Exception):
-                args = {
-                    "level": "time",
-                    "message": message,
-                    "type": "text",
-                }
-
-                if self.thread_id != 0:
-                    args["thread"] = self.thread_id
+        self._ship("time", message)
 
-                # Not threaded because it's a time message
-                requests.post(self.drain, json.dumps(args))
-
-                # keep track of the overall time for threaded workflows
-                if self.overall_time_estimator is not None:
-                    if "thread" in args:
-                        del args["thread"]
-                    args["message"] = overall_messsage
-                    requests.post(self.drain, json.dumps(args))
+        # keep track of the overall time for threaded workflows
+        if self.overall_time_estimator is not None:
+            self._ship("time", overall_messsage, with_thread=False)
 
     def fastTime(self, message: str):
         """Send a threaded time message to the logwatch server. Used for items that need to be processed quickly"""
@@ -252,30 +403,8 @@ class Logwatch:
                 )
             else:
                 print(f"{Back.GREEN}{Fore.WHITE}{message}{Style.RESET_ALL}")
-        if not self.local:
-            with contextlib.suppress(Exception):
-                args = {
-                    "level": "time",
-                    "message": message,
-                    "type": "text",
-                }
-
-                if self.thread_id != 0:
-                    args["thread"] = self.thread_id
-
-                threading.Thread(
-                    target=requests.post,
-                    args=(self.drain, json.dumps(args)),
-                ).start()
+        self._ship("time", message)
 
     def noPrintTime(self, message: str):
         """Send a threaded time message to the logwatch server. Used for items that need to be processed quickly"""
-        if not self.local:
-            with contextlib.suppress(Exception):
-                threading.Thread(
-                    target=requests.post,
-                    args=(
-                        self.drain,
-                        {"level": "time", "message": message, "type": "text"},
-                    ),
-                ).start()
+        self._ship("time", message, with_thread=False)
@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from traceback import format_exc
+
+import azure.storage.filedatalake as azurelake
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+
+import config
+
+MB = 1024 * 1024
+
+# Upload defaults, can be overridden through the environment
+UPLOAD_MAX_CONCURRENCY = int(config.FAIRHUB_UPLOAD_MAX_CONCURRENCY or 8)
+UPLOAD_MAX_IN_FLIGHT_BYTES = int(config.FAIRHUB_UPLOAD_MAX_IN_FLIGHT_MB or 256) * MB
+UPLOAD_CHUNK_SIZE = int(config.FAIRHUB_UPLOAD_CHUNK_SIZE_MB or 8) * MB
+UPLOAD_MAX_ATTEMPTS = int(config.FAIRHUB_UPLOAD_MAX_ATTEMPTS or 3)
+UPLOAD_RETRY_BACKOFF = 1.0
+
+
+class ByteBudget:
+    """Caps the number of bytes held in memory by uploads that are in flight.
+
+    A reservation larger than the whole budget is let through once nothing else
+    is in flight, so a single big file can never wait forever.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, size: int):
+        with self.condition:
+            while self.in_flight and self.in_flight + size > self.limit:
+                self.condition.wait()
+
+            self.in_flight += size
+
+    def release(self, size: int):
+        with self.condition:
+            self.in_flight -= size
+            self.condition.notify_all()
+
+
+# Shared by every stage in the process, so the cap holds across pipeline workers
+_budget = ByteBudget(UPLOAD_MAX_IN_FLIGHT_BYTES)
+
+
+def collect_uploads(local_folder: str, output_folder: str, depth: int) -> list:
+    """
+    Pair every file under local_folder with its data lake path.
+
+    The data lake path is output_folder followed by the last depth components of
+    the local path, e.g. depth 2 keeps the file name and its parent folder.
+    """
+    uploads = []
+
+    for root, dirs, files in os.walk(local_folder):
+        for file in files:
+            full_file_path = os.path.join(root, file)
+            combined_file_name = "/".join(full_file_path.split("/")[-depth:])
+
+            uploads.append((full_file_path, f"{output_folder}/{combined_file_name}"))
+
+    return uploads
+
+
+class UploadStage:
+    """Uploads the output set of one processed file concurrently.
+
+    Each output is streamed from disk in chunks of UPLOAD_CHUNK_SIZE and retried
+    with exponential backoff when it fails. At most max_concurrency uploads run at
+    once, and all stages in the process together keep at most
+    UPLOAD_MAX_IN_FLIGHT_BYTES buffered. When existing files must not be replaced,
+    each destination folder is listed once instead of checking every file.
+    """
+
+    def __init__(
+        self,
+        file_system_client: azurelake.FileSystemClient,
+        max_concurrency: int = None,
+        max_attempts: int = None,
+        chunk_size: int = None,
+        budget: ByteBudget = None,
+    ):
+        self.file_system_client = file_system_client
+        self.max_concurrency = max(1, max_concurrency or UPLOAD_MAX_CONCURRENCY)
+        self.max_attempts = max(1, max_attempts or UPLOAD_MAX_ATTEMPTS)
+        self.chunk_size = chunk_size or UPLOAD_CHUNK_SIZE
+        self.budget = budget or _budget
+
+    def upload(self, uploads: list, fail_if_exists: bool = False) -> list:
+        """
+        Upload local files to the data lake.
+
+        Args:
+            uploads (list): (local file path, data lake file path) pairs.
+            fail_if_exists (bool): Fail the files that already exist in the data lake
+                instead of overwriting them.
+
+        Returns:
+            list: (data lake file path, error) pairs in the order of uploads, where
+                error is None on success or the formatted traceback of the last attempt.
+        """
+        if not uploads:
+            return []
+
+        existing = self.list_existing(uploads) if fail_if_exists else set()
+
+        if len(uploads) == 1 or self.max_concurrency == 1:
+            return [
+                self._upload_one(local_path, output_path, existing)
+                for local_path, output_path in uploads
+            ]
+
+        with ThreadPoolExecutor(
+            max_workers=min(self.max_concurrency, len(uploads)),
+            thread_name_prefix="upload-stage",
+        ) as executor:
+            futures = [
+                executor.submit(self._upload_one, local_path, output_path, existing)
+                for local_path, output_path in uploads
+            ]
+
+            return [future.result() for future in futures]
+
+    def list_existing(self, uploads: list) -> set:
+        """Return the destinations that already exist, listing each folder once"""
+        folders = {output_path.rsplit("/", 1)[0] for _, output_path in uploads}
+        existing = set()
+
+        for folder in folders:
+            try:
+                existing.update(
+                    str(path.name)
+                    for path in self.file_system_client.get_paths(
+                        path=folder, recursive=False
+                    )
+                    if not path.is_directory
+                )
+            except ResourceNotFoundError:
+                # Nothing has been written to this folder yet
+                continue
+
+        return existing
+
+    def _upload_one(self, local_path: str, output_path: str, existing: set):
+        try:
+            if output_path in existing:
+                raise ResourceExistsError(
+                    f"File {output_path} already exists. Throwing exception"
+                )
+
+            size = os.path.getsize(local_path)
+        except Exception:
+            return output_path, "".join(format_exc().splitlines())
+
+        # The client buffers at most one chunk of a streamed upload at a time
+        reserved = min(size, self.chunk_size)
+        output_file_client = self.file_system_client.get_file_client(
+            file_path=output_path
+        )
+
+        self.budget.acquire(reserved)
+
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    with open(local_path, "rb") as data:
+                        output_file_client.upload_data(
+                            data,
+                            length=size,
+                            overwrite=True,
+                            chunk_size=self.chunk_size,
+                        )
+
+                    return output_path, None
+                except Exception:
+                    error = "".join(format_exc().splitlines())
+
+                    if attempt < self.max_attempts:
+                        time.sleep(UPLOAD_RETRY_BACKOFF * 2 ** (attempt - 1))
+
+            return output_path, error
+        finally:
+            self.budget.release(reserved)
@@ -0,0 +1,67 @@
+import queue
+
+import config
+
+# "size" hands out the largest inputs first, "listing" keeps the listing order
+WORK_QUEUE_ORDER = (config.FAIRHUB_WORK_QUEUE_ORDER or "size").lower()
+
+
+class WorkShare:
+    """The view of a WorkQueue that a single worker iterates over.
+
+    Iterating pulls the next item from the shared queue until it is empty, so a
+    worker that finishes early keeps taking work instead of going idle. The length
+    is the even share the worker is expected to take, which keeps the per-worker
+    time estimates meaningful.
+    """
+
+    def __init__(self, source, expected: int):
+        self.source = source
+        self.expected = expected
+
+    def __len__(self):
+        return self.expected
+
+    def __iter__(self):
+        while True:
+            try:
+                item = self.source.get_nowait()
+            except queue.Empty:
+                return
+
+            yield item
+
+
+class WorkQueue:
+    """Queue of work items shared by the workers of a pipeline.
+
+    Workers pull one item at a time, so a worker that drew a large file does not
+    hold up the ones that are left, and the run ends roughly one largest file
+    after the last worker went idle. When a size function is given the largest
+    items are handed out first, unless FAIRHUB_WORK_QUEUE_ORDER is "listing".
+
+    Pass a multiprocessing Manager to share the queue with a process pool. The
+    items are then pickled, so changes a worker makes to them are not seen by the
+    parent.
+    """
+
+    def __init__(self, items: list, workers: int, size=None, manager=None):
+        items = list(items)
+
+        if size is not None and WORK_QUEUE_ORDER == "size":
+            # sorted is stable, so items of equal size keep the listing order
+            items = sorted(items, key=size, reverse=True)
+
+        self.source = manager.Queue() if manager is not None else queue.Queue()
+
+        for item in items:
+            self.source.put(item)
+
+        self.total = len(items)
+        self.workers = min(max(1, workers), self.total)
+
+    def shares(self) -> list:
+        """One WorkShare per worker, no more workers than there are items"""
+        expected = (self.total + self.workers - 1) // self.workers if self.total else 0
+
+        return [WorkShare(self.source, expected) for _ in range(self.workers)]
@@ -0,0 +1,125 @@
+from functools import partial
+from multiprocessing import Manager
+from multiprocessing.pool import Pool, ThreadPool
+
+import utils.dependency as deps
+import utils.logwatch as logging
+from utils.file_map_processor import FileMapProcessor
+from utils.work_queue import WorkQueue, WorkShare
+
+
+class _TrackedShare:
+    """A WorkShare that keeps the items it handed out to the worker"""
+
+    def __init__(self, share: WorkShare):
+        self.share = share
+        self.items = []
+
+    def __len__(self):
+        return len(self.share)
+
+    def __iter__(self):
+        for item in self.share:
+            self.items.append(item)
+            yield item
+
+
+def _process_worker(
+    worker, file_processor: FileMapProcessor, worker_args: tuple, share, worker_id
+):
+    # Runs in a worker process on copies of the parent's objects, so everything
+    # the worker changed is returned for the parent to merge
+    workflow_file_dependencies = deps.WorkflowFileDependencies()
+    tracked_share = _TrackedShare(share)
+
+    try:
+        worker(
+            workflow_file_dependencies,
+            file_processor,
+            *worker_args,
+            tracked_share,
+            worker_id,
+        )
+    finally:
+        # Pool workers exit without running atexit handlers
+        logging.flush()
+
+    return {
+        "dependencies": workflow_file_dependencies.dependencies,
+        "file_items": tracked_share.items,
+        "file_map": file_processor.export_paths(
+            [file_item["file_path"] for file_item in tracked_share.items]
+        ),
+    }
+
+
+def run_workers(
+    worker,
+    workflow_file_dependencies: deps.WorkflowFileDependencies,
+    file_processor: FileMapProcessor,
+    worker_args: tuple,
+    file_paths: list,
+    workers: int,
+    size=None,
+    processes: bool = False,
+):
+    """
+    Run the worker of a pipeline over file_paths from a shared work queue.
+
+    The worker is called as worker(workflow_file_dependencies, file_processor,
+    *worker_args, file_paths, worker_id). By default the workers are threads that
+    share the objects passed in. With processes, every worker process gets its own
+    copy instead, and the file map entries, dependencies and file items it produced
+    are merged back here once it finishes, so CPU bound conversions are not held
+    back by the GIL.
+
+    Args:
+        worker (callable): The worker function of the pipeline.
+        workflow_file_dependencies (WorkflowFileDependencies): Dependencies of the run.
+        file_processor (FileMapProcessor): File map of the run.
+        worker_args (tuple): Arguments passed between file_processor and file_paths.
+        file_paths (list): File items of the run, dicts with a "file_path" key.
+        workers (int): Number of workers.
+        size (callable): Size of a file item, larger items are handed out first.
+        processes (bool): Run the workers in processes instead of threads.
+    """
+    if not processes:
+        work_queue = WorkQueue(file_paths, workers, size=size)
+        args = [(share, index + 1) for index, share in enumerate(work_queue.shares())]
+
+        pipe = partial(worker, workflow_file_dependencies, file_processor, *worker_args)
+
+        # Thread pool created
+        pool = ThreadPool(workers)
+        # Distributes the pipe function across the threads in the pool
+        pool.starmap(pipe, args)
+
+        return
+
+    queue_manager = Manager()
+
+    try:
+        work_queue = WorkQueue(file_paths, workers, size=size, manager=queue_manager)
+        args = [(share, index + 1) for index, share in enumerate(work_queue.shares())]
+
+        pipe = partial(_process_worker, worker, file_processor, worker_args)
+
+        # Process pool created
+        with Pool(workers) as pool:
+            worker_results = pool.starmap(pipe, args)
+    finally:
+        queue_manager.shutdown()
+
+    file_items = {file_item["file_path"]: file_item for file_item in file_paths}
+
+    # Merge results from all worker processes
+    for result in worker_results:
+        for dependency in result["dependencies"]:
+            workflow_file_dependencies.add_dependency(
+                dependency["input_files"], dependency["output_files"]
+            )
+
+        for file_item in result["file_items"]:
+            file_items[file_item["file_path"]].update(file_item)
+
+        file_processor.merge_paths(result["file_map"])